@@ -46,10 +46,24 @@ print(f"Configuring database with URL: {db_url[:50]}...", flush=True)
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# --- Connection pool (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING) ---
+from backend.processing.functions.db_pool import engine_options
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(db_url)
+
 print("Initializing SQLAlchemy...", flush=True)
 db = SQLAlchemy(app)
 print("SQLAlchemy initialized successfully", flush=True)
 
+# --- Statement timing / slow-query log (SLOW_QUERY_SECONDS, QUERY_TIMING_ENABLED) ---
+from backend.processing.functions.query_timing import query_timer, QUERY_TIMING_ENABLED
+if QUERY_TIMING_ENABLED:
+    query_timer.install()
+
+# --- Change log for incremental recomputation (CHANGE_LOG_ENABLED, CHANGE_LOG_RETENTION_DAYS) ---
+from backend.processing.functions.change_log import change_tracker, CHANGE_LOG_ENABLED
+if CHANGE_LOG_ENABLED:
+    change_tracker.install()
+
 # --- CORS ---
 # Allow everything first; later set ALLOWED_ORIGINS to your Vercel domain.
 allowed = os.getenv("ALLOWED_ORIGINS", "*")
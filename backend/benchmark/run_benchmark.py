@@ -0,0 +1,224 @@
+"""
+Benchmark harness for the BI pipeline
+Generates a synthetic dataset into a dedicated database, times the generate pipelines and every dashboard route through
+the Flask test client, and reports throughput, p50 / p95 latency and peak RSS; results can be saved as a baseline and
+compared against it on the next run
+
+Usage (run as a script, not with -m, so DATABASE_URL is set before backend is imported):
+    python backend/benchmark/run_benchmark.py --database-url sqlite:////tmp/benchmark.db --sales 20000 --output results.json
+    python backend/benchmark/run_benchmark.py --baseline results.json --output new_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, datetime
+current_directory = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_directory, os.pardir, os.pardir))
+sys.path.append(project_root)
+
+import numpy as np
+
+try:
+    import resource  # peak RSS; not available on Windows dev machines
+except ImportError:
+    resource = None
+
+DEFAULT_DATABASE_URL = 'sqlite:///benchmark.db'  # relative SQLite paths land in the Flask instance folder
+
+# (name, method, path, rows_table) run once each in order; rows_table is the input table used for throughput
+PIPELINE_STEPS = [
+    ('manufacture_result_generate', 'GET', '/manufacture_result/generate', 'manufactureorders'),
+    ('manufacture_result_stock_exchange', 'GET', '/manufacture_result/update_with_stock_exchange', 'stockexchange'),
+    ('cogs_generate', 'GET', '/cogs/generate', 'salesrecords'),
+    ('inventory_generate', 'GET', '/inventory/generate?date={end_date}', 'manufactureresult'),
+    ('all_orders_pnl_generate', 'POST', '/amazon/all-orders-pnl/generate', 'amazonallorders'),
+]
+
+# (name, path) timed --repeat times each; the first call is cold, later calls hit the dashboard cache
+DASHBOARD_ROUTES = [
+    ('filters_all_brand_component_sku', '/filters_all_brand_component_sku'),
+    ('summary_revenue_gross_margin_net_profit', '/summary_revenue_gross_margin_net_profit?dateUpTo={end_date}&displayMode=month'),
+    ('summary_revenue_gross_margin_net_profit_chart_data', '/summary_revenue_gross_margin_net_profit_chart_data?dateUpTo={end_date}&displayMode=month'),
+    ('SKU_sales_performance_revenue_quantity_pie_chart_data', '/SKU_sales_performance_revenue_quantity_pie_chart_data?dateUpTo={end_date}&displayMode=month'),
+    ('SKU_profitability_horizontal_bar_chart_data', '/SKU_profitability_horizontal_bar_chart_data?dateUpTo={end_date}&displayMode=month&mode=top5'),
+    ('summary_AR_AP_and_statements_closing_chart_data', '/summary_AR_AP_and_statements_closing_chart_data?dateUpTo={end_date}'),
+    ('summary_AP_vendor', '/summary_AP_vendor?dateUpTo={end_date}'),
+    ('COGS_summary_card', '/cogs_details/COGS_summary_card?dateUpTo={end_date}&displayMode=month'),
+    ('COGS_pie_chart_data_brand_in_PC', '/cogs_details/COGS_pie_chart_data_brand_in_PC?dateUpTo={end_date}&displayMode=month'),
+    ('COGS_pie_chart_data_product_in_hardware_accessory_os', '/cogs_details/COGS_pie_chart_data_product_in_hardware_accessory_os?dateUpTo={end_date}&displayMode=month'),
+    ('PO_pie_chart_data_brand_in_PC', '/cogs_details/PO_pie_chart_data_brand_in_PC?dateUpTo={end_date}&displayMode=month'),
+    ('PO_pie_chart_data_product_in_hardware_accessory_os', '/cogs_details/PO_pie_chart_data_product_in_hardware_accessory_os?dateUpTo={end_date}&displayMode=month'),
+    ('PO_average_cost_by_period', '/cogs_details/PO_average_cost_by_period?dateUpTo={end_date}&displayMode=month'),
+    ('dsi', '/cogs_details/dsi?dateUpTo={end_date}'),
+    ('operating_expenses_details_summary_card', '/operating_expenses_details_summary_card?dateUpTo={end_date}&displayMode=month'),
+    ('operating_expenses_details_trend_chart_by_brand', '/operating_expenses_details_trend_chart_by_brand?dateUpTo={end_date}&displayMode=month'),
+    ('operating_expenses_items_breakdown_summary_card', '/operating_expenses_items_breakdown_summary_card?dateUpTo={end_date}&displayMode=month&expenseItem=advertisements'),
+    ('operating_expenses_items_breakdown_trend_chart', '/operating_expenses_items_breakdown_trend_chart?dateUpTo={end_date}&displayMode=month'),
+    ('pnl_report_data', '/pnl_report_data?startDate={start_date}&endDate={end_date}'),
+    ('profitability_report_weeks', '/profitability_report_weeks'),
+    ('returns_report_data', '/returns_report_data?startDate={start_date}&endDate={end_date}'),
+    ('revenue_oriented_forecast_line_table_data', '/evaluate_strategy/revenue_oriented_forecast_line_table_data?dateUpTo={end_date}&forecast_revenue_method=benchmark&forecast_DSI_method=benchmark&DSI_period_in_days=30'),
+    ('AR_AP_and_statements_closing_with_forecast_chart_data', '/evaluate_strategy/AR_AP_and_statements_closing_with_forecast_chart_data?forecast_revenue_method=benchmark'),
+    ('cashflow_AR_AP_net_add_vendor_payment_actuals_and_forecast_chart_data', '/evaluate_strategy/cashflow_AR_AP_net_add_vendor_payment_actuals_and_forecast_chart_data?forecast_revenue_method=benchmark'),
+    ('po_gantt_chart', '/evaluate_strategy/po_gantt_chart?po_start_date={start_date}&po_end_date={end_date}'),
+]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)  # bytes on macOS, KB on Linux
+
+
+def _table_rows(app, db, table):
+    from sqlalchemy import text
+
+    with app.app_context():
+        rows = db.session.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() or 0
+        db.session.remove()
+    return rows
+
+
+def _timed_request(client, method, path):
+    started = time.perf_counter()
+    response = client.open(path, method=method)
+    seconds = time.perf_counter() - started
+    return response.status_code, seconds, _error_message(response)
+
+
+def _error_message(response):
+    # routes report failures as {'error': ...}; keep it in the results so a 500 is explained without the server log
+    if response.status_code < 400:
+        return None
+    payload = response.get_json(silent=True)
+    return str(payload.get('error'))[:300] if isinstance(payload, dict) and payload.get('error') else None
+
+
+def run_pipeline(app, client, db, params):
+    """Run each generate step once; throughput is input rows per second"""
+    results = {}
+    for name, method, path, rows_table in PIPELINE_STEPS:
+        rows = _table_rows(app, db, rows_table)
+        status_code, seconds, error = _timed_request(client, method, path.format(**params))
+        results[name] = {
+            'status_code': status_code,
+            'error': error,
+            'seconds': round(seconds, 4),
+            'input_rows': rows,
+            'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        print(f"{name:<45} {status_code}  {seconds:8.3f}s  {rows:>9} rows" + (f"  {error}" if error else ''))
+    return results
+
+
+def run_dashboards(client, params, repeat):
+    """Time every dashboard route repeat times; p50 / p95 are over all calls, cold is the first one"""
+    results = {}
+    for name, path in DASHBOARD_ROUTES:
+        timings = []
+        status_codes = set()
+        error = None
+        for _ in range(repeat):
+            status_code, seconds, error = _timed_request(client, 'GET', path.format(**params))
+            status_codes.add(status_code)
+            timings.append(seconds)
+        timings = np.array(timings)
+        results[name] = {
+            'status_codes': sorted(status_codes),
+            'error': error,
+            'cold_seconds': round(float(timings[0]), 4),
+            'p50_seconds': round(float(np.percentile(timings, 50)), 4),
+            'p95_seconds': round(float(np.percentile(timings, 95)), 4),
+            'requests_per_second': round(repeat / float(timings.sum()), 2) if timings.sum() > 0 else None,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        print(f"{name:<70} {sorted(status_codes)}  cold {timings[0]:7.3f}s  p50 {results[name]['p50_seconds']:7.3f}s  p95 {results[name]['p95_seconds']:7.3f}s")
+    return results
+
+
+def compare_with_baseline(results, baseline):
+    """Print the relative change of every timing against a stored baseline run"""
+    print(f"\nComparison with baseline from {baseline.get('started_at')}:")
+    for section, metric in (('pipeline', 'seconds'), ('dashboards', 'p50_seconds')):
+        for name, entry in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name, {}).get(metric)
+            current = entry.get(metric)
+            if not previous or current is None:
+                continue
+            change = (current - previous) / previous * 100
+            print(f"{section:<10} {name:<70} {previous:8.3f}s -> {current:8.3f}s  ({change:+6.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the BI generate pipelines and dashboard routes on synthetic data')
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL, help='benchmark database, dropped and recreated unless --skip-generate')
+    parser.add_argument('--skus', type=int, default=50)
+    parser.add_argument('--purchase-orders', type=int, default=500)
+    parser.add_argument('--sales', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--end-date', default='2025-06-30', help='YYYY-MM-DD')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help='calls per dashboard route')
+    parser.add_argument('--skip-generate', action='store_true', help='reuse the data already in the benchmark database')
+    parser.add_argument('--skip-pipeline', action='store_true')
+    parser.add_argument('--skip-dashboards', action='store_true')
+    parser.add_argument('--output', help='write results as JSON, e.g. to keep as a baseline')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # backend reads DATABASE_URL at import time, so point it at the benchmark database first
+    os.environ['DATABASE_URL'] = args.database_url
+    from backend import app, db
+    if app.config['SQLALCHEMY_DATABASE_URI'] != args.database_url:
+        sys.exit(f"backend was imported before DATABASE_URL was set and points at {app.config['SQLALCHEMY_DATABASE_URI']}; "
+                 f"run this file as a script instead of with python -m")
+    from backend import crud, evaluate_performance_input_crud, evaluate_performance_dashboard_crud  # noqa: F401  register routes
+    from backend.benchmark.synthetic_data import SyntheticDataConfig, generate_synthetic_data
+
+    config = SyntheticDataConfig(
+        skus=args.skus, purchase_orders=args.purchase_orders, sales=args.sales, days=args.days,
+        end_date=datetime.strptime(args.end_date, '%Y-%m-%d').date(), seed=args.seed
+    )
+    params = {
+        'start_date': date.fromordinal(config.end_date.toordinal() - config.days).isoformat(),
+        'end_date': config.end_date.isoformat()
+    }
+    results = {'started_at': datetime.now().isoformat(timespec='seconds'), 'config': config.to_dict(), 'database': args.database_url.split('@')[-1]}
+
+    with app.app_context():
+        if not args.skip_generate:
+            started = time.perf_counter()
+            counts = generate_synthetic_data(config)
+            results['generate'] = {'seconds': round(time.perf_counter() - started, 4), 'rows': counts, 'peak_rss_mb': peak_rss_mb()}
+            print(f"Synthetic data generated in {results['generate']['seconds']:.2f}s: {counts}")
+        db.session.remove()
+
+    # no app context is held while requests run, so every request gets its own session like in production
+    client = app.test_client()
+    if not args.skip_pipeline:
+        results['pipeline'] = run_pipeline(app, client, db, params)
+    if not args.skip_dashboards:
+        results['dashboards'] = run_dashboards(client, params, max(1, args.repeat))
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            compare_with_baseline(results, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+Synthetic dataset generator for the benchmark harness
+Fills every table read by the generate pipelines and dashboards with parameterized, internally consistent data:
+SKUs named <brand>_<ir>_<variant> built from one PC product per IR plus hardware / OS products, POs covering the
+manufacturing demand, sales with matching Amazon orders and settlement statements, ads spend and shipping costs
+"""
+
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from backend import db
+from backend.models import (
+    Customer, Supplier, PurchaseOrder, ManufactureOrder, SalesRecord, Return, StockExchange,
+    AmazonAllOrders, SKUEconomics, AdsSpendByDay, AmazonStatements, AdsCreditCardPayment,
+    AmazonInboundShipping, FBMShippingCost
+)
+
+BRANDS = ['ACER', 'ASUS', 'DELL', 'HP', 'LENOVO', 'MSI']
+HARDWARE_PRODUCTS = ['16GB DDR4 SODIMM', '32GB DDR5 SODIMM', '512GB PCIE 2280', '1TB PCIE 2280']
+OS_PRODUCTS = ['WIN 11 HOME', 'WIN 11 PRO']
+INSERT_CHUNK_SIZE = 5000
+
+
+@dataclass
+class SyntheticDataConfig:
+    """
+    Size of the generated dataset
+
+    Args:
+        skus: number of sellable SKUs
+        purchase_orders: number of PO lines
+        sales: number of sales records (one Amazon order each)
+        days: length of the simulated history ending at end_date
+        end_date: last sales / statement date
+        paid_ratio: share of orders with a settlement statement
+        fbm_ratio: share of orders fulfilled by the merchant (with an FBM shipping cost)
+        return_ratio: share of sales records with a return
+        seed: random seed, the same config always produces the same data
+    """
+    skus: int = 50
+    purchase_orders: int = 500
+    sales: int = 20000
+    days: int = 365
+    end_date: date = date(2025, 6, 30)
+    paid_ratio: float = 0.9
+    fbm_ratio: float = 0.2
+    return_ratio: float = 0.02
+    seed: int = 42
+
+    def to_dict(self):
+        config = asdict(self)
+        config['end_date'] = self.end_date.isoformat()
+        return config
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(model.__table__.insert(), rows[start:start + INSERT_CHUNK_SIZE])
+    return len(rows)
+
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def reset_database():
+    """Drop and recreate every model table; only ever called against the benchmark database"""
+    db.drop_all()
+    db.create_all()
+
+
+def _catalog(config, rng):
+    irs = [f"IR{index:03d}" for index in range(max(1, config.skus // 2))]
+    skus = pd.DataFrame({'sku_index': np.arange(config.skus)})
+    skus['brand'] = rng.choice(BRANDS, size=config.skus)
+    skus['ir'] = [irs[index % len(irs)] for index in range(config.skus)]
+    skus['sku'] = skus['brand'] + '_' + skus['ir'] + '_' + skus['sku_index'].map(lambda index: f"V{index:03d}")
+    skus['pc_product'] = skus['ir'] + '-BASE'
+    skus['hardware_product'] = rng.choice(HARDWARE_PRODUCTS, size=config.skus)
+    skus['os_product'] = rng.choice(OS_PRODUCTS, size=config.skus)
+    skus['unit_price'] = rng.uniform(300, 1500, size=config.skus).round(2)
+    skus['popularity'] = rng.pareto(1.5, size=config.skus) + 1
+    return skus
+
+
+def _purchase_orders(config, rng, catalog, supplier_id, start_date):
+    products = sorted(set(catalog['pc_product']) | set(catalog['hardware_product']) | set(catalog['os_product']))
+    product_demand = pd.concat([
+        catalog[['pc_product', 'popularity']].rename(columns={'pc_product': 'product'}),
+        catalog[['hardware_product', 'popularity']].rename(columns={'hardware_product': 'product'}),
+        catalog[['os_product', 'popularity']].rename(columns={'os_product': 'product'})
+    ]).groupby('product')['popularity'].sum().reindex(products)
+    weights = (product_demand / product_demand.sum()).to_numpy()
+
+    # every product gets at least one PO, the rest follow demand
+    po_products = products + list(rng.choice(products, size=max(0, config.purchase_orders - len(products)), p=weights))
+    po = pd.DataFrame({'product': po_products})
+    po['order_date'] = [start_date + timedelta(days=int(offset)) for offset in rng.integers(0, max(1, config.days - 30), size=len(po))]
+    po = po.sort_values(['order_date', 'product']).reset_index(drop=True)
+    po['purchase_order_id'] = [f"PO{index // 3:06d}" for index in range(len(po))]  # ~3 products per PO
+    po = po.drop_duplicates(['purchase_order_id', 'product']).reset_index(drop=True)
+
+    # size POs so total supply covers ~110% of the sales demand of each product
+    total_units = config.sales * 1.6 * 1.1
+    po_weight = po['product'].map(product_demand / product_demand.sum()) / po.groupby('product')['product'].transform('count')
+    po['purchase_quantity'] = np.maximum(1, (po_weight * total_units).round().astype(int))
+    is_pc = po['product'].str.endswith('-BASE')
+    po['purchase_unit_price'] = np.where(is_pc, rng.uniform(150, 700, size=len(po)), rng.uniform(15, 120, size=len(po))).round(4)
+    po['supplier_id'] = supplier_id
+    po['purchase_currency'] = 'USD'
+    po['target_currency'] = 'USD'
+    po['fx_rate'] = 1
+    po['quantity_left'] = po['purchase_quantity']
+    return po
+
+
+def _manufacture_orders(config, rng, catalog, sales_units, start_date):
+    # one manufacture order per SKU and month, sized to the SKU's sales of that month
+    monthly = sales_units.groupby(['sku', pd.Grouper(key='sales_date', freq='MS')])['quantity'].sum().reset_index()
+    monthly['manufacture_date'] = (monthly['sales_date'] - pd.Timedelta(days=7)).clip(lower=pd.Timestamp(start_date) + pd.Timedelta(days=30)).dt.date
+    monthly = monthly.sort_values(['manufacture_date', 'sku']).reset_index(drop=True)
+    monthly['manufacture_order_id'] = np.arange(1, len(monthly) + 1)
+    monthly['manufacture_quantity'] = (monthly['quantity'] * rng.uniform(1.0, 1.15, size=len(monthly))).round().astype(int)
+
+    bom = catalog.melt(id_vars=['sku'], value_vars=['pc_product', 'hardware_product', 'os_product'], value_name='product')[['sku', 'product']]
+    orders = monthly.merge(bom, on='sku')
+    return orders[['manufacture_order_id', 'sku', 'product', 'manufacture_quantity', 'manufacture_date']].drop_duplicates(['sku', 'manufacture_date', 'product'])
+
+
+def _sales(config, rng, catalog, start_date):
+    weights = (catalog['popularity'] / catalog['popularity'].sum()).to_numpy()
+    sales = pd.DataFrame({'sku_position': rng.choice(len(catalog), size=config.sales, p=weights)})
+    sales['sku'] = catalog['sku'].to_numpy()[sales['sku_position']]
+    sales['unit_price'] = catalog['unit_price'].to_numpy()[sales['sku_position']]
+    # first month is stock build-up, sales start afterwards
+    offsets = rng.integers(30, config.days, size=config.sales)
+    sales['purchase_date_pst_pdt'] = pd.Timestamp(start_date) + pd.to_timedelta(offsets, unit='D') + pd.to_timedelta(rng.integers(0, 86400, size=config.sales), unit='s')
+    sales['sales_date'] = sales['purchase_date_pst_pdt'].dt.normalize()
+    sales['quantity'] = rng.choice([1, 1, 1, 2, 3], size=config.sales)
+    sales['amazon_order_id'] = [f"{111 + index % 800:03d}-{index:07d}-{rng_value:07d}" for index, rng_value in enumerate(rng.integers(0, 10 ** 7, size=config.sales))]
+    sales['fulfillment_channel'] = np.where(rng.random(config.sales) < config.fbm_ratio, 'Merchant', 'Amazon')
+    sales['paid'] = rng.random(config.sales) < config.paid_ratio
+    return sales.drop(columns=['sku_position'])
+
+
+def _statements(config, rng, sales, start_date):
+    # 14-day settlements, deposited 3 days after the settlement end
+    paid = sales[sales['paid']].copy()
+    paid['posted'] = paid['purchase_date_pst_pdt'] + pd.to_timedelta(rng.integers(1, 5, size=len(paid)), unit='D')
+    paid['settlement_index'] = ((paid['posted'] - pd.Timestamp(start_date)).dt.days // 14).astype(int)
+
+    settlements = pd.DataFrame({'settlement_index': sorted(paid['settlement_index'].unique())})
+    settlements['settlement_id'] = (10000000 + settlements['settlement_index']).astype(str)
+    settlements['settlement_start_date_pst_pdt'] = pd.Timestamp(start_date) + pd.to_timedelta(settlements['settlement_index'] * 14, unit='D')
+    settlements['settlement_end_date_pst_pdt'] = settlements['settlement_start_date_pst_pdt'] + pd.Timedelta(days=14)
+    settlements['deposit_date_pst_pdt'] = settlements['settlement_end_date_pst_pdt'] + pd.Timedelta(days=3)
+    for column in ['settlement_start_date', 'settlement_end_date', 'deposit_date']:
+        settlements[f'{column}_utc'] = settlements[f'{column}_pst_pdt'] + pd.Timedelta(hours=8)
+    paid = paid.merge(settlements[['settlement_index', 'settlement_id']], on='settlement_index')
+
+    principal = (paid['unit_price'] * paid['quantity']).round(2)
+    detail_amounts = {
+        ('ItemPrice', 'Principal'): principal,
+        ('ItemPrice', 'Tax'): (principal * 0.08).round(2),
+        ('ItemFees', 'Commission'): -(principal * 0.08).round(2),
+        ('ItemFees', 'FBAPerUnitFulfillmentFee'): np.where(paid['fulfillment_channel'] == 'Amazon', -(6.5 * paid['quantity']), 0.0),
+        ('ItemWithheldTax', 'MarketplaceFacilitatorTax-Principal'): -(principal * 0.08).round(2),
+    }
+    details = []
+    for (amount_type, amount_description), amount in detail_amounts.items():
+        details.append(pd.DataFrame({
+            'settlement_id': paid['settlement_id'],
+            'transaction_type': 'Order',
+            'order_id': paid['amazon_order_id'],
+            'marketplace_name': 'Amazon.com',
+            'amount_type': amount_type,
+            'amount_description': amount_description,
+            'amount': amount,
+            'posted_date_time_pst_pdt': paid['posted'],
+            'posted_date_time_utc': paid['posted'] + pd.Timedelta(hours=8),
+            'sku': paid['sku'],
+            'quantity_purchased': paid['quantity'],
+            'currency': 'USD'
+        }))
+    # account level fees without an order id, one of each per settlement, as in real statements
+    non_order_amounts = {
+        ('other-transaction', 'Storage Fee'): -25.0,
+        ('other-transaction', 'Subscription Fee'): -39.99,
+        ('Cost of Advertising', 'TransactionTotalAmount'): -150.0,
+        ('CouponRedemptionFee', 'Coupon Redemption Fee'): -5.0,
+    }
+    settlement_posted = settlements['settlement_end_date_pst_pdt'] - pd.Timedelta(days=1)
+    for (amount_type, amount_description), amount in non_order_amounts.items():
+        details.append(pd.DataFrame({
+            'settlement_id': settlements['settlement_id'],
+            'transaction_type': 'other-transaction',
+            'marketplace_name': 'Amazon.com',
+            'amount_type': amount_type,
+            'amount_description': amount_description,
+            'amount': amount,
+            'posted_date_time_pst_pdt': settlement_posted,
+            'posted_date_time_utc': settlement_posted + pd.Timedelta(hours=8),
+            'currency': 'USD'
+        }))
+    details = pd.concat(details, ignore_index=True)
+    details = details[details['amount'] != 0]
+
+    # the summary row (no transaction_type) carries the settlement period, deposit date and total
+    summary = settlements.drop(columns=['settlement_index'])
+    summary['total_amount'] = details.groupby('settlement_id')['amount'].sum().reindex(summary['settlement_id']).round(2).to_numpy()
+    summary['currency'] = 'USD'
+    return pd.concat([summary, details], ignore_index=True)
+
+
+def generate_synthetic_data(config=None):
+    """
+    Reset the benchmark database and fill it with a synthetic dataset
+
+    Returns:
+        dict: rows inserted per table
+    """
+    config = config or SyntheticDataConfig()
+    rng = np.random.default_rng(config.seed)
+    start_date = config.end_date - timedelta(days=config.days)
+    counts = {}
+
+    reset_database()
+    counts['customers'] = _insert(Customer, [{'customer_id': 1, 'name': 'Amazon'}])
+    counts['suppliers'] = _insert(Supplier, [{'supplier_id': 1, 'name': 'Benchmark Supplier'}])
+
+    catalog = _catalog(config, rng)
+    sales = _sales(config, rng, catalog, start_date)
+
+    purchase_orders = _purchase_orders(config, rng, catalog, 1, start_date)
+    counts['purchaseorders'] = _insert(PurchaseOrder, _records(purchase_orders[[
+        'purchase_order_id', 'supplier_id', 'order_date', 'product', 'purchase_quantity', 'purchase_unit_price',
+        'purchase_currency', 'target_currency', 'fx_rate', 'quantity_left'
+    ]]))
+    counts['manufactureorders'] = _insert(ManufactureOrder, _records(_manufacture_orders(config, rng, catalog, sales, start_date)))
+
+    sales_records = sales.rename(columns={'amazon_order_id': 'sales_record_id', 'quantity': 'quantity_sold'})
+    sales_records['sales_date'] = sales_records['sales_date'].dt.date
+    sales_records['customer_id'] = 1
+    counts['salesrecords'] = _insert(SalesRecord, _records(sales_records[['sales_record_id', 'sales_date', 'sku', 'quantity_sold', 'customer_id']]))
+
+    returns = sales_records.sample(frac=config.return_ratio, random_state=config.seed)
+    returns = pd.DataFrame({
+        'return_order_id': returns['sales_record_id'],
+        'sku': returns['sku'],
+        'return_date': (pd.to_datetime(returns['sales_date']) + pd.Timedelta(days=14)).dt.date,
+        'return_quantity': 1,
+        'return_unit_price': (returns['unit_price'] * 0.5).round(2),
+        'supplier_id': 1,
+        'return_currency': 'USD',
+        'target_currency': 'USD',
+        'fx_rate': 1,
+        'quantity_left': 1
+    })
+    counts['returns'] = _insert(Return, _records(returns))
+
+    exchange_skus = catalog.groupby('ir')['sku'].apply(list)
+    exchange_skus = exchange_skus[exchange_skus.map(len) > 1]
+    exchanges = [
+        {'sku_original': skus[0], 'sku_new': skus[1], 'quantity': 1, 'exchange_date': start_date + timedelta(days=int(offset))}
+        for skus, offset in zip(exchange_skus, rng.integers(60, config.days, size=len(exchange_skus)))
+    ]
+    counts['stockexchange'] = _insert(StockExchange, exchanges)
+
+    orders = sales[['amazon_order_id', 'purchase_date_pst_pdt', 'fulfillment_channel', 'sku', 'quantity', 'unit_price']].copy()
+    orders['purchase_date_utc'] = orders['purchase_date_pst_pdt'] + pd.Timedelta(hours=8)
+    orders['order_status'] = 'Shipped'
+    orders['sales_channel'] = 'Amazon.com'
+    orders['item_status'] = 'Shipped'
+    orders['currency'] = 'USD'
+    orders['item_price'] = (orders['unit_price'] * orders['quantity']).round(2)
+    orders['item_tax'] = (orders['item_price'] * 0.08).round(2)
+    orders['shipping_price'] = 0.0
+    orders['shipping_tax'] = 0.0
+    orders['gift_wrap_price'] = 0.0
+    orders['gift_wrap_tax'] = 0.0
+    orders['item_promotion_discount'] = 0.0
+    orders['ship_promotion_discount'] = 0.0
+    counts['amazonallorders'] = _insert(AmazonAllOrders, _records(orders.drop(columns=['unit_price'])))
+
+    counts['amazonstatements'] = _insert(AmazonStatements, _records(_statements(config, rng, sales, start_date)))
+
+    fbm = sales[sales['fulfillment_channel'] == 'Merchant']
+    counts['fbmshippingcost'] = _insert(FBMShippingCost, _records(pd.DataFrame({
+        'order_id': fbm['amazon_order_id'],
+        'shipping_id': [f"SHIP{index:07d}" for index in range(len(fbm))],
+        'shipping_cost': rng.uniform(8, 25, size=len(fbm)).round(2),
+        'warehouse_cost': rng.uniform(1, 3, size=len(fbm)).round(2),
+        'source': 'benchmark',
+        'payment_date': fbm['purchase_date_pst_pdt'] + pd.Timedelta(days=30)
+    })))
+
+    days = pd.date_range(start_date, config.end_date, freq='D')
+    ads = pd.DataFrame({
+        'date_by_day': np.repeat(days.date, len(catalog)),
+        'sku': np.tile(catalog['sku'].to_numpy(), len(days))
+    })
+    ads['spend'] = rng.gamma(2.0, 3.0, size=len(ads)).round(2)
+    counts['adsspendbyday'] = _insert(AdsSpendByDay, _records(ads))
+
+    months = pd.date_range(start_date, config.end_date, freq='MS')
+    economics = pd.DataFrame({
+        'start_date_pst_pdt': np.repeat(months.date, len(catalog)),
+        'msku': np.tile(catalog['sku'].to_numpy(), len(months))
+    })
+    economics['end_date_pst_pdt'] = (pd.to_datetime(economics['start_date_pst_pdt']) + pd.offsets.MonthEnd(0)).dt.date
+    economics['amazon_store'] = 'US'
+    economics['currency_code'] = 'USD'
+    economics['fba_fulfillment_fees_total'] = -rng.uniform(10, 200, size=len(economics)).round(2)
+    economics['sponsored_products_charge_total'] = -rng.uniform(10, 300, size=len(economics)).round(2)
+    economics['monthly_inventory_storage_fee_total'] = -rng.uniform(1, 30, size=len(economics)).round(2)
+    economics['inbound_transportation_charge_total'] = -rng.uniform(1, 40, size=len(economics)).round(2)
+    counts['skueconomics'] = _insert(SKUEconomics, _records(economics))
+
+    counts['adscreditcardpayment'] = _insert(AdsCreditCardPayment, [
+        {
+            'invoice_id': f"INV{index:05d}",
+            'issued_on': (month + pd.offsets.MonthEnd(0)).date(),
+            'due_date': (month + pd.offsets.MonthEnd(0) + pd.Timedelta(days=15)).date(),
+            'total_amount_billed': round(float(ads.loc[pd.to_datetime(ads['date_by_day']).dt.to_period('M') == month.to_period('M'), 'spend'].sum()), 2)
+        }
+        for index, month in enumerate(months)
+    ])
+
+    shipments = catalog.sample(n=min(len(catalog), max(1, config.skus // 2)), random_state=config.seed)
+    counts['amazoninboundshipping'] = _insert(AmazonInboundShipping, [
+        {
+            'shipment_name': f"Benchmark shipment {index}",
+            'shipment_id': f"FBA{index:07d}",
+            'created_pst_pdt': datetime.combine(start_date + timedelta(days=30 + index), datetime.min.time()),
+            'last_updated_pst_pdt': datetime.combine(start_date + timedelta(days=35 + index), datetime.min.time()),
+            'ship_to': 'LGB8',
+            'units_expected': 50,
+            'units_located': 50,
+            'status': 'Closed',
+            'amazon_partnered_carrier_cost': 120.0,
+            'currency': 'USD',
+            'msku': sku
+        }
+        for index, sku in enumerate(shipments['sku'])
+    ])
+
+    db.session.commit()
+    return counts
@@ -6,17 +6,26 @@ project_root = os.path.abspath(os.path.join(current_directory, os.pardir))
 sys.path.append(project_root)
 
 from backend import app, db
-from backend.models import Customer, Supplier, PurchaseOrder, ManufactureOrder, SalesRecord, Return, ManufactureStockInitiationAddition, ManufactureResult, FailedManufactureResult, Inventory, InventoryRawMaterial, COGS, FailedCOGS, StockExchange, FailedStockExchange
+from backend.models import Customer, Supplier, PurchaseOrder, ManufactureOrder, SalesRecord, Return, ManufactureStockInitiationAddition, ManufactureResult, FailedManufactureResult, Inventory, InventoryRawMaterial, COGS, FailedCOGS, StockExchange, FailedStockExchange, QBReference
 from flask import request, jsonify, send_file
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy import or_, and_, text, func, desc, not_, asc, Computed
 from datetime import datetime, timedelta
 import pandas as pd
+from backend.processing.functions.sku_dimensions import register_skus, register_products
+from backend.processing.functions.pipeline_timing import pipeline_timer
+from backend.processing.functions.change_log import change_tracker
+from backend.processing.functions.bulk_update import settable_columns, rows_by_key, ids_by_name, update_by_key
+from backend.processing.functions.bulk_delete import delete_by_key
+from backend.processing.functions.table_swap import replace_tables
+from backend.processing.functions.fifo_lots import ProductRatioTable
+from backend.processing.functions.fifo_cogs import allocate_sales
+from backend.processing.functions.fifo_manufacture import build_manufacture_results, exchange_stock
+from backend.processing.functions.fifo_simulation import simulate
 
 from werkzeug.utils import secure_filename
 from bs4 import BeautifulSoup
-from dotenv import dotenv_values
 
 # ---------------------------------------------------------------------------------------------------------------
 # Customers CRUD Operations                                                                                      |
@@ -433,6 +442,7 @@ def create_purchase_order():
                 return jsonify({'error': 'Primary key constraint faild: Duplicate combination of purchase order ID and product detected.'}), 400
             else:
                 return jsonify({'error': f'Database error: {str(e)}'}), 500
+        register_products(record['product'] for record in purchase_orders)
         return jsonify({'message': 'Purchase orders created successfully!', 'purchase_orders': purchase_orders}), 201
     else:
         for field in required_fields:
@@ -477,6 +487,7 @@ def create_purchase_order():
                 return jsonify({'error': 'Primary key constraint faild: Duplicate combination of purchase order ID and product detected.'}), 400
             else:
                 return jsonify({'error': f'Database error: {str(e)}'}), 500
+        register_products([new_purchase_order.product])
         return jsonify({'message': 'Purchase order created successfully!', 'purchase_order': new_purchase_order.to_dict()}), 201
 
 # Bulk upload endpoint for purchase orders - optimized for large datasets
@@ -542,6 +553,7 @@ def bulk_create_purchase_orders():
             validated_records
         )
         db.session.commit()
+        register_products(record['product'] for record in validated_records)
         
         return jsonify({
             'message': f'Successfully created {len(validated_records)} purchase orders!',
@@ -603,125 +615,80 @@ def update_purchase_orders():
     if not isinstance(update_data, list) or len(update_data) != len(selected_records):
         return jsonify({'error': 'The update_data must be a list and match the number of selected_records.'}), 400
 
-    # Use session.no_autoflush to prevent autoflush while querying
-    with db.session.no_autoflush:
-        # Build the query for selected records
-        query_conditions = [
-            (PurchaseOrder.purchase_order_id == record['purchase_order_id'].upper()) &
-            (PurchaseOrder.product == record['product'].upper())
-            for record in selected_records
-        ]
-        query = PurchaseOrder.query.filter(or_(*query_conditions))
+    table = PurchaseOrder.__table__
+    key_columns = ['purchase_order_id', 'product']
+    selected_keys = [(record['purchase_order_id'].upper(), record['product'].upper()) for record in selected_records]
+    if len(set(selected_keys)) != len(selected_keys):
+        return jsonify({'error': 'Each record can only be selected once per update.'}), 400
 
-        matching_records = query.all()
-
-        if not matching_records:
-            return jsonify({'error': 'No selected records found for update.'}), 404
-        
-        if len(matching_records) != len(selected_records):
-            # Identify the missing records
-            found_records = {(record.purchase_order_id, record.product) for record in matching_records}
-            missing_records = [
-                record for record in selected_records
-                if (record['purchase_order_id'].upper(), record['product'].upper()) not in found_records
-            ]
-            return jsonify({
-                'error': 'Some selected records were not found for update.',
-                'missing_records': missing_records
-            }), 404
-        
-        updated_identifiers = []
+    # Fetch all selected records in one query
+    stored_records = rows_by_key(table, key_columns, selected_keys)
+    if not stored_records:
+        return jsonify({'error': 'No selected records found for update.'}), 404
 
-        for record_to_update, record_update_data in zip(matching_records, update_data):
-            # Validate required fields
-            required_fields = ['purchase_order_id', 'supplier_name', 'order_date', 'product', 'purchase_quantity', 'purchase_unit_price', 'purchase_currency', 'target_currency', 'fx_rate']
-            for field in required_fields:
-                if field not in record_update_data or not record_update_data[field]:
-                    return jsonify({'error': f'{field} is required for all records'}), 400
-
-            # Handle supplier_name lookup
-            if 'supplier_name' in record_update_data:
-                supplier = Supplier.query.filter(Supplier.name.ilike(record_update_data['supplier_name'])).first()
-                if not supplier:
-                    return jsonify({'error': f'Supplier with name "{record_update_data["supplier_name"]}" not found'}), 404
-                record_to_update.supplier_id = supplier.supplier_id
-
-            # Convert string fields to uppercase
-            if 'purchase_order_id' in record_update_data:
-                record_update_data['purchase_order_id'] = record_update_data['purchase_order_id'].upper()
-            if 'product' in record_update_data:
-                record_update_data['product'] = record_update_data['product'].upper()
-            if 'purchase_currency' in record_update_data:
-                record_update_data['purchase_currency'] = record_update_data['purchase_currency'].upper()
-            if 'target_currency' in record_update_data:
-                record_update_data['target_currency'] = record_update_data['target_currency'].upper()
-
-            # Validate and convert order_date
-            if 'order_date' in record_update_data:
-                try:
-                    record_update_data['order_date'] = datetime.strptime(record_update_data['order_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    return jsonify({'error': 'Invalid date format for order_date. Use YYYY-MM-DD.'}), 400
-
-            # Check if new identifiers already exist
-            new_purchase_order_id = record_update_data.get('purchase_order_id', record_to_update.purchase_order_id)
-            new_product = record_update_data.get('product', record_to_update.product)
-
-            if new_purchase_order_id != record_to_update.purchase_order_id or new_product != record_to_update.product:
-                existing_record = PurchaseOrder.query.filter_by(
-                    purchase_order_id=new_purchase_order_id,
-                    product=new_product
-                ).first()
-
-                if existing_record and existing_record != record_to_update:
-                    return jsonify({'error': f'Record with purchase_order_id "{new_purchase_order_id}" and product "{new_product}" already exists.'}), 400
-
-            # Create a new record with updated identifiers
-            if new_purchase_order_id != record_to_update.purchase_order_id or new_product != record_to_update.product:
-                new_record = PurchaseOrder(
-                    purchase_order_id=new_purchase_order_id,
-                    product=new_product,
-                    supplier_id=record_to_update.supplier_id,
-                    order_date=record_update_data['order_date'],
-                    purchase_quantity=record_update_data['purchase_quantity'],
-                    purchase_unit_price=record_update_data['purchase_unit_price'],
-                    purchase_currency=record_update_data['purchase_currency'],
-                    target_currency=record_update_data['target_currency'],
-                    fx_rate=record_update_data['fx_rate'],
-                    quantity_left=0
-                )
-                db.session.add(new_record)
-                db.session.delete(record_to_update)
-            else:
-                for field, value in record_update_data.items():
-                    if hasattr(record_to_update, field):
-                        setattr(record_to_update, field, value)
-            
-            updated_identifiers.append((new_purchase_order_id, new_product))
+    missing_records = [record for record, key in zip(selected_records, selected_keys) if key not in stored_records]
+    if missing_records:
+        return jsonify({
+            'error': 'Some selected records were not found for update.',
+            'missing_records': missing_records
+        }), 404
 
+    # Validate required fields, convert string fields to uppercase and order_date to a date
+    required_fields = ['purchase_order_id', 'supplier_name', 'order_date', 'product', 'purchase_quantity', 'purchase_unit_price', 'purchase_currency', 'target_currency', 'fx_rate']
+    for record_update_data in update_data:
+        for field in required_fields:
+            if field not in record_update_data or not record_update_data[field]:
+                return jsonify({'error': f'{field} is required for all records'}), 400
+        for field in ('purchase_order_id', 'product', 'purchase_currency', 'target_currency'):
+            record_update_data[field] = record_update_data[field].upper()
         try:
-            db.session.commit()
-        except IntegrityError as e:
-            db.session.rollback()
-            if "FOREIGN KEY constraint" in str(e.orig):
-                return jsonify({'error': 'Foreign key constraint failed: No supplier referenced record exist in Suppliers dataset.'}), 400
-            elif "UNIQUE constraint" in str(e.orig):
-                return jsonify({'error': 'Primary key constraint faild: Duplicate combination of purchase order ID and product detected.'}), 400
-            else:
-                return jsonify({'error': f'Database error: {str(e)}'}), 500
+            record_update_data['order_date'] = datetime.strptime(record_update_data['order_date'], "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format for order_date. Use YYYY-MM-DD.'}), 400
 
-        # Re-query updated records to ensure they are attached to the session
-        updated_records = PurchaseOrder.query.filter(
-            or_(
-                *[
-                    (PurchaseOrder.purchase_order_id == purchase_order_id) &
-                    (PurchaseOrder.product == product)
-                    for purchase_order_id, product in updated_identifiers
-                ]
-            )
-        ).all()
+    # Resolve all supplier names in one query
+    suppliers = ids_by_name(Supplier.name, Supplier.supplier_id, [record['supplier_name'] for record in update_data])
+    for record_update_data in update_data:
+        if record_update_data['supplier_name'].lower() not in suppliers:
+            return jsonify({'error': f'Supplier with name "{record_update_data["supplier_name"]}" not found'}), 404
+
+    columns = settable_columns(table)
+    updates = []
+    for key, record_update_data in zip(selected_keys, update_data):
+        values = {column: stored_records[key][column] for column in columns}
+        values.update({field: value for field, value in record_update_data.items() if field in values})
+        values['supplier_id'] = suppliers[record_update_data['supplier_name'].lower()][0]
+        if (values['purchase_order_id'], values['product']) != key:
+            values['quantity_left'] = 0  # a purchase order under a new identifier starts unallocated
+        updates.append((key, values))
+
+    # Check if new identifiers already exist, for all changed identifiers in one query
+    new_keys = [tuple(values[column] for column in key_columns) for _, values in updates]
+    if len(set(new_keys)) != len(new_keys):
+        return jsonify({'error': 'Primary key constraint faild: Duplicate combination of purchase order ID and product detected.'}), 400
+    existing_records = rows_by_key(table, key_columns, [new for old, new in zip(selected_keys, new_keys) if new != old])
+    if existing_records:
+        new_purchase_order_id, new_product = next(iter(existing_records))
+        return jsonify({'error': f'Record with purchase_order_id "{new_purchase_order_id}" and product "{new_product}" already exists.'}), 400
+
+    try:
+        updated_rows = update_by_key(table, key_columns, updates)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "FOREIGN KEY constraint" in str(e.orig):
+            return jsonify({'error': 'Foreign key constraint failed: No supplier referenced record exist in Suppliers dataset.'}), 400
+        elif "UNIQUE constraint" in str(e.orig):
+            return jsonify({'error': 'Primary key constraint faild: Duplicate combination of purchase order ID and product detected.'}), 400
+        else:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-        return jsonify({'message': 'Selected purchase orders updated successfully!', 'updated_records': [record.to_dict() for record in updated_records]})
+    register_products(row['product'] for row in updated_rows)
+    supplier_names = dict(suppliers.values())
+    updated_records = [
+        {**PurchaseOrder(**row).to_dict(), 'supplier_name': supplier_names.get(row['supplier_id'])} for row in updated_rows
+    ]
+    return jsonify({'message': 'Selected purchase orders updated successfully!', 'updated_records': updated_records})
 
 # Delete one or multiple records
 @app.route('/purchase_orders/delete', methods=['DELETE'])
@@ -731,60 +698,40 @@ def delete_purchase_orders():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
 
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-
-    for selected_record in selected_records:
-        purchase_order_id = selected_record.get('purchase_order_id', '').upper()
-        product = selected_record.get('product', '').upper()
-
-        # Query the matching record
-        record_to_delete = PurchaseOrder.query.filter_by(
-            purchase_order_id=purchase_order_id,
-            product=product
-        ).first()
-
-        if not record_to_delete:
-            failed_deletes.append({
-                'purchase_order_id': purchase_order_id,
-                'product': product,
-                'error': 'Record not found in Purchase Orders.'
-            })
-            continue
-
-        # Check for references in the ManufactureResult table
-        linked_records = ManufactureResult.query.filter_by(
-            fulfilled_by_po=purchase_order_id,
-            product=product
-        ).all()
-
-        if linked_records:
-            failed_deletes.append({
-                'purchase_order_id': purchase_order_id,
-                'product': product,
-                'error': 'Record is referenced in the ManufactureResult table and cannot be deleted.',
-                'dependent_records': [record.to_dict() for record in linked_records]
-            })
-            continue
-
-        # Delete the record if no references exist
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'purchase_order_id': purchase_order_id,
-            'product': product,
-            'message': 'Record deleted successfully.'
-        })
+    keys = [
+        (selected_record.get('purchase_order_id', '').upper(), selected_record.get('product', '').upper())
+        for selected_record in selected_records
+    ]
 
-    # Commit the transaction if there are successful deletes
+    # Delete the records not referenced in the ManufactureResult table in one statement
     try:
-        if success_deletes:
+        result = delete_by_key(
+            PurchaseOrder.__table__, ['purchase_order_id', 'product'], keys,
+            references=[(ManufactureResult.__table__, ['fulfilled_by_po', 'product'])]
+        )
+        if result['deleted']:
             db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
 
     # Return the response with details for both successful and failed deletes
+    success_deletes = [
+        {'purchase_order_id': purchase_order_id, 'product': product, 'message': 'Record deleted successfully.'}
+        for purchase_order_id, product in result['deleted']
+    ]
+    failed_deletes = [
+        {'purchase_order_id': purchase_order_id, 'product': product, 'error': 'Record not found in Purchase Orders.'}
+        for purchase_order_id, product in result['missing']
+    ] + [
+        {
+            'purchase_order_id': purchase_order_id,
+            'product': product,
+            'error': 'Record is referenced in the ManufactureResult table and cannot be deleted.',
+            'dependent_records': [ManufactureResult(**row).to_dict() for row in dependents['manufactureresult']]
+        }
+        for (purchase_order_id, product), dependents in result['referenced'].items()
+    ]
     return jsonify({
         'success_deletes': success_deletes,
         'failed_deletes': failed_deletes
@@ -834,48 +781,22 @@ def bulk_delete_purchase_orders():
                 return jsonify({'error': 'Each record must contain purchase_order_id and product'}), 400
             record_identifiers.append((record['purchase_order_id'], record['product']))
         
-        # Get the records that will be deleted to check for references
-        records_to_delete = []
-        for purchase_order_id, product in record_identifiers:
-            record = db.session.query(PurchaseOrder).filter_by(
-                purchase_order_id=purchase_order_id,
-                product=product
-            ).first()
-            if record:
-                records_to_delete.append(record)
-        
-        # Check for ManufactureResult references
-        error_messages = []
-        valid_records = []
-        
-        for record in records_to_delete:
-            has_references = False
-            
-            # Check for ManufactureResult references
-            manufacture_references = db.session.query(ManufactureResult).filter_by(
-                fulfilled_by_po=record.purchase_order_id,
-                product=record.product
-            ).first()
-            
-            if manufacture_references:
-                error_messages.append(f'Purchase order {record.purchase_order_id} (product: {record.product}) is referenced in the ManufactureResult table')
-                has_references = True
-            
-            if not has_references:
-                valid_records.append(record)
-        
-        # If there are any reference errors, return them all
-        if error_messages:
+        # Nothing is deleted when any selected record is referenced in the ManufactureResult table
+        result = delete_by_key(
+            PurchaseOrder.__table__, ['purchase_order_id', 'product'], record_identifiers,
+            references=[(ManufactureResult.__table__, ['fulfilled_by_po', 'product'])], partial=False
+        )
+        if result['referenced']:
+            db.session.rollback()
+            error_messages = [
+                f'Purchase order {purchase_order_id} (product: {product}) is referenced in the ManufactureResult table'
+                for purchase_order_id, product in result['referenced']
+            ]
             return jsonify({
                 'error': f'Cannot delete some records due to foreign key constraints:\n' + '\n'.join(error_messages)
             }), 400
-        
-        # Delete only the valid records (those without foreign key references)
-        num_deleted = 0
-        for record in valid_records:
-            db.session.delete(record)
-            num_deleted += 1
-        
+
+        num_deleted = len(result['deleted'])
         db.session.commit()
         
         return jsonify({
@@ -1073,130 +994,75 @@ def update_manufacture_orders():
     if not isinstance(update_data, list) or len(update_data) != len(selected_records):
         return jsonify({'error': 'The update_data must be a list and match the number of selected_records.'}), 400
 
-    # Use session.no_autoflush to prevent autoflush while querying
-    with db.session.no_autoflush:
-        # Build the query for selected records
-        query_conditions = [
-            (ManufactureOrder.sku == record['sku'].upper()) &
-            (ManufactureOrder.manufacture_date == record['manufacture_date']) &
-            (ManufactureOrder.product == record['product'].upper())
+    table = ManufactureOrder.__table__
+    key_columns = ['sku', 'manufacture_date', 'product']
+    try:
+        selected_keys = [
+            (record['sku'].upper(), datetime.strptime(record['manufacture_date'], "%Y-%m-%d").date(), record['product'].upper())
             for record in selected_records
         ]
-        query = ManufactureOrder.query.filter(or_(*query_conditions))
-
-        matching_records = query.all()
-
-        if not matching_records:
-            return jsonify({'error': 'No selected records found for update.'}), 404
-        
-        if len(matching_records) != len(selected_records):
-            # Identify the missing records
-            found_records = {
-                (record.sku, record.manufacture_date, record.product)
-                for record in matching_records
-            }
-            missing_records = [
-                record for record in selected_records
-                if (
-                    record['sku'].upper(),
-                    record['manufacture_date'],
-                    record['product'].upper()
-                ) not in found_records
-            ]
-            return jsonify({
-                'error': 'Some selected records were not found for update.',
-                'missing_records': missing_records
-            }), 404
-
-        updated_identifiers = []
-
-        for record_to_update, record_update_data in zip(matching_records, update_data):
-            # Validate required fields
-            required_fields = ['sku', 'product', 'manufacture_quantity', 'manufacture_date']
-            for field in required_fields:
-                if field not in record_update_data or not record_update_data[field]:
-                    return jsonify({'error': f'{field} is required for all records'}), 400
-
-            # Convert sku and product to uppercase
-            if 'sku' in record_update_data:
-                record_update_data['sku'] = record_update_data['sku'].upper()
-            if 'product' in record_update_data:
-                record_update_data['product'] = record_update_data['product'].upper()
-
-            # Validate and convert manufacture_date
-            if 'manufacture_date' in record_update_data:
-                try:
-                    record_update_data['manufacture_date'] = datetime.strptime(
-                        record_update_data['manufacture_date'], "%Y-%m-%d"
-                    ).date()
-                except ValueError:
-                    return jsonify({'error': 'Invalid date format for manufacture_date. Use YYYY-MM-DD.'}), 400
-
-            # Check if new identifiers already exist
-            new_sku = record_update_data.get('sku', record_to_update.sku)
-            new_product = record_update_data.get('product', record_to_update.product)
-            new_manufacture_date = record_update_data.get('manufacture_date', record_to_update.manufacture_date)
-
-            if (
-                new_sku != record_to_update.sku
-                or new_product != record_to_update.product
-                or new_manufacture_date != record_to_update.manufacture_date
-            ):
-                existing_record = ManufactureOrder.query.filter_by(
-                    sku=new_sku,
-                    product=new_product,
-                    manufacture_date=new_manufacture_date
-                ).first()
-
-                if existing_record and existing_record != record_to_update:
-                    return jsonify({
-                        'error': f'Record with sku "{new_sku}", product "{new_product}", and manufacture_date "{new_manufacture_date}" already exists.'
-                    }), 400
-
-            # Create a new record with updated identifiers if necessary
-            if (
-                new_sku != record_to_update.sku
-                or new_product != record_to_update.product
-                or new_manufacture_date != record_to_update.manufacture_date
-            ):
-                new_record = ManufactureOrder(
-                    sku=new_sku,
-                    product=new_product,
-                    manufacture_quantity=record_update_data['manufacture_quantity'],
-                    manufacture_date=new_manufacture_date,
-                    manufacture_order_id=record_to_update.manufacture_order_id
-                )
-                db.session.add(new_record)
-                db.session.delete(record_to_update)
-            else:
-                for field, value in record_update_data.items():
-                    if hasattr(record_to_update, field):
-                        setattr(record_to_update, field, value)
-
-            updated_identifiers.append((new_sku, new_product, new_manufacture_date))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format for manufacture_date. Use YYYY-MM-DD.'}), 400
+    if len(set(selected_keys)) != len(selected_keys):
+        return jsonify({'error': 'Each record can only be selected once per update.'}), 400
+
+    # Fetch all selected records in one query
+    stored_records = rows_by_key(table, key_columns, selected_keys)
+    if not stored_records:
+        return jsonify({'error': 'No selected records found for update.'}), 404
+
+    missing_records = [record for record, key in zip(selected_records, selected_keys) if key not in stored_records]
+    if missing_records:
+        return jsonify({
+            'error': 'Some selected records were not found for update.',
+            'missing_records': missing_records
+        }), 404
 
+    # Validate required fields, convert sku and product to uppercase and manufacture_date to a date
+    required_fields = ['sku', 'product', 'manufacture_quantity', 'manufacture_date']
+    for record_update_data in update_data:
+        for field in required_fields:
+            if field not in record_update_data or not record_update_data[field]:
+                return jsonify({'error': f'{field} is required for all records'}), 400
+        record_update_data['sku'] = record_update_data['sku'].upper()
+        record_update_data['product'] = record_update_data['product'].upper()
         try:
-            db.session.commit()
-        except IntegrityError as e:
-            db.session.rollback()
-            if "UNIQUE constraint" in str(e.orig):
-                return jsonify({'error': 'Primary key constraint failed: Duplicate combination of sku, manufacture date, and product detected.'}), 400
-            else:
-                return jsonify({'error': f'Database error: {str(e)}'}), 500
+            record_update_data['manufacture_date'] = datetime.strptime(
+                record_update_data['manufacture_date'], "%Y-%m-%d"
+            ).date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format for manufacture_date. Use YYYY-MM-DD.'}), 400
+
+    columns = settable_columns(table)
+    updates = []
+    for key, record_update_data in zip(selected_keys, update_data):
+        values = {column: stored_records[key][column] for column in columns}
+        values.update({field: value for field, value in record_update_data.items() if field in values})
+        updates.append((key, values))
+
+    # Check if new identifiers already exist, for all changed identifiers in one query
+    new_keys = [tuple(values[column] for column in key_columns) for _, values in updates]
+    if len(set(new_keys)) != len(new_keys):
+        return jsonify({'error': 'Primary key constraint failed: Duplicate combination of sku, manufacture date, and product detected.'}), 400
+    existing_records = rows_by_key(table, key_columns, [new for old, new in zip(selected_keys, new_keys) if new != old])
+    if existing_records:
+        new_sku, new_manufacture_date, new_product = next(iter(existing_records))
+        return jsonify({
+            'error': f'Record with sku "{new_sku}", product "{new_product}", and manufacture_date "{new_manufacture_date}" already exists.'
+        }), 400
 
-        # Re-query updated records to ensure they are attached to the session
-        updated_records = ManufactureOrder.query.filter(
-            or_(
-                *[
-                    (ManufactureOrder.sku == sku) &
-                    (ManufactureOrder.product == product) &
-                    (ManufactureOrder.manufacture_date == manufacture_date)
-                    for sku, product, manufacture_date in updated_identifiers
-                ]
-            )
-        ).all()
+    try:
+        updated_rows = update_by_key(table, key_columns, updates)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "UNIQUE constraint" in str(e.orig):
+            return jsonify({'error': 'Primary key constraint failed: Duplicate combination of sku, manufacture date, and product detected.'}), 400
+        else:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-        return jsonify({'message': 'Selected manufacture orders updated successfully!','updated_records': [record.to_dict() for record in updated_records]})
+    updated_records = [ManufactureOrder(**row).to_dict() for row in updated_rows]
+    return jsonify({'message': 'Selected manufacture orders updated successfully!','updated_records': updated_records})
 
 # Delete one or multiple records
 @app.route('/manufacture_orders/delete', methods=['DELETE'])
@@ -1206,49 +1072,41 @@ def delete_manufacture_orders():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
 
-    # Initialize response containers
-    success_deletes = []
+    keys = []
     failed_deletes = []
-
     for selected_record in selected_records:
         sku = selected_record.get('sku', '').upper()
         manufacture_date = selected_record.get('manufacture_date', '')
         product = selected_record.get('product', '').upper()
-
-        # Query the matching record
-        record_to_delete = ManufactureOrder.query.filter_by(
-            sku=sku,
-            manufacture_date=manufacture_date,
-            product=product
-        ).first()
-
-        if not record_to_delete:
+        try:
+            keys.append((sku, datetime.strptime(manufacture_date, "%Y-%m-%d").date(), product))
+        except (TypeError, ValueError):
+            # No record can match an invalid date
             failed_deletes.append({
                 'sku': sku,
                 'manufacture_date': manufacture_date,
                 'product': product,
                 'error': 'Record not found in ManufactureOrders table.'
             })
-            continue
-
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'sku': sku,
-            'manufacture_date': manufacture_date,
-            'product': product,
-            'message': 'Record deleted successfully.'
-        })
 
-    # Commit the transaction if there are successful deletes
+    # Delete the matching records in one statement
     try:
-        if success_deletes:
+        result = delete_by_key(ManufactureOrder.__table__, ['sku', 'manufacture_date', 'product'], keys)
+        if result['deleted']:
             db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
 
     # Return the response with details for both successful and failed deletes
+    success_deletes = [
+        {'sku': sku, 'manufacture_date': manufacture_date.isoformat(), 'product': product, 'message': 'Record deleted successfully.'}
+        for sku, manufacture_date, product in result['deleted']
+    ]
+    failed_deletes += [
+        {'sku': sku, 'manufacture_date': manufacture_date.isoformat(), 'product': product, 'error': 'Record not found in ManufactureOrders table.'}
+        for sku, manufacture_date, product in result['missing']
+    ]
     return jsonify({
         'success_deletes': success_deletes,
         'failed_deletes': failed_deletes
@@ -1286,10 +1144,9 @@ def bulk_delete_manufacture_orders():
         return jsonify({'message': 'No records to delete'}), 200
     
     try:
-        # Bulk delete using SQLAlchemy core for better performance
-        num_deleted = db.session.query(ManufactureOrder).filter(
-            ManufactureOrder.id.in_(record_ids)
-        ).delete(synchronize_session=False)
+        # Bulk delete through a staged id list joined in one statement
+        result = delete_by_key(ManufactureOrder.__table__, ['id'], [(record_id,) for record_id in record_ids])
+        num_deleted = len(result['deleted'])
         
         db.session.commit()
         
@@ -1347,6 +1204,7 @@ def create_sales_record():
                 return jsonify({'error': 'Primary key constraint faild: Duplicate combination of Sales Record ID and SKU detected.'}), 400
             else:
                 return jsonify({'error': f'Database error: {str(e)}'}), 500
+        register_skus(record['sku'] for record in sales_records)
         return jsonify({'message': 'Sales records created successfully!', 'sales_records': sales_records}), 201
     else:
         for field in required_fields:
@@ -1375,6 +1233,7 @@ def create_sales_record():
                 return jsonify({'error': 'Primary key constraint faild: Duplicate combination of Sales Record ID and SKU detected.'}), 400
             else:
                 return jsonify({'error': f'Database error: {str(e)}'}), 500
+        register_skus([new_sales_record.sku])
 
         return jsonify({'message': 'Sales record created successfully!', 'sales_record': new_sales_record.to_dict()}), 201
 
@@ -1436,6 +1295,7 @@ def bulk_create_sales_records():
             validated_records
         )
         db.session.commit()
+        register_skus(record['sku'] for record in validated_records)
         
         return jsonify({
             'message': f'Successfully created {len(validated_records)} sales records!',
@@ -1530,121 +1390,78 @@ def update_sales_records():
     if not isinstance(update_data, list) or len(update_data) != len(selected_records):
         return jsonify({'error': 'The update_data must be a list and match the number of selected_records.'}), 400
 
-    # Use session.no_autoflush to prevent autoflush while querying
-    with db.session.no_autoflush:
-        # Build the query for selected records
-        query_conditions = [
-            (SalesRecord.sales_record_id == record['sales_record_id'].upper()) &
-            (SalesRecord.sku == record['sku'].upper())
-            for record in selected_records
-        ]
-        query = SalesRecord.query.filter(or_(*query_conditions))
-
-        matching_records = query.all()
-
-        if not matching_records:
-            return jsonify({'error': 'No selected records found for update.'}), 404
-        
-        if len(matching_records) != len(selected_records):
-            # Identify the missing records
-            found_records = {(record.sales_record_id, record.sku) for record in matching_records}
-            missing_records = [
-                record for record in selected_records
-                if (record['sales_record_id'].upper(), record['sku'].upper()) not in found_records
-            ]
-            return jsonify({
-                'error': 'Some selected records were not found for update.',
-                'missing_records': missing_records
-            }), 404
-
-        updated_identifiers = []
-
-        for record_to_update, record_update_data in zip(matching_records, update_data):
-            # Validate required fields
-            required_fields = ['sales_record_id', 'sales_date', 'sku', 'quantity_sold', 'customer_name']
-            for field in required_fields:
-                if field not in record_update_data or not record_update_data[field]:
-                    return jsonify({'error': f'{field} is required for all records'}), 400
+    table = SalesRecord.__table__
+    key_columns = ['sales_record_id', 'sku']
+    selected_keys = [(record['sales_record_id'].upper(), record['sku'].upper()) for record in selected_records]
+    if len(set(selected_keys)) != len(selected_keys):
+        return jsonify({'error': 'Each record can only be selected once per update.'}), 400
 
-            # Handle customer_name lookup
-            if 'customer_name' in record_update_data:
-                customer = Customer.query.filter(Customer.name.ilike(record_update_data['customer_name'])).first()
-                if not customer:
-                    return jsonify({'error': f'Customer with name "{record_update_data["customer_name"]}" not found'}), 404
-                record_to_update.customer_id = customer.customer_id
-
-            # Convert string fields to uppercase
-            if 'sales_record_id' in record_update_data:
-                record_update_data['sales_record_id'] = record_update_data['sales_record_id'].upper()
-            if 'sku' in record_update_data:
-                record_update_data['sku'] = record_update_data['sku'].upper()
-
-            # Validate and convert sales_date
-            if 'sales_date' in record_update_data:
-                try:
-                    record_update_data['sales_date'] = datetime.strptime(record_update_data['sales_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    return jsonify({'error': 'Invalid date format for sales_date. Use YYYY-MM-DD.'}), 400
-
-            # Check if new identifiers already exist
-            new_sales_record_id = record_update_data.get('sales_record_id', record_to_update.sales_record_id)
-            new_sku = record_update_data.get('sku', record_to_update.sku)
-
-            if new_sales_record_id != record_to_update.sales_record_id or new_sku != record_to_update.sku:
-                existing_record = SalesRecord.query.filter_by(
-                    sales_record_id=new_sales_record_id,
-                    sku=new_sku
-                ).first()
-
-                if existing_record and existing_record != record_to_update:
-                    return jsonify({'error': f'Record with sales_record_id "{new_sales_record_id}" and sku "{new_sku}" already exists.'}), 400
-
-            # Create a new record with updated identifiers if primary keys change
-            if new_sales_record_id != record_to_update.sales_record_id or new_sku != record_to_update.sku:
-                new_record = SalesRecord(
-                    sales_record_id=new_sales_record_id,
-                    sales_date=record_update_data['sales_date'],
-                    sku=new_sku,
-                    quantity_sold=record_update_data['quantity_sold'],
-                    customer_id=record_to_update.customer_id
-                )
-                db.session.add(new_record)
-                db.session.delete(record_to_update)
-            else:
-                # Update the existing record
-                for field, value in record_update_data.items():
-                    # Map frontend field names to database field names  
-                    if field == 'sku':
-                        if hasattr(record_to_update, 'sku'):
-                            setattr(record_to_update, 'sku', value)
-                    elif hasattr(record_to_update, field):
-                        setattr(record_to_update, field, value)
+    # Fetch all selected records in one query
+    stored_records = rows_by_key(table, key_columns, selected_keys)
+    if not stored_records:
+        return jsonify({'error': 'No selected records found for update.'}), 404
 
-            updated_identifiers.append((new_sales_record_id, new_sku))
+    missing_records = [record for record, key in zip(selected_records, selected_keys) if key not in stored_records]
+    if missing_records:
+        return jsonify({
+            'error': 'Some selected records were not found for update.',
+            'missing_records': missing_records
+        }), 404
 
+    # Validate required fields, convert string fields to uppercase and sales_date to a date
+    required_fields = ['sales_record_id', 'sales_date', 'sku', 'quantity_sold', 'customer_name']
+    for record_update_data in update_data:
+        for field in required_fields:
+            if field not in record_update_data or not record_update_data[field]:
+                return jsonify({'error': f'{field} is required for all records'}), 400
+        record_update_data['sales_record_id'] = record_update_data['sales_record_id'].upper()
+        record_update_data['sku'] = record_update_data['sku'].upper()
         try:
-            db.session.commit()
-        except IntegrityError as e:
-            db.session.rollback()
-            if "FOREIGN KEY constraint" in str(e.orig):
-                return jsonify({'error': 'Foreign key constraint failed: No customer referenced record exists in Customers dataset.'}), 400
-            elif "UNIQUE constraint" in str(e.orig):
-                return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Sales Record ID and SKU detected.'}), 400
-            else:
-                return jsonify({'error': f'Database error: {str(e)}'}), 500
+            record_update_data['sales_date'] = datetime.strptime(record_update_data['sales_date'], "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format for sales_date. Use YYYY-MM-DD.'}), 400
+
+    # Resolve all customer names in one query
+    customers = ids_by_name(Customer.name, Customer.customer_id, [record['customer_name'] for record in update_data])
+    for record_update_data in update_data:
+        if record_update_data['customer_name'].lower() not in customers:
+            return jsonify({'error': f'Customer with name "{record_update_data["customer_name"]}" not found'}), 404
+
+    columns = settable_columns(table)
+    updates = []
+    for key, record_update_data in zip(selected_keys, update_data):
+        values = {column: stored_records[key][column] for column in columns}
+        values.update({field: value for field, value in record_update_data.items() if field in values})
+        values['customer_id'] = customers[record_update_data['customer_name'].lower()][0]
+        updates.append((key, values))
+
+    # Check if new identifiers already exist, for all changed identifiers in one query
+    new_keys = [tuple(values[column] for column in key_columns) for _, values in updates]
+    if len(set(new_keys)) != len(new_keys):
+        return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Sales Record ID and SKU detected.'}), 400
+    existing_records = rows_by_key(table, key_columns, [new for old, new in zip(selected_keys, new_keys) if new != old])
+    if existing_records:
+        new_sales_record_id, new_sku = next(iter(existing_records))
+        return jsonify({'error': f'Record with sales_record_id "{new_sales_record_id}" and sku "{new_sku}" already exists.'}), 400
 
-        # Re-query updated records to ensure they are attached to the session
-        updated_records = SalesRecord.query.filter(
-            or_(
-                *[
-                    (SalesRecord.sales_record_id == sales_record_id) &
-                    (SalesRecord.sku == SKU)
-                    for sales_record_id, SKU in updated_identifiers
-                ]
-            )
-        ).all()
+    try:
+        updated_rows = update_by_key(table, key_columns, updates)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "FOREIGN KEY constraint" in str(e.orig):
+            return jsonify({'error': 'Foreign key constraint failed: No customer referenced record exists in Customers dataset.'}), 400
+        elif "UNIQUE constraint" in str(e.orig):
+            return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Sales Record ID and SKU detected.'}), 400
+        else:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-        return jsonify({'message': 'Selected sales records updated successfully!', 'updated_records': [record.to_dict() for record in updated_records]})
+    register_skus(row['sku'] for row in updated_rows)
+    customer_names = dict(customers.values())
+    updated_records = [
+        {**SalesRecord(**row).to_dict(), 'customer_name': customer_names.get(row['customer_id'])} for row in updated_rows
+    ]
+    return jsonify({'message': 'Selected sales records updated successfully!', 'updated_records': updated_records})
 
 # Delete one or multiple records
 @app.route('/sales_records/delete', methods=['DELETE'])
@@ -1654,75 +1471,44 @@ def delete_sales_records():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
 
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-
-    for selected_record in selected_records:
-        sales_record_id = selected_record.get('sales_record_id', '').upper()
-        sku = selected_record.get('sku', '').upper()
-
-        # Query the matching record
-        record_to_delete = SalesRecord.query.filter_by(
-            sales_record_id=sales_record_id,
-            sku=sku
-        ).first()
-
-        if not record_to_delete:
-            failed_deletes.append({
-                'sales_record_id': sales_record_id,
-                'sku': sku,
-                'error': 'Record not found in SalesRecords table.'
-            })
-            continue
-
-        # Check for references in COGS table
-        cogs_references = COGS.query.filter_by(
-            sales_record_id=sales_record_id,
-            sku=sku
-        ).all()
-
-        if cogs_references:
-            failed_deletes.append({
-                'sales_record_id': sales_record_id,
-                'sku': sku,
-                'error': 'Record is referenced in the COGS table and cannot be deleted.',
-                'dependent_records': [record.to_dict() for record in cogs_references]
-            })
-            continue
-
-        # Check for references in Returns table
-        return_references = Return.query.filter_by(
-            return_order_id=sales_record_id,
-            sku=sku
-        ).all()
-
-        if return_references:
-            failed_deletes.append({
-                'sales_record_id': sales_record_id,
-                'sku': sku,
-                'error': 'Record is referenced in the Returns table and cannot be deleted.',
-                'dependent_records': [record.to_dict() for record in return_references]
-            })
-            continue
+    keys = [
+        (selected_record.get('sales_record_id', '').upper(), selected_record.get('sku', '').upper())
+        for selected_record in selected_records
+    ]
 
-        # Delete the record if no references exist
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'sales_record_id': sales_record_id,
-            'sku': sku,
-            'message': 'Record deleted successfully.'
-        })
-
-    # Commit the transaction if there are successful deletes
+    # Delete the records not referenced in the COGS or Returns tables in one statement
     try:
-        if success_deletes:
+        result = delete_by_key(
+            SalesRecord.__table__, ['sales_record_id', 'sku'], keys,
+            references=[(COGS.__table__, ['sales_record_id', 'sku']), (Return.__table__, ['return_order_id', 'sku'])]
+        )
+        if result['deleted']:
             db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
 
     # Return the response with details for both successful and failed deletes
+    success_deletes = [
+        {'sales_record_id': sales_record_id, 'sku': sku, 'message': 'Record deleted successfully.'}
+        for sales_record_id, sku in result['deleted']
+    ]
+    failed_deletes = [
+        {'sales_record_id': sales_record_id, 'sku': sku, 'error': 'Record not found in SalesRecords table.'}
+        for sales_record_id, sku in result['missing']
+    ]
+    for (sales_record_id, sku), dependents in result['referenced'].items():
+        # COGS references are reported first, as a record referenced in both tables used to be
+        if 'cogs' in dependents:
+            error, dependent_records = 'COGS', [COGS(**row).to_dict() for row in dependents['cogs']]
+        else:
+            error, dependent_records = 'Returns', [Return(**row).to_dict() for row in dependents['returns']]
+        failed_deletes.append({
+            'sales_record_id': sales_record_id,
+            'sku': sku,
+            'error': f'Record is referenced in the {error} table and cannot be deleted.',
+            'dependent_records': dependent_records
+        })
     return jsonify({
         'success_deletes': success_deletes,
         'failed_deletes': failed_deletes
@@ -1777,58 +1563,24 @@ def bulk_delete_sales_records():
                 return jsonify({'error': 'Each record must contain sales_record_id and sku'}), 400
             record_identifiers.append((record['sales_record_id'], record['sku']))
         
-        # Get the records that will be deleted to check for references
-        records_to_delete = []
-        for sales_record_id, sku in record_identifiers:
-            record = db.session.query(SalesRecord).filter_by(
-                sales_record_id=sales_record_id,
-                sku=sku
-            ).first()
-            if record:
-                records_to_delete.append(record)
-        
-        # Check for COGS and Returns references
-        error_messages = []
-        valid_records = []
-        
-        for record in records_to_delete:
-            has_references = False
-            
-            # Check for COGS references
-            cogs_references = db.session.query(COGS).filter_by(
-                sales_record_id=record.sales_record_id,
-                sku=record.sku
-            ).first()
-            
-            if cogs_references:
-                error_messages.append(f'Sales record {record.sales_record_id} (sku: {record.sku}) is referenced in the COGS table')
-                has_references = True
-                
-            # Check for Returns references
-            return_references = db.session.query(Return).filter_by(
-                return_order_id=record.sales_record_id,
-                sku=record.sku
-            ).first()
-            
-            if return_references:
-                error_messages.append(f'Sales record {record.sales_record_id} (sku: {record.sku}) is referenced in the Returns table')
-                has_references = True
-            
-            if not has_references:
-                valid_records.append(record)
-        
-        # If there are any reference errors, return them all
-        if error_messages:
+        # Nothing is deleted when any selected record is referenced in the COGS or Returns tables
+        result = delete_by_key(
+            SalesRecord.__table__, ['sales_record_id', 'sku'], record_identifiers,
+            references=[(COGS.__table__, ['sales_record_id', 'sku']), (Return.__table__, ['return_order_id', 'sku'])],
+            partial=False
+        )
+        if result['referenced']:
+            db.session.rollback()
+            error_messages = []
+            for (sales_record_id, sku), dependents in result['referenced'].items():
+                for table_name, table in (('cogs', 'COGS'), ('returns', 'Returns')):
+                    if table_name in dependents:
+                        error_messages.append(f'Sales record {sales_record_id} (sku: {sku}) is referenced in the {table} table')
             return jsonify({
                 'error': f'Cannot delete some records due to foreign key constraints:\n' + '\n'.join(error_messages)
             }), 400
-        
-        # Delete only the valid records (those without foreign key references)
-        num_deleted = 0
-        for record in valid_records:
-            db.session.delete(record)
-            num_deleted += 1
-        
+
+        num_deleted = len(result['deleted'])
         db.session.commit()
         
         return jsonify({
@@ -1992,138 +1744,86 @@ def update_returns():
     if not isinstance(update_data, list) or len(update_data) != len(selected_records):
         return jsonify({'error': 'The update_data must be a list and match the number of selected_records.'}), 400
 
-    # Use session.no_autoflush to prevent autoflush while querying
-    with db.session.no_autoflush:
-        # Build the query for selected records
-        query_conditions = [
-            (Return.return_order_id == record['return_order_id'].upper()) &
-            (Return.SKU == record['SKU'].upper()) &
-            (Return.return_date == record['return_date'])
+    table = Return.__table__
+    key_columns = ['return_order_id', 'sku', 'return_date']
+    try:
+        selected_keys = [
+            (record['return_order_id'].upper(), record['SKU'].upper(), datetime.strptime(record['return_date'], "%Y-%m-%d").date())
             for record in selected_records
         ]
-        query = Return.query.filter(or_(*query_conditions))
-
-        matching_records = query.all()
-
-        if not matching_records:
-            return jsonify({'error': 'No selected records found for update.'}), 404
-        
-        if len(matching_records) != len(selected_records):
-            # Identify the missing records
-            found_records = {
-                (record.return_order_id, record.SKU, record.return_date)
-                for record in matching_records
-            }
-            missing_records = [
-                record for record in selected_records
-                if (
-                    record['return_order_id'].upper(),
-                    record['SKU'].upper(),
-                    datetime.strptime(record['return_date'], "%Y-%m-%d").date()
-                ) not in found_records
-            ]
-            return jsonify({
-                'error': 'Some selected records were not found for update.',
-                'missing_records': missing_records
-            }), 404
-
-        updated_identifiers = []
-
-        for record_to_update, record_update_data in zip(matching_records, update_data):
-            # Validate required fields
-            required_fields = ['return_order_id', 'SKU', 'return_date', 'return_quantity', 'return_unit_price', 'supplier_name', 'return_currency', 'target_currency', 'fx_rate']
-            for field in required_fields:
-                if field not in record_update_data or not record_update_data[field]:
-                    return jsonify({'error': f'{field} is required for all records'}), 400
-
-            # Handle supplier_name lookup
-            if 'supplier_name' in record_update_data:
-                supplier = Supplier.query.filter(Supplier.name.ilike(record_update_data['supplier_name'])).first()
-                if not supplier:
-                    return jsonify({'error': f'Supplier with name "{record_update_data["supplier_name"]}" not found'}), 404
-                record_to_update.supplier_id = supplier.supplier_id
-
-            # Convert string fields to uppercase
-            if 'return_order_id' in record_update_data:
-                record_update_data['return_order_id'] = record_update_data['return_order_id'].upper()
-            if 'SKU' in record_update_data:
-                record_update_data['SKU'] = record_update_data['SKU'].upper()
-            if 'return_currency' in record_update_data:
-                record_update_data['return_currency'] = record_update_data['return_currency'].upper()
-            if 'target_currency' in record_update_data:
-                record_update_data['target_currency'] = record_update_data['target_currency'].upper()
-
-            # Validate and convert return_date
-            if 'return_date' in record_update_data:
-                try:
-                    record_update_data['return_date'] = datetime.strptime(record_update_data['return_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    return jsonify({'error': 'Invalid date format for return_date. Use YYYY-MM-DD.'}), 400
-
-            # Check if new identifiers already exist
-            new_return_order_id = record_update_data.get('return_order_id', record_to_update.return_order_id)
-            new_SKU = record_update_data.get('SKU', record_to_update.SKU)
-            new_return_date = record_update_data.get('return_date', record_to_update.return_date)
-
-            if (new_return_order_id != record_to_update.return_order_id or
-                new_SKU != record_to_update.SKU or
-                new_return_date != record_to_update.return_date):
-                existing_record = Return.query.filter_by(
-                    return_order_id=new_return_order_id,
-                    SKU=new_SKU,
-                    return_date=new_return_date
-                ).first()
-
-                if existing_record and existing_record != record_to_update:
-                    return jsonify({'error': f'Record with return_order_id "{new_return_order_id}" and SKU "{new_SKU}" already exists.'}), 400
-
-            # Create a new record with updated identifiers if primary keys change
-            if new_return_order_id != record_to_update.return_order_id or new_SKU != record_to_update.SKU:
-                new_record = Return(
-                    return_order_id=new_return_order_id,
-                    SKU=new_SKU,
-                    return_date=new_return_date,
-                    return_quantity=record_update_data['return_quantity'],
-                    return_unit_price=record_update_data['return_unit_price'],
-                    supplier_id=record_to_update.supplier_id,
-                    return_currency=record_update_data['return_currency'],
-                    target_currency=record_update_data['target_currency'],
-                    fx_rate=record_update_data['fx_rate'],
-                    quantity_left=0
-                )
-                db.session.add(new_record)
-                db.session.delete(record_to_update)
-            else:
-                # Update the existing record
-                for field, value in record_update_data.items():
-                    if hasattr(record_to_update, field):
-                        setattr(record_to_update, field, value)
-
-            updated_identifiers.append((new_return_order_id, new_SKU, str(new_return_date)))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format for return_date. Use YYYY-MM-DD.'}), 400
+    if len(set(selected_keys)) != len(selected_keys):
+        return jsonify({'error': 'Each record can only be selected once per update.'}), 400
+
+    # Fetch all selected records in one query
+    stored_records = rows_by_key(table, key_columns, selected_keys)
+    if not stored_records:
+        return jsonify({'error': 'No selected records found for update.'}), 404
+
+    missing_records = [record for record, key in zip(selected_records, selected_keys) if key not in stored_records]
+    if missing_records:
+        return jsonify({
+            'error': 'Some selected records were not found for update.',
+            'missing_records': missing_records
+        }), 404
 
+    # Validate required fields, convert string fields to uppercase and return_date to a date
+    required_fields = ['return_order_id', 'SKU', 'return_date', 'return_quantity', 'return_unit_price', 'supplier_name', 'return_currency', 'target_currency', 'fx_rate']
+    for record_update_data in update_data:
+        for field in required_fields:
+            if field not in record_update_data or not record_update_data[field]:
+                return jsonify({'error': f'{field} is required for all records'}), 400
+        for field in ('return_order_id', 'return_currency', 'target_currency'):
+            record_update_data[field] = record_update_data[field].upper()
+        record_update_data['sku'] = record_update_data.pop('SKU').upper()  # the grid sends SKU, the column is sku
         try:
-            db.session.commit()
-        except IntegrityError as e:
-            db.session.rollback()
-            if "FOREIGN KEY constraint" in str(e.orig):
-                return jsonify({'error': 'Foreign key constraint failed: No supplier or SalesRecord referenced record exists in the dataset.'}), 400
-            elif "UNIQUE constraint" in str(e.orig):
-                return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Return Order ID and SKU detected.'}), 400
-            else:
-                return jsonify({'error': f'Database error: {str(e)}'}), 500
+            record_update_data['return_date'] = datetime.strptime(record_update_data['return_date'], "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format for return_date. Use YYYY-MM-DD.'}), 400
+
+    # Resolve all supplier names in one query
+    suppliers = ids_by_name(Supplier.name, Supplier.supplier_id, [record['supplier_name'] for record in update_data])
+    for record_update_data in update_data:
+        if record_update_data['supplier_name'].lower() not in suppliers:
+            return jsonify({'error': f'Supplier with name "{record_update_data["supplier_name"]}" not found'}), 404
+
+    columns = settable_columns(table)
+    updates = []
+    for key, record_update_data in zip(selected_keys, update_data):
+        values = {column: stored_records[key][column] for column in columns}
+        values.update({field: value for field, value in record_update_data.items() if field in values})
+        values['supplier_id'] = suppliers[record_update_data['supplier_name'].lower()][0]
+        if (values['return_order_id'], values['sku']) != key[:2]:
+            values['quantity_left'] = 0  # a return under a new order ID / SKU starts unallocated
+        updates.append((key, values))
+
+    # Check if new identifiers already exist, for all changed identifiers in one query
+    new_keys = [tuple(values[column] for column in key_columns) for _, values in updates]
+    if len(set(new_keys)) != len(new_keys):
+        return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Return Order ID and SKU detected.'}), 400
+    existing_records = rows_by_key(table, key_columns, [new for old, new in zip(selected_keys, new_keys) if new != old])
+    if existing_records:
+        new_return_order_id, new_SKU, _ = next(iter(existing_records))
+        return jsonify({'error': f'Record with return_order_id "{new_return_order_id}" and SKU "{new_SKU}" already exists.'}), 400
 
-        # Re-query updated records to ensure they are attached to the session
-        updated_records = Return.query.filter(
-            or_(
-                *[(
-                    (Return.return_order_id == return_order_id) &
-                    (Return.SKU == SKU) &
-                    (Return.return_date == return_date)
-                ) for return_order_id, SKU, return_date in updated_identifiers]
-            )
-        ).all()
+    try:
+        updated_rows = update_by_key(table, key_columns, updates)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "FOREIGN KEY constraint" in str(e.orig):
+            return jsonify({'error': 'Foreign key constraint failed: No supplier or SalesRecord referenced record exists in the dataset.'}), 400
+        elif "UNIQUE constraint" in str(e.orig):
+            return jsonify({'error': 'Primary key constraint failed: Duplicate combination of Return Order ID and SKU detected.'}), 400
+        else:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-        return jsonify({'message': 'Selected returns updated successfully!', 'updated_records': [record.to_dict() for record in updated_records]})
+    supplier_names = dict(suppliers.values())
+    updated_records = [
+        {**Return(**row).to_dict(), 'supplier_name': supplier_names.get(row['supplier_id'])} for row in updated_rows
+    ]
+    return jsonify({'message': 'Selected returns updated successfully!', 'updated_records': updated_records})
 
 # Delete one or multiple records
 @app.route('/returns/delete', methods=['DELETE'])
@@ -2133,49 +1833,41 @@ def delete_returns():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
 
-    # Initialize response containers
-    success_deletes = []
+    keys = []
     failed_deletes = []
-
     for selected_record in selected_records:
         return_order_id = selected_record.get('return_order_id', '').upper()
         sku = selected_record.get('SKU', '').upper()
         return_date = selected_record.get('return_date', '')
-
-        # Query the matching record
-        record_to_delete = Return.query.filter_by(
-            return_order_id=return_order_id,
-            SKU=sku,
-            return_date=return_date
-        ).first()
-
-        if not record_to_delete:
+        try:
+            keys.append((return_order_id, sku, datetime.strptime(return_date, "%Y-%m-%d").date()))
+        except (TypeError, ValueError):
+            # No record can match an invalid date
             failed_deletes.append({
                 'return_order_id': return_order_id,
                 'SKU': sku,
                 'return_date': return_date,
                 'error': 'Record not found in Returns table.'
             })
-            continue
-
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'return_order_id': return_order_id,
-            'SKU': sku,
-            'return_date': return_date,
-            'message': 'Record deleted successfully.'
-        })
 
-    # Commit the transaction if there are successful deletes
+    # Delete the matching records in one statement
     try:
-        if success_deletes:
+        result = delete_by_key(Return.__table__, ['return_order_id', 'sku', 'return_date'], keys)
+        if result['deleted']:
             db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
 
     # Return the response with details for both successful and failed deletes
+    success_deletes = [
+        {'return_order_id': return_order_id, 'SKU': sku, 'return_date': return_date.isoformat(), 'message': 'Record deleted successfully.'}
+        for return_order_id, sku, return_date in result['deleted']
+    ]
+    failed_deletes += [
+        {'return_order_id': return_order_id, 'SKU': sku, 'return_date': return_date.isoformat(), 'error': 'Record not found in Returns table.'}
+        for return_order_id, sku, return_date in result['missing']
+    ]
     return jsonify({
         'success_deletes': success_deletes,
         'failed_deletes': failed_deletes
@@ -2917,29 +2609,7 @@ def delete_all_inventory_raw_material():
 def re_rank_manufacture_orders():
     try:
         with db.session.begin():
-            # Create temporary table for ranking
-            db.session.execute(text("""
-                CREATE TEMPORARY TABLE rankedrows AS
-                SELECT
-                    id,
-                    dense_rank() OVER (
-                        ORDER BY manufacture_date, sku
-                    ) AS new_manufacture_order_id
-                FROM manufactureorders;
-            """))
-
-            # Update manufacture order IDs
-            db.session.execute(text("""
-                UPDATE manufactureorders
-                SET manufacture_order_id = (
-                    SELECT new_manufacture_order_id
-                    FROM rankedrows
-                    WHERE manufactureorders.id = rankedrows.id
-                );
-            """))
-
-            # Drop temporary table
-            db.session.execute(text("DROP TABLE IF EXISTS rankedrows;"))
+            rank_manufacture_orders()
 
         return jsonify({'message': 'Manufacture orders re-ranked successfully'}), 200
     except Exception as e:
@@ -2950,486 +2620,324 @@ def re_rank_manufacture_orders():
 # ---------------------------------------------
 # Helper functions for FIFO logic & batching    |
 # ---------------------------------------------
-def calculate_product_ratios(order_id, mo_data_df=None):
-    # Use provided DataFrame or query database (for backward compatibility)
-    if mo_data_df is not None:
-        products_info = mo_data_df[['product', 'manufacture_quantity']].values.tolist()
-    else:
-        # Fallback to database query
-        products_info = db.session.execute(text("""
-            SELECT product, manufacture_quantity
-                FROM manufactureorders
-            WHERE manufacture_order_id = :order_id
-            ORDER BY product;
-        """), {'order_id': order_id}).fetchall()
-    
-    if not products_info:
-        print(f"calculate_product_ratios for MO {order_id}: No products found!")
-        return {}, 0
-    
-    min_quantity = min(qty for _, qty in products_info)
-    
-    product_ratios = {
-        product: qty // min_quantity
-        for product, qty in products_info
-    }
+@pipeline_timer.timed('re_rank_manufacture_orders')
+def rank_manufacture_orders():
+    """Number manufacture orders by (manufacture_date, sku), in the caller's transaction"""
+    # Create temporary table for ranking
+    db.session.execute(text("""
+        CREATE TEMPORARY TABLE rankedrows AS
+        SELECT
+            id,
+            dense_rank() OVER (
+                ORDER BY manufacture_date, sku
+            ) AS new_manufacture_order_id
+        FROM manufactureorders;
+    """))
 
-    return product_ratios, min_quantity
+    # Update manufacture order IDs
+    db.session.execute(text("""
+        UPDATE manufactureorders
+        SET manufacture_order_id = (
+            SELECT new_manufacture_order_id
+            FROM rankedrows
+            WHERE manufactureorders.id = rankedrows.id
+        );
+    """))
 
-def calculate_product_ratios_COGS(order_id, batch, completion_date, manufacture_orders_df=None, manufacture_results_df=None):
-    """
-    Calculate product ratios using DataFrames instead of database queries for performance.
-    Falls back to database queries if DataFrames are not provided.
-    """
+    # Drop temporary table
+    db.session.execute(text("DROP TABLE IF EXISTS rankedrows;"))
 
-    # normal manufacture order
-    if order_id > 0:
-        if manufacture_orders_df is not None:
-            # Use DataFrame - much faster than database query
-            order_products = manufacture_orders_df[
-                manufacture_orders_df['manufacture_order_id'] == order_id
-            ][['product', 'manufacture_quantity']]
-            
-            if order_products.empty:
-                # Fallback to database if not found in DataFrame
-                products_info = db.session.execute(text("""
-                    SELECT product, manufacture_quantity
-                            FROM manufactureorders
-                            WHERE manufacture_order_id = :order_id
-                            ORDER BY product;
-                """), {'order_id': order_id}).fetchall()
-            else:
-                products_info = [(row['product'], row['manufacture_quantity']) for _, row in order_products.iterrows()]
-        else:
-            # Fallback to database query
-            products_info = db.session.execute(text("""
-                SELECT product, manufacture_quantity
-                FROM manufactureorders
-            WHERE manufacture_order_id = :order_id
-            ORDER BY product;
-        """), {'order_id': order_id}).fetchall()
-        
-        if not products_info:
-            return {}, 0
-        
-        min_quantity = min(qty for _, qty in products_info)
-        product_ratios = {
-            product: qty // min_quantity
-            for product, qty in products_info
-        }
-    else:
-        if manufacture_results_df is not None:
-            # Use DataFrame - much faster than database query
-            batch_products = manufacture_results_df[
-                (manufacture_results_df['manufacture_order_id'] == order_id) &
-                (manufacture_results_df['manufacture_batch'] == batch) &
-                (manufacture_results_df['manufacture_completion_date'] == completion_date)
-            ][['product', 'fulfilled_quantity']]
-            
-            if batch_products.empty:
-                # Fallback to database if not found in DataFrame
-                products_info = db.session.execute(text("""
-                    SELECT product, fulfilled_quantity
-                            FROM manufactureresult
-                            WHERE manufacture_order_id = :order_id and manufacture_batch = :batch and manufacture_completion_date = :completion_date
-                            ORDER BY product;
-                """), {'order_id': order_id, 'batch': batch, 'completion_date': completion_date}).fetchall()
-            else:
-                products_info = [(row['product'], row['fulfilled_quantity']) for _, row in batch_products.iterrows()]
-        else:
-            # Fallback to database query
-            products_info = db.session.execute(text("""
-                SELECT product, fulfilled_quantity
-                FROM manufactureresult
-            WHERE manufacture_order_id = :order_id and manufacture_batch = :batch and manufacture_completion_date = :completion_date
-            ORDER BY product;
-        """), {'order_id': order_id, 'batch': batch, 'completion_date': completion_date}).fetchall()
-    
-        if not products_info:
-            return {}, 0
-    
-    min_quantity = min(qty for _, qty in products_info)
-    product_ratios = {
-        product: qty // min_quantity
-        for product, qty in products_info
-    }
-    
-    return product_ratios, min_quantity
 
-def process_manufacture_batches(order_id, staged_updates, required_skus, product_ratios=None):
-    if product_ratios is None:
-        product_ratios, _ = calculate_product_ratios(order_id)
-    else:
-        # Use the provided product_ratios to avoid database query
-        pass
-    batch_number = 1
-    final_updates = []
+def fifo_manufacture_results(cutoff_date=None):
+    """
+    Rebuild manufactureresult and failedmanufactureresult from the manufacture orders, drawing purchase orders FIFO
 
-    # Group POs per product and sort them FIFO
-    product_po_queues = {}
-    for update in staged_updates:
-        if update['product'] not in product_po_queues:
-            product_po_queues[update['product']] = []
-        product_po_queues[update['product']].append(update)
+    Runs in the caller's transaction; COGS is cleared as it no longer matches. With cutoff_date only the orders
+    manufactured on or before it are built (inventory as of that date).
 
-    for product in product_po_queues:
-        product_po_queues[product].sort(key=lambda x: x['order_date'])
+    Returns:
+        dict: total_processed, successful, failed and success_rate of the manufacture orders
+    """
+    with pipeline_timer.span('reset'):
+        # Clear previous results
+        db.session.execute(text("DELETE FROM cogs;"))
+        db.session.execute(text("DELETE FROM failedcogs;"))
+        db.session.execute(text("DELETE FROM manufactureresult;"))
+        db.session.execute(text("DELETE FROM failedmanufactureresult;"))
+
+    with pipeline_timer.span('fetch') as fetch:
+        # Pre-fetch all data needed for processing
+        print("Pre-fetching manufacture orders data...")
+        manufacture_orders_df = pd.read_sql_query("""
+            SELECT manufacture_order_id, sku, product, manufacture_quantity, manufacture_date
+            FROM manufactureorders
+            ORDER BY manufacture_order_id, product;
+        """, db.session.connection())  # same connection as the open transaction
+
+        print("Pre-fetching purchase orders data...")
+        purchase_orders_df = pd.read_sql_query("""
+            SELECT *
+            FROM purchaseorders
+            ORDER BY product, order_date, purchase_order_id;
+        """, db.session.connection())  # same connection as the open transaction
+        fetch.rows = len(manufacture_orders_df) + len(purchase_orders_df)
+
+    with pipeline_timer.span('allocate') as allocate:
+        # FIFO batching of every order; updates quantity_left of the purchase order frame
+        manufacture = build_manufacture_results(manufacture_orders_df, purchase_orders_df, cutoff_date)
+        allocate.rows = manufacture['total_processed']
+    all_manufacture_results = manufacture['manufactureresult']
+    all_failed_results = manufacture['failedmanufactureresult']
+
+    with pipeline_timer.span('write', rows=len(purchase_orders_df) + len(all_manufacture_results) + len(all_failed_results)):
+        # Replace entire purchase orders table with updated DataFrame using high-performance bulk insert
+        if not purchase_orders_df.empty:
+            print(f"Replacing purchase orders table with updated DataFrame ({len(purchase_orders_df)} records)...")
+
+            # Remove generated columns before inserting (PostgreSQL will auto-calculate them)
+            columns_to_exclude = ['total_cost']  # Add other generated columns if any
+            df_to_insert = purchase_orders_df.drop(columns=[col for col in columns_to_exclude if col in purchase_orders_df.columns])
+
+            # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
+            records_to_insert = df_to_insert.to_dict('records')
+
+            # Clear the existing table and bulk insert using SQLAlchemy core (same as bulk create endpoint)
+            db.session.execute(text("DELETE FROM purchaseorders;"))
+            db.session.execute(
+                PurchaseOrder.__table__.insert(),
+                records_to_insert
+            )
+            print("✅ Purchase orders table successfully updated with high-performance bulk insert")
 
-    fulfilled_skus = 0
+        # High-performance bulk insert for manufacture results using SQLAlchemy core
+        if all_manufacture_results:
+            total_results = len(all_manufacture_results)
+            print(f"\nBulk inserting {total_results} manufacture results using high-performance method...")
 
-    while fulfilled_skus < required_skus:
-        max_skus = float('inf')
-        current_pos = {}
+            # Single bulk insert operation (same as bulk create endpoint performance)
+            db.session.execute(
+                ManufactureResult.__table__.insert(),
+                all_manufacture_results  # already manufactureresult records, as the batching returns them
+            )
+            print(f"✅ Successfully bulk inserted {total_results} manufacture results")
+
+        # High-performance bulk insert for failed results using SQLAlchemy core
+        if all_failed_results:
+            total_failed = len(all_failed_results)
+            print(f"Bulk inserting {total_failed} failed manufacture results using high-performance method...")
+
+            # Records are already in the correct format for SQLAlchemy core bulk insert
+            # Single bulk insert operation (same as bulk create endpoint performance)
+            db.session.execute(
+                FailedManufactureResult.__table__.insert(),
+                all_failed_results
+            )
+            print(f"✅ Successfully bulk inserted {total_failed} failed manufacture results")
 
-        for product, ratio in product_ratios.items():
-            # Skip POs that don't have enough for even 1 ratio unit
-            while product_po_queues[product] and product_po_queues[product][0]['allocated_qty'] < ratio:
-                product_po_queues[product].pop(0)
+    return {key: manufacture[key] for key in ('total_processed', 'successful', 'failed', 'success_rate')}
 
-            if not product_po_queues[product]:
-                return []  # No more usable POs for this product
 
-            po = product_po_queues[product][0]
-            possible_skus = po['allocated_qty'] // ratio
+def fifo_stock_exchanges(cutoff_date=None):
+    """
+    Move manufactured stock between SKUs for every stock exchange (up to cutoff_date), in the caller's transaction
 
-            if possible_skus == 0:
-                return []  # Defensive: shouldn't hit this if while-loop above is correct
+    Exchanges that cannot be fully fulfilled are recorded in failedstockexchange.
+    """
+    # Clear all failed stock exchanges
+    db.session.execute(text("""
+        DELETE FROM failedstockexchange;
+    """))
 
-            current_pos[product] = po
-            max_skus = min(max_skus, possible_skus)
+    with pipeline_timer.span('fetch') as fetch:
+        # Get all stock exchanges and the manufacture results they draw from
+        stock_exchanges_df = pd.read_sql_query("""
+            SELECT id, sku_original, sku_new, quantity, exchange_date
+            FROM stockexchange
+            ORDER BY exchange_date, id;
+        """, db.session.connection())  # same connection as the open transaction
+        manufacture_results_df = pd.read_sql_query("""
+            SELECT *
+            FROM manufactureresult
+            ORDER BY result_id;
+        """, db.session.connection())  # same connection as the open transaction
+        fetch.rows = len(stock_exchanges_df) + len(manufacture_results_df)
+
+    stock_exchanges_df['exchange_date'] = pd.to_datetime(stock_exchanges_df['exchange_date']).dt.date
+    manufacture_results_df['manufacture_completion_date'] = pd.to_datetime(manufacture_results_df['manufacture_completion_date']).dt.date
+    if cutoff_date is not None:
+        stock_exchanges_df = stock_exchanges_df[stock_exchanges_df['exchange_date'] <= pd.Timestamp(cutoff_date).date()]
+
+    with pipeline_timer.span('exchange', rows=len(stock_exchanges_df)):
+        exchange = exchange_stock(manufacture_results_df, stock_exchanges_df, ProductRatioTable())
+
+    results = exchange['manufactureresult'].set_index('result_id', drop=False)
+    with pipeline_timer.span('write', rows=len(exchange['updated']) + len(exchange['inserted']) + len(exchange['failedstockexchange'])):
+        # Stored rows drawn from keep their result_id; the new rows are numbered by the database in exchange order
+        update_by_key(ManufactureResult.__table__, ['result_id'], [
+            ((result_id,), {column: results.at[result_id, column] for column in ('fulfilled_quantity', 'quantity_left', 'cost')})
+            for result_id in exchange['updated']
+        ])
+        if exchange['inserted']:
+            db.session.execute(
+                ManufactureResult.__table__.insert(),
+                results.loc[exchange['inserted']].drop(columns=['result_id']).to_dict('records')
+            )
+        if exchange['failedstockexchange']:
+            db.session.execute(FailedStockExchange.__table__.insert(), exchange['failedstockexchange'])
+    print(f"Processed {len(stock_exchanges_df)} stock exchanges, {len(exchange['failedstockexchange'])} failed")
 
-        # Limit to how many SKUs still needed
-        batch_skus = min(max_skus, required_skus - fulfilled_skus)
 
-        # Consume from each product's current PO
-        for product, ratio in product_ratios.items():
-            po = current_pos[product]
-            consume_qty = batch_skus * ratio
+def fifo_cogs(cutoff_date=None, batch_lots=False):
+    """
+    Rebuild cogs and failedcogs by FIFO-costing the sales against returns, stock initiations and manufacture results
 
-            batch_update = po.copy()
-            batch_update['allocated_qty'] = consume_qty
-            batch_update['manufacture_batch'] = batch_number
-            batch_update['cost'] = consume_qty * po['unit_price']
-            batch_update['unit_price'] = po['unit_price']
-            final_updates.append(batch_update)
+    Runs in the caller's transaction and writes the remaining quantities of the lots back. With cutoff_date only the
+    sales up to it are costed; batch_lots draws each manufacture result batch as one lot (see allocate_sales), as the
+    inventory snapshots do.
 
-            po['allocated_qty'] -= consume_qty
-            if po['allocated_qty'] == 0:
-                product_po_queues[product].pop(0)
+    Returns:
+        dict: sale counts (total_processed, successful, failed, success_rate) and the cogs / failedcogs rows written
+    """
+    # Reset quantities will be handled in DataFrames (applied when we replace tables)
+    # Manufacture Result Reset is handled by calling 
+    # app.route('/manufacture_result/generate', methods=['GET'])
+    # and app.route('/manufacture_result/update_with_stock_exchange', methods=['GET'])
+    # in the frontend refresh button
+
+    with pipeline_timer.span('fetch') as fetch:
+        # Pre-fetch all data needed for COGS processing
+        print("Pre-fetching sales records data...")
+        sales_records_df = pd.read_sql_query("""
+            SELECT sales_record_id, sku, quantity_sold, sales_date
+            FROM salesrecords
+            ORDER BY sales_date;
+        """, db.session.connection())  # same connection as the open transaction
+
+        print("Pre-fetching manufacture orders data for product ratios...")
+        manufacture_orders_df = pd.read_sql_query("""
+            SELECT manufacture_order_id, product, manufacture_quantity
+            FROM manufactureorders
+            ORDER BY manufacture_order_id, product;
+        """, db.session.connection())  # same connection as the open transaction
+
+        print("Pre-fetching manufacture results data...")
+        manufacture_results_df = pd.read_sql_query("""
+            SELECT *
+            FROM manufactureresult
+            ORDER BY sku, manufacture_completion_date, result_id;
+        """, db.session.connection())  # same connection as the open transaction
+
+        print("Pre-fetching returns data...")
+        returns_df = pd.read_sql_query("""
+            SELECT *
+            FROM returns
+            ORDER BY sku, return_date;
+        """, db.session.connection())  # same connection as the open transaction
+
+        print("Pre-fetching stock initiation data...")
+        stock_initiation_df = pd.read_sql_query("""
+            SELECT *
+            FROM stockinitiationaddition
+            ORDER BY sku, manufacture_completion_date;
+        """, db.session.connection())  # same connection as the open transaction
+        fetch.rows = len(sales_records_df) + len(manufacture_orders_df) + len(manufacture_results_df) + len(returns_df) + len(stock_initiation_df)
+
+    # Reset quantities in DataFrames (will be applied when we replace tables)
+    if not returns_df.empty:
+        returns_df['quantity_left'] = returns_df['return_quantity']
+        print("✅ Reset return quantities in DataFrame")
+
+    if not stock_initiation_df.empty:
+        stock_initiation_df['quantity_left'] = stock_initiation_df['fulfilled_quantity']
+        print("✅ Reset stock initiation quantities in DataFrame")
+
+    # Convert date columns to proper datetime format
+    if not sales_records_df.empty:
+        sales_records_df['sales_date'] = pd.to_datetime(sales_records_df['sales_date']).dt.date
+    if not manufacture_results_df.empty:
+        manufacture_results_df['manufacture_completion_date'] = pd.to_datetime(manufacture_results_df['manufacture_completion_date']).dt.date
+    if not returns_df.empty:
+        returns_df['return_date'] = pd.to_datetime(returns_df['return_date']).dt.date
+    if not stock_initiation_df.empty:
+        stock_initiation_df['manufacture_completion_date'] = pd.to_datetime(stock_initiation_df['manufacture_completion_date']).dt.date
+
+    if cutoff_date is not None:
+        # only sales up to the cutoff are costed, so lots completed after it are never drawn
+        sales_records_df = sales_records_df[sales_records_df['sales_date'] <= pd.Timestamp(cutoff_date).date()].reset_index(drop=True)
+
+    # Product ratios and products of every manufacture result batch, looked up per lot consumed
+    ratio_table = ProductRatioTable(manufacture_orders_df, manufacture_results_df)
+
+    import time
+    start_time = time.time()
+    print(f"🚀 Starting COGS processing for {len(sales_records_df)} sales records at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    with pipeline_timer.span('allocate', rows=len(sales_records_df)):
+        # FIFO allocation per SKU (in worker processes for large runs); updates quantity_left of the lot frames
+        allocation = allocate_sales(
+            sales_records_df, returns_df, stock_initiation_df, manufacture_results_df, ratio_table, batch_lots=batch_lots
+        )
+    all_cogs_updates = allocation['cogs']
+    all_failed_cogs = allocation['failedcogs']
+    processed_count = len(sales_records_df)
+    successful_count = allocation['successful']
+    failed_count = allocation['failed']
+
+    # Final processing summary
+    end_time = time.time()
+    duration = end_time - start_time
+    print(f"\n🎉 === COGS PROCESSING COMPLETE ===")
+    print(f"⏱️  Total Duration: {duration:.2f} seconds ({duration/60:.1f} minutes)")
+    print(f"📦 Total Sales Records Processed: {processed_count}")
+    print(f"✅ Successful: {successful_count}")
+    print(f"❌ Failed: {failed_count}")
+    print(f"📊 Success Rate: {(successful_count/processed_count*100):.1f}%" if processed_count > 0 else "N/A")
+    print(f"⚡ Processing Speed: {(processed_count/duration):.1f} records/second" if duration > 0 else "N/A")
+
+    with pipeline_timer.span('write', rows=len(all_cogs_updates) + len(returns_df) + len(stock_initiation_df) + len(manufacture_results_df) + len(all_failed_cogs)):
+        # Each generated table is rebuilt in a shadow table, all swapped in at the end (see table_swap.py), so readers
+        # keep the previous rows until this transaction commits
+        replacements = {
+            COGS.__table__: pd.DataFrame(all_cogs_updates, columns=[
+                column.name for column in COGS.__table__.c if column.name != 'id'
+            ]),  # already cogs records, as the allocation returns them
+            FailedCOGS.__table__: pd.DataFrame(all_failed_cogs, columns=[
+                column.name for column in FailedCOGS.__table__.c if column.name != 'id'
+            ])
+        }
+        # Replace entire returns, stock initiation and manufacture results tables with the updated DataFrames
+        if not returns_df.empty:
+            replacements[Return.__table__] = returns_df.drop(columns=['total_cost'], errors='ignore')  # generated column
+        if not stock_initiation_df.empty:
+            replacements[ManufactureStockInitiationAddition.__table__] = stock_initiation_df.drop(columns=['unit_cost'], errors='ignore')  # generated column
+        if not manufacture_results_df.empty:
+            replacements[ManufactureResult.__table__] = manufacture_results_df
+
+        print(f"Replacing {', '.join(table.name for table in replacements)} tables...")
+        for table_name, rows in replace_tables(replacements).items():
+            print(f"✅ {table_name} table successfully replaced with {rows} records")
+
+    return {
+        'total_processed': processed_count,
+        'successful': successful_count,
+        'failed': failed_count,
+        'success_rate': round((successful_count/processed_count*100), 1) if processed_count > 0 else 0,
+        'cogs_records_created': len(all_cogs_updates),
+        'failed_cogs_records': len(all_failed_cogs)
+    }
 
-        fulfilled_skus += batch_skus
-        batch_number += 1
 
-    return final_updates
-    
 @app.route('/manufacture_result/generate', methods=['GET'])
+@pipeline_timer.timed('manufacture_result_generate')
+@change_tracker.consumer('manufacture_result', ('manufactureorders', 'purchaseorders'))
 def generate_manufacture_results():
     try:
         with db.session.begin():
-            # Clear previous results
-            db.session.execute(text("DELETE FROM cogs;"))
-            db.session.execute(text("DELETE FROM failedcogs;"))
-            db.session.execute(text("DELETE FROM manufactureresult;"))
-            db.session.execute(text("DELETE FROM failedmanufactureresult;"))
-
-            # Pre-fetch all data needed for processing
-            print("Pre-fetching manufacture orders data...")
-            manufacture_orders_df = pd.read_sql_query("""
-                SELECT manufacture_order_id, sku, product, manufacture_quantity, manufacture_date
-                FROM manufactureorders
-                ORDER BY manufacture_order_id, product;
-            """, db.engine)
-
-            print("Pre-fetching purchase orders data...")
-            purchase_orders_df = pd.read_sql_query("""
-                SELECT *
-                FROM purchaseorders
-                ORDER BY product, order_date;
-            """, db.engine)
-            
-            # Reset PO quantities in DataFrame (this will be applied when we replace the table)
-            if not purchase_orders_df.empty:
-                purchase_orders_df['quantity_left'] = purchase_orders_df['purchase_quantity']
-                print("✅ Reset purchase order quantities in DataFrame")
-
-            # Convert date columns to proper datetime format
-            if not manufacture_orders_df.empty:
-                manufacture_orders_df['manufacture_date'] = pd.to_datetime(manufacture_orders_df['manufacture_date']).dt.date
-            if not purchase_orders_df.empty:
-                purchase_orders_df['order_date'] = pd.to_datetime(purchase_orders_df['order_date']).dt.date
-
-            # Get unique order IDs
-            order_ids = manufacture_orders_df['manufacture_order_id'].unique() if not manufacture_orders_df.empty else []
-
-            # Collect all results for batch insertion at the end
-            all_failed_results = []
-            all_manufacture_results = []
-
-            import time
-            start_time = time.time()
-            print(f"🚀 Starting processing of {len(order_ids)} manufacture orders at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            processed_count = 0
-            successful_count = 0
-            failed_count = 0
-            
-            for order_id in order_ids:
-                # Convert numpy types to native Python types
-                order_id = int(order_id)
-                processed_count += 1
-                staged_updates = []
-
-                # Step 1: Get required product quantities from DataFrame
-                mo_order_data = manufacture_orders_df[manufacture_orders_df['manufacture_order_id'] == order_id].copy()
-                
-                if mo_order_data.empty:
-                    print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: No data found, skipping")
-                    continue
-                
-                # Progress logging every 100 orders or for specific intervals
-                if processed_count % 100 == 0 or processed_count <= 10:
-                    progress_pct = (processed_count / len(order_ids)) * 100
-                    print(f"[{processed_count}/{len(order_ids)}] ({progress_pct:.1f}%) Processing MO {order_id}... (Success: {successful_count}, Failed: {failed_count})")
-                
-                # Major milestone logging every 1000 orders
-                if processed_count % 1000 == 0:
-                    print(f"\n🎯 MILESTONE: {processed_count} orders processed ({(processed_count/len(order_ids)*100):.1f}% complete)")
-                    print(f"   📊 Current Stats: ✅ {successful_count} successful, ❌ {failed_count} failed")
-                    print(f"   💾 Database operations optimized with batch processing")
-                    print("   ⏱️  Process continuing...\n")
-
-                # Step 2: Compute product ratios and required SKU count
-                try:
-                    product_ratios, _ = calculate_product_ratios(order_id, mo_order_data)
-                    
-                    product_qtys = []
-                    for _, row in mo_order_data.iterrows():
-                        product_qtys.append((row['product'], row['manufacture_quantity']))
-                    
-                    # Check if all products exist in product_ratios
-                    missing_products = []
-                    for product, qty in product_qtys:
-                        if product not in product_ratios:
-                            missing_products.append(product)
-                    
-                    if missing_products:
-                        print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: FAILED - Missing products in ratios: {missing_products}")
-                        failed_count += 1
-                        # Collect failed results for batch insertion
-                        for _, row in mo_order_data.iterrows():
-                            manufacture_date = row['manufacture_date']
-                            if isinstance(manufacture_date, datetime):
-                                manufacture_date = manufacture_date.strftime('%Y-%m-%d')
-                            all_failed_results.append({
-                                'order_id': order_id,
-                                'sku': str(row['sku']),
-                                'product': str(row['product']),
-                                'manufacture_date': manufacture_date,
-                                'failure_reason': f'Missing product in ratios calculation: {missing_products}'
-                            })
-                        continue  # Skip to next order
-                    
-                    required_skus = min(qty // product_ratios[product] for product, qty in product_qtys)
-                    
-                except ZeroDivisionError as e:
-                    print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: FAILED - ZeroDivisionError in ratio calculation: {e}")
-                    failed_count += 1
-                    required_skus = 0
-                except Exception as e:
-                    print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: FAILED - Error in ratio calculation: {e}")
-                    failed_count += 1
-                    # Collect failed results for batch insertion
-                    for _, row in mo_order_data.iterrows():
-                        manufacture_date = row['manufacture_date']
-                        if isinstance(manufacture_date, datetime):
-                            manufacture_date = manufacture_date.strftime('%Y-%m-%d')
-                        all_failed_results.append({
-                            'order_id': order_id,
-                            'sku': str(row['sku']),
-                            'product': str(row['product']),
-                            'manufacture_date': manufacture_date,
-                            'failure_reason': f'Error in ratio calculation: {str(e)}'
-                        })
-                    continue  # Skip to next order
-
-                # Step 3: Prepare raw PO pool (no allocation yet) using DataFrame filtering
-                for _, row in mo_order_data.iterrows():
-                    sku = str(row['sku'])
-                    product = str(row['product'])
-                    manufacture_date = row['manufacture_date']
-                    
-                    if isinstance(manufacture_date, str):
-                        manufacture_date = datetime.strptime(manufacture_date, '%Y-%m-%d').date()
-
-                    try:
-                        # Filter purchase orders from DataFrame for this product
-                        # Convert manufacture_date to pandas datetime for comparison
-                        manufacture_datetime = pd.to_datetime(manufacture_date)
-                        cutoff_date = (manufacture_datetime + pd.Timedelta(days=5)).date()
-                        
-                        product_pos = purchase_orders_df[
-                            (purchase_orders_df['product'] == product) & 
-                            (purchase_orders_df['quantity_left'] > 0) & 
-                            (purchase_orders_df['order_date'] <= cutoff_date)
-                        ].copy()
-                        
-                        # Sort by order_date for FIFO
-                        product_pos = product_pos.sort_values('order_date')
-
-                        for _, po_row in product_pos.iterrows():
-                            staged_updates.append({
-                                'order_id': order_id,
-                                'sku': sku,
-                                'product': product,
-                                'po_id': str(po_row['purchase_order_id']),
-                                'allocated_qty': int(po_row['quantity_left']),
-                                'unit_price': float(po_row['purchase_unit_price']) * float(po_row['fx_rate']),
-                                'fx_rate': float(po_row['fx_rate']),
-                                'cost': int(po_row['quantity_left']) * float(po_row['purchase_unit_price']) * float(po_row['fx_rate']),
-                                'completion_date': manufacture_date,
-                                'order_date': po_row['order_date']
-                            })
-                    except Exception as e:
-                        print(f"MO {order_id}: Error processing POs for product '{product}': {e}")
-                        # Continue with other products rather than failing the entire MO
-
-                # Step 4: Attempt batching
-                try:
-                    processed_updates = process_manufacture_batches(order_id, staged_updates, required_skus, product_ratios)
-                except Exception as e:
-                    print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: ERROR in batching process: {e}")
-                    processed_updates = []
-
-                if processed_updates:
-                    # Collect manufacture results for batch insertion later
-                    all_manufacture_results.extend(processed_updates)
-                    
-                    # Update the DataFrame to reflect consumed quantities for next MOs
-                    for update_record in processed_updates:
-                        po_id = update_record['po_id']
-                        product = update_record['product']
-                        allocated_qty = update_record['allocated_qty']
-                        
-                        # Find and update the corresponding row in purchase_orders_df
-                        mask = (purchase_orders_df['purchase_order_id'] == po_id) & (purchase_orders_df['product'] == product)
-                        if mask.any():
-                            # Get current quantity before update for logging
-                            current_qty = purchase_orders_df.loc[mask, 'quantity_left'].iloc[0]
-                            purchase_orders_df.loc[mask, 'quantity_left'] -= allocated_qty
-                            new_qty = purchase_orders_df.loc[mask, 'quantity_left'].iloc[0]
-                            
-                            # Log DataFrame updates for debugging (only for first few records)
-                            if processed_count <= 5:
-                                print(f"    Updated PO {po_id} {product}: {current_qty} -> {new_qty} (consumed: {allocated_qty})")
-                    
-                    successful_count += 1
-                    if processed_count % 100 == 0 or processed_count <= 10:
-                        print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: SUCCESS - Collected {len(processed_updates)} manufacture results for batch processing")
-                else:
-                    print(f"[{processed_count}/{len(order_ids)}] MO {order_id}: FAILED - Insufficient stock or batching failed")
-                    failed_count += 1
-                    for _, row in mo_order_data.iterrows():
-                        manufacture_date = row['manufacture_date']
-                        if isinstance(manufacture_date, datetime):
-                            manufacture_date = manufacture_date.strftime('%Y-%m-%d')
-                        all_failed_results.append({
-                            'order_id': order_id,
-                            'sku': str(row['sku']),
-                            'product': str(row['product']),
-                            'manufacture_date': manufacture_date,
-                            'failure_reason': 'Insufficient stock to fulfill order'
-                        })
-
-            # Final processing summary
-            end_time = time.time()
-            duration = end_time - start_time
-            print(f"\n🎉 === PROCESSING COMPLETE ===")
-            print(f"⏱️  Total Duration: {duration:.2f} seconds ({duration/60:.1f} minutes)")
-            print(f"📦 Total Orders Processed: {processed_count}")
-            print(f"✅ Successful: {successful_count}")
-            print(f"❌ Failed: {failed_count}")
-            print(f"📊 Success Rate: {(successful_count/processed_count*100):.1f}%" if processed_count > 0 else "N/A")
-            print(f"⚡ Processing Speed: {(processed_count/duration):.1f} orders/second" if duration > 0 else "N/A")
-            
-            # Replace entire purchase orders table with updated DataFrame using high-performance bulk insert
-            if not purchase_orders_df.empty:
-                print(f"Replacing purchase orders table with updated DataFrame ({len(purchase_orders_df)} records)...")
-                
-                # Remove generated columns before inserting (PostgreSQL will auto-calculate them)
-                columns_to_exclude = ['total_cost']  # Add other generated columns if any
-                df_to_insert = purchase_orders_df.drop(columns=[col for col in columns_to_exclude if col in purchase_orders_df.columns])
-                
-                # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
-                records_to_insert = df_to_insert.to_dict('records')
-                
-                # Clear the existing table and bulk insert using SQLAlchemy core (same as bulk create endpoint)
-                db.session.execute(text("DELETE FROM purchaseorders;"))
-                db.session.execute(
-                    PurchaseOrder.__table__.insert(),
-                    records_to_insert
-                )
-                print("✅ Purchase orders table successfully updated with high-performance bulk insert")
-
-            # High-performance bulk insert for manufacture results using SQLAlchemy core
-            if all_manufacture_results:
-                total_results = len(all_manufacture_results)
-                print(f"\nBulk inserting {total_results} manufacture results using high-performance method...")
-                
-                # Prepare records for SQLAlchemy core bulk insert (same format as bulk create endpoints)
-                manufacture_records = []
-                for record in all_manufacture_results:
-                    manufacture_records.append({
-                        'manufacture_order_id': record['order_id'],
-                        'manufacture_batch': record['manufacture_batch'],
-                        'sku': record['sku'],
-                        'product': record['product'],
-                        'fulfilled_by_po': record['po_id'],
-                        'fulfilled_quantity': record['allocated_qty'],
-                        'cost': record['cost'],
-                        'unit_cost': record['unit_price'],
-                        'manufacture_completion_date': record['completion_date'],
-                        'status': 'COMPLETED',
-                        'quantity_left': record['allocated_qty']
-                    })
-                
-                # Single bulk insert operation (same as bulk create endpoint performance)
-                db.session.execute(
-                    ManufactureResult.__table__.insert(),
-                    manufacture_records
-                )
-                print(f"✅ Successfully bulk inserted {total_results} manufacture results")
-
-            # High-performance bulk insert for failed results using SQLAlchemy core
-            if all_failed_results:
-                total_failed = len(all_failed_results)
-                print(f"Bulk inserting {total_failed} failed manufacture results using high-performance method...")
-                
-                # Records are already in the correct format for SQLAlchemy core bulk insert
-                # Just need to map the field names to match the model
-                failed_records = []
-                for record in all_failed_results:
-                    failed_records.append({
-                        'manufacture_order_id': record['order_id'],
-                        'sku': record['sku'],
-                        'product': record['product'],
-                        'manufacture_date': record['manufacture_date'],
-                        'failure_reason': record['failure_reason']
-                    })
-                
-                # Single bulk insert operation (same as bulk create endpoint performance)
-                db.session.execute(
-                    FailedManufactureResult.__table__.insert(),
-                    failed_records
-                )
-                print(f"✅ Successfully bulk inserted {total_failed} failed manufacture results")
+            summary = fifo_manufacture_results()
 
         return jsonify({
             'message': 'Manufacture results generated successfully',
-            'summary': {
-                'total_processed': processed_count,
-                'successful': successful_count,
-                'failed': failed_count,
-                'success_rate': round((successful_count/processed_count*100), 1) if processed_count > 0 else 0
-            }
+            'summary': summary
         }), 200
 
     except Exception as e:
@@ -3439,182 +2947,12 @@ def generate_manufacture_results():
 
 
 @app.route('/manufacture_result/update_with_stock_exchange', methods=['GET'])
+@pipeline_timer.timed('manufacture_result_stock_exchange')
+@change_tracker.consumer('manufacture_result_stock_exchange', ('stockexchange', 'manufactureresult'))
 def update_manufacture_results_with_stock_exchange():
     try:
         with db.session.begin():
-
-            # Clear all failed stock exchanges
-            db.session.execute(text("""
-                DELETE FROM failedstockexchange;
-            """))
-
-            # Get all stock exchanges
-            stock_exchanges = db.session.execute(text("""
-                SELECT id, sku_original, sku_new, quantity, exchange_date
-                FROM stockexchange
-                ORDER BY exchange_date;
-            """)).fetchall()
-
-            mo_number = -2
-            for exchange_id, sku_original, sku_new, exchange_quantity, exchange_date in stock_exchanges:
-                remaining_qty = exchange_quantity
-                staged_updates = []
-
-                # Get all manufacture results for the original SKU
-                manufacture_results = db.session.execute(text("""
-                    SELECT 
-                        manufacture_order_id,
-                        manufacture_batch,
-                        sku,
-                        product,
-                        fulfilled_by_PO,
-                        fulfilled_quantity,
-                        cost,
-                        unit_cost,
-                        manufacture_completion_date,
-                        status,
-                        quantity_left
-                    FROM manufactureresult
-                    WHERE sku = :sku AND quantity_left > 0 AND manufacture_completion_date <= CAST(:exchange_date AS DATE)
-                    ORDER BY manufacture_completion_date DESC, manufacture_batch DESC, manufacture_order_id DESC;
-                """), {
-                    'sku': sku_original,
-                    'exchange_date': exchange_date
-                }).fetchall()
-
-                # Check if any manufacture results are available
-                if not manufacture_results:
-                    # Store failed exchange in FailedStockExchange table
-                    db.session.execute(text("""
-                        INSERT INTO FailedStockExchange (
-                            sku_original, sku_new, quantity, exchange_date
-                        ) VALUES (:sku_original, :sku_new, :quantity, :exchange_date);
-                    """), {
-                        'sku_original': sku_original,
-                        'sku_new': sku_new,
-                        'quantity': exchange_quantity,
-                        'exchange_date': exchange_date
-                    })
-                    print(f"Failed to process exchange ID {exchange_id}. "
-                          f"No available stock found for SKU {sku_original}")
-                    continue
-
-                # Group results by MO ID and batch
-                grouped_results = {}
-                for result in manufacture_results:
-                    mo_id, batch = result[0], result[1]
-                    key = (mo_id, batch)
-                    if key not in grouped_results:
-                        grouped_results[key] = []
-                    grouped_results[key].append(result)
-
-                # Process each group and create staged updates
-                batch_number = 1
-                exchange_fulfilled = False
-                
-                for (mo_id, batch), group in grouped_results.items():
-                    if remaining_qty <= 0:
-                        exchange_fulfilled = True
-                        break
-
-                    # Calculate product ratios for this manufacture order
-                    product_ratios, min_quantity = calculate_product_ratios(mo_id)
-                    
-                    # Find how much we can consume from this group
-                    min_available = float('inf')
-                    for result in group:
-                        product = result[3]
-                        quantity = int(result[5])
-                        if product in product_ratios:
-                            possible_skus = quantity // product_ratios[product]
-                            min_available = min(min_available, possible_skus)
-
-                    # Calculate how much to consume
-                    to_consume = min(remaining_qty, min_available)
-                    if to_consume <= 0:
-                        continue
-
-                    # Create staged updates for each product in the group
-                    for result in group:
-                        mo_id = result[0]
-                        batch = result[1]
-                        product = result[3]
-                        po_id = result[4]
-                        current_cost = result[6]
-                        unit_cost = result[7]
-
-                        if product in product_ratios:
-                            consume_qty = to_consume * product_ratios[product]
-
-                            # Stage update for existing record
-                            staged_updates.append({
-                                "type": "update",
-                                "mo_id": mo_id,
-                                "batch": batch,
-                                "product": product,
-                                "po_id": po_id,
-                                "consume_qty": consume_qty,
-                                "new_cost": current_cost - consume_qty * unit_cost
-                            })
-
-                            # Stage insert for new record
-                            staged_updates.append({
-                                "type": "insert",
-                                "mo_id": mo_number,
-                                "batch": batch_number,
-                                "sku": sku_new,
-                                "product": product,
-                                "po_id": po_id,
-                                "quantity": consume_qty,
-                                "cost": consume_qty * unit_cost,
-                                "unit_cost": unit_cost,
-                                "completion_date": exchange_date
-                            })
-
-                    remaining_qty -= to_consume
-                    batch_number = batch_number + 1
-                mo_number = mo_number -1
-
-                # Only process updates if the exchange can be fully fulfilled
-                if remaining_qty <= 0:
-                    # Process all staged updates
-                    for update in staged_updates:
-                        if update["type"] == "update":
-                            db.session.execute(text("""
-                                UPDATE manufactureresult
-                                SET fulfilled_quantity = fulfilled_quantity - :consume_qty,
-                                    quantity_left = quantity_left - :consume_qty,
-                                    cost = :new_cost
-                                WHERE manufacture_order_id = :mo_id 
-                                    AND manufacture_batch = :batch
-                                    AND product = :product
-                                    AND fulfilled_by_po = :po_id;
-                            """), update)
-                        else:  # insert
-                            db.session.execute(text("""
-                                INSERT INTO manufactureresult (
-                                    manufacture_order_id, manufacture_batch, sku, product,
-                                    fulfilled_by_po, fulfilled_quantity, cost, unit_cost,
-                                    manufacture_completion_date, status, quantity_left
-                                ) VALUES (
-                                    :mo_id, :batch, :sku, :product,
-                                    :po_id, :quantity, :cost, :unit_cost,
-                                    :completion_date, 'COMPLETED', :quantity
-                                );
-                            """), update)
-                    print(f"Successfully processed exchange ID {exchange_id}")
-                else:
-                    # Store failed exchange in FailedStockExchange table
-                    db.session.execute(text("""
-                        INSERT INTO FailedStockExchange (
-                            sku_original, sku_new, quantity, exchange_date
-                        ) VALUES (:sku_original, :sku_new, :quantity, :exchange_date);
-                    """), {
-                        'sku_original': sku_original,
-                        'sku_new': sku_new,
-                        'quantity': exchange_quantity,
-                        'exchange_date': exchange_date
-                    })
+            fifo_stock_exchanges()
 
         return jsonify({'message': 'Stock exchanges processed successfully'}), 200
 
@@ -3624,1043 +2962,59 @@ def update_manufacture_results_with_stock_exchange():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/cogs/generate', methods=['GET'])
+@pipeline_timer.timed('cogs_generate')
+@change_tracker.consumer('cogs', ('salesrecords', 'returns', 'stockinitiationaddition', 'manufactureresult'))
 def generate_cogs():
     try:
         with db.session.begin():
-            # Reset quantities will be handled in DataFrames (applied when we replace tables)
-            # Manufacture Result Reset is handled by calling 
-            # app.route('/manufacture_result/generate', methods=['GET'])
-            # and app.route('/manufacture_result/update_with_stock_exchange', methods=['GET'])
-            # in the frontend refresh button
-
-            # Clear existing COGS
-            db.session.execute(text("DELETE FROM cogs;"))
-            db.session.execute(text("DELETE FROM failedcogs;"))
-
-            # Pre-fetch all data needed for COGS processing
-            print("Pre-fetching sales records data...")
-            sales_records_df = pd.read_sql_query("""
-                SELECT sales_record_id, sku, quantity_sold, sales_date
-                FROM salesrecords
-                ORDER BY sales_date;
-            """, db.engine)
-            
-            print("Pre-fetching manufacture orders data for product ratios...")
-            manufacture_orders_df = pd.read_sql_query("""
-                SELECT manufacture_order_id, product, manufacture_quantity
-                FROM manufactureorders
-                ORDER BY manufacture_order_id, product;
-            """, db.engine)
-            
-            print("Pre-fetching manufacture results data...")
-            manufacture_results_df = pd.read_sql_query("""
-                SELECT *
-                FROM manufactureresult
-                ORDER BY sku, manufacture_completion_date;
-            """, db.engine)
-            
-            print("Pre-fetching returns data...")
-            returns_df = pd.read_sql_query("""
-                SELECT *
-                FROM returns
-                ORDER BY sku, return_date;
-            """, db.engine)
-            
-            print("Pre-fetching stock initiation data...")
-            stock_initiation_df = pd.read_sql_query("""
-                SELECT *
-                FROM stockinitiationaddition
-                ORDER BY sku, manufacture_completion_date;
-            """, db.engine)
-            
-            # Reset quantities in DataFrames (will be applied when we replace tables)
-            if not returns_df.empty:
-                returns_df['quantity_left'] = returns_df['return_quantity']
-                print("✅ Reset return quantities in DataFrame")
-            
-            if not stock_initiation_df.empty:
-                stock_initiation_df['quantity_left'] = stock_initiation_df['fulfilled_quantity']
-                print("✅ Reset stock initiation quantities in DataFrame")
-
-            # Convert date columns to proper datetime format
-            if not sales_records_df.empty:
-                sales_records_df['sales_date'] = pd.to_datetime(sales_records_df['sales_date']).dt.date
-            if not manufacture_results_df.empty:
-                manufacture_results_df['manufacture_completion_date'] = pd.to_datetime(manufacture_results_df['manufacture_completion_date']).dt.date
-            if not returns_df.empty:
-                returns_df['return_date'] = pd.to_datetime(returns_df['return_date']).dt.date
-            if not stock_initiation_df.empty:
-                stock_initiation_df['manufacture_completion_date'] = pd.to_datetime(stock_initiation_df['manufacture_completion_date']).dt.date
-
-            # Collect all COGS and failed COGS for batch insertion
-            all_cogs_updates = []
-            all_failed_cogs = []
-            all_return_updates = []
-            all_initiation_updates = []
-            all_manufacture_updates = []
-
-            import time
-            start_time = time.time()
-            print(f"🚀 Starting COGS processing for {len(sales_records_df)} sales records at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            processed_count = 0
-            successful_count = 0
-            failed_count = 0
-
-            # Process each sales record using DataFrame
-            for _, sales_row in sales_records_df.iterrows():
-                sales_record_id = str(sales_row['sales_record_id'])  # Keep as string - can contain hyphens like Amazon order IDs
-                SKU = str(sales_row['sku'])
-                quantity_sold = int(sales_row['quantity_sold'])
-                sales_date = sales_row['sales_date']
-                
-                processed_count += 1
-                
-                # Progress logging
-                if processed_count % 100 == 0 or processed_count <= 10:
-                    progress_pct = (processed_count / len(sales_records_df)) * 100
-                    print(f"[{processed_count}/{len(sales_records_df)}] ({progress_pct:.1f}%) Processing SKU {SKU}... (Success: {successful_count}, Failed: {failed_count})")
-                
-                # Major milestone logging every 1000 records
-                if processed_count % 1000 == 0:
-                    print(f"\n🎯 MILESTONE: {processed_count} sales records processed ({(processed_count/len(sales_records_df)*100):.1f}% complete)")
-                    print(f"   📊 Current Stats: ✅ {successful_count} successful, ❌ {failed_count} failed")
-                    print("   ⏱️  Process continuing...\n")
-
-                # Check available inventory using DataFrames
-                # Filter manufacture results for this SKU and sales date (only records with quantity > 0)
-                manufacture_qty = manufacture_results_df[
-                    (manufacture_results_df['sku'] == SKU) & 
-                    (manufacture_results_df['manufacture_completion_date'] <= sales_date) &
-                    (manufacture_results_df['quantity_left'] > 0)
-                ]['quantity_left'].sum()
-                
-                # Filter returns for this SKU and sales date (only records with quantity > 0)
-                returns_qty = returns_df[
-                    (returns_df['sku'] == SKU) & 
-                    (returns_df['return_date'] <= sales_date) &
-                    (returns_df['quantity_left'] > 0)
-                ]['quantity_left'].sum()
-                
-                # Filter stock initiation for this SKU and sales date (only records with quantity > 0)
-                initiation_qty = stock_initiation_df[
-                    (stock_initiation_df['sku'] == SKU) & 
-                    (stock_initiation_df['manufacture_completion_date'] <= sales_date) &
-                    (stock_initiation_df['quantity_left'] > 0)
-                ]['quantity_left'].sum()
-                
-                total_available = manufacture_qty + returns_qty + initiation_qty
-
-                # If no inventory available, record as failed immediately
-                if total_available == 0:
-                    all_failed_cogs.append({
-                        'sales_record_id': sales_record_id,
-                        'sales_date': sales_date,
-                        'sku': SKU,
-                        'quantity_sold': quantity_sold,
-                        'failed_quantity': quantity_sold,
-                        'failure_reason': 'No available inventory'
-                    })
-                    failed_count += 1
-                    continue
-
-                remaining_qty = quantity_sold
-                cogs_updates = []
-
-                # Get available inventory from DataFrames and combine them
-                available_inventory = []
-                
-                # Add returns inventory
-                available_returns = returns_df[
-                    (returns_df['sku'] == SKU) & 
-                    (returns_df['return_date'] <= sales_date) &
-                    (returns_df['quantity_left'] > 0)
-                ].copy()
-                
-                for _, row in available_returns.iterrows():
-                    try:
-                        available_inventory.append({
-                            'source': 'return',
-                            'order_id': 0,
-                            'batch': 0,
-                            'completion_date': row['return_date'],
-                            'source_id': str(row['return_order_id']),
-                            'quantity_left': int(row['quantity_left']),
-                            'unit_cost': float(row['return_unit_price']) * float(row['fx_rate'])
-                        })
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Skipping return record due to data conversion error: {e}")
-                
-                # Add manufacture results inventory  
-                available_manufacture = manufacture_results_df[
-                    (manufacture_results_df['sku'] == SKU) & 
-                    (manufacture_results_df['manufacture_completion_date'] <= sales_date) &
-                    (manufacture_results_df['quantity_left'] > 0)
-                ].copy()
-                
-                for _, row in available_manufacture.iterrows():
-                    try:
-                        available_inventory.append({
-                            'source': 'manufacture',
-                            'order_id': int(row['manufacture_order_id']),
-                            'batch': int(row['manufacture_batch']),
-                            'completion_date': row['manufacture_completion_date'],
-                            'source_id': str(row['manufacture_order_id']),
-                            'quantity_left': int(row['quantity_left']),
-                            'unit_cost': float(row['unit_cost'])
-                        })
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Skipping manufacture record due to data conversion error: {e}")
-                
-                # Add stock initiation inventory
-                available_initiation = stock_initiation_df[
-                    (stock_initiation_df['sku'] == SKU) & 
-                    (stock_initiation_df['manufacture_completion_date'] <= sales_date) &
-                    (stock_initiation_df['quantity_left'] > 0)
-                ].copy()
-                
-                for _, row in available_initiation.iterrows():
-                    try:
-                        available_inventory.append({
-                            'source': 'initiation',
-                            'order_id': int(row['result_id']),
-                            'batch': int(row['manufacture_batch']),
-                            'completion_date': row['manufacture_completion_date'],
-                            'source_id': str(row['result_id']),
-                            'quantity_left': int(row['quantity_left']),
-                            'unit_cost': float(row['unit_cost'])
-                        })
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Skipping initiation record due to data conversion error: {e}")
-                
-                # Sort by completion date for FIFO
-                available_inventory.sort(key=lambda x: x['completion_date'])
-
-                for inv_item in available_inventory:
-                    if remaining_qty == 0:
-                        break
-
-                    source = inv_item['source']
-                    order_id = inv_item['order_id']
-                    batch = inv_item['batch']
-                    source_id = inv_item['source_id']
-                    available_qty = inv_item['quantity_left']
-                    unit_cost = inv_item['unit_cost']
-                    completion_date = inv_item['completion_date']
-
-                    allocated_qty = min(remaining_qty, available_qty)
-                    remaining_qty -= allocated_qty
-                    
-                    if source == 'return':
-                        # For returns, we don't need product ratios
-                        cogs_updates.append({
-                            'sales_record_id': sales_record_id,
-                            'manufacture_order_id': 0,
-                            'manufacture_batch': 0,
-                            'sku': SKU,
-                            'product': SKU,
-                            'fulfilled_by_po': source_id,
-                            'consumed_quantity': allocated_qty,
-                            'cost': allocated_qty * float(unit_cost),
-                            'sales_date': sales_date
-                        })
-                    elif source == 'initiation':
-                        # For stock initiation, we don't need product ratios
-                        cogs_updates.append({
-                            'sales_record_id': sales_record_id,
-                            'manufacture_order_id': -1,
-                            'manufacture_batch': -1,
-                            'sku': SKU,
-                            'product': SKU,
-                            'fulfilled_by_po': 'INITIATION & ADDITION ' + source_id,
-                            'consumed_quantity': allocated_qty,
-                            'cost': allocated_qty * float(unit_cost),
-                            'sales_date': sales_date
-                        })
-                    else:
-                        # Get product ratios for manufacture orders using DataFrames for performance
-                        product_ratios,_ = calculate_product_ratios_COGS(order_id, batch, completion_date, manufacture_orders_df, manufacture_results_df)
-                        
-                        # Get all products used in this batch from DataFrame
-                        batch_products = manufacture_results_df[
-                            (manufacture_results_df['manufacture_order_id'] == order_id) &
-                            (manufacture_results_df['manufacture_batch'] == batch)
-                        ][['product', 'fulfilled_by_po', 'unit_cost']].drop_duplicates()
-
-                        for _, product_row in batch_products.iterrows():
-                            product = str(product_row['product'])
-                            po_id = str(product_row['fulfilled_by_po'])
-                            product_unit_cost = float(product_row['unit_cost'])
-                            
-                            ratio = product_ratios[product]
-                            consumed_qty = allocated_qty * ratio
-                            
-                            cogs_updates.append({
-                                'sales_record_id': sales_record_id,
-                                'manufacture_order_id': order_id,
-                                'manufacture_batch': batch,
-                                'sku': SKU,
-                                'product': product,
-                                'fulfilled_by_po': po_id,
-                                'consumed_quantity': consumed_qty,
-                                'cost': consumed_qty * float(product_unit_cost),
-                                'sales_date': sales_date
-                            })
-
-                # Collect COGS updates for batch processing
-                if cogs_updates:
-                    all_cogs_updates.extend(cogs_updates)
-                    successful_count += 1
-                    
-                    # Separate updates by source type for batch processing and update DataFrames
-                    for update in cogs_updates:
-                        if update.get('manufacture_order_id') == 0:  # Return source
-                            all_return_updates.append(update)
-                            
-                            # Update returns DataFrame for next sales records
-                            return_mask = (returns_df['return_order_id'] == update['fulfilled_by_po']) & (returns_df['sku'] == update['sku'])
-                            if return_mask.any():
-                                returns_df.loc[return_mask, 'quantity_left'] -= update['consumed_quantity']
-                                
-                        elif update.get('manufacture_order_id') == -1:  # Stock Initiation source
-                            try:
-                                result_id_str = update['fulfilled_by_po'].replace('INITIATION & ADDITION ', '')
-                                result_id_int = int(result_id_str)
-                                all_initiation_updates.append({
-                                    **update,
-                                    'result_id': result_id_int
-                                })
-                                
-                                # Update stock initiation DataFrame for next sales records
-                                initiation_mask = (stock_initiation_df['result_id'] == result_id_int) & (stock_initiation_df['sku'] == update['sku'])
-                                if initiation_mask.any():
-                                    stock_initiation_df.loc[initiation_mask, 'quantity_left'] -= update['consumed_quantity']
-                                    
-                            except ValueError as e:
-                                print(f"Warning: Could not convert result_id '{result_id_str}' to integer for initiation update: {e}")
-                                # Skip this update if result_id cannot be converted
-                        else:  # Manufacture source
-                            all_manufacture_updates.append(update)
-                            
-                            # Update manufacture results DataFrame for next sales records
-                            manufacture_mask = (
-                                (manufacture_results_df['manufacture_order_id'] == update['manufacture_order_id']) &
-                                (manufacture_results_df['manufacture_batch'] == update['manufacture_batch']) &
-                                (manufacture_results_df['sku'] == update['sku']) &
-                                (manufacture_results_df['product'] == update['product']) &
-                                (manufacture_results_df['fulfilled_by_po'] == update['fulfilled_by_po'])
-                            )
-                            if manufacture_mask.any():
-                                manufacture_results_df.loc[manufacture_mask, 'quantity_left'] -= update['consumed_quantity']
-
-                # Record failed portion if any
-                if remaining_qty > 0:
-                    all_failed_cogs.append({
-                        'sales_record_id': sales_record_id,
-                        'sales_date': sales_date,
-                        'sku': SKU,
-                        'quantity_sold': quantity_sold,
-                        'failed_quantity': remaining_qty,
-                        'failure_reason': 'Insufficient stock to fulfill order'
-                    })
-                    
-                    if remaining_qty == quantity_sold:  # Complete failure
-                        failed_count += 1
-
-            # Final processing summary
-            end_time = time.time()
-            duration = end_time - start_time
-            print(f"\n🎉 === COGS PROCESSING COMPLETE ===")
-            print(f"⏱️  Total Duration: {duration:.2f} seconds ({duration/60:.1f} minutes)")
-            print(f"📦 Total Sales Records Processed: {processed_count}")
-            print(f"✅ Successful: {successful_count}")
-            print(f"❌ Failed: {failed_count}")
-            print(f"📊 Success Rate: {(successful_count/processed_count*100):.1f}%" if processed_count > 0 else "N/A")
-            print(f"⚡ Processing Speed: {(processed_count/duration):.1f} records/second" if duration > 0 else "N/A")
-
-            # High-performance bulk insert for COGS records using SQLAlchemy core
-            if all_cogs_updates:
-                total_cogs = len(all_cogs_updates)
-                print(f"Bulk inserting {total_cogs} COGS records using high-performance method...")
-                
-                # Prepare records for SQLAlchemy core bulk insert
-                cogs_records = []
-                for record in all_cogs_updates:
-                    cogs_records.append({
-                        'sales_record_id': record['sales_record_id'],
-                        'sales_date': record['sales_date'],
-                        'sku': record['sku'],
-                        'quantity_sold': record['consumed_quantity'],
-                        'result_id': record['manufacture_order_id'],
-                        'manufacture_batch': record['manufacture_batch'],
-                        'product': record['product'],
-                        'fulfilled_by_po': record['fulfilled_by_po'],
-                        'cogs': record['cost']
-                    })
-                
-                # Single bulk insert operation (same as bulk create endpoint performance)
-                db.session.execute(
-                    COGS.__table__.insert(),
-                    cogs_records
-                )
-                print(f"✅ Successfully bulk inserted {total_cogs} COGS records")
-
-            # Replace entire returns table with updated DataFrame using high-performance bulk insert
-            if not returns_df.empty:
-                print(f"Replacing returns table with updated DataFrame ({len(returns_df)} records)...")
-                
-                # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
-                returns_records = returns_df.to_dict('records')
-                
-                # Clear the existing table and bulk insert using SQLAlchemy core
-                db.session.execute(text("DELETE FROM returns;"))
-                db.session.execute(
-                    Return.__table__.insert(),
-                    returns_records
-                )
-                print("✅ Returns table successfully updated with high-performance bulk insert")
-            
-            # Replace entire stock initiation table with updated DataFrame using high-performance bulk insert
-            if not stock_initiation_df.empty:
-                print(f"Replacing stock initiation table with updated DataFrame ({len(stock_initiation_df)} records)...")
-                
-                # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
-                initiation_records = stock_initiation_df.to_dict('records')
-                
-                # Clear the existing table and bulk insert using SQLAlchemy core
-                db.session.execute(text("DELETE FROM stockinitiationaddition;"))
-                db.session.execute(
-                    ManufactureStockInitiationAddition.__table__.insert(),
-                    initiation_records
-                )
-                print("✅ Stock initiation table successfully updated with high-performance bulk insert")
-            
-            # Replace entire manufacture results table with updated DataFrame using high-performance bulk insert
-            if not manufacture_results_df.empty:
-                print(f"Replacing manufacture results table with updated DataFrame ({len(manufacture_results_df)} records)...")
-                
-                # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
-                manufacture_records = manufacture_results_df.to_dict('records')
-                
-                # Clear the existing table and bulk insert using SQLAlchemy core
-                db.session.execute(text("DELETE FROM manufactureresult;"))
-                db.session.execute(
-                    ManufactureResult.__table__.insert(),
-                    manufacture_records
-                )
-                print("✅ Manufacture results table successfully updated with high-performance bulk insert")
-
-            # High-performance bulk insert for failed COGS records using SQLAlchemy core
-            if all_failed_cogs:
-                total_failed = len(all_failed_cogs)
-                print(f"Bulk inserting {total_failed} failed COGS records using high-performance method...")
-                
-                # Records are already in the correct format for SQLAlchemy core bulk insert
-                # Single bulk insert operation (same as bulk create endpoint performance)
-                db.session.execute(
-                    FailedCOGS.__table__.insert(),
-                    all_failed_cogs
-                )
-                print(f"✅ Successfully bulk inserted {total_failed} failed COGS records")
+            summary = fifo_cogs()
 
         return jsonify({
             'message': 'COGS generated successfully',
-            'summary': {
-                'total_processed': processed_count,
-                'successful': successful_count,
-                'failed': failed_count,
-                'success_rate': round((successful_count/processed_count*100), 1) if processed_count > 0 else 0,
-                'cogs_records_created': len(all_cogs_updates),
-                'failed_cogs_records': len(all_failed_cogs)
-            }
+            'summary': summary
         }), 200
     except Exception as e:
         db.session.rollback()
         print(f"Error in generate_cogs: {str(e)}")  # Add this for debugging
         return jsonify({'error': str(e)}), 500
-    
-
-# ---------------------------------------------------------------------------------------------------------------
-# Routes for generate Inventory and InventoryRawMaterial                                                         |
-# ---------------------------------------------------------------------------------------------------------------
-# Helper function to generate call COGS generation as of a specific date
-# which updates remaining quantities for ManufactureResult and Returns as of that date
-def re_rank_manufacture_orders_use_before_generate_manufacture_results_as_of_date():
-    # Create temporary table for ranking
-    db.session.execute(text("""
-        CREATE TEMPORARY TABLE RankedRows AS
-        SELECT
-            id,
-            dense_rank() OVER (
-                ORDER BY manufacture_date, SKU
-            ) AS new_manufacture_order_id
-        FROM manufactureorders;
-    """))
-
-    # Update manufacture order IDs
-    db.session.execute(text("""
-        UPDATE manufactureorders
-        SET manufacture_order_id = (
-            SELECT new_manufacture_order_id
-            FROM RankedRows
-            WHERE manufactureorders.id = RankedRows.id
-        );
-    """))
 
-    # Drop temporary table
-    db.session.execute(text("DROP TABLE IF EXISTS RankedRows;"))
-
-def generate_cogs_as_of_date(target_date):
-    # Reset quantities
-    # Manufacture Result Reset must be handled outside before use of this function
-    db.session.execute(text("""
-        UPDATE returns
-        SET quantity_left = return_quantity;
-    """))
-
-    db.session.execute(text("""
-                UPDATE stockinitiationaddition
-                SET quantity_left = fulfilled_quantity;
-            """))
-
-    # Clear existing COGS
-    db.session.execute(text("DELETE FROM cogs;"))
-    db.session.execute(text("DELETE FROM failedcogs;"))
-
-    # Get all sales records up to target date
-    sales_records = db.session.execute(text("""
-        SELECT sales_record_id, SKU, quantity_sold, sales_date
-        FROM salesrecords
-        WHERE sales_date <= CAST(:target_date AS DATE)
-        ORDER BY sales_date;
-    """), {'target_date': target_date}).fetchall()
-
-    # Process each sales record
-    for sales_record_id, SKU, quantity_sold, sales_date in sales_records:
-
-        # First check if there's any available inventory
-        total_available = db.session.execute(text("""
-            WITH manufacture_qty AS (
-                SELECT 
-                    manufacture_order_id,
-                    manufacture_batch,
-                    manufacture_completion_date,
-                    COALESCE(min(quantity_left), 0) as qty
-                FROM manufactureresult 
-                WHERE SKU = :SKU 
-                AND manufacture_completion_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-                GROUP BY manufacture_order_id, manufacture_batch, manufacture_completion_date
-            ),
-            all_qty AS (
-                SELECT COALESCE(sum(quantity_left), 0) as qty
-                FROM returns
-                WHERE SKU = :SKU 
-                AND return_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-                
-                UNION ALL
-                
-                SELECT COALESCE(sum(qty), 0) as qty
-                FROM manufacture_qty
-                
-                UNION ALL
-                
-                SELECT COALESCE(sum(quantity_left), 0) as qty
-                FROM stockinitiationaddition
-                WHERE SKU = :SKU 
-                AND manufacture_completion_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-            )
-            SELECT COALESCE(sum(qty), 0) as total_qty
-            FROM all_qty;
-        """), {'SKU': SKU, 'sales_date': sales_date}).scalar()
-
-        # If no inventory available, record as failed immediately
-        if total_available == 0:
-            db.session.execute(text("""
-                INSERT INTO FailedCOGS (
-                    sales_record_id, sales_date, SKU, quantity_sold,
-                    failed_quantity, failure_reason
-                ) VALUES (
-                    :sales_record_id, :sales_date, :SKU, :quantity_sold,
-                    :quantity_sold, 'No available inventory'
-                );
-            """), {
-                'sales_record_id': sales_record_id,
-                'sales_date': sales_date,
-                'SKU': SKU,
-                'quantity_sold': quantity_sold
-            })
-            continue
-
-        remaining_qty = quantity_sold
-        cogs_updates = []
-
-        # Get available inventory
-        available_inventory = db.session.execute(text("""
-            WITH available_inventory AS (
-                SELECT 
-                    'return' as source,
-                    0 as manufacture_order_id,
-                    0 as manufacture_batch,
-                    return_date as completion_date,
-                    return_order_id as source_id,
-                    quantity_left,
-                    return_unit_price*fx_rate as unit_cost
-                FROM returns
-                WHERE SKU = :SKU 
-                AND return_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-                
-                UNION ALL
-                
-                SELECT 
-                    'manufacture' as source,
-                    manufacture_order_id,
-                    manufacture_batch,
-                    manufacture_completion_date as completion_date,
-                    cast(manufacture_order_id as text) as source_id,
-                        COALESCE(min(quantity_left), 0) as quantity_left,
-                        COALESCE(sum(unit_cost), 0) as unit_cost
-                FROM manufactureresult
-                WHERE SKU = :SKU 
-                AND manufacture_completion_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-                GROUP BY source, manufacture_order_id, manufacture_batch, 
-                            completion_date
-                UNION ALL
-                
-                SELECT 
-                    'initiation' as source,
-                    result_id as manufacture_order_id,
-                    manufacture_batch,
-                    manufacture_completion_date as completion_date,
-                    cast(result_id as text) as source_id,
-                        COALESCE(sum(quantity_left), 0) as quantity_left,
-                        COALESCE(sum(unit_cost), 0) as unit_cost
-                FROM stockinitiationaddition
-                WHERE SKU = :SKU 
-                AND manufacture_completion_date <= CAST(:sales_date AS DATE) 
-                AND quantity_left > 0
-                    GROUP BY source, manufacture_order_id, manufacture_batch, 
-                            completion_date
-            )
-            SELECT * FROM available_inventory
-            ORDER BY completion_date;
-        """), {'SKU': SKU, 'sales_date': sales_date}).fetchall()
-
-        for source, order_id, batch, completion_date, source_id, available_qty, unit_cost in available_inventory:
-            if remaining_qty == 0:
-                break
-
-            allocated_qty = min(remaining_qty, available_qty)
-            remaining_qty -= allocated_qty
-            
-            if source == 'return':
-                # For returns, we don't need product ratios
-                cogs_updates.append({
-                    'sales_record_id': sales_record_id,
-                    'manufacture_order_id': 0,
-                    'manufacture_batch': 0,
-                    'SKU': SKU,
-                    'product': SKU,
-                    'fulfilled_by_PO': source_id,
-                    'consumed_quantity': allocated_qty,
-                    'cost': allocated_qty * float(unit_cost),
-                    'sales_date': sales_date
-                })
-            elif source == 'initiation':
-                # For stock initiation, we don't need product ratios
-                cogs_updates.append({
-                    'sales_record_id': sales_record_id,
-                    'manufacture_order_id': -1,
-                    'manufacture_batch': -1,
-                    'SKU': SKU,
-                    'product': SKU,
-                    'fulfilled_by_PO': 'INITIATION & ADDITION ' + source_id,
-                    'consumed_quantity': allocated_qty,
-                    'cost': allocated_qty * float(unit_cost),
-                    'sales_date': sales_date
-                })
-            else:
-                # Get product ratios for manufacture orders
-                product_ratios,_ = calculate_product_ratios_COGS(order_id, batch, completion_date)
-                
-                # Get all products used in this batch
-                batch_products = db.session.execute(text("""
-                    SELECT product, fulfilled_by_PO, unit_cost
-                    FROM manufactureresult
-                    WHERE manufacture_order_id = :order_id 
-                    AND manufacture_batch = :batch;
-                """), {'order_id': order_id, 'batch': batch}).fetchall()
-
-                for product, po_id, product_unit_cost in batch_products:
-                    ratio = product_ratios[product]
-                    consumed_qty = allocated_qty * ratio
-                    
-                    cogs_updates.append({
-                        'sales_record_id': sales_record_id,
-                        'manufacture_order_id': order_id,
-                        'manufacture_batch': batch,
-                        'SKU': SKU,
-                        'product': product,
-                        'fulfilled_by_PO': po_id,
-                        'consumed_quantity': consumed_qty,
-                        'cost': consumed_qty * float(product_unit_cost),
-                        'sales_date': sales_date
-                    })
-
-        # Insert successful COGS records
-        for update in cogs_updates:
-            db.session.execute(text("""
-                INSERT INTO COGS (
-                    sales_record_id, sales_date, SKU, quantity_sold,
-                    result_id, manufacture_batch, product, fulfilled_by_PO,
-                    COGS
-                ) VALUES (
-                    :sales_record_id, :sales_date, :SKU, :consumed_quantity,
-                    :manufacture_order_id, :manufacture_batch, :product, :fulfilled_by_PO,
-                    :cost
-                );
-            """), update)
-
-            if update.get('manufacture_order_id') == 0:  # Return source
-                db.session.execute(text("""
-                    UPDATE returns
-                    SET quantity_left = quantity_left - :consumed_quantity
-                    WHERE return_order_id = :fulfilled_by_PO AND SKU = :SKU;
-                """), update)
-            elif update.get('manufacture_order_id') == -1:  # Stock Initiation source
-                result_id_int = int(update['fulfilled_by_PO'].replace('INITIATION & ADDITION ', ''))
-                db.session.execute(text("""
-                    UPDATE stockinitiationaddition
-                    SET quantity_left = quantity_left - :consumed_quantity
-                    WHERE result_id = :result_id AND SKU = :SKU;
-                """), {
-                    **update,
-                    'result_id': result_id_int
-                })
-            else:  # Manufacture source
-                db.session.execute(text("""
-                    UPDATE manufactureresult
-                    SET quantity_left = quantity_left - :consumed_quantity
-                    WHERE manufacture_order_id = :manufacture_order_id
-                    AND manufacture_batch = :manufacture_batch
-                    AND SKU = :SKU
-                    AND product = :product
-                    AND fulfilled_by_PO = :fulfilled_by_PO;
-                """), update)
-
-        # Record failed portion if any
-        if remaining_qty > 0:
-            db.session.execute(text("""
-                INSERT INTO FailedCOGS (
-                    sales_record_id, sales_date, SKU, quantity_sold,
-                    failed_quantity, failure_reason
-                ) VALUES (
-                    :sales_record_id, :sales_date, :SKU, :quantity_sold,
-                    :remaining_qty, 'Insufficient stock to fulfill order'
-                );
-            """), {
-                'sales_record_id': sales_record_id,
-                'sales_date': sales_date,
-                'SKU': SKU,
-                'quantity_sold': quantity_sold,
-                'remaining_qty': remaining_qty
-            })
-    
-def generate_manufacture_results_as_of_date(target_date):
+@app.route('/cogs/simulate', methods=['POST'])
+@pipeline_timer.timed('cogs_simulate')
+def simulate_cogs():
+    """
+    What-if COGS and inventory per SKU, run in memory without writing anything
+    Body: {"date": optional YYYY-MM-DD snapshot date, "overlays": {table: {"upsert": [rows], "delete": [rows]}}}
+    for purchaseorders, salesrecords and stockexchange
+    """
     try:
-        with db.session.begin():
-            # Reset PO quantities
-            db.session.execute(text("UPDATE purchaseorders SET quantity_left = purchase_quantity;"))
-
-            # Clear previous results
-            db.session.execute(text("DELETE FROM cogs;"))
-            db.session.execute(text("DELETE FROM failedcogs;"))
-            db.session.execute(text("DELETE FROM manufactureresult;"))
-            db.session.execute(text("DELETE FROM failedmanufactureresult;"))
-
-            # Get manufacture orders as of target_date
-            order_ids = db.session.execute(text("""
-                SELECT DISTINCT manufacture_order_id
-                FROM manufactureorders
-                WHERE manufacture_date <= CAST(:target_date AS DATE)
-                ORDER BY manufacture_order_id;
-            """), {'target_date': target_date}).fetchall()
-
-            for (order_id,) in order_ids:
-                staged_updates = []
-
-                # Step 1: Get required product quantities
-                needed_products = db.session.execute(text("""
-                    SELECT SKU, product, manufacture_quantity, manufacture_date
-                    FROM manufactureorders
-                    WHERE manufacture_order_id = :order_id
-                    ORDER BY product;
-                """), {'order_id': order_id}).fetchall()
-
-                if not needed_products:
-                    continue
-
-                # Step 2: Compute product ratios and required SKU count
-                product_ratios, _ = calculate_product_ratios(order_id)
-                product_qtys = []
-                for _, product, qty, _ in needed_products:
-                    product_qtys.append((product, qty))
-                try:
-                    required_skus = min(qty // product_ratios[product] for product, qty in product_qtys)
-                except ZeroDivisionError:
-                    required_skus = 0
-
-                # Step 3: Prepare raw PO pool (no allocation yet)
-                for SKU, product, _, manufacture_date in needed_products:
-                    if isinstance(manufacture_date, str):
-                        manufacture_date = datetime.strptime(manufacture_date, '%Y-%m-%d').date()
-
-                    purchase_orders = db.session.execute(text("""
-                        SELECT purchase_order_id, quantity_left, purchase_unit_price, fx_rate, order_date
-                        FROM purchaseorders
-                        WHERE product = :product
-                        AND quantity_left > 0
-                        AND (order_date - INTERVAL '5 days') <= :manufacture_date
-                        ORDER BY order_date;
-                    """), {'product': product, 'manufacture_date': manufacture_date}).fetchall()
-
-                    for po_id, quantity_left, unit_price, fx_rate, order_date in purchase_orders:
-                        if isinstance(order_date, str):
-                            order_date = datetime.strptime(order_date, '%Y-%m-%d').date()
-
-                        staged_updates.append({
-                            'order_id': order_id,
-                            'SKU': SKU,
-                            'product': product,
-                            'po_id': po_id,
-                            'allocated_qty': quantity_left,
-                            'unit_price': float(unit_price) * float(fx_rate),
-                            'fx_rate': float(fx_rate),
-                            'cost': quantity_left * float(unit_price) * float(fx_rate),
-                            'completion_date': manufacture_date,
-                            'order_date': order_date
-                        })
-
-                # Step 4: Attempt batching
-                processed_updates = process_manufacture_batches(order_id, staged_updates, required_skus)
-
-                if processed_updates:
-                    for update in processed_updates:
-                        db.session.execute(text("""
-                            INSERT INTO manufactureresult (
-                                manufacture_order_id, manufacture_batch, SKU, product, fulfilled_by_PO,
-                                fulfilled_quantity, cost, unit_cost, manufacture_completion_date, status, quantity_left
-                            ) VALUES (
-                                :order_id, :manufacture_batch, :SKU, :product, :po_id,
-                                :allocated_qty, :cost, :unit_price, :completion_date, 'COMPLETED', :allocated_qty
-                            )
-                        """), update)
-
-                        db.session.execute(text("""
-                            UPDATE purchaseorders
-                            SET quantity_left = quantity_left - :allocated_qty
-                            WHERE purchase_order_id = :po_id AND product = :product;
-                        """), update)
-                else:
-                    for SKU, product, _, manufacture_date in needed_products:
-                        if isinstance(manufacture_date, datetime):
-                            manufacture_date = manufacture_date.strftime('%Y-%m-%d')
-                        db.session.execute(text("""
-                            INSERT INTO failedmanufactureresult (
-                                manufacture_order_id, SKU, product, manufacture_date, failure_reason
-                            ) VALUES (
-                                :order_id, :SKU, :product, :manufacture_date, 'Insufficient stock to fulfill order'
-                            )
-                        """), {
-                            'order_id': order_id,
-                            'SKU': SKU,
-                            'product': product,
-                            'manufacture_date': manufacture_date
-                        })
+        data = request.get_json(silent=True) or {}
+        target_date = data.get('date')
+        if target_date:
+            try:
+                datetime.strptime(target_date, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid date format. Please format date as YYYY-MM-DD'}), 400
 
+        try:
+            result = simulate(data.get('overlays') or {}, target_date)
+        finally:
+            db.session.rollback()  # reads only; end the implicit transaction
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        db.session.rollback()
-        print(f"Error in generate_manufacture_results_as_of_date: {str(e)}")
-
-def update_manufacture_results_with_stock_exchange_as_of_date(target_date):
-    # Clear all failed stock exchanges
-    db.session.execute(text("""
-        DELETE FROM failedstockexchange;
-    """))
-
-    # Get all stock exchanges
-    stock_exchanges = db.session.execute(text("""
-        SELECT id, SKU_original, SKU_new, quantity, exchange_date
-        FROM stockexchange
-        WHERE exchange_date <= CAST(:target_date AS DATE)
-        ORDER BY exchange_date;
-    """), {'target_date': target_date}).fetchall()
-
-    mo_number = -2
-    for exchange_id, sku_original, sku_new, exchange_quantity, exchange_date in stock_exchanges:
-        remaining_qty = exchange_quantity
-        staged_updates = []
-
-        # Get all manufacture results for the original SKU
-        manufacture_results = db.session.execute(text("""
-            SELECT 
-                manufacture_order_id,
-                manufacture_batch,
-                SKU,
-                product,
-                fulfilled_by_PO,
-                fulfilled_quantity,
-                cost,
-                unit_cost,
-                manufacture_completion_date,
-                status,
-                quantity_left
-            FROM manufactureresult
-            WHERE SKU = :sku AND quantity_left > 0 AND manufacture_completion_date <= CAST(:exchange_date AS DATE)
-            ORDER BY manufacture_completion_date DESC, manufacture_batch DESC, manufacture_order_id DESC;
-        """), {
-            'sku': sku_original,
-            'exchange_date': exchange_date
-        }).fetchall()
-
-        # Check if any manufacture results are available
-        if not manufacture_results:
-            # Store failed exchange in FailedStockExchange table
-            db.session.execute(text("""
-                INSERT INTO FailedStockExchange (
-                    SKU_original, SKU_new, quantity, exchange_date
-                ) VALUES (:sku_original, :sku_new, :quantity, :exchange_date);
-            """), {
-                'sku_original': sku_original,
-                'sku_new': sku_new,
-                'quantity': exchange_quantity,
-                'exchange_date': exchange_date
-            })
-            print(f"Failed to process exchange ID {exchange_id}. "
-                    f"No available stock found for SKU {sku_original}")
-            continue
-
-        # Group results by MO ID and batch
-        grouped_results = {}
-        for result in manufacture_results:
-            mo_id, batch = result[0], result[1]
-            key = (mo_id, batch)
-            if key not in grouped_results:
-                grouped_results[key] = []
-            grouped_results[key].append(result)
-
-        # Process each group and create staged updates
-        batch_number = 1
-        exchange_fulfilled = False
-        
-        for (mo_id, batch), group in grouped_results.items():
-            if remaining_qty <= 0:
-                exchange_fulfilled = True
-                break
+        print(f"Error in simulate_cogs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-            # Calculate product ratios for this manufacture order
-            product_ratios, min_quantity = calculate_product_ratios(mo_id)
-            
-            # Find how much we can consume from this group
-            min_available = float('inf')
-            for result in group:
-                product = result[3]
-                quantity = int(result[5])
-                if product in product_ratios:
-                    possible_skus = quantity // product_ratios[product]
-                    min_available = min(min_available, possible_skus)
-
-            # Calculate how much to consume
-            to_consume = min(remaining_qty, min_available)
-            if to_consume <= 0:
-                continue
-
-            # Create staged updates for each product in the group
-            for result in group:
-                mo_id = result[0]
-                batch = result[1]
-                product = result[3]
-                po_id = result[4]
-                current_cost = result[6]
-                unit_cost = result[7]
-
-                if product in product_ratios:
-                    consume_qty = to_consume * product_ratios[product]
-
-                    # Stage update for existing record
-                    staged_updates.append({
-                        "type": "update",
-                        "mo_id": mo_id,
-                        "batch": batch,
-                        "product": product,
-                        "po_id": po_id,
-                        "consume_qty": consume_qty,
-                        "new_cost": current_cost - consume_qty * unit_cost
-                    })
-
-                    # Stage insert for new record
-                    staged_updates.append({
-                        "type": "insert",
-                        "mo_id": mo_number,
-                        "batch": batch_number,
-                        "sku": sku_new,
-                        "product": product,
-                        "po_id": po_id,
-                        "quantity": consume_qty,
-                        "cost": consume_qty * unit_cost,
-                        "unit_cost": unit_cost,
-                        "completion_date": exchange_date
-                    })
-
-            remaining_qty -= to_consume
-            batch_number = batch_number + 1
-        mo_number = mo_number -1
-
-        # Only process updates if the exchange can be fully fulfilled
-        if remaining_qty <= 0:
-            # Process all staged updates
-            for update in staged_updates:
-                if update["type"] == "update":
-                    db.session.execute(text("""
-                        UPDATE manufactureresult
-                        SET fulfilled_quantity = fulfilled_quantity - :consume_qty,
-                            quantity_left = quantity_left - :consume_qty,
-                            cost = :new_cost
-                        WHERE manufacture_order_id = :mo_id 
-                            AND manufacture_batch = :batch
-                            AND product = :product
-                            AND fulfilled_by_PO = :po_id;
-                    """), update)
-                else:  # insert
-                    db.session.execute(text("""
-                        INSERT INTO manufactureresult (
-                            manufacture_order_id, manufacture_batch, SKU, product,
-                            fulfilled_by_PO, fulfilled_quantity, cost, unit_cost,
-                            manufacture_completion_date, status, quantity_left
-                        ) VALUES (
-                            :mo_id, :batch, :sku, :product,
-                            :po_id, :quantity, :cost, :unit_cost,
-                            :completion_date, 'COMPLETED', :quantity
-                        );
-                    """), update)
-            print(f"Successfully processed exchange ID {exchange_id}")
-        else:
-            # Store failed exchange in FailedStockExchange table
-            db.session.execute(text("""
-                INSERT INTO FailedStockExchange (
-                    SKU_original, SKU_new, quantity, exchange_date
-                ) VALUES (:sku_original, :sku_new, :quantity, :exchange_date);
-            """), {
-                'sku_original': sku_original,
-                'sku_new': sku_new,
-                'quantity': exchange_quantity,
-                'exchange_date': exchange_date
-            })
 
+# ---------------------------------------------------------------------------------------------------------------
+# Routes for generate Inventory and InventoryRawMaterial                                                         |
+# ---------------------------------------------------------------------------------------------------------------
 @app.route('/inventory/generate', methods=['GET'])
+@pipeline_timer.timed('inventory_generate')
+@change_tracker.consumer('inventory', (
+    'purchaseorders', 'manufactureorders', 'salesrecords', 'returns', 'stockinitiationaddition', 'stockexchange'
+))
 def generate_inventory():
     try:
         target_date = request.args.get('date', None)
@@ -4695,94 +3049,98 @@ def generate_inventory():
                 return jsonify({'error': 'No records found to determine inventory date'}), 404
 
             # Generate Manufacture Result, Update with Exchange, then Generate COGS as of target date
-            re_rank_manufacture_orders_use_before_generate_manufacture_results_as_of_date()
-            generate_manufacture_results_as_of_date(target_date)
-            update_manufacture_results_with_stock_exchange_as_of_date(target_date)
-            generate_cogs_as_of_date(target_date)
-
-            # Now proceed with inventory calculation
-            db.session.execute(text("""
-                DELETE FROM inventory
-                WHERE as_of_date = CAST(:target_date AS DATE);
-            """), {'target_date': target_date})
+            rank_manufacture_orders()
+            with pipeline_timer.span('manufacture_results_as_of_date'):
+                fifo_manufacture_results(target_date)
+            with pipeline_timer.span('stock_exchange_as_of_date'):
+                fifo_stock_exchanges(target_date)
+            with pipeline_timer.span('cogs_as_of_date'):
+                fifo_cogs(target_date, batch_lots=True)
+
+            with pipeline_timer.span('inventory'):
+                # Now proceed with inventory calculation
+                db.session.execute(text("""
+                    DELETE FROM inventory
+                    WHERE as_of_date = CAST(:target_date AS DATE);
+                """), {'target_date': target_date})
 
-            # Insert new inventory records
-            db.session.execute(text("""
-                INSERT INTO Inventory (SKU, as_of_date, manufactured_total_quantity, in_stock_quantity, inventory_value)
-                WITH 
-                initiated AS (
-                    SELECT 
-                        SKU,
-                        -1 as manufacture_order_id,
-                        -1 as manufacture_batch,
-                        sum(fulfilled_quantity) as manufactured_total,
-                        sum(quantity_left) as manufactured_stock,
-                        sum(unit_cost * quantity_left) as inventory_value
-                    FROM stockinitiationaddition
-                    WHERE manufacture_completion_date <= CAST(:target_date AS DATE)
-                    GROUP BY SKU, manufacture_order_id, manufacture_batch
-                ),
-                manufactured AS (
-                    SELECT 
-                        SKU,
-                        manufacture_order_id,
-                        manufacture_batch,
-                        min(fulfilled_quantity) as manufactured_total,
-                        min(quantity_left) as manufactured_stock,
-                        sum(unit_cost * quantity_left) as inventory_value
-                    FROM manufactureresult
-                    WHERE manufacture_completion_date <= CAST(:target_date AS DATE)
-                    GROUP BY SKU, manufacture_order_id, manufacture_batch
-                ),
-                returned AS (
-                    SELECT 
-                        SKU,
-                        0 as manufacture_order_id,
-                        0 as manufacture_batch,
-                        sum(return_quantity) as returns_total,
-                        sum(quantity_left) as returns_stock,
-                        sum(return_unit_price * quantity_left) as inventory_value
-                    FROM returns
-                    WHERE return_date <= CAST(:target_date AS DATE)
-                    GROUP BY SKU, manufacture_order_id, manufacture_batch
-                ),
-                combine AS (
-                    SELECT 
-                        SKU,
-                        CAST(:target_date AS DATE) as as_of_date,
-                        sum(manufactured_total) as manufactured_total_quantity,
-                        sum(manufactured_stock) as in_stock_quantity,
-                        sum(inventory_value) as inventory_value
-                    FROM initiated 
-                    GROUP BY SKU, as_of_date
-                    UNION ALL
-                    SELECT 
-                        SKU,
-                        CAST(:target_date AS DATE) as as_of_date,
-                        sum(manufactured_total) as manufactured_total_quantity,
-                        sum(manufactured_stock) as in_stock_quantity,
-                        sum(inventory_value) as inventory_value
-                    FROM manufactured 
-                    GROUP BY SKU, as_of_date
-                    UNION ALL
-                    SELECT 
+                # Insert new inventory records
+                db.session.execute(text("""
+                    INSERT INTO Inventory (SKU, as_of_date, manufactured_total_quantity, in_stock_quantity, inventory_value)
+                    WITH 
+                    initiated AS (
+                        SELECT 
+                            SKU,
+                            -1 as manufacture_order_id,
+                            -1 as manufacture_batch,
+                            sum(fulfilled_quantity) as manufactured_total,
+                            sum(quantity_left) as manufactured_stock,
+                            sum(unit_cost * quantity_left) as inventory_value
+                        FROM stockinitiationaddition
+                        WHERE manufacture_completion_date <= CAST(:target_date AS DATE)
+                        GROUP BY SKU, manufacture_order_id, manufacture_batch
+                    ),
+                    manufactured AS (
+                        SELECT 
+                            SKU,
+                            manufacture_order_id,
+                            manufacture_batch,
+                            min(fulfilled_quantity) as manufactured_total,
+                            min(quantity_left) as manufactured_stock,
+                            sum(unit_cost * quantity_left) as inventory_value
+                        FROM manufactureresult
+                        WHERE manufacture_completion_date <= CAST(:target_date AS DATE)
+                        GROUP BY SKU, manufacture_order_id, manufacture_batch
+                    ),
+                    returned AS (
+                        SELECT 
+                            SKU,
+                            0 as manufacture_order_id,
+                            0 as manufacture_batch,
+                            sum(return_quantity) as returns_total,
+                            sum(quantity_left) as returns_stock,
+                            sum(return_unit_price * quantity_left) as inventory_value
+                        FROM returns
+                        WHERE return_date <= CAST(:target_date AS DATE)
+                        GROUP BY SKU, manufacture_order_id, manufacture_batch
+                    ),
+                    combine AS (
+                        SELECT 
+                            SKU,
+                            CAST(:target_date AS DATE) as as_of_date,
+                            sum(manufactured_total) as manufactured_total_quantity,
+                            sum(manufactured_stock) as in_stock_quantity,
+                            sum(inventory_value) as inventory_value
+                        FROM initiated 
+                        GROUP BY SKU, as_of_date
+                        UNION ALL
+                        SELECT 
+                            SKU,
+                            CAST(:target_date AS DATE) as as_of_date,
+                            sum(manufactured_total) as manufactured_total_quantity,
+                            sum(manufactured_stock) as in_stock_quantity,
+                            sum(inventory_value) as inventory_value
+                        FROM manufactured 
+                        GROUP BY SKU, as_of_date
+                        UNION ALL
+                        SELECT 
+                            SKU,
+                            CAST(:target_date AS DATE) as as_of_date,
+                            sum(returns_total) as manufactured_total_quantity,
+                            sum(returns_stock) as in_stock_quantity,
+                            sum(inventory_value) as inventory_value
+                        FROM returned
+                        GROUP BY SKU, as_of_date
+                    )
+                    SELECT
                         SKU,
-                        CAST(:target_date AS DATE) as as_of_date,
-                        sum(returns_total) as manufactured_total_quantity,
-                        sum(returns_stock) as in_stock_quantity,
+                        as_of_date,
+                        sum(manufactured_total_quantity) as manufactured_total_quantity,
+                        sum(in_stock_quantity) as in_stock_quantity,
                         sum(inventory_value) as inventory_value
-                    FROM returned
+                    FROM combine
                     GROUP BY SKU, as_of_date
-                )
-                SELECT
-                    SKU,
-                    as_of_date,
-                    sum(manufactured_total_quantity) as manufactured_total_quantity,
-                    sum(in_stock_quantity) as in_stock_quantity,
-                    sum(inventory_value) as inventory_value
-                FROM combine
-                GROUP BY SKU, as_of_date
-            """), {'target_date': target_date})
+                """), {'target_date': target_date})
 
         return jsonify({
             'message': f'Inventory generated successfully as of {target_date}'
@@ -4827,9 +3185,9 @@ def generate_inventory_raw_material():
                 return jsonify({'error': 'No records found to determine inventory date'}), 404
 
             # Generate manufacture and exchange stock as of target date
-            re_rank_manufacture_orders_use_before_generate_manufacture_results_as_of_date()
-            generate_manufacture_results_as_of_date(target_date)
-            update_manufacture_results_with_stock_exchange_as_of_date(target_date)
+            rank_manufacture_orders()
+            fifo_manufacture_results(target_date)
+            fifo_stock_exchanges(target_date)
 
             # Now proceed with inventory calculation
             db.session.execute(text("""
@@ -5114,11 +3472,9 @@ def book_cogs_to_quickbooks():
         # Convert to float to ensure it's a proper number
         cogs_amount = float(cogs_result)
         
-        # Get tokens directly from .env file
-        env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
-        config = dotenv_values(env_path)
-        access_token = config.get('ACCESS_TOKEN')
-        realm_id = config.get('REALM_ID')
+        # Get tokens from the shared QuickBooks token manager (the booking subprocess reads the same state store)
+        from backend.processing.api.refresh_tokens import token_manager
+        access_token, _, realm_id = token_manager.get_token()
         
         if not realm_id:
             return jsonify({'error': 'QuickBooks realm_id is not configured'}), 500
@@ -5140,7 +3496,6 @@ project_root = "{project_root.replace('\\', '\\\\')}"
 sys.path.append(project_root)
 
 from backend.processing.api.journal_entries_api_booking.COGS_journal import create_COGS_journal_entry
-from dotenv import dotenv_values
 
 # Call the function with our parameters
 result = create_COGS_journal_entry(
@@ -5192,6 +3547,38 @@ print("COGS journal entry created successfully")
         return jsonify({'error': str(e)}), 500
 
 
+# ---------------------------------------------------------------------------------------------------------------
+# QuickBooks Reference IDs                                                                                       |
+# ---------------------------------------------------------------------------------------------------------------
+# Refresh the local Account / Customer / Vendor ID table from QuickBooks
+@app.route('/quickbooks/references/sync', methods=['POST'])
+def sync_quickbooks_references():
+    from backend.processing.api.api_requests.qb_reference_fetcher import sync_qb_references, QB_REFERENCE_ENTITIES
+
+    data = request.get_json(silent=True) or {}
+    entity_types = data.get('entity_types') or QB_REFERENCE_ENTITIES
+    invalid_entity_types = [entity_type for entity_type in entity_types if entity_type not in QB_REFERENCE_ENTITIES]
+    if invalid_entity_types:
+        return jsonify({'error': f'Unsupported entity types: {invalid_entity_types}. Expected any of {QB_REFERENCE_ENTITIES}'}), 400
+
+    try:
+        counts = sync_qb_references(entity_types)
+        return jsonify({'message': 'QuickBooks references synced successfully', 'counts': counts}), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in sync_quickbooks_references: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Read the local QuickBooks reference IDs
+@app.route('/quickbooks/references', methods=['GET'])
+def get_quickbooks_references():
+    query = QBReference.query
+    if 'entity_type' in request.args:
+        query = query.filter(QBReference.entity_type == request.args.get('entity_type'))
+    references = query.order_by(QBReference.entity_type, QBReference.name).all()
+    return jsonify([reference.to_dict() for reference in references])
+
+
 # ---------------------------------------------------------------------------------------------------------------
 # Frontend Cards Metrics                                                                                         |
 # ---------------------------------------------------------------------------------------------------------------
@@ -5561,3 +3948,111 @@ def check_cogs_status():
 
 
 
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Process Metrics                                                                                                |
+# ---------------------------------------------------------------------------------------------------------------
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Timings of this worker process: generate pipeline phases, SQL, connection pool, dashboard cache and QuickBooks
+    Each gunicorn worker keeps its own numbers, so repeated calls may land on different workers
+    """
+    from backend.processing.functions.dashboard_graph import dashboard_graph
+    from backend.processing.api.quickbooks_client import get_quickbooks_client
+    from backend.processing.functions.query_timing import query_timer
+    from backend.processing.functions.db_pool import pool_metrics
+
+    return jsonify({
+        'pid': os.getpid(),
+        'pipelines': pipeline_timer.metrics(),
+        'queries': query_timer.summary(),
+        'db_pool': pool_metrics(db.engine),
+        'dashboard_cache': dashboard_graph.stats(),
+        'quickbooks': get_quickbooks_client().metrics()
+    })
+
+@app.route('/metrics/pipeline_runs', methods=['GET'])
+def get_pipeline_runs():
+    """
+    Last generate runs of this worker with their nested phases, newest first
+    Runs triggered with ?profile=1 also carry the cProfile summary
+    """
+    name = request.args.get('name')
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify(pipeline_timer.runs(name=name, limit=limit))
+
+@app.route('/metrics/queries', methods=['GET'])
+def get_query_metrics():
+    """
+    SQL statements of this worker aggregated by fingerprint, slowest first
+
+    Query params:
+        sort: total_seconds (default), max_seconds, count or slow_count
+        limit: number of fingerprints, default 20
+        explain: EXPLAIN plans for this many of the returned fingerprints (SELECT only, not executed)
+    """
+    from backend.processing.functions.query_timing import query_timer
+
+    sort = request.args.get('sort', 'total_seconds')
+    if sort not in ('total_seconds', 'max_seconds', 'count', 'slow_count'):
+        return jsonify({'error': 'sort must be one of total_seconds, max_seconds, count, slow_count'}), 400
+    statements = query_timer.top(limit=request.args.get('limit', 20, type=int), sort=sort)
+    for entry in statements[:request.args.get('explain', 0, type=int)]:
+        entry['explain'] = query_timer.explain(entry['fingerprint'])
+    return jsonify({'summary': query_timer.summary(), 'statements': statements})
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Change Log                                                                                                     |
+# ---------------------------------------------------------------------------------------------------------------
+@app.route('/change-log', methods=['GET'])
+def get_change_log():
+    """
+    Change log entries after a change id, oldest first
+
+    Query params:
+        since: changelog id to start after, default 0
+        tables: comma-separated table names, default all
+        limit: number of entries, default 1000
+    """
+    tables = [table.strip().lower() for table in request.args.get('tables', '').split(',') if table.strip()]
+    changes = change_tracker.changes_since(
+        request.args.get('since', 0, type=int), tables=tables, limit=request.args.get('limit', 1000, type=int)
+    )
+    return jsonify([change.to_dict() for change in changes])
+
+@app.route('/change-log/dirty', methods=['GET'])
+def get_change_log_dirty():
+    """
+    Partitions changed since a consumer's last successful run (see change_log.py)
+
+    Query params:
+        consumer: e.g. cogs, inventory, all_orders_pnl or any name used with /change-log/checkpoint
+        tables: comma-separated table names, default the tables the consumer reads
+    """
+    consumer = request.args.get('consumer')
+    if not consumer:
+        return jsonify({'error': 'consumer is required', 'consumers': change_tracker.consumers}), 400
+    tables = [table.strip().lower() for table in request.args.get('tables', '').split(',') if table.strip()]
+    if not tables and consumer not in change_tracker.consumers:
+        return jsonify({'error': f'tables is required for consumer {consumer}'}), 400
+    return jsonify(change_tracker.dirty_partitions(consumer, tables))
+
+@app.route('/change-log/checkpoint', methods=['POST'])
+def post_change_log_checkpoint():
+    """
+    Record a consumer's successful run up to a change id, usually upto_change_id of /change-log/dirty
+
+    Body: {"consumer": "dashboard_export", "change_id": 123}
+    """
+    data = request.get_json(silent=True) or {}
+    consumer, change_id = data.get('consumer'), data.get('change_id')
+    if not consumer or not isinstance(change_id, int):
+        return jsonify({'error': 'consumer and an integer change_id are required'}), 400
+    try:
+        change_tracker.mark_consumed(consumer, change_id)
+        return jsonify({'consumer': consumer, 'last_change_id': change_tracker.checkpoint(consumer)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
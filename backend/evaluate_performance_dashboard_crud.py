@@ -1,7 +1,7 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from typing import Dict, List, Tuple, Any, Union, Optional
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, bindparam
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta, date
 from calendar import monthrange
@@ -9,7 +9,9 @@ from dateutil.relativedelta import relativedelta
 import pandas as pd
 import numpy as np
 from backend import app, db
-from backend.models import COGS, AllOrdersPnL
+from backend.models import COGS, AllOrdersPnL, ProfitabilityWeekSKU
+from backend.processing.functions.dashboard_graph import dashboard_graph
+from backend.processing.functions.sku_dimensions import attach_sku_dimensions, attach_product_dimensions
 from sqlalchemy import text
 import traceback
 # from scipy.optimize import root_scalar  # Temporarily commented out for AWS App Runner build
@@ -403,7 +405,7 @@ def get_main_component_sales(as_of_date: datetime, period_display: str):
         return jsonify({'error': 'No Amazon orders found'}), 404
     
     result_df = pd.DataFrame(result)
-    result_df['main_component'] = result_df['sku'].apply(lambda s: s.split('_', 1)[-1].split('_', 1)[0])
+    result_df = attach_sku_dimensions(result_df, columns=('main_component',))
 
     return result_df
 
@@ -549,13 +551,14 @@ def get_main_component_gross_margin_net_profit(as_of_date: datetime, period_disp
     result_df['revenue']=result_df['revenue'].fillna(0)
     result_df['COGS']=result_df['COGS'].fillna(0)
     result_df['operating_expenses']=result_df['operating_expenses'].fillna(0)
-    result_df['main_component'] = result_df['sku'].apply(lambda s: s.split('_', 1)[-1].split('_', 1)[0])
+    result_df = attach_sku_dimensions(result_df, columns=('main_component',))
     result_df['gross_margin'] = result_df['revenue'] - result_df['COGS']
     result_df['operating_expenses'] = result_df['operating_expenses'] * -1
     result_df['net_profit'] = result_df['revenue'] - result_df['COGS'] - result_df['operating_expenses']
 
     return result_df
 
+@dashboard_graph.node(tables=['allorderspnl', 'fbmshippingcost'])
 def get_AR_AP_by_date():
     query = """
     select 
@@ -687,6 +690,7 @@ def get_AR_AP_by_date():
 
     return result_df
 
+@dashboard_graph.node(tables=['allorderspnl', 'fbmshippingcost'])
 def get_statements_deposit_closing_AR_AP_by_date():
     query = """
     with order_statements as (
@@ -926,10 +930,7 @@ def get_cogs_details_by_component_type(as_of_date: datetime, period_display: str
     result_df['month_str'] = pd.to_datetime(result_df['purchase_date_pst_pdt']).dt.strftime("%b'%y")
     result_df['quarter_str'] = result_df['purchase_date_pst_pdt'].apply(lambda x: f"Q{((x.month - 1) // 3 + 1)}'{str(x.year)[-2:]}")
 
-    result_df['brand'] = result_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    result_df['main_component'] = result_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    result_df = attach_sku_dimensions(result_df)
 
     # Create component_type column
     hardware_items = [
@@ -999,32 +1000,8 @@ def get_PO_details_by_component_type(as_of_date: datetime, period_display: str):
         return jsonify({'error': 'No enough data available based on the selected filters.'}), 404
     
     else:
-        query2 = """
-        select
-            distinct SKU as SKU
-            from allorderspnl
-        """
-        unique_sku_result = pd.DataFrame(db.session.execute(text(query2)).mappings().all())
-
-        # Get SKU example for PO product then use it to develop brank and main_component
-        exceptions = ['ALEG', 'V3520']
-        def custom_ir_extraction(product):
-            if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-                return product  # keep original
-            else:
-                return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-        PO_result['ir'] = PO_result['product'].apply(custom_ir_extraction)
-        def first_matched_SKU(ir):
-            matched = unique_sku_result[unique_sku_result['sku'].str.contains(f"{ir}", case=False, na=False)]
-            return matched['sku'].iloc[0] if not matched.empty else None
-        PO_result['sku_one_example'] = PO_result['ir'].apply(first_matched_SKU)
-        PO_result = PO_result.drop(columns=['ir'])
-
-        PO_result['brand'] = PO_result['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-        PO_result['main_component'] = PO_result['sku_one_example'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
-        PO_result = PO_result.drop(columns=['sku_one_example'])
+        # brand and main_component of the PO product's example SKU
+        PO_result = attach_product_dimensions(PO_result)
         # Create component_type column
         hardware_items = [
             '16GB DDR4 SODIMM', '16GB DDR5 SODIMM', '1TB PCIE 2242', '1TB PCIE 2280',
@@ -1052,104 +1029,107 @@ def get_PO_average_cost_by_period():
     group by order_date, product
     """
     PO_result = pd.DataFrame(db.session.execute(text(query1)).mappings().all())
-
-    query2 = """
-    select
-        distinct sku as sku
-        from allorderspnl
-    """
-    unique_sku_result = pd.DataFrame(db.session.execute(text(query2)).mappings().all())
-    unique_sku_result = unique_sku_result.rename(columns={'sku': 'SKU'})
-
-    exceptions = ['ALEG', 'V3520']
-    def custom_ir_extraction(product):
-        if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-            return product  # keep original
-        else:
-            return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-    PO_result['ir'] = PO_result['product'].apply(custom_ir_extraction)
-    def first_matched_SKU(ir):
-        matched = unique_sku_result[unique_sku_result['SKU'].str.contains(f"{ir}", case=False, na=False)]
-        return matched['SKU'].iloc[0] if not matched.empty else None
-    PO_result['sku_one_example'] = PO_result['ir'].apply(first_matched_SKU)
-    PO_result = PO_result.drop(columns=['ir'])
+    PO_result = attach_product_dimensions(PO_result)
 
     return PO_result
 
-def get_DSI(as_of_date: datetime, DSI_days: int):
-
-    period_start = as_of_date - timedelta(days=DSI_days)
-    period_start = period_start.date()
-    period_end = as_of_date.date()
-
-    query1 = """
-    select
-        sku,
-        sum(COALESCE(cogs, 0)) as COGS
-    from cogs
-    where CAST(sales_date AS date) <= CAST(:as_of_date AS date) and CAST(sales_date AS date) >= CAST(:period_start AS date)
-    group by sku
+@dashboard_graph.node(tables=['cogs', 'inventory'])
+def get_DSI_windows(windows: Tuple[Tuple[Any, int], ...]):
     """
-    query1_params = {
-        "as_of_date": period_end,
-        "period_start": period_start
-    }
-    COGS_data = db.session.execute(text(query1), params=query1_params).mappings().all()
-    COGS_result = pd.DataFrame(COGS_data) if COGS_data else pd.DataFrame(columns=['SKU', 'COGS'])
-    COGS_result = COGS_result.rename(columns={'sku': 'SKU','cogs': 'COGS'})
+    DSI by SKU for several (as_of_date, DSI_days) windows in one query
 
-    query2 = """
-    select 
-        sku,
-        sum(COALESCE(inventory_value, 0)) as inventory_end_value
-    from inventory
-    where CAST(as_of_date AS date) = CAST(:as_of_date AS date)
-    group by sku
-    """
-    query2_params = {
-        "as_of_date": period_end
-    }
-    Inventory_end_data = db.session.execute(text(query2), params=query2_params).mappings().all()
-    Inventory_end_result = pd.DataFrame(Inventory_end_data) if Inventory_end_data else pd.DataFrame(columns=['SKU', 'inventory_end_value'])
-    Inventory_end_result = Inventory_end_result.rename(columns={'sku': 'SKU'})
+    Args:
+        windows: tuple of (as_of_date, DSI_days) pairs, e.g. ((as_of_date, 30), (as_of_date, 60), (as_of_date, 90))
 
-    query3 = """
+    Returns:
+        DataFrame: as_of_date, DSI_days, SKU, COGS, inventory_end_value, inventory_start_value, DSI; as_of_date is
+        returned exactly as passed in so callers can merge on it
+    """
+    columns = ['as_of_date', 'DSI_days', 'SKU', 'COGS', 'inventory_end_value', 'inventory_start_value', 'DSI']
+    if not windows:
+        return pd.DataFrame(columns=columns)
+
+    window_values = []
+    params = {}
+    for window_id, (as_of_date, DSI_days) in enumerate(windows):
+        period_end = pd.Timestamp(as_of_date).date()
+        window_values.append(f"({window_id}, CAST(:period_end_{window_id} AS date), CAST(:period_start_{window_id} AS date), {int(DSI_days)})")
+        params[f"period_end_{window_id}"] = period_end
+        params[f"period_start_{window_id}"] = period_end - timedelta(days=int(DSI_days))
+
+    # DSI per window: 0 without end inventory, NULL without COGS, otherwise average (or end) inventory / COGS * days
+    query = f"""
+    with windows (window_id, period_end, period_start, dsi_days) as (
+        values {', '.join(window_values)}
+    ),
+    daily_cogs as (
+        select
+            sku,
+            CAST(sales_date AS date) as sales_date,
+            sum(COALESCE(cogs, 0)) as cogs
+        from cogs
+        where CAST(sales_date AS date) >= (select min(period_start) from windows)
+          and CAST(sales_date AS date) <= (select max(period_end) from windows)
+        group by sku, CAST(sales_date AS date)
+    ),
+    period_cogs as (
+        select
+            w.window_id,
+            d.sku,
+            sum(d.cogs) as cogs
+        from windows w
+        join daily_cogs d
+        on d.sales_date >= w.period_start and d.sales_date <= w.period_end
+        group by w.window_id, d.sku
+    ),
+    inventory_by_date as (
+        select
+            sku,
+            CAST(as_of_date AS date) as as_of_date,
+            sum(COALESCE(inventory_value, 0)) as inventory_value
+        from inventory
+        where CAST(as_of_date AS date) in (select period_end from windows union select period_start from windows)
+        group by sku, CAST(as_of_date AS date)
+    )
     select
-        sku,
-        sum(COALESCE(inventory_value, 0)) as inventory_start_value
-    from inventory
-    where CAST(as_of_date AS date) = CAST(:period_start AS date)
-    group by sku
+        p.window_id,
+        p.sku,
+        p.cogs,
+        inventory_end.inventory_value as inventory_end_value,
+        inventory_start.inventory_value as inventory_start_value,
+        case
+            when inventory_end.inventory_value is null or inventory_end.inventory_value = 0 then 0
+            when p.cogs = 0 then null
+            when inventory_start.inventory_value is null or inventory_start.inventory_value = 0
+                then inventory_end.inventory_value / p.cogs * w.dsi_days
+            else (inventory_end.inventory_value + inventory_start.inventory_value) / 2 / p.cogs * w.dsi_days
+        end as dsi
+    from period_cogs p
+    join windows w on w.window_id = p.window_id
+    left join inventory_by_date inventory_end
+    on inventory_end.sku = p.sku and inventory_end.as_of_date = w.period_end
+    left join inventory_by_date inventory_start
+    on inventory_start.sku = p.sku and inventory_start.as_of_date = w.period_start
+    order by p.window_id, p.sku
     """
-    query3_params = {
-        "period_start": period_start
-    }
-    Inventory_start_data = db.session.execute(text(query3), params=query3_params).mappings().all()
-    Inventory_start_result = pd.DataFrame(Inventory_start_data) if Inventory_start_data else pd.DataFrame(columns=['SKU', 'inventory_start_value'])
-    Inventory_start_result = Inventory_start_result.rename(columns={'sku': 'SKU'})
-
-    result = pd.merge(COGS_result, Inventory_end_result, on='SKU', how='left')
-    result = pd.merge(result, Inventory_start_result, on='SKU', how='left')
-
-    def compute_dsi(row):
-        cogs = row['COGS']
-        inv_end = row['inventory_end_value']
-        inv_start = row['inventory_start_value']
-
-        if pd.isna(inv_end) or inv_end == 0:
-            return 0
-        elif pd.isna(inv_start) or inv_start == 0:
-            avg_inventory = inv_end
-        else:
-            avg_inventory = (inv_end + inv_start) / 2
+    result = db.session.execute(text(query), params=params).mappings().all()
+    if not result:
+        return pd.DataFrame(columns=columns)
 
-        if cogs == 0:
-            return None
-        else:
-            return (avg_inventory / cogs) * DSI_days
+    result = pd.DataFrame(result)
+    result = result.rename(columns={'sku': 'SKU', 'cogs': 'COGS', 'dsi': 'DSI'})
+    numeric_columns = ['COGS', 'inventory_end_value', 'inventory_start_value', 'DSI']
+    result[numeric_columns] = result[numeric_columns].astype(float)
 
-    result['DSI'] = result.apply(compute_dsi, axis=1)
-    return result
+    window_id = result.pop('window_id')
+    result.insert(0, 'as_of_date', window_id.map(lambda i: windows[i][0]))
+    result.insert(1, 'DSI_days', window_id.map(lambda i: windows[i][1]))
+    return result[columns]
+
+def get_DSI(as_of_date: datetime, DSI_days: int):
+    """DSI by SKU for a single window, see get_DSI_windows"""
+    result = get_DSI_windows(((as_of_date, DSI_days),))
+    return result.drop(columns=['as_of_date', 'DSI_days']).reset_index(drop=True)
 
 def get_procurement_AP(as_of_date: datetime):
 
@@ -1176,32 +1156,7 @@ def get_procurement_AP(as_of_date: datetime):
     procurement_cost_result['order_date'] = pd.to_datetime(procurement_cost_result['order_date'])
     procurement_cost_result['data_month_last_day'] = procurement_cost_result['order_date'] + pd.offsets.MonthEnd(0)
 
-    exceptions = ['ALEG', 'V3520']
-    def custom_ir_extraction(product):
-        if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-            return product  # keep original
-        else:
-            return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-    procurement_cost_result['ir'] = procurement_cost_result['product'].apply(custom_ir_extraction)
-
-    query2 = """
-    select
-        distinct sku as sku
-        from allorderspnl
-    """
-    unique_sku_result = pd.DataFrame(db.session.execute(text(query2)).mappings().all())
-    unique_sku_result = unique_sku_result.rename(columns={'sku': 'SKU'})
-
-    def first_matched_SKU(ir):
-        matched = unique_sku_result[unique_sku_result['SKU'].str.contains(f"{ir}", case=False, na=False)]
-        return matched['SKU'].iloc[0] if not matched.empty else None
-    procurement_cost_result['sku_one_example'] = procurement_cost_result['ir'].apply(first_matched_SKU)
-    procurement_cost_result = procurement_cost_result.drop(columns=['ir'])
-    procurement_cost_result['brand'] = procurement_cost_result['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    procurement_cost_result['main_component'] = procurement_cost_result['sku_one_example'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
-    procurement_cost_result = procurement_cost_result.drop(columns=['sku_one_example'])
+    procurement_cost_result = attach_product_dimensions(procurement_cost_result)
 
     procurement_cost_result = procurement_cost_result.groupby(['data_month_last_day','main_component'])['procurement_cost'].sum().reset_index()
 
@@ -1256,12 +1211,74 @@ def get_procurement_AP(as_of_date: datetime):
 
     return procurement_cost_result
 
+def simulate_closing_forward_pass(dates, AR_closing, AP_closing, AR_cumulative, AP_cumulative, deposit_dates=(), AR_paid_ratio=0.0, AP_paid_to_AR_paid_ratio=0.0, shipping_payment_dates=(), shipping_payments=None):
+    """
+    Apply forecasted deposit closings and FBM shipping payments to the daily AR/AP series in one forward pass
+
+    Each event only changes its own row and shifts the cumulative balance of every later date, so the running
+    amount carried forward is accumulated once per event and applied to the later rows with a single cumsum
+    instead of re-scanning the frame for every event.
+
+    Args:
+        dates: daily dates, sorted ascending
+        AR_closing, AP_closing, AR_cumulative, AP_cumulative: float arrays aligned with dates
+        deposit_dates: forecast deposit dates; AR closing is AR_paid_ratio of the AR balance on that day
+        AR_paid_ratio: average share of the AR balance paid out at a deposit
+        AP_paid_to_AR_paid_ratio: AP closed per unit of AR closed at a deposit
+        shipping_payment_dates: forecast FBM shipping payment dates
+        shipping_payments: FBM shipping payment per row, added to AP closing on the payment dates
+
+    Returns:
+        tuple: (AR_closing, AP_closing, AR_cumulative, AP_cumulative) as new arrays
+    """
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+    AR_closing = np.array(AR_closing, dtype=float)
+    AP_closing = np.array(AP_closing, dtype=float)
+    AR_cumulative = np.array(AR_cumulative, dtype=float)
+    AP_cumulative = np.array(AP_cumulative, dtype=float)
+    AR_carry = np.zeros(len(dates) + 1)
+    AP_carry = np.zeros(len(dates) + 1)
+
+    def event_rows(event_dates):
+        # first row on each event date and the first row strictly after it
+        event_dates = np.sort(pd.to_datetime(pd.Series(list(event_dates), dtype=object)).to_numpy())
+        rows = np.searchsorted(dates, event_dates, side='left')
+        later_rows = np.searchsorted(dates, event_dates, side='right')
+        found = rows < len(dates)
+        found[found] = dates[rows[found]] == event_dates[found]
+        return rows[found], later_rows[found]
+
+    # deposits: each closing depends on the balance left by the earlier ones, so carry the running total forward
+    AR_closed_before = 0.0
+    for row, later_row in zip(*event_rows(deposit_dates)):
+        current_AR_cum = AR_cumulative[row] - AR_closed_before
+        closing_AR = current_AR_cum * AR_paid_ratio
+        closing_AP = closing_AR * AP_paid_to_AR_paid_ratio
+
+        AR_closing[row] = closing_AR
+        AP_closing[row] = closing_AP
+        AR_cumulative[row] -= closing_AR
+        AP_cumulative[row] -= closing_AP
+        AR_carry[later_row] += closing_AR
+        AP_carry[later_row] += closing_AP
+        AR_closed_before += closing_AR
+
+    # FBM shipping payments: booked as AP closing on the payment date and carried into every later balance
+    if shipping_payments is not None:
+        for row, later_row in zip(*event_rows(shipping_payment_dates)):
+            AP_closing[row] += shipping_payments[row]
+            AP_cumulative[row] -= shipping_payments[row]
+            AP_carry[later_row] += shipping_payments[row]
+
+    AR_cumulative -= np.cumsum(AR_carry)[:-1]
+    AP_cumulative -= np.cumsum(AP_carry)[:-1]
+
+    return AR_closing, AP_closing, AR_cumulative, AP_cumulative
+
+@dashboard_graph.node(depends_on=['get_AR_AP_by_date', 'get_statements_deposit_closing_AR_AP_by_date', 'get_sku_dimensions'])
 def get_AR_AP_by_date_with_statement_shipping_closing_forecast(brand: Optional[str] = None, ir: Optional[str] = None, forecast_revenue_method: str = "benchmark", year_end_total_revenue_target: Optional[float] = None, input_growth_rate: Optional[float] = None, FBMshipping_cost_to_revenue_ratio: Optional[float] = None):
     AR_AP_df = get_AR_AP_by_date()
-    AR_AP_df['brand'] = AR_AP_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    AR_AP_df['main_component'] = AR_AP_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    AR_AP_df = attach_sku_dimensions(AR_AP_df)
 
     if brand is not None:
         AR_AP_df = AR_AP_df[AR_AP_df['brand'] == brand]
@@ -1397,10 +1414,7 @@ def get_AR_AP_by_date_with_statement_shipping_closing_forecast(brand: Optional[s
     AR_AP_df = AR_AP_df.drop(columns=['data_month_last_day', 'days_in_month', 'AR_monthly', 'AP_monthly', 'Indicator'])
 
     statements_deposit_closing = get_statements_deposit_closing_AR_AP_by_date()
-    statements_deposit_closing['brand'] = statements_deposit_closing['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    statements_deposit_closing['main_component'] = statements_deposit_closing['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    statements_deposit_closing = attach_sku_dimensions(statements_deposit_closing)
 
     if brand is not None:
         statements_deposit_closing = statements_deposit_closing[statements_deposit_closing['brand'] == brand]
@@ -1446,32 +1460,16 @@ def get_AR_AP_by_date_with_statement_shipping_closing_forecast(brand: Optional[s
     AR_AP_df.drop(columns=['AR_paid_ratio'], inplace=True)
 
     # update AR_AP_df with forecasted AR_closing and AP_closing and AR_cumulative and AP_cumulative
-    for forecast_date in deposit_date_list_forecast:
-        # Step 1: locate the row with matching deposit_date_pst_pdt
-        row_mask = AR_AP_df['date'] == forecast_date
-        if not row_mask.any():
-            continue  # skip if the row doesn't exist
-
-        row_index = AR_AP_df[row_mask].index[0]  # get the index of the matching row
-
-        # Get current AR/AP cumulative
-        current_AR_cum = AR_AP_df.at[row_index, 'AR_cumulative']
-        current_AP_cum = AR_AP_df.at[row_index, 'AP_cumulative']
-
-        # Step 2 & 3: Calculate closing values
-        AR_closing = current_AR_cum * AR_paid_ratio_avg_actual
-        AP_closing = AR_closing * AP_paid_to_AR_paid_ratio_avg_actual
-
-        # Step 4 & 5: Update current row
-        AR_AP_df.at[row_index, 'AR_closing'] = AR_closing
-        AR_AP_df.at[row_index, 'AP_closing'] = AP_closing
-        AR_AP_df.at[row_index, 'AR_cumulative'] = current_AR_cum - AR_closing
-        AR_AP_df.at[row_index, 'AP_cumulative'] = current_AP_cum - AP_closing
-
-        # Step 6: Update all rows after this row
-        later_rows_mask = AR_AP_df['date'] > forecast_date
-        AR_AP_df.loc[later_rows_mask, 'AR_cumulative'] -= AR_closing
-        AR_AP_df.loc[later_rows_mask, 'AP_cumulative'] -= AP_closing
+    AR_closing, AP_closing, AR_cumulative, AP_cumulative = simulate_closing_forward_pass(
+        AR_AP_df['date'],
+        AR_AP_df['AR_closing'].to_numpy(dtype=float),
+        AR_AP_df['AP_closing'].to_numpy(dtype=float),
+        AR_AP_df['AR_cumulative'].to_numpy(dtype=float),
+        AR_AP_df['AP_cumulative'].to_numpy(dtype=float),
+        deposit_dates=deposit_date_list_forecast,
+        AR_paid_ratio=AR_paid_ratio_avg_actual,
+        AP_paid_to_AR_paid_ratio=AP_paid_to_AR_paid_ratio_avg_actual
+    )
 
     # closing FBM shipping cost - assumption input shipping cost as 2.5% of AR
     if FBMshipping_cost_to_revenue_ratio is None:
@@ -1494,29 +1492,20 @@ def get_AR_AP_by_date_with_statement_shipping_closing_forecast(brand: Optional[s
     shipping_payment_date_list = [d.date() for d in shipping_payment_date_list]
 
     # update AR_AP_df with forecasted AP_closing for FBM shipping cost payment and AP_cumulative
-    for shipping_payment_date in shipping_payment_date_list:
-        # Step 1: locate the row with matching deposit_date_pst_pdt
-        row_mask = AR_AP_df['date'] == shipping_payment_date
-        if not row_mask.any():
-            continue  # skip if the row doesn't exist
-
-        row_index = AR_AP_df[row_mask].index[0]  # get the index of the matching row
-
-        # Get current AP cumulative
-        current_AP_cum = AR_AP_df.at[row_index, 'AP_cumulative']
-
-        # Step 2 & 3: Get FBM shipping cost forecast and calculate closing values
-        FBM_shipping_monthly_cost = AR_AP_df.at[row_index, 'FBM_shipping_cost_forecast_monthly']
-        current_AP_closing = AR_AP_df.at[row_index, 'AP_closing']
-        AR_AP_df.at[row_index, 'AP_closing'] = current_AP_closing + FBM_shipping_monthly_cost
-
-        # Step 4: Update current row
-        AR_AP_df.at[row_index, 'AP_cumulative'] = current_AP_cum - FBM_shipping_monthly_cost
+    AR_closing, AP_closing, AR_cumulative, AP_cumulative = simulate_closing_forward_pass(
+        AR_AP_df['date'],
+        AR_closing,
+        AP_closing,
+        AR_cumulative,
+        AP_cumulative,
+        shipping_payment_dates=shipping_payment_date_list,
+        shipping_payments=AR_AP_df['FBM_shipping_cost_forecast_monthly'].to_numpy(dtype=float)
+    )
+    AR_AP_df['AR_closing'] = AR_closing
+    AR_AP_df['AP_closing'] = AP_closing
+    AR_AP_df['AR_cumulative'] = AR_cumulative
+    AR_AP_df['AP_cumulative'] = AP_cumulative
 
-        # Step 6: Update all rows after this row
-        later_rows_mask = AR_AP_df['date'] > forecast_date
-        AR_AP_df.loc[later_rows_mask, 'AP_cumulative'] -= FBM_shipping_monthly_cost
-    
     AR_AP_df.drop(columns=['AR', 'AP','deposit_date_pst_pdt', 'FBM_shipping_cost_forecast', 'data_month_last_day', 'FBM_shipping_cost_forecast_monthly'], inplace=True)
 
     return AR_AP_df, max_actual_date_add_1day
@@ -1590,98 +1579,60 @@ def get_vendor_payment_paid_and_AP():
     return PO_result
 
 def get_PO_ganntt_chart(start_date: datetime, end_date: datetime, default_fully_consumption_period: int = 60, brand: Optional[str] = None, ir: Optional[str] = None):
+    # PO with its sales consumption aggregated per PO and product in SQL
     query = """
-        SELECT purchase_order_id, order_date, product, purchase_quantity
-        FROM purchaseorders 
-        WHERE CAST(order_date AS date) >= CAST(:start_date AS date) AND CAST(order_date AS date) <= CAST(:end_date AS date)
-    """
-    po_df = pd.DataFrame(db.session.execute(text(query), {'start_date': start_date, 'end_date': end_date}).mappings().all())
-
-    # Fetch sales consumption data linked to PO
-    consumption_query = """
-        SELECT s.sales_record_id, s.fulfilled_by_PO, s.product, s.sales_date, s.quantity_sold, m.manufacture_completion_date
-        FROM cogs s
-        LEFT JOIN purchaseorders p ON s.fulfilled_by_PO = p.purchase_order_id AND s.product = p.product
+        SELECT
+            p.purchase_order_id,
+            p.order_date,
+            p.product,
+            p.purchase_quantity,
+            COALESCE(SUM(s.quantity_sold), 0) as total_quantity_sold,
+            COALESCE(SUM(
+                CASE WHEN CAST(s.sales_date AS date) <= CAST(p.order_date AS date) + CAST(:default_fully_consumption_period AS integer)
+                     THEN s.quantity_sold ELSE 0 END
+            ), 0) as total_quantity_sold_within_bill_date,
+            MAX(s.sales_date) as latest_sales_date,
+            MIN(m.manufacture_completion_date) as earliest_manufacture_completion_date
+        FROM purchaseorders p
+        LEFT JOIN cogs s ON s.fulfilled_by_PO = p.purchase_order_id AND s.product = p.product
         LEFT JOIN manufactureresult m ON s.result_id = m.manufacture_order_id AND s.manufacture_batch = m.manufacture_batch AND s.fulfilled_by_PO = m.fulfilled_by_PO AND s.product = m.product AND m.manufacture_order_id <> 0 AND m.manufacture_order_id <> -1
         WHERE CAST(p.order_date AS date) >= CAST(:start_date AS date) AND CAST(p.order_date AS date) <= CAST(:end_date AS date)
+        GROUP BY p.purchase_order_id, p.order_date, p.product, p.purchase_quantity
     """
-    sales_df = pd.DataFrame(db.session.execute(text(consumption_query), {'start_date': start_date, 'end_date': end_date}).mappings().all())
-
-    # Merge PO data with sales consumption
-    merged_df = pd.merge(
-        po_df, 
-        sales_df, 
-        left_on=['purchase_order_id', 'product'], 
-        right_on=['fulfilled_by_PO', 'product'],
-        how='left'
+    chart_df = pd.DataFrame(
+        db.session.execute(text(query), {'start_date': start_date, 'end_date': end_date, 'default_fully_consumption_period': default_fully_consumption_period}).mappings().all(),
+        columns=['purchase_order_id', 'order_date', 'product', 'purchase_quantity', 'total_quantity_sold',
+                 'total_quantity_sold_within_bill_date', 'latest_sales_date', 'earliest_manufacture_completion_date']
     )
 
     # Ensure date columns are in datetime format
-    merged_df["order_date"] = pd.to_datetime(merged_df["order_date"], errors='coerce')
-    merged_df["sales_date"] = pd.to_datetime(merged_df["sales_date"], errors='coerce')
-    merged_df["manufacture_completion_date"] = pd.to_datetime(merged_df["manufacture_completion_date"], errors='coerce')
-
-    # Filter data based on date range
-    exceptions = ['ALEG', 'V3520']
-    def custom_ir_extraction(product):
-        if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-            return product  # keep original
-        else:
-            return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-    merged_df['ir'] = merged_df['product'].apply(custom_ir_extraction)
+    chart_df["order_date"] = pd.to_datetime(chart_df["order_date"], errors='coerce')
+    chart_df["latest_sales_date"] = pd.to_datetime(chart_df["latest_sales_date"], errors='coerce')
+    chart_df["earliest_manufacture_completion_date"] = pd.to_datetime(chart_df["earliest_manufacture_completion_date"], errors='coerce')
 
-    query_unique_sku = """
-    select
-        distinct sku as sku
-        from allorderspnl
-    """
-    unique_sku_result = pd.DataFrame(db.session.execute(text(query_unique_sku)).mappings().all())
-    unique_sku_result = unique_sku_result.rename(columns={'sku': 'SKU'})
-
-    def first_matched_SKU(ir):
-        matched = unique_sku_result[unique_sku_result['SKU'].str.contains(f"{ir}", case=False, na=False)]
-        return matched['SKU'].iloc[0] if not matched.empty else None
-    merged_df['sku_one_example'] = merged_df['ir'].apply(first_matched_SKU)
-    merged_df = merged_df.drop(columns=['ir'])
-    merged_df['brand'] = merged_df['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    merged_df['main_component'] = merged_df['sku_one_example'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
-    merged_df = merged_df.drop(columns=['sku_one_example'])
-    merged_df = merged_df[merged_df['main_component'].notna()]
+    # Filter data based on brand / main component of the product
+    chart_df = attach_product_dimensions(chart_df)
+    chart_df = chart_df[chart_df['main_component'].notna()]
 
     if brand is not None:
-        merged_df = merged_df[merged_df['brand'] == brand]
+        chart_df = chart_df[chart_df['brand'] == brand]
     if ir is not None:
-        merged_df = merged_df[merged_df['main_component'] == ir]
+        chart_df = chart_df[chart_df['main_component'] == ir]
 
     # Create a unique row label combining PO and product
-    merged_df["PO_Product"] = merged_df["purchase_order_id"] + " - " + merged_df["product"]
+    chart_df["PO_Product"] = chart_df["purchase_order_id"] + " - " + chart_df["product"]
+    chart_df = chart_df.sort_values(by="PO_Product").reset_index(drop=True)
 
-    # Compute the bill date and sold quantity within the bill date
-    merged_df["bill_date"] = merged_df["order_date"] + pd.Timedelta(days=default_fully_consumption_period)
-    merged_df["quantity_sold_within_bill_date"] = merged_df.apply(
-        lambda row: row["quantity_sold"] if row["sales_date"] <= row["bill_date"] else 0,
-        axis=1
-    )
-    merged_df["total_quantity_sold_within_bill_date"] = merged_df.groupby("PO_Product")["quantity_sold_within_bill_date"].transform("sum")
-    merged_df["sold_progress_within_bill_date_represented_by_date"] = merged_df.apply(
-        lambda row: row["order_date"] + pd.Timedelta(days=round(row["total_quantity_sold_within_bill_date"] / (row["purchase_quantity"] / default_fully_consumption_period))),
-        axis=1
-    )
+    # Compute the bill date and the sold progress within the bill date
+    chart_df["bill_date"] = chart_df["order_date"] + pd.Timedelta(days=default_fully_consumption_period)
+    progress_days = np.round(chart_df["total_quantity_sold_within_bill_date"] / (chart_df["purchase_quantity"] / default_fully_consumption_period))
+    chart_df["sold_progress_within_bill_date_represented_by_date"] = chart_df["order_date"] + pd.to_timedelta(progress_days.replace([np.inf, -np.inf], np.nan), unit='D')
 
-    # compute total quantity sold for PO_Product, keep only sales date if total quantity sold is equal to purchase_quantity
-    merged_df["total_quantity_sold"] = merged_df.groupby("PO_Product")["quantity_sold"].transform("sum")
-    merged_df["fully_consumed_PO_Product_Flag"] = merged_df.apply(
-        lambda row: 'Fully Consumed' if row['total_quantity_sold'] == row['purchase_quantity'] else 'Not Fully Consumed',
-        axis=1
-    )
-    merged_df["sales_date_for_fully_consumed_PO_Product"] = merged_df.apply(
-        lambda row: row['sales_date'] if row['total_quantity_sold'] == row['purchase_quantity'] else None,
-        axis=1
-    )
-    merged_df["completion_date_for_fully_consumed_PO_Product"] = merged_df.groupby("PO_Product")["sales_date_for_fully_consumed_PO_Product"].transform("max")
-    merged_df.drop(columns=["sales_date_for_fully_consumed_PO_Product"], inplace=True)
+    # fully consumed when total quantity sold equals purchase_quantity; its completion date is the latest sales date
+    fully_consumed = chart_df["total_quantity_sold"] == chart_df["purchase_quantity"]
+    chart_df["fully_consumed_PO_Product_Flag"] = np.where(fully_consumed, 'Fully Consumed', 'Not Fully Consumed')
+    chart_df["completion_date_for_fully_consumed_PO_Product"] = chart_df["latest_sales_date"].where(fully_consumed)
+    chart_df["earliest_manufacture_completion_date_for_fully_consumed"] = chart_df["earliest_manufacture_completion_date"].where(fully_consumed)
 
     # if not fully consumed, find latest sales date and earliest manufacture completion date and calculate average daily consumption from earliest manufactured date to latest sales date
     # then calculate estimated completion date for fully consuming PO_Product
@@ -1691,70 +1642,38 @@ def get_PO_ganntt_chart(start_date: datetime, end_date: datetime, default_fully_
     """
     latest_sales_date = db.session.execute(text(query)).fetchone()
     latest_sales_date = pd.to_datetime(latest_sales_date[0])
-    merged_df["latest_sales_date_for_not_fully_consumed"] = merged_df.apply(
-        lambda row: latest_sales_date if row['fully_consumed_PO_Product_Flag'] == 'Not Fully Consumed' else None,
-        axis=1
-    )
 
-    merged_df["earliest_manufacture_completion_date_all"] = merged_df.groupby("PO_Product")["manufacture_completion_date"].transform("min")
-    merged_df["earliest_manufacture_completion_date_for_fully_consumed"] = merged_df.apply(
-        lambda row: row["earliest_manufacture_completion_date_all"] if row['fully_consumed_PO_Product_Flag'] == 'Fully Consumed' else None,
-        axis=1
-    )
-    merged_df["earliest_manufacture_completion_date_for_not_fully_consumed"] = merged_df.apply(
-        lambda row: row["earliest_manufacture_completion_date_all"] if row['fully_consumed_PO_Product_Flag'] == 'Not Fully Consumed' else None,
-        axis=1
-    )
-    merged_df.drop(columns=["earliest_manufacture_completion_date_all"], inplace=True)
-
-    merged_df["average_daily_consumption_for_not_fully_consumed"] = merged_df.apply(
-        lambda row: row["total_quantity_sold"] / ((row["latest_sales_date_for_not_fully_consumed"] - row["earliest_manufacture_completion_date_for_not_fully_consumed"]).days + 1)
-        if row["fully_consumed_PO_Product_Flag"] == "Not Fully Consumed" 
-        and pd.notna(row["earliest_manufacture_completion_date_for_not_fully_consumed"]) 
-        and pd.notna(row["latest_sales_date_for_not_fully_consumed"]) 
-        else None, 
-        axis=1
-    )
-
-    merged_df["estimated_completion_date_for_not_fully_consumed"] = merged_df.apply(
-        lambda row: row["earliest_manufacture_completion_date_for_not_fully_consumed"] + pd.Timedelta(days= math.ceil(row["purchase_quantity"]/row["average_daily_consumption_for_not_fully_consumed"]))+ pd.Timedelta(days=-1)
-        if row["fully_consumed_PO_Product_Flag"] == "Not Fully Consumed" 
-        and pd.notna(row["earliest_manufacture_completion_date_for_not_fully_consumed"]) 
-        and pd.notna(row["latest_sales_date_for_not_fully_consumed"]) 
-        else None, 
-        axis=1
-    )
-
-    # Aggregate result for data feed for chart
-    chart_df = merged_df.groupby(["PO_Product"]).agg({
-        "fully_consumed_PO_Product_Flag": "first",
-        "order_date": "first",
-        "bill_date": "first",
-        "sold_progress_within_bill_date_represented_by_date": "first",
-        "earliest_manufacture_completion_date_for_fully_consumed": "first",
-        "completion_date_for_fully_consumed_PO_Product": "first",
-        "estimated_completion_date_for_not_fully_consumed": "first",
-        
-        "purchase_quantity": "first",
-        "total_quantity_sold_within_bill_date": "first",
-        "total_quantity_sold": "first",
-        "average_daily_consumption_for_not_fully_consumed": "first"
-    }).reset_index()
+    earliest_for_not_fully_consumed = chart_df["earliest_manufacture_completion_date"].where(~fully_consumed)
+    chart_df["average_daily_consumption_for_not_fully_consumed"] = (
+        chart_df["total_quantity_sold"] / ((latest_sales_date - earliest_for_not_fully_consumed).dt.days + 1)
+    ).astype(float)
+    estimated_days = np.ceil(chart_df["purchase_quantity"] / chart_df["average_daily_consumption_for_not_fully_consumed"].replace(0, np.nan))
+    chart_df["estimated_completion_date_for_not_fully_consumed"] = earliest_for_not_fully_consumed + pd.to_timedelta(estimated_days - 1, unit='D')
+
+    chart_df = chart_df[[
+        "PO_Product",
+        "fully_consumed_PO_Product_Flag",
+        "order_date",
+        "bill_date",
+        "sold_progress_within_bill_date_represented_by_date",
+        "earliest_manufacture_completion_date_for_fully_consumed",
+        "completion_date_for_fully_consumed_PO_Product",
+        "estimated_completion_date_for_not_fully_consumed",
+
+        "purchase_quantity",
+        "total_quantity_sold_within_bill_date",
+        "total_quantity_sold",
+        "average_daily_consumption_for_not_fully_consumed"
+    ]]
 
     # Clean outliers
-    chart_df["estimated_completion_date_GT1year_flag"] = chart_df.apply(
-        lambda row: 'Estimated Completion Date > 1 Year' 
-        if pd.isna(row['estimated_completion_date_for_not_fully_consumed']) 
-        or (row['estimated_completion_date_for_not_fully_consumed'] - row["bill_date"]).days + 1 > 365 
-        else None,
-        axis=1
+    beyond_one_year = (
+        chart_df["estimated_completion_date_for_not_fully_consumed"].isna()
+        | ((chart_df["estimated_completion_date_for_not_fully_consumed"] - chart_df["bill_date"]).dt.days + 1 > 365)
     )
-    chart_df["estimated_completion_date_for_not_fully_consumed"] = chart_df.apply(
-        lambda row: row["bill_date"] + pd.Timedelta(days=365) 
-        if pd.isna(row['estimated_completion_date_for_not_fully_consumed']) 
-        or (row['estimated_completion_date_for_not_fully_consumed'] - row["bill_date"]).days + 1 > 365 
-        else row['estimated_completion_date_for_not_fully_consumed'],
-        axis=1
+    chart_df["estimated_completion_date_GT1year_flag"] = np.where(beyond_one_year, 'Estimated Completion Date > 1 Year', None)
+    chart_df["estimated_completion_date_for_not_fully_consumed"] = chart_df["estimated_completion_date_for_not_fully_consumed"].mask(
+        beyond_one_year, chart_df["bill_date"] + pd.Timedelta(days=365)
     )
     
     chart_df = chart_df.sort_values(by="order_date", ascending=False)
@@ -3168,6 +3087,7 @@ def get_operating_expenses_detailed_items_breakdown_since_beginning(as_of_date:
 
         return result
 
+@dashboard_graph.node(tables=['allorderspnl', 'cogs', 'fbmshippingcost'])
 def get_pnl_report_by_day():
 
     query = """
@@ -3585,42 +3505,92 @@ def get_profitability_report_by_week_and_sku():
         'returns_shipping_gift_wrap', 'returns_tax', 'returns_refund_commission', 'net_profit'
     ]
     
-    # Convert existing columns to float
-    for col in expected_numeric_cols:
-        if col in raw_data.columns:
-            raw_data[col] = pd.to_numeric(raw_data[col], errors='coerce').astype(float)
+    # Convert existing columns to float in one pass
+    numeric_cols = [col for col in expected_numeric_cols if col in raw_data.columns]
+    raw_data[numeric_cols] = raw_data[numeric_cols].apply(pd.to_numeric, errors='coerce').astype(float)
 
     raw_data.drop(columns=['FBA_fulfillment_fee', 'FBA_storage_fee', 'returns_shipping_gift_wrap', 'returns_tax', 'returns_refund_commission'], inplace=True)
-    raw_data['operating_expenses_FBA_and_service_fees'] = raw_data['operating_expenses_FBA_fees'].astype(float) + raw_data['operating_expenses_service_fees'].astype(float)
-    raw_data['operating_expenses_FBM_shipping_and_almost_0_revenue_chargebacks'] = raw_data['operating_expenses_FBM_shipping_cost'].astype(float) + raw_data['operating_expenses_revenue_chargebacks'].astype(float)
+    raw_data['operating_expenses_FBA_and_service_fees'] = raw_data['operating_expenses_FBA_fees'] + raw_data['operating_expenses_service_fees']
+    raw_data['operating_expenses_FBM_shipping_and_almost_0_revenue_chargebacks'] = raw_data['operating_expenses_FBM_shipping_cost'] + raw_data['operating_expenses_revenue_chargebacks']
     raw_data.drop(columns=['operating_expenses_FBA_fees', 'operating_expenses_service_fees', 'operating_expenses_FBM_shipping_cost', 'operating_expenses_revenue_chargebacks'], inplace=True)
 
     # Convert date_by_day to datetime to ensure we can manipulate it
     raw_data['date_by_day'] = pd.to_datetime(raw_data['date_by_day'])
     # Create week start and end dates
     # For Sunday start (weekday 6)
-    raw_data['week_start'] = raw_data['date_by_day'].apply(
-        lambda x: x - pd.Timedelta(days=(x.weekday() + 1) % 7))
+    raw_data['week_start'] = raw_data['date_by_day'] - pd.to_timedelta((raw_data['date_by_day'].dt.weekday + 1) % 7, unit='D')
     raw_data['week_end'] = raw_data['week_start'] + pd.Timedelta(days=6)
-    # # Ensure the week_start doesn't exceed the actual start and end date in the dataset
-    # min_date = raw_data['date_by_day'].min()
-    # max_date = raw_data['date_by_day'].max()
-    # raw_data['week_start'] = raw_data['week_start'].apply(lambda x: max(x, min_date))
-    # raw_data['week_end'] = raw_data['week_end'].apply(lambda x: min(x, max_date))
 
     raw_data['week_label'] = raw_data['week_start'].dt.strftime('%Y-%m-%d') + ' to ' + raw_data['week_end'].dt.strftime('%Y-%m-%d')
-    numeric_columns = raw_data.select_dtypes(include=['number']).columns.tolist()
-    agg_columns = ['week_label'] + [col for col in numeric_columns if col not in ['week_start', 'week_end']] + ['sku']
-    weekly_data = raw_data[agg_columns].groupby(['week_label', 'sku']).sum().reset_index()
-    # Calculate net profit percentage, handling division by zero with proper float conversion
-    weekly_data['net_profit_percentage'] = weekly_data.apply(
-        lambda row: (float(row['net_profit']) / float(row['total_revenue']) * 100) if row['total_revenue'] != 0 else 0.0, 
-        axis=1
+    weekly_data = raw_data.groupby(['week_label', 'sku']).agg(
+        week_start=('week_start', 'first'),
+        week_end=('week_end', 'first'),
+        net_profit=('net_profit', 'sum'),
+        total_revenue=('total_revenue', 'sum')
+    ).reset_index()
+    # Calculate net profit percentage, handling division by zero
+    weekly_data['net_profit_percentage'] = np.where(
+        weekly_data['total_revenue'] != 0,
+        weekly_data['net_profit'] / weekly_data['total_revenue'].replace(0, np.nan) * 100,
+        0.0
     )
 
-    weekly_data = weekly_data[['week_label', 'sku', 'net_profit', 'total_revenue', 'net_profit_percentage']]
+    weekly_data = weekly_data[['week_label', 'week_start', 'week_end', 'sku', 'net_profit', 'total_revenue', 'net_profit_percentage']]
     return weekly_data
 
+def refresh_profitability_week_sku():
+    """
+    Rebuild the profitabilityweeksku aggregate from the daily PnL report
+
+    Called after /amazon/all-orders-pnl/generate so the profitability report endpoints only read week x SKU rows.
+
+    Returns:
+        int: number of week x SKU rows written
+    """
+    weekly_data = get_profitability_report_by_week_and_sku()
+    refreshed_at = datetime.utcnow()
+    records = [
+        {
+            'week_label': row.week_label,
+            'sku': row.sku,
+            'week_start': row.week_start.date(),
+            'week_end': row.week_end.date(),
+            'net_profit': round(float(row.net_profit), 2),
+            'total_revenue': round(float(row.total_revenue), 2),
+            'refreshed_at': refreshed_at
+        }
+        for row in weekly_data.itertuples(index=False)
+    ]
+
+    db.session.execute(text("DELETE FROM profitabilityweeksku"))
+    if records:
+        db.session.execute(ProfitabilityWeekSKU.__table__.insert(), records)
+    db.session.commit()
+    print(f"Refreshed profitabilityweeksku with {len(records)} week x SKU rows")
+    return len(records)
+
+def get_profitability_weeks():
+    """Distinct week labels in the profitability aggregate, oldest first; builds the aggregate on first use"""
+    query = "SELECT DISTINCT week_label, week_start FROM profitabilityweeksku ORDER BY week_start"
+    weeks = [row.week_label for row in db.session.execute(text(query))]
+    if not weeks and refresh_profitability_week_sku():
+        weeks = [row.week_label for row in db.session.execute(text(query))]
+    return weeks
+
+def get_profitability_by_sku_for_weeks(week_labels: List[str]):
+    """Net profit and revenue per SKU summed over the selected week labels"""
+    query = text("""
+        SELECT sku, SUM(net_profit) AS net_profit, SUM(total_revenue) AS total_revenue
+        FROM profitabilityweeksku
+        WHERE week_label IN :week_labels
+        GROUP BY sku
+    """).bindparams(bindparam('week_labels', expanding=True))
+    result = db.session.execute(query, {'week_labels': list(week_labels)}).mappings().all()
+
+    aggregated_data = pd.DataFrame(result, columns=['sku', 'net_profit', 'total_revenue'])
+    aggregated_data[['net_profit', 'total_revenue']] = aggregated_data[['net_profit', 'total_revenue']].astype(float)
+    return aggregated_data
+
 def get_returns_report_by_day():
 
     query = """
@@ -3899,10 +3869,7 @@ def get_summary_revenue_gross_margin_net_profit():
         last_period_result_df = pd.DataFrame(columns=result_df.columns)
         last_period_empty_flag = True
 
-    result_df['brand'] = result_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    result_df['main_component'] = result_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    result_df = attach_sku_dimensions(result_df)
     # Apply filters if provided
     if brand is not None:
         result_df = result_df[result_df['brand'] == brand]
@@ -3911,10 +3878,7 @@ def get_summary_revenue_gross_margin_net_profit():
     if sku is not None:
         result_df = result_df[result_df['sku'] == sku]
 
-    last_period_result_df['brand'] = last_period_result_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    last_period_result_df['main_component'] = last_period_result_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    last_period_result_df = attach_sku_dimensions(last_period_result_df)
     # Apply filters if provided
     if brand is not None:
         last_period_result_df = last_period_result_df[last_period_result_df['brand'] == brand]
@@ -4137,10 +4101,7 @@ def get_summary_revenue_gross_margin_net_profit_chart_data():
             })
 
         # Step 2: Apply filters if provided
-        financial_df['brand'] = financial_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-        financial_df['main_component'] = financial_df['sku'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
+        financial_df = attach_sku_dimensions(financial_df)
         if brand is not None:
             financial_df = financial_df[financial_df['brand'] == brand]
         if ir is not None:
@@ -4467,10 +4428,7 @@ def get_summary_AR_AP_and_statements_closing_chart_data():
         merged_df = merged_df.drop(columns=['deposit_date_pst_pdt'])
         
         # Apply filters if provided
-        merged_df['brand'] = merged_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-        merged_df['main_component'] = merged_df['sku'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
+        merged_df = attach_sku_dimensions(merged_df)
         if brand:
             merged_df = merged_df[merged_df['brand'] == brand]
         if ir:
@@ -4554,31 +4512,7 @@ def get_summary_AP_vendor():
 
         vendor_payment_paid_and_AP_df = get_vendor_payment_paid_and_AP()
         
-        exceptions = ['ALEG', 'V3520']
-        def custom_ir_extraction(product):
-            if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-                return product  # keep original
-            else:
-                return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-        vendor_payment_paid_and_AP_df['ir'] = vendor_payment_paid_and_AP_df['product'].apply(custom_ir_extraction)
-        query = """
-        select
-            distinct sku as sku
-            from allorderspnl
-        """
-        unique_sku_result = pd.DataFrame(db.session.execute(text(query)).mappings().all())
-        unique_sku_result = unique_sku_result.rename(columns={'sku': 'SKU'})
-        
-        def first_matched_SKU(ir):
-            matched = unique_sku_result[unique_sku_result['SKU'].str.contains(f"{ir}", case=False, na=False)]
-            return matched['SKU'].iloc[0] if not matched.empty else None
-        vendor_payment_paid_and_AP_df['sku_one_example'] = vendor_payment_paid_and_AP_df['ir'].apply(first_matched_SKU)
-        vendor_payment_paid_and_AP_df = vendor_payment_paid_and_AP_df.drop(columns=['ir'])
-        vendor_payment_paid_and_AP_df['brand'] = vendor_payment_paid_and_AP_df['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-        vendor_payment_paid_and_AP_df['main_component'] = vendor_payment_paid_and_AP_df['sku_one_example'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
-        vendor_payment_paid_and_AP_df = vendor_payment_paid_and_AP_df.drop(columns=['sku_one_example'])
+        vendor_payment_paid_and_AP_df = attach_product_dimensions(vendor_payment_paid_and_AP_df)
 
         # Apply filters if provided
         if brand is not None:
@@ -4998,13 +4932,6 @@ def get_cogs_details_PO_average_cost_by_period():
     result_df = get_PO_average_cost_by_period()
     result_df['order_date'] = pd.to_datetime(result_df['order_date'])
 
-    # Create brand and main component columns
-    result_df['brand'] = result_df['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    result_df['main_component'] = result_df['sku_one_example'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
-    result_df = result_df.drop(columns=['sku_one_example'])
-
     # Apply filters if provided
     if brand is not None:
         result_df = result_df[result_df['brand'] == brand]
@@ -5082,9 +5009,10 @@ def get_cogs_details_dsi():
         as_of_date = datetime.strptime(as_of_date, '%Y-%m-%d')
         as_of_date = as_of_date.replace(hour=23, minute=59, second=59)
 
-    DSI_30days = get_DSI(as_of_date, 30)
-    DSI_60days = get_DSI(as_of_date, 60)
-    DSI_90days = get_DSI(as_of_date, 90)
+    DSI_windows = get_DSI_windows(((as_of_date, 30), (as_of_date, 60), (as_of_date, 90)))
+    DSI_30days = DSI_windows[DSI_windows['DSI_days'] == 30].drop(columns=['as_of_date', 'DSI_days'])
+    DSI_60days = DSI_windows[DSI_windows['DSI_days'] == 60].drop(columns=['as_of_date', 'DSI_days'])
+    DSI_90days = DSI_windows[DSI_windows['DSI_days'] == 90].drop(columns=['as_of_date', 'DSI_days'])
 
     # Get all unique SKUs across the three DSI results
     all_skus = pd.Series(
@@ -5152,11 +5080,6 @@ def get_cogs_details_dsi():
     ir_PO_cost_trend['order_date'] = pd.to_datetime(ir_PO_cost_trend['order_date'])
     ir_PO_cost_trend['month_start_date'] = ir_PO_cost_trend['order_date'].values.astype('datetime64[M]')
 
-    ir_PO_cost_trend['main_component'] = ir_PO_cost_trend['sku_one_example'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
-    ir_PO_cost_trend = ir_PO_cost_trend.drop(columns=['sku_one_example'])
-
     ir_PO_cost_trend = ir_PO_cost_trend.groupby(['month_start_date', 'main_component']).agg(
         total_cost=pd.NamedAgg(column='purchase_unit_price', aggfunc=lambda x: (x * ir_PO_cost_trend.loc[x.index, 'purchase_quantity']).sum()),
         total_quantity=pd.NamedAgg(column='purchase_quantity', aggfunc='sum')
@@ -5173,9 +5096,7 @@ def get_cogs_details_dsi():
     # Step 4: Merge into one summary table
     ir_procurement_cost_at_min_max_months = pd.merge(min_month_costs, max_month_costs, on='main_component', how='outer')
 
-    dsi_df['main_component'] = dsi_df['SKU'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    dsi_df = attach_sku_dimensions(dsi_df, sku_column='SKU', columns=('main_component',))
     dsi_df = dsi_df.merge(ir_procurement_cost_at_min_max_months, on='main_component', how='left')
     dsi_df = dsi_df.drop(columns='main_component')
 
@@ -5219,6 +5140,9 @@ def get_cogs_details_dsi():
         'Flag_Reason'
     ] = 'Low DSI (<30)'
 
+    # missing / undefined DSI as null rather than NaN
+    dsi_df = dsi_df.astype(object).where(dsi_df.notna(), None)
+
     return jsonify(dsi_df.to_dict(orient='records'))
 
 
@@ -5263,10 +5187,7 @@ def get_operating_expenses_details_summary_card():
     result_df = get_operating_expenses_breakdown(as_of_date, period_display)
 
     
-    result_df['brand'] = result_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    result_df['main_component'] = result_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    result_df = attach_sku_dimensions(result_df)
     # Apply filters if provided
     if brand is not None:
         result_df = result_df[result_df['brand'] == brand]
@@ -5407,10 +5328,7 @@ def get_operating_expenses_details_trend_chart_by_brand():
             'period': all_periods.strftime("%Y")
         })
 
-    operating_expenses_breakdown_since_beginning['brand'] = operating_expenses_breakdown_since_beginning['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    operating_expenses_breakdown_since_beginning['main_component'] = operating_expenses_breakdown_since_beginning['sku'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
+    operating_expenses_breakdown_since_beginning = attach_sku_dimensions(operating_expenses_breakdown_since_beginning)
     if brand is not None:
         operating_expenses_breakdown_since_beginning = operating_expenses_breakdown_since_beginning[operating_expenses_breakdown_since_beginning['brand'] == brand]
     if ir is not None:
@@ -5509,10 +5427,7 @@ def get_operating_expenses_items_breakdown_summary_card():
 
     # get operating expenses items breakdown
     result_df = get_operating_expenses_detailed_items_breakdown(as_of_date, period_display)
-    result_df['brand'] = result_df['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    result_df['main_component'] = result_df['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    result_df = attach_sku_dimensions(result_df)
 
     # Apply filters if provided
     if brand is not None:
@@ -5685,10 +5600,7 @@ def get_operating_expenses_items_breakdown_trend_chart():
             'period': all_periods.strftime("%Y")
         })
 
-    OpExpenses_detailed_item_since_beginning['brand'] = OpExpenses_detailed_item_since_beginning['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    OpExpenses_detailed_item_since_beginning['main_component'] = OpExpenses_detailed_item_since_beginning['sku'].apply(
-            lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-        )
+    OpExpenses_detailed_item_since_beginning = attach_sku_dimensions(OpExpenses_detailed_item_since_beginning)
     if brand is not None:
         OpExpenses_detailed_item_since_beginning = OpExpenses_detailed_item_since_beginning[OpExpenses_detailed_item_since_beginning['brand'] == brand]
     if ir is not None:
@@ -6042,17 +5954,14 @@ def get_pnl_report_data():
 @app.route('/profitability_report_weeks', methods=['GET'])
 def get_profitability_report_weeks():
     try:
-        raw_data = get_profitability_report_by_week_and_sku()
+        unique_weeks = get_profitability_weeks()
         
-        if raw_data.empty:
+        if not unique_weeks:
             return jsonify({
                 'error': 'No profitability data available',
                 'status': 'error'
             }), 404
         
-        # Get unique week labels, sorted
-        unique_weeks = sorted(raw_data['week_label'].unique().tolist())
-        
         return jsonify({
             'weeks': unique_weeks,
             'status': 'success'
@@ -6070,10 +5979,9 @@ def get_profitability_report_data():
         # Get filter parameters - can be multiple weeks separated by comma
         performance_weeks_param = request.args.get('performanceWeeks', '')
         
-        # Get raw data
-        raw_data = get_profitability_report_by_week_and_sku()
+        unique_weeks = get_profitability_weeks()
         
-        if raw_data.empty:
+        if not unique_weeks:
             return jsonify({
                 'error': 'No profitability data available',
                 'status': 'error'
@@ -6084,32 +5992,22 @@ def get_profitability_report_data():
             performance_weeks = [week.strip() for week in performance_weeks_param.split(',') if week.strip()]
         else:
             # If no performance weeks provided, use the latest week
-            unique_weeks = sorted(raw_data['week_label'].unique().tolist())
-            if unique_weeks:
-                performance_weeks = [unique_weeks[-1]]  # Latest week
-            else:
-                performance_weeks = []
-        
-        # Filter by performance weeks
-        if performance_weeks:
-            raw_data = raw_data[raw_data['week_label'].isin(performance_weeks)]
-            
-            if raw_data.empty:
-                return jsonify({
-                    'error': f'No data available for selected weeks: {", ".join(performance_weeks)}',
-                    'status': 'error'
-                }), 404
+            performance_weeks = [unique_weeks[-1]]
         
         # Aggregate data by SKU (sum net_profit and total_revenue across selected weeks)
-        aggregated_data = raw_data.groupby('sku').agg({
-            'net_profit': 'sum',
-            'total_revenue': 'sum'
-        }).reset_index()
+        aggregated_data = get_profitability_by_sku_for_weeks(performance_weeks)
         
-        # Recalculate net_profit_percentage with proper float conversion
-        aggregated_data['net_profit_percentage'] = aggregated_data.apply(
-            lambda row: (float(row['net_profit']) / float(row['total_revenue']) * 100) if row['total_revenue'] != 0 else 0.0, 
-            axis=1
+        if aggregated_data.empty:
+            return jsonify({
+                'error': f'No data available for selected weeks: {", ".join(performance_weeks)}',
+                'status': 'error'
+            }), 404
+        
+        # Recalculate net_profit_percentage
+        aggregated_data['net_profit_percentage'] = np.where(
+            aggregated_data['total_revenue'] != 0,
+            aggregated_data['net_profit'] / aggregated_data['total_revenue'].replace(0, np.nan) * 100,
+            0.0
         )
         
         # Prepare the 4 sets of data using aggregated data
@@ -6387,14 +6285,10 @@ def get_evaluate_strategy_revenue_oriented_forecast_line_table_data():
 
     # get DSI
     unique_months = forecast_metrics['data_month_last_day'].unique()
-    dsi_result_df = []
-    for month in unique_months:
-        dsi = get_DSI(month, DSI_period_in_days)
-        dsi['avg_inventory'] = dsi['DSI'] / DSI_period_in_days * dsi['COGS']
-        dsi['data_month_last_day'] = month
-        dsi_result_df.append(dsi)
-    dsi_result_df = pd.concat(dsi_result_df)
-    dsi_result_df.drop(columns=['DSI','inventory_start_value','inventory_end_value'], inplace=True)
+    dsi_result_df = get_DSI_windows(tuple((pd.Timestamp(month), DSI_period_in_days) for month in unique_months))
+    dsi_result_df['avg_inventory'] = dsi_result_df['DSI'] / DSI_period_in_days * dsi_result_df['COGS']
+    dsi_result_df = dsi_result_df.rename(columns={'as_of_date': 'data_month_last_day'})
+    dsi_result_df.drop(columns=['DSI_days','DSI','inventory_start_value','inventory_end_value'], inplace=True)
     dsi_result_df.rename(columns={'COGS':'DSI_COGS'}, inplace=True)
     forecast_metrics = pd.merge(
         forecast_metrics, 
@@ -6427,10 +6321,7 @@ def get_evaluate_strategy_revenue_oriented_forecast_line_table_data():
         how='left'
     )
     forecast_metrics['sku'] = forecast_metrics['sku'].replace('NonSKU_NonSKU_NonSKU', np.nan)
-    forecast_metrics['brand'] = forecast_metrics['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    forecast_metrics['main_component'] = forecast_metrics['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    forecast_metrics = attach_sku_dimensions(forecast_metrics)
 
     procurement_AP_result = get_procurement_AP(as_of_date)
 
@@ -6917,29 +6808,7 @@ def get_cashflow_AR_AP_net_add_vendor_payment_actuals_and_forecast_chart_data():
     
     vendor_payment_paid_and_AP_df = get_vendor_payment_paid_and_AP()
     
-    exceptions = ['ALEG', 'V3520']
-    def custom_ir_extraction(product):
-        if isinstance(product, str) and any(product.startswith(prefix) for prefix in exceptions):
-            return product  # keep original
-        else:
-            return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
-    vendor_payment_paid_and_AP_df['ir'] = vendor_payment_paid_and_AP_df['product'].apply(custom_ir_extraction)
-    query = """
-    select
-        distinct SKU as SKU
-        from allorderspnl
-    """
-    unique_sku_result = pd.DataFrame(db.session.execute(text(query)).mappings().all())
-    def first_matched_SKU(ir):
-        matched = unique_sku_result[unique_sku_result['SKU'].str.contains(f"{ir}", case=False, na=False)]
-        return matched['SKU'].iloc[0] if not matched.empty else None
-    vendor_payment_paid_and_AP_df['sku_one_example'] = vendor_payment_paid_and_AP_df['ir'].apply(first_matched_SKU)
-    vendor_payment_paid_and_AP_df = vendor_payment_paid_and_AP_df.drop(columns=['ir'])
-    vendor_payment_paid_and_AP_df['brand'] = vendor_payment_paid_and_AP_df['sku_one_example'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    vendor_payment_paid_and_AP_df['main_component'] = vendor_payment_paid_and_AP_df['sku_one_example'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
-    vendor_payment_paid_and_AP_df = vendor_payment_paid_and_AP_df.drop(columns=['sku_one_example'])
+    vendor_payment_paid_and_AP_df = attach_product_dimensions(vendor_payment_paid_and_AP_df)
 
     # clean data for dates to date, then aggregate
     vendor_payment_paid_and_AP_df['order_date'] = pd.to_datetime(vendor_payment_paid_and_AP_df['order_date']).dt.date
@@ -7068,14 +6937,10 @@ def get_cashflow_AR_AP_net_add_vendor_payment_actuals_and_forecast_chart_data():
 
     # get DSI
     unique_months = forecast_metrics['data_month_last_day'].unique()
-    dsi_result_df = []
-    for month in unique_months:
-        dsi = get_DSI(month, DSI_period_in_days)
-        dsi['avg_inventory'] = dsi['DSI'] / DSI_period_in_days * dsi['COGS']
-        dsi['data_month_last_day'] = month
-        dsi_result_df.append(dsi)
-    dsi_result_df = pd.concat(dsi_result_df)
-    dsi_result_df.drop(columns=['DSI','inventory_start_value','inventory_end_value'], inplace=True)
+    dsi_result_df = get_DSI_windows(tuple((pd.Timestamp(month), DSI_period_in_days) for month in unique_months))
+    dsi_result_df['avg_inventory'] = dsi_result_df['DSI'] / DSI_period_in_days * dsi_result_df['COGS']
+    dsi_result_df = dsi_result_df.rename(columns={'as_of_date': 'data_month_last_day'})
+    dsi_result_df.drop(columns=['DSI_days','DSI','inventory_start_value','inventory_end_value'], inplace=True)
     dsi_result_df.rename(columns={'COGS':'DSI_COGS'}, inplace=True)
     forecast_metrics = pd.merge(
         forecast_metrics, 
@@ -7108,10 +6973,7 @@ def get_cashflow_AR_AP_net_add_vendor_payment_actuals_and_forecast_chart_data():
         how='left'
     )
     forecast_metrics['sku'] = forecast_metrics['sku'].replace('NonSKU_NonSKU_NonSKU', np.nan)
-    forecast_metrics['brand'] = forecast_metrics['sku'].apply(lambda s: s.split('_', 1)[0] if isinstance(s, str) else None)
-    forecast_metrics['main_component'] = forecast_metrics['sku'].apply(
-        lambda s: s.split('_', 1)[-1].split('_', 1)[0] if isinstance(s, str) and '_' in s else None
-    )
+    forecast_metrics = attach_sku_dimensions(forecast_metrics)
 
     procurement_AP_result = get_procurement_AP(as_of_date)
 
@@ -1,11 +1,86 @@
 from flask import jsonify, request
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import pandas as pd
 from backend import app, db
 from backend.models import AmazonAllOrders, SKUEconomics, AmazonStatements, AmazonInboundShipping, FBMShippingCost, AllOrdersPnL, AdsSpendByDay, AdsCreditCardPayment, QBAccountIDMapping
 from sqlalchemy import text
+from backend.processing.api.qb_account_mapping import invalidate_qb_account_mapping
+from backend.processing.functions.pipeline_timing import pipeline_timer
+from backend.processing.functions.bulk_insert import upsert_frame, replace_partitions
+from backend.processing.functions.bulk_delete import delete_by_key
+from backend.processing.functions.change_log import change_tracker
+
+
+def bulk_upload_response(noun, result, error_records, error_count):
+    """
+    Summary of an upserting bulk upload
+
+    created_count stays the number of new rows; 201 when rows were added, 200 when the upload only updated or
+    matched stored rows, 400 when no row was valid. duplicate_count counts rows combined into another row of the upload
+    with the same natural key; rows repeating a key that could not be combined are among the errors.
+    """
+    processed = result['inserted'] + result['updated'] + result['unchanged']
+    return jsonify({
+        'message': (
+            f"Bulk upload completed. {result['inserted']} {noun} records created, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {error_count} failed."
+        ),
+        'created_count': result['inserted'],
+        'inserted_count': result['inserted'],
+        'updated_count': result['updated'],
+        'unchanged_count': result['unchanged'],
+        'duplicate_count': result['duplicates'],
+        'error_count': error_count,
+        'errors': error_records[:10]  # Limit to first 10 errors
+    }), 201 if result['inserted'] else 200 if processed else 400
+
+
+def with_rejected_rows(error_records, result, data):
+    """error_records and the rows upsert_frame rejected (its frame indexed by payload position), in payload order"""
+    rejected = [
+        {'index': int(index), 'record': data[index], 'error': error} for index, error in result['rejected'].items()
+    ]
+    return sorted(error_records + rejected, key=lambda error_record: error_record['index'])
+
+
+def delete_by_id_response(model, selected_records, table_label, after_commit=None):
+    """
+    Delete the selected records of a /delete request by id in one statement
+
+    Every distinct id is reported in success_deletes or, when no row had it, in failed_deletes. after_commit (e.g. a
+    cache invalidation) runs when rows were deleted.
+    """
+    try:
+        record_ids = list(dict.fromkeys(selected_record.get('id') for selected_record in selected_records))
+        # ids may arrive as strings; one that is not an integer matches no row
+        staged_ids = {}
+        for record_id in record_ids:
+            try:
+                staged_ids[record_id] = int(record_id)
+            except (TypeError, ValueError):
+                pass
+        result = delete_by_key(model.__table__, ['id'], [(staged_id,) for staged_id in staged_ids.values()])
+        if result['deleted']:
+            db.session.commit()
+            if after_commit:
+                after_commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
+
+    deleted = {deleted_id for deleted_id, in result['deleted']}
+    return jsonify({
+        'success_deletes': [
+            {'id': record_id, 'message': 'Record deleted successfully.'}
+            for record_id in record_ids if staged_ids.get(record_id) in deleted
+        ],
+        'failed_deletes': [
+            {'id': record_id, 'error': f'Record not found in {table_label}.'}
+            for record_id in record_ids if staged_ids.get(record_id) not in deleted
+        ]
+    })
 
 # ---------------------------------------------------------------------------------------------------------------
 # AmazonAllOrders CRUD Operations                                                                               |
@@ -31,8 +106,11 @@ def create_amazon_order():
     except Exception as e:
         return jsonify({'error': f'Error processing date: {str(e)}'}), 400
     
-    # Create a new AmazonAllOrders instance
+    # Create a new AmazonAllOrders instance, as the next line of its SKU in the order
     try:
+        line_number = db.session.query(func.max(AmazonAllOrders.line_number)).filter(
+            AmazonAllOrders.amazon_order_id == data.get('amazon_order_id'), AmazonAllOrders.sku == data.get('sku')
+        ).scalar()
         new_order = AmazonAllOrders(
             amazon_order_id=data.get('amazon_order_id'),
             purchase_date_utc=purchase_date_utc.tz_convert('UTC').tz_localize(None).to_pydatetime(),
@@ -41,6 +119,7 @@ def create_amazon_order():
             fulfillment_channel=data.get('fulfillment_channel'),
             sales_channel=data.get('sales_channel'),
             sku=data.get('sku'),
+            line_number=(line_number or 0) + 1,
             item_status=data.get('item_status'),
             quantity=data.get('quantity'),
             currency=data.get('currency'),
@@ -67,6 +146,18 @@ def create_amazon_order():
         return jsonify({'error': f'Error creating order: {str(e)}'}), 500
 
 # Bulk create Amazon orders
+ALL_ORDERS_COLUMNS = [
+    'amazon_order_id', 'purchase_date_utc', 'order_status', 'fulfillment_channel', 'sales_channel', 'sku', 'item_status',
+    'quantity', 'currency', 'item_price', 'item_tax', 'shipping_price', 'shipping_tax', 'gift_wrap_price', 'gift_wrap_tax',
+    'item_promotion_discount', 'ship_promotion_discount'
+]
+ALL_ORDERS_KEY = ['amazon_order_id', 'sku', 'line_number']
+ALL_ORDERS_REQUIRED_COLUMNS = ['amazon_order_id', 'order_status', 'fulfillment_channel', 'sales_channel', 'sku', 'item_status']
+ALL_ORDERS_AMOUNT_COLUMNS = [
+    'item_price', 'item_tax', 'shipping_price', 'shipping_tax', 'gift_wrap_price', 'gift_wrap_tax',
+    'item_promotion_discount', 'ship_promotion_discount'
+]
+
 @app.route('/amazon/all-orders/bulk-create', methods=['POST'])
 def bulk_create_amazon_orders():
     data = request.json
@@ -77,68 +168,53 @@ def bulk_create_amazon_orders():
     if len(data) == 0:
         return jsonify({'message': 'No orders to create.'}), 200
     
-    created_orders = []
-    error_records = []
-    
     try:
-        # Process all records in a single transaction for efficiency
-        for index, record in enumerate(data):
-            try:
-                # Handle purchase_date_utc conversion
-                purchase_date_utc = pd.to_datetime(record.get('purchase_date_utc'), errors='coerce', utc=True)
-                if pd.isna(purchase_date_utc):
-                    error_records.append({
-                        'index': index,
-                        'record': record,
-                        'error': 'Invalid purchase_date_utc format. Expected format: 2024-04-30T22:51:10+00:00'
-                    })
-                    continue
-                
-                # Generate purchase_date_pst_pdt automatically
-                purchase_date_pst_pdt = purchase_date_utc.tz_convert('US/Pacific')
-                
-                # Create a new AmazonAllOrders instance
-                new_order = AmazonAllOrders(
-                    amazon_order_id=record.get('amazon_order_id'),
-                    purchase_date_utc=purchase_date_utc.tz_convert('UTC').tz_localize(None).to_pydatetime(),
-                    purchase_date_pst_pdt=purchase_date_pst_pdt.tz_localize(None).to_pydatetime(),
-                    order_status=record.get('order_status'),
-                    fulfillment_channel=record.get('fulfillment_channel'),
-                    sales_channel=record.get('sales_channel'),
-                    sku=record.get('sku'),
-                    item_status=record.get('item_status'),
-                    quantity=record.get('quantity'),
-                    currency=record.get('currency'),
-                    item_price=record.get('item_price'),
-                    item_tax=record.get('item_tax'),
-                    shipping_price=record.get('shipping_price'),
-                    shipping_tax=record.get('shipping_tax'),
-                    gift_wrap_price=record.get('gift_wrap_price'),
-                    gift_wrap_tax=record.get('gift_wrap_tax'),
-                    item_promotion_discount=record.get('item_promotion_discount'),
-                    ship_promotion_discount=record.get('ship_promotion_discount')
-                )
-                
-                db.session.add(new_order)
-                created_orders.append(new_order)
-            except Exception as e:
-                error_records.append({
-                    'index': index,
-                    'record': record,
-                    'error': str(e)
-                })
-        
-        # Commit all successfully processed records at once
-        if created_orders:
-            db.session.commit()
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_orders)} records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_orders),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_orders else 400
+        # Validate the whole payload at once; every failed check is recorded against its row index
+        orders = pd.DataFrame.from_records(data).reindex(columns=ALL_ORDERS_COLUMNS)
+        # an order can list one SKU on several lines (item status, price or promotion differ): number them in report
+        # order, so each is stored and a re-uploaded report updates the same lines
+        orders['line_number'] = orders.groupby(['amazon_order_id', 'sku'], dropna=False, sort=False).cumcount() + 1
+        row_errors = pd.Series(None, index=orders.index, dtype=object)
+
+        def flag(mask, message):
+            row_errors[mask & row_errors.isna()] = message
+
+        # Timestamps in one step: ISO 8601 (what the upload dialog sends) vectorized, anything else parsed per value as before
+        raw_dates = orders['purchase_date_utc']
+        purchase_date_utc = pd.to_datetime(raw_dates, errors='coerce', utc=True, format='ISO8601')
+        retry = purchase_date_utc.isna() & raw_dates.notna()
+        if retry.any():
+            purchase_date_utc[retry] = pd.to_datetime(raw_dates[retry], errors='coerce', utc=True, format='mixed')
+        flag(purchase_date_utc.isna(), 'Invalid purchase_date_utc format. Expected format: 2024-04-30T22:51:10+00:00')
+
+        for column in ALL_ORDERS_REQUIRED_COLUMNS:
+            flag(orders[column].isna(), f'{column} is required and cannot be empty.')
+
+        quantity = pd.to_numeric(orders['quantity'], errors='coerce')
+        flag(quantity.isna() | (quantity % 1 != 0), 'quantity is required and must be a whole number.')
+
+        for column in ALL_ORDERS_AMOUNT_COLUMNS:
+            amounts = pd.to_numeric(orders[column], errors='coerce')
+            flag(amounts.isna() & orders[column].notna(), f'Invalid {column}: expected a number.')
+            orders[column] = amounts
+
+        orders['purchase_date_utc'] = purchase_date_utc.dt.tz_localize(None)
+        orders['purchase_date_pst_pdt'] = purchase_date_utc.dt.tz_convert('US/Pacific').dt.tz_localize(None)
+        orders['quantity'] = quantity
+
+        # Upsert of the valid rows on (amazon_order_id, sku, line_number): re-uploaded orders are updated, unchanged ones
+        # not written
+        valid = row_errors.isna()
+        result = upsert_frame(AmazonAllOrders.__table__, orders[valid].astype({'quantity': 'int64'}), ALL_ORDERS_KEY)
+        db.session.commit()
+
+        error_records = [
+            {'index': int(index), 'record': data[index], 'error': row_errors[index]}
+            for index in row_errors.index[~valid][:10]
+        ]
+        error_count = int((~valid).sum())
+
+        return bulk_upload_response('order', result, error_records, error_count)
     
     except Exception as e:
         db.session.rollback()
@@ -204,43 +280,7 @@ def delete_amazon_all_orders():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = AmazonAllOrders.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in Amazon All Orders.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(AmazonAllOrders, selected_records, 'Amazon All Orders')
 
 # Delete all Amazon orders
 @app.route('/amazon/all-orders/delete-all', methods=['DELETE'])
@@ -302,6 +342,8 @@ def create_sku_economics():
         return jsonify({'error': f'Error creating SKU Economics record: {str(e)}'}), 500
 
 # Bulk create SKU Economics data
+SKU_ECONOMICS_KEY = ['amazon_store', 'msku', 'start_date_pst_pdt', 'end_date_pst_pdt']
+
 @app.route('/amazon/sku-economics/bulk-create', methods=['POST'])
 def bulk_create_sku_economics():
     data = request.json
@@ -312,11 +354,12 @@ def bulk_create_sku_economics():
     if len(data) == 0:
         return jsonify({'message': 'No SKU economics records to create.'}), 200
     
-    created_records = []
+    valid_records = []
+    valid_indexes = []
     error_records = []
     
     try:
-        # Process all records in a single transaction for efficiency
+        # Validate all records first, then upsert them on (amazon_store, msku, period) in one statement
         for index, record in enumerate(data):
             try:
                 # Handle date conversions
@@ -330,22 +373,27 @@ def bulk_create_sku_economics():
                         'error': 'Invalid date format. Expected format: YYYY-MM-DD'
                     })
                     continue
+
+                if not record.get('amazon_store') or not record.get('MSKU'):
+                    error_records.append({
+                        'index': index,
+                        'record': record,
+                        'error': 'amazon_store and MSKU are required and cannot be empty.'
+                    })
+                    continue
                 
-                # Create a new SKUEconomics instance
-                new_record = SKUEconomics(
-                    amazon_store=record.get('amazon_store'),
-                    start_date_pst_pdt=start_date,
-                    end_date_pst_pdt=end_date,
-                    msku=record.get('MSKU'),
-                    currency_code=record.get('currency_code'),
-                    fba_fulfillment_fees_total=record.get('FBA_fulfillment_fees_total'),
-                    sponsored_products_charge_total=record.get('sponsored_products_charge_total'),
-                    monthly_inventory_storage_fee_total=record.get('monthly_inventory_storage_fee_total'),
-                    inbound_transportation_charge_total=record.get('inbound_transportation_charge_total')
-                )
-                
-                db.session.add(new_record)
-                created_records.append(new_record)
+                valid_indexes.append(index)
+                valid_records.append({
+                    'amazon_store': record.get('amazon_store'),
+                    'start_date_pst_pdt': start_date,
+                    'end_date_pst_pdt': end_date,
+                    'msku': record.get('MSKU'),
+                    'currency_code': record.get('currency_code'),
+                    'fba_fulfillment_fees_total': record.get('FBA_fulfillment_fees_total'),
+                    'sponsored_products_charge_total': record.get('sponsored_products_charge_total'),
+                    'monthly_inventory_storage_fee_total': record.get('monthly_inventory_storage_fee_total'),
+                    'inbound_transportation_charge_total': record.get('inbound_transportation_charge_total')
+                })
             except Exception as e:
                 error_records.append({
                     'index': index,
@@ -353,17 +401,11 @@ def bulk_create_sku_economics():
                     'error': str(e)
                 })
         
-        # Commit all successfully processed records at once
-        if created_records:
-            db.session.commit()
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_records)} SKU economics records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_records),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_records else 400
+        result = upsert_frame(SKUEconomics.__table__, pd.DataFrame(valid_records, index=valid_indexes), SKU_ECONOMICS_KEY)
+        db.session.commit()
+
+        error_records = with_rejected_rows(error_records, result, data)
+        return bulk_upload_response('SKU economics', result, error_records, len(error_records))
     
     except Exception as e:
         db.session.rollback()
@@ -425,43 +467,7 @@ def delete_sku_economics():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = SKUEconomics.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in SKU Economics.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(SKUEconomics, selected_records, 'SKU Economics')
 
 # Delete all SKU Economics records
 @app.route('/amazon/sku-economics/delete-all', methods=['DELETE'])
@@ -574,13 +580,21 @@ def bulk_create_statements():
     if len(data) == 0:
         return jsonify({'message': 'No statement records to create.'}), 200
     
-    created_records = []
+    valid_records = []
     error_records = []
     
     try:
-        # Process all records in a single transaction for efficiency
+        # Validate all records first; settlements are then stored whole, replacing a stored settlement that changed
         for index, record in enumerate(data):
             try:
+                if not record.get('settlement_id'):
+                    error_records.append({
+                        'index': index,
+                        'record': record,
+                        'error': 'settlement_id is required and cannot be empty.'
+                    })
+                    continue
+
                 # Handle UTC date conversions and generate PST/PDT dates
                 datetime_fields = {
                     'settlement_start_date_utc': 'settlement_start_date_pst_pdt',
@@ -618,31 +632,27 @@ def bulk_create_statements():
                         processed_dates[utc_field] = None
                         processed_dates[pst_pdt_field] = None
                 
-                # Create a new AmazonStatements instance
-                new_record = AmazonStatements(
-                    settlement_id=record.get('settlement_id'),
-                    settlement_start_date_utc=processed_dates.get('settlement_start_date_utc'),
-                    settlement_start_date_pst_pdt=processed_dates.get('settlement_start_date_pst_pdt'),
-                    settlement_end_date_utc=processed_dates.get('settlement_end_date_utc'),
-                    settlement_end_date_pst_pdt=processed_dates.get('settlement_end_date_pst_pdt'),
-                    deposit_date_utc=processed_dates.get('deposit_date_utc'),
-                    deposit_date_pst_pdt=processed_dates.get('deposit_date_pst_pdt'),
-                    total_amount=record.get('total_amount'),
-                    currency=record.get('currency'),
-                    transaction_type=record.get('transaction_type'),
-                    order_id=record.get('order_id'),
-                    marketplace_name=record.get('marketplace_name'),
-                    amount_type=record.get('amount_type'),
-                    amount_description=record.get('amount_description'),
-                    amount=record.get('amount'),
-                    posted_date_time_utc=processed_dates.get('posted_date_time_utc'),
-                    posted_date_time_pst_pdt=processed_dates.get('posted_date_time_pst_pdt'),
-                    sku=record.get('sku'),
-                    quantity_purchased=record.get('quantity_purchased')
-                )
-                
-                db.session.add(new_record)
-                created_records.append(new_record)
+                valid_records.append({
+                    'settlement_id': str(record.get('settlement_id')),
+                    'settlement_start_date_utc': processed_dates.get('settlement_start_date_utc'),
+                    'settlement_start_date_pst_pdt': processed_dates.get('settlement_start_date_pst_pdt'),
+                    'settlement_end_date_utc': processed_dates.get('settlement_end_date_utc'),
+                    'settlement_end_date_pst_pdt': processed_dates.get('settlement_end_date_pst_pdt'),
+                    'deposit_date_utc': processed_dates.get('deposit_date_utc'),
+                    'deposit_date_pst_pdt': processed_dates.get('deposit_date_pst_pdt'),
+                    'total_amount': record.get('total_amount'),
+                    'currency': record.get('currency'),
+                    'transaction_type': record.get('transaction_type'),
+                    'order_id': record.get('order_id'),
+                    'marketplace_name': record.get('marketplace_name'),
+                    'amount_type': record.get('amount_type'),
+                    'amount_description': record.get('amount_description'),
+                    'amount': record.get('amount'),
+                    'posted_date_time_utc': processed_dates.get('posted_date_time_utc'),
+                    'posted_date_time_pst_pdt': processed_dates.get('posted_date_time_pst_pdt'),
+                    'sku': record.get('sku'),
+                    'quantity_purchased': record.get('quantity_purchased')
+                })
             except Exception as e:
                 error_records.append({
                     'index': index,
@@ -650,17 +660,10 @@ def bulk_create_statements():
                     'error': str(e)
                 })
         
-        # Commit all successfully processed records at once
-        if created_records:
-            db.session.commit()
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_records)} statement records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_records),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_records else 400
+        result = replace_partitions(AmazonStatements.__table__, pd.DataFrame.from_records(valid_records), 'settlement_id')
+        db.session.commit()
+
+        return bulk_upload_response('statement', result, error_records, len(error_records))
     
     except Exception as e:
         db.session.rollback()
@@ -726,43 +729,7 @@ def delete_amazon_statements():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = AmazonStatements.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in Amazon Statements.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(AmazonStatements, selected_records, 'Amazon Statements')
 
 # Delete all Amazon Statements records
 @app.route('/amazon/statements/delete-all', methods=['DELETE'])
@@ -844,6 +811,8 @@ def create_amazon_inbound_shipping():
         return jsonify({'error': f'Error creating Amazon inbound shipping record: {str(e)}'}), 500
     
 # Bulk create Inbound Shipping data
+INBOUND_SHIPPING_KEY = ['shipment_id', 'msku']
+
 @app.route('/amazon/inbound-shipping/bulk-create', methods=['POST'])
 def bulk_create_inbound_shipping():
     data = request.json
@@ -854,13 +823,17 @@ def bulk_create_inbound_shipping():
     if len(data) == 0:
         return jsonify({'message': 'No inbound shipping records to create.'}), 200
     
-    created_records = []
+    valid_records = []
+    valid_indexes = []
     error_records = []
     
     try:
-        # Process all records in a single transaction for efficiency
+        # Validate all records first, then upsert them on (shipment_id, msku) in one statement
         for index, record in enumerate(data):
             try:
+                if not record.get('shipment_id'):
+                    raise ValueError('shipment_id is required and cannot be empty.')
+
                 # Handle date conversions
                 datetime_fields = ['created_pst_pdt', 'last_updated_pst_pdt']
                 processed_dates = {}
@@ -889,23 +862,20 @@ def bulk_create_inbound_shipping():
                     else:
                         processed_dates[field] = None
                 
-                # Create a new AmazonInboundShipping instance
-                new_record = AmazonInboundShipping(
-                    shipment_name=record.get('shipment_name'),
-                    shipment_id=record.get('shipment_id'),
-                    created_pst_pdt=processed_dates.get('created_pst_pdt'),
-                    last_updated_pst_pdt=processed_dates.get('last_updated_pst_pdt'),
-                    ship_to=record.get('ship_to'),
-                    units_expected=record.get('units_expected'),
-                    units_located=record.get('units_located'),
-                    status=record.get('status'),
-                    amazon_partnered_carrier_cost=record.get('amazon_partnered_carrier_cost'),
-                    currency=record.get('currency'),
-                    msku=record.get('MSKU')
-                )
-                
-                db.session.add(new_record)
-                created_records.append(new_record)
+                valid_indexes.append(index)
+                valid_records.append({
+                    'shipment_name': record.get('shipment_name'),
+                    'shipment_id': record.get('shipment_id'),
+                    'created_pst_pdt': processed_dates.get('created_pst_pdt'),
+                    'last_updated_pst_pdt': processed_dates.get('last_updated_pst_pdt'),
+                    'ship_to': record.get('ship_to'),
+                    'units_expected': record.get('units_expected'),
+                    'units_located': record.get('units_located'),
+                    'status': record.get('status'),
+                    'amazon_partnered_carrier_cost': record.get('amazon_partnered_carrier_cost'),
+                    'currency': record.get('currency'),
+                    'msku': record.get('MSKU')
+                })
             except Exception as e:
                 error_records.append({
                     'index': index,
@@ -913,17 +883,11 @@ def bulk_create_inbound_shipping():
                     'error': str(e)
                 })
         
-        # Commit all successfully processed records at once
-        if created_records:
-            db.session.commit()
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_records)} inbound shipping records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_records),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_records else 400
+        result = upsert_frame(AmazonInboundShipping.__table__, pd.DataFrame(valid_records, index=valid_indexes), INBOUND_SHIPPING_KEY)
+        db.session.commit()
+
+        error_records = with_rejected_rows(error_records, result, data)
+        return bulk_upload_response('inbound shipping', result, error_records, len(error_records))
     
     except Exception as e:
         db.session.rollback()
@@ -989,43 +953,7 @@ def delete_amazon_inbound_shipping():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = AmazonInboundShipping.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in Amazon Inbound Shipping.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(AmazonInboundShipping, selected_records, 'Amazon Inbound Shipping')
 
 # Delete all Amazon Inbound Shipping records
 @app.route('/amazon/inbound-shipping/delete-all', methods=['DELETE'])
@@ -1044,6 +972,8 @@ def delete_all_amazon_inbound_shipping():
 # FBMShippingCost CRUD Operations                                                                                |
 # ---------------------------------------------------------------------------------------------------------------
 
+FBM_SHIPPING_COST_KEY = ['order_id', 'shipping_id']
+
 @app.route('/amazon/fbm-shipping-cost/bulk-create', methods=['POST'])
 def bulk_create_fbm_shipping_cost():
     data = request.json
@@ -1054,7 +984,8 @@ def bulk_create_fbm_shipping_cost():
     if len(data) == 0:
         return jsonify({'message': 'No FBM shipping cost records to create.'}), 200
     
-    created_records = []
+    valid_records = []
+    valid_indexes = []
     error_records = []
     
     # Helper function to handle scientific notation in IDs
@@ -1073,7 +1004,7 @@ def bulk_create_fbm_shipping_cost():
             return value  # Return original if conversion fails
     
     try:
-        # Process all records in a single transaction for efficiency
+        # Validate all records first, then upsert them on (order_id, shipping_id) in one statement
         for index, record in enumerate(data):
             try:
                 # Get order_id and shipping_id, handling scientific notation
@@ -1099,18 +1030,15 @@ def bulk_create_fbm_shipping_cost():
                     except Exception:
                         pass  
                 
-                # Create a new FBMShippingCost instance
-                new_record = FBMShippingCost(
-                    order_id=order_id,
-                    shipping_id=shipping_id,
-                    shipping_cost=record.get('shipping_cost'),
-                    warehouse_cost=record.get('warehouse_cost'),
-                    source=record.get('source'),
-                    payment_date=payment_date
-                )
-                
-                db.session.add(new_record)
-                created_records.append(new_record)
+                valid_indexes.append(index)
+                valid_records.append({
+                    'order_id': order_id,
+                    'shipping_id': shipping_id,
+                    'shipping_cost': record.get('shipping_cost'),
+                    'warehouse_cost': record.get('warehouse_cost'),
+                    'source': record.get('source'),
+                    'payment_date': payment_date
+                })
             except Exception as e:
                 error_records.append({
                     'index': index,
@@ -1118,17 +1046,11 @@ def bulk_create_fbm_shipping_cost():
                     'error': str(e)
                 })
         
-        # Commit all successfully processed records at once
-        if created_records:
-            db.session.commit()
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_records)} FBM shipping cost records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_records),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_records else 400
+        result = upsert_frame(FBMShippingCost.__table__, pd.DataFrame(valid_records, index=valid_indexes), FBM_SHIPPING_COST_KEY)
+        db.session.commit()
+
+        error_records = with_rejected_rows(error_records, result, data)
+        return bulk_upload_response('FBM shipping cost', result, error_records, len(error_records))
     
     except Exception as e:
         db.session.rollback()
@@ -1148,43 +1070,7 @@ def delete_amazon_fbm_shipping_cost():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = FBMShippingCost.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in FBM Shipping Cost.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(FBMShippingCost, selected_records, 'FBM Shipping Cost')
 
 # Delete all FBM Shipping Cost records
 @app.route('/amazon/fbm-shipping-cost/delete-all', methods=['DELETE'])
@@ -1400,6 +1286,8 @@ def create_ads_spend_by_day():
         return jsonify({'error': f'Error creating ad spend record: {str(e)}'}), 500
 
 # Bulk create Ad Spend by Day data
+ADS_SPEND_BY_DAY_KEY = ['date_by_day', 'sku']
+
 @app.route('/amazon/ads-spend-by-day/bulk-create', methods=['POST'])
 def bulk_create_ads_spend_by_day():
     data = request.json
@@ -1410,12 +1298,12 @@ def bulk_create_ads_spend_by_day():
     if len(data) == 0:
         return jsonify({'message': 'No ad spend records to create.'}), 200
     
-    created_records = []
     error_records = []
     
     try:
         # Prepare records for bulk insert
         valid_records = []
+        valid_indexes = []
         
         # Process all records and validate them first
         for index, record in enumerate(data):
@@ -1456,6 +1344,7 @@ def bulk_create_ads_spend_by_day():
                     'sku': record.get('sku'),
                     'spend': record.get('spend') if record.get('spend') is not None else 0
                 }
+                valid_indexes.append(index)
                 valid_records.append(valid_record)
                 
             except Exception as e:
@@ -1465,22 +1354,16 @@ def bulk_create_ads_spend_by_day():
                     'error': str(e)
                 })
         
-        # Perform bulk insert if we have valid records
-        if valid_records:
-            db.session.execute(
-                AdsSpendByDay.__table__.insert(),
-                valid_records
-            )
-            db.session.commit()
-            created_records = valid_records  # For count purposes
-            
-        # Return summary of the operation
-        return jsonify({
-            'message': f'Bulk upload completed. {len(created_records)} ad spend records created successfully, {len(error_records)} failed.',
-            'created_count': len(created_records),
-            'error_count': len(error_records),
-            'errors': error_records[:10] if error_records else []  # Limit to first 10 errors
-        }), 201 if created_records else 400
+        # Upsert on (date_by_day, sku): a re-uploaded day only rewrites the SKUs whose spend changed; rows of one
+        # SKU and day (e.g. one per campaign) are added up
+        result = upsert_frame(
+            AdsSpendByDay.__table__, pd.DataFrame(valid_records, index=valid_indexes), ADS_SPEND_BY_DAY_KEY,
+            sum_columns=['spend']
+        )
+        db.session.commit()
+
+        error_records = with_rejected_rows(error_records, result, data)
+        return bulk_upload_response('ad spend', result, error_records, len(error_records))
     
     except Exception as e:
         db.session.rollback()
@@ -1534,43 +1417,7 @@ def delete_ads_spend_by_day():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = AdsSpendByDay.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in Ad Spend by Day.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(AdsSpendByDay, selected_records, 'Ad Spend by Day')
 
 # Delete all Ad Spend by Day records
 @app.route('/amazon/ads-spend-by-day/delete-all', methods=['DELETE'])
@@ -1813,43 +1660,7 @@ def delete_ads_credit_card_payment():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = AdsCreditCardPayment.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in Ad Credit Card Payment.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(AdsCreditCardPayment, selected_records, 'Ad Credit Card Payment')
 
 # Delete all Ad Credit Card Payment records
 @app.route('/amazon/ads-credit-card-payment/delete-all', methods=['DELETE'])
@@ -1916,6 +1727,7 @@ def create_qb_account_mapping():
         
         db.session.add(new_mapping)
         db.session.commit()
+        invalidate_qb_account_mapping()
         
         return jsonify({
             'message': 'QB Account ID Mapping record created successfully!',
@@ -1983,6 +1795,7 @@ def bulk_create_qb_account_mapping():
         # Commit all successfully processed records at once
         if created_records:
             db.session.commit()
+            invalidate_qb_account_mapping()
             
         # Return summary of the operation
         return jsonify({
@@ -2042,43 +1855,9 @@ def delete_qb_account_mapping():
     if not selected_records:
         return jsonify({'error': 'No records selected for deletion.'}), 400
     
-    # Initialize response containers
-    success_deletes = []
-    failed_deletes = []
-    
-    for selected_record in selected_records:
-        record_id = selected_record.get('id')
-        
-        # Query the matching record
-        record_to_delete = QBAccountIDMapping.query.get(record_id)
-        
-        if not record_to_delete:
-            failed_deletes.append({
-                'id': record_id,
-                'error': 'Record not found in QB Account ID Mapping.'
-            })
-            continue
-        
-        # Delete the record
-        db.session.delete(record_to_delete)
-        success_deletes.append({
-            'id': record_id,
-            'message': 'Record deleted successfully.'
-        })
-    
-    # Commit the transaction if there are successful deletes
-    try:
-        if success_deletes:
-            db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error occurred during deletion: {str(e)}'}), 500
-    
-    # Return the response with details for both successful and failed deletes
-    return jsonify({
-        'success_deletes': success_deletes,
-        'failed_deletes': failed_deletes
-    })
+    return delete_by_id_response(
+        QBAccountIDMapping, selected_records, 'QB Account ID Mapping', after_commit=invalidate_qb_account_mapping
+    )
 
 # Delete all QB Account ID Mapping records
 @app.route('/qb-account-mapping/delete-all', methods=['DELETE'])
@@ -2088,6 +1867,7 @@ def delete_all_qb_account_mapping():
         count = QBAccountIDMapping.query.count()
         QBAccountIDMapping.query.delete()
         db.session.commit()
+        invalidate_qb_account_mapping()
         return jsonify({'message': f'Successfully deleted all {count} QB Account ID Mapping records'}), 200
     except Exception as e:
         db.session.rollback()
@@ -2126,6 +1906,10 @@ def get_latest_qb_account_mapping():
 
 # Generate All Orders PnL
 @app.route('/amazon/all-orders-pnl/generate', methods=['POST'])
+@pipeline_timer.timed('all_orders_pnl_generate')
+@change_tracker.consumer('all_orders_pnl', (
+    'amazonallorders', 'skueconomics', 'adsspendbyday', 'amazoninboundshipping', 'amazonstatements', 'adscreditcardpayment'
+))
 def all_orders_pnl_generate():
     """Generate All Orders PnL data by running the processing script and saving results to database"""
     from backend import db
@@ -2141,21 +1925,19 @@ def all_orders_pnl_generate():
     script_path = os.path.join(current_directory, 'processing', 'PnL_Generation', 'all_orders_PnL_table.py')
     
     try:
-        # Import the module from the file path
-        spec = importlib.util.spec_from_file_location("all_orders_PnL_table", script_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        with pipeline_timer.span('script') as script:
+            # Import the module from the file path
+            spec = importlib.util.spec_from_file_location("all_orders_PnL_table", script_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
         
-        # The script already processes the data and creates a DataFrame called all_orders_PnL
-        # We can access it from the module's namespace
-        all_orders_pnl_df = module.all_orders_PnL
+            # The script already processes the data and creates a DataFrame called all_orders_PnL
+            # We can access it from the module's namespace
+            all_orders_pnl_df = module.all_orders_PnL
+            script.rows = len(all_orders_pnl_df)
         
-        # High-performance table replacement using SQLAlchemy core bulk insert
         print(f"Replacing AllOrdersPnL table with {len(all_orders_pnl_df)} records...")
         
-        # Convert DataFrame to list of dictionaries for SQLAlchemy core bulk insert
-        # Handle NaN values by converting them to None and map column names to database schema
-        
         # Column mapping from DataFrame names to database column names
         column_mapping = {
             'FBA_fulfillment_fee': 'fba_fulfillment_fee',
@@ -2168,30 +1950,27 @@ def all_orders_pnl_generate():
             'returns_FBM_shipping_commission': 'returns_fbm_shipping_commission'
         }
         
-        records_to_insert = []
-        for _, row in all_orders_pnl_df.iterrows():
-            # Convert NaN to None for database compatibility
-            row_dict = row.where(pd.notnull(row), None).to_dict()
-            
-            # Apply column name mapping
-            mapped_dict = {}
-            for key, value in row_dict.items():
-                mapped_key = column_mapping.get(key, key)  # Use mapping if exists, otherwise keep original
-                mapped_dict[mapped_key] = value
-            
-            records_to_insert.append(mapped_dict)
-        
-        # Clear existing table and bulk insert using SQLAlchemy core (same as your 2-second bulk create endpoints)
-        from sqlalchemy import text
-        db.session.execute(text("DELETE FROM allorderspnl;"))
-        db.session.execute(
-            AllOrdersPnL.__table__.insert(),
-            records_to_insert
-        )
-        records_created = len(records_to_insert)
-        print(f"✅ Successfully bulk inserted {records_created} AllOrdersPnL records")
+        with pipeline_timer.span('write', rows=len(all_orders_pnl_df)):
+            # Rebuilt in a shadow table swapped in at the end (see table_swap.py): dashboards keep reading the previous
+            # rows meanwhile; NaN values are written as NULL
+            from backend.processing.functions.table_swap import replace_table
+            pnl_df = all_orders_pnl_df.rename(columns=column_mapping)
+            pnl_df = pnl_df[[column for column in pnl_df.columns if column in AllOrdersPnL.__table__.c]]  # script-only columns are not stored
+            records_created = replace_table(AllOrdersPnL.__table__, pnl_df)
+            print(f"✅ Successfully replaced AllOrdersPnL table with {records_created} records")
                 
-        db.session.commit()
+            db.session.commit()
+
+        # Rebuild the week x SKU aggregate read by the profitability report
+        from backend.evaluate_performance_dashboard_crud import refresh_profitability_week_sku
+        with pipeline_timer.span('refresh_profitability_week_sku'):
+            refresh_profitability_week_sku()
+
+        # New SKUs (and POs waiting for them) get their brand / main component
+        from backend.processing.functions.sku_dimensions import register_skus
+        with pipeline_timer.span('register_skus'):
+            register_skus(all_orders_pnl_df['sku'].dropna().unique())
+
         return jsonify({"message": f"Successfully generated {records_created} AllOrdersPnL records"}), 200
     
     except Exception as e:
@@ -2214,6 +1993,7 @@ def all_orders_pnl_delete_all():
     try:
         count = AllOrdersPnL.query.count()
         AllOrdersPnL.query.delete()
+        db.session.execute(text("DELETE FROM profitabilityweeksku"))
         db.session.commit()
         return jsonify({"message": f"Successfully deleted {count} AllOrdersPnL records"}), 200
     except Exception as e:
@@ -437,6 +437,7 @@ class AmazonAllOrders(db.Model):
     fulfillment_channel = db.Column(db.String, nullable=False)
     sales_channel = db.Column(db.String, nullable=False)
     sku = db.Column(db.String, nullable=False)
+    line_number = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # n-th line of the SKU in the order
     item_status = db.Column(db.String, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     currency = db.Column(db.String)
@@ -449,6 +450,11 @@ class AmazonAllOrders(db.Model):
     item_promotion_discount = db.Column(db.Numeric(10, 2))
     ship_promotion_discount = db.Column(db.Numeric(10, 2))
 
+    __table_args__ = (
+        # natural key of an order line (an order can list one SKU on several lines); bulk uploads upsert on it
+        db.Index('uq_amazonallorders_order_sku_line', 'amazon_order_id', 'sku', 'line_number', unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -459,6 +465,7 @@ class AmazonAllOrders(db.Model):
             'fulfillment_channel': self.fulfillment_channel,
             'sales_channel': self.sales_channel,
             'sku': self.sku,
+            'line_number': self.line_number,
             'item_status': self.item_status,
             'quantity': self.quantity,
             'currency': self.currency,
@@ -487,6 +494,10 @@ class SKUEconomics(db.Model):
     monthly_inventory_storage_fee_total = db.Column(db.Numeric(10, 2))
     inbound_transportation_charge_total = db.Column(db.Numeric(10, 2))
 
+    __table_args__ = (
+        db.Index('uq_skueconomics_store_msku_period', 'amazon_store', 'msku', 'start_date_pst_pdt', 'end_date_pst_pdt', unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -508,6 +519,10 @@ class AdsSpendByDay(db.Model):
     date_by_day = db.Column(db.Date, nullable=False)
     sku = db.Column(db.String, nullable=False)
     spend = db.Column(db.Numeric(10, 2))
+
+    __table_args__ = (
+        db.Index('uq_adsspendbyday_date_sku', 'date_by_day', 'sku', unique=True),
+    )
     
     def to_dict(self):
         return {
@@ -541,6 +556,11 @@ class AmazonStatements(db.Model):
     sku = db.Column(db.String)
     quantity_purchased = db.Column(db.Integer)
 
+    __table_args__ = (
+        # settlements are uploaded and replaced whole; their lines have no natural key of their own
+        db.Index('amazonstatements_settlement_id_idx', 'settlement_id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -599,6 +619,11 @@ class AmazonInboundShipping(db.Model):
     currency = db.Column(db.String)
     msku = db.Column(db.String)
 
+    __table_args__ = (
+        # msku is optional, rows without one share the key (shipment_id, '')
+        db.Index('uq_amazoninboundshipping_shipment_msku', 'shipment_id', db.text("coalesce(msku, '')"), unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -626,6 +651,10 @@ class FBMShippingCost(db.Model):
     source = db.Column(db.String)
     payment_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index('uq_fbmshippingcost_order_shipping', 'order_id', 'shipping_id', unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -842,3 +871,166 @@ class QBAccountIDMapping(db.Model):
             'bs_account_name': self.bs_account_name,
             'bs_account_id': self.bs_account_id
         }
+
+class QBAccountMappingVersion(db.Model):
+    __tablename__ = 'qbaccountmappingversion'
+
+    id = db.Column(db.Integer, primary_key=True)  # single row, id = 1
+    version = db.Column(db.BigInteger, nullable=False)  # bumped by a trigger on every qbaccountidmapping write
+
+class QBReference(db.Model):
+    __tablename__ = 'qbreference'
+
+    entity_type = db.Column(db.String, nullable=False)  # Account, Customer or Vendor
+    qb_id = db.Column(db.String, nullable=False)
+    name = db.Column(db.String)
+    fully_qualified_name = db.Column(db.String)
+    acct_num = db.Column(db.String)
+    account_type = db.Column(db.String)
+    active = db.Column(db.Boolean)
+    last_updated_time = db.Column(db.String)
+    synced_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.PrimaryKeyConstraint('entity_type', 'qb_id'),
+        db.Index('qbreference_acct_num_idx', 'entity_type', 'acct_num'),
+        db.Index('qbreference_name_idx', 'entity_type', 'name'),
+    )
+
+    def to_dict(self):
+        return {
+            'entity_type': self.entity_type,
+            'qb_id': self.qb_id,
+            'name': self.name,
+            'fully_qualified_name': self.fully_qualified_name,
+            'acct_num': self.acct_num,
+            'account_type': self.account_type,
+            'active': self.active,
+            'last_updated_time': self.last_updated_time,
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
+
+
+class ProfitabilityWeekSKU(db.Model):
+    __tablename__ = 'profitabilityweeksku'
+
+    week_label = db.Column(db.String, nullable=False)  # 'YYYY-MM-DD to YYYY-MM-DD', Sunday-start weeks
+    sku = db.Column(db.String, nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    week_end = db.Column(db.Date, nullable=False)
+    net_profit = db.Column(db.Numeric(15, 2))
+    total_revenue = db.Column(db.Numeric(15, 2))
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.PrimaryKeyConstraint('week_label', 'sku'),
+        db.Index('profitabilityweeksku_week_start_idx', 'week_start'),
+    )
+
+    def to_dict(self):
+        return {
+            'week_label': self.week_label,
+            'sku': self.sku,
+            'week_start': self.week_start.isoformat() if self.week_start else None,
+            'week_end': self.week_end.isoformat() if self.week_end else None,
+            'net_profit': float(self.net_profit) if self.net_profit is not None else None,
+            'total_revenue': float(self.total_revenue) if self.total_revenue is not None else None,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
+
+
+class SKUDimension(db.Model):
+    __tablename__ = 'skudimension'
+
+    sku = db.Column(db.String, primary_key=True)
+    brand = db.Column(db.String)  # SKU prefix before the first '_'
+    main_component = db.Column(db.String)  # SKU part between the first and second '_'
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('skudimension_brand_idx', 'brand'),
+        db.Index('skudimension_main_component_idx', 'main_component'),
+    )
+
+    def to_dict(self):
+        return {
+            'sku': self.sku,
+            'brand': self.brand,
+            'main_component': self.main_component,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ProductDimension(db.Model):
+    __tablename__ = 'productdimension'
+
+    product = db.Column(db.String, primary_key=True)
+    ir = db.Column(db.String)
+    sku_one_example = db.Column(db.String)  # first SKU containing the IR; NULL until a matching SKU is written
+    brand = db.Column(db.String)
+    main_component = db.Column(db.String)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('productdimension_ir_idx', 'ir'),
+        db.Index('productdimension_brand_idx', 'brand'),
+        db.Index('productdimension_main_component_idx', 'main_component'),
+    )
+
+    def to_dict(self):
+        return {
+            'product': self.product,
+            'ir': self.ir,
+            'sku_one_example': self.sku_one_example,
+            'brand': self.brand,
+            'main_component': self.main_component,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ChangeLog(db.Model):
+    __tablename__ = 'changelog'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String, nullable=False)
+    operation = db.Column(db.String, nullable=False)  # insert / update / delete
+    partition_key = db.Column(db.String)  # SKU (product for purchase orders / raw materials); NULL when not known
+    month = db.Column(db.Date)  # first day of the month of date_from..date_to; NULL when not known (both NULL: whole table)
+    date_from = db.Column(db.Date)
+    date_to = db.Column(db.Date)
+    row_count = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String)  # consumer or route that wrote the rows, e.g. 'cogs' or 'POST /sales_records'
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('changelog_table_name_id_idx', 'table_name', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'table_name': self.table_name,
+            'operation': self.operation,
+            'partition_key': self.partition_key,
+            'month': self.month.isoformat() if self.month else None,
+            'date_from': self.date_from.isoformat() if self.date_from else None,
+            'date_to': self.date_to.isoformat() if self.date_to else None,
+            'row_count': self.row_count,
+            'source': self.source,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None
+        }
+
+
+class ChangeLogCheckpoint(db.Model):
+    __tablename__ = 'changelogcheckpoint'
+
+    consumer = db.Column(db.String, primary_key=True)  # e.g. 'cogs', 'all_orders_pnl'
+    last_change_id = db.Column(db.Integer, nullable=False)  # changelog.id covered by the consumer's last successful run
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'consumer': self.consumer,
+            'last_change_id': self.last_change_id,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
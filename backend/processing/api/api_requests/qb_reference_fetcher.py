@@ -0,0 +1,195 @@
+"""
+Parallel paginated fetch of QuickBooks Account / Customer / Vendor lists into the local qbreference table
+Journal builders read IDs from qbreference instead of re-querying QuickBooks
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import text
+from backend import db
+from backend.models import QBReference
+from backend.processing.api.quickbooks_client import get_quickbooks_client, QuickBooksAPIError
+
+QB_REFERENCE_ENTITIES = ['Account', 'Customer', 'Vendor']
+QB_QUERY_PAGE_SIZE = 1000  # QuickBooks maximum for MAXRESULTS
+QB_FETCH_WORKERS = int(os.getenv('QB_FETCH_WORKERS', '4'))  # QuickBooks throttles above 10 concurrent requests per company
+
+
+def _query_page(client, statement):
+    response = client.query(statement)
+    if response.status_code != 200:
+        raise QuickBooksAPIError(f"QuickBooks query failed: {statement}", response.status_code, response.text)
+    return response.json().get('QueryResponse', {})
+
+
+def fetch_qb_entities(entity_type, page_size=QB_QUERY_PAGE_SIZE, max_workers=QB_FETCH_WORKERS):
+    """
+    Fetch every record of a QuickBooks entity: COUNT(*) first, then all pages concurrently
+
+    Args:
+        entity_type: 'Account', 'Customer' or 'Vendor'
+        page_size: MAXRESULTS per page
+        max_workers: bounded number of concurrent page requests
+
+    Returns:
+        list: unique records (by Id) in page order
+    """
+    client = get_quickbooks_client()
+
+    total_count = _query_page(client, f"SELECT COUNT(*) FROM {entity_type}").get('totalCount', 0)
+    if not total_count:
+        return []
+
+    statements = [
+        f"SELECT * FROM {entity_type} STARTPOSITION {start_position} MAXRESULTS {page_size}"
+        for start_position in range(1, total_count + 1, page_size)
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(statements)))) as executor:
+        pages = list(executor.map(lambda statement: _query_page(client, statement).get(entity_type, []), statements))
+
+    # Remove duplicates if any
+    records = {}
+    for page in pages:
+        for record in page:
+            records.setdefault(record['Id'], record)
+    print(f"Total unique {entity_type} records retrieved: {len(records)}")
+    return list(records.values())
+
+
+def _reference_row(entity_type, record, synced_at):
+    return {
+        'entity_type': entity_type,
+        'qb_id': str(record['Id']),
+        'name': record.get('DisplayName') or record.get('Name'),
+        'fully_qualified_name': record.get('FullyQualifiedName'),
+        'acct_num': record.get('AcctNum'),
+        'account_type': record.get('AccountType'),
+        'active': record.get('Active'),
+        'last_updated_time': record.get('MetaData', {}).get('LastUpdatedTime'),
+        'synced_at': synced_at
+    }
+
+
+def upsert_qb_references(entity_type, records):
+    """
+    Upsert fetched records into qbreference and drop the ones QuickBooks no longer returns
+
+    Returns:
+        dict: upserted and removed counts
+    """
+    synced_at = datetime.utcnow()
+    rows = [_reference_row(entity_type, record, synced_at) for record in records]
+
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    if rows:
+        statement = insert(QBReference.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['entity_type', 'qb_id'],
+            set_={column: statement.excluded[column] for column in rows[0] if column not in ('entity_type', 'qb_id')}
+        )
+        db.session.execute(statement, rows)
+
+    removed = db.session.execute(
+        text("DELETE FROM qbreference WHERE entity_type = :entity_type AND synced_at < :synced_at"),
+        {'entity_type': entity_type, 'synced_at': synced_at}
+    ).rowcount
+    db.session.commit()
+    invalidate_qb_reference_cache()
+
+    return {'upserted': len(rows), 'removed': removed}
+
+
+def sync_qb_references(entity_types=None):
+    """Fetch and upsert each entity type; returns per-entity counts"""
+    return {
+        entity_type: upsert_qb_references(entity_type, fetch_qb_entities(entity_type))
+        for entity_type in (entity_types or QB_REFERENCE_ENTITIES)
+    }
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Lookups used by the journal entry builders
+# ---------------------------------------------------------------------------------------------------------------
+_reference_lock = threading.Lock()
+_reference_cache = {}  # (entity_type, acct_num, name) -> qb_id, None when qbreference has no match
+_reference_fingerprint = None  # qbreference (row count, last sync) the cached lookups were read from
+_reference_generation = 0  # bumped whenever the cache is cleared, so a lookup racing a sync is not cached
+
+
+def _load_reference_fingerprint():
+    # Every sync rewrites synced_at, so workers that did not handle /quickbooks/references/sync still pick it up
+    count, last_synced_at = db.session.execute(text("SELECT COUNT(*), MAX(synced_at) FROM qbreference")).one()
+    return count, last_synced_at
+
+
+def _clear_reference_cache(fingerprint):
+    global _reference_fingerprint, _reference_generation
+    _reference_cache.clear()
+    _reference_fingerprint = fingerprint
+    _reference_generation += 1
+
+
+def invalidate_qb_reference_cache():
+    with _reference_lock:
+        _clear_reference_cache(None)
+
+
+def refresh_qb_reference_cache():
+    """
+    Drop the cached lookups when qbreference was synced since they were read
+
+    Called once at the start of every journal build, so lookups within the build do not query the fingerprint.
+    Runs in a savepoint: a missing or unreadable table leaves the caller's transaction untouched.
+    """
+    try:
+        with db.session.begin_nested():
+            fingerprint = _load_reference_fingerprint()
+    except Exception as e:
+        print(f"QB reference fingerprint unavailable, clearing cached IDs: {e}")
+        fingerprint = None
+    with _reference_lock:
+        if fingerprint is None or fingerprint != _reference_fingerprint:
+            _clear_reference_cache(fingerprint)
+
+
+def get_qb_reference_id(entity_type, default=None, acct_num=None, name=None):
+    """
+    Look up a QuickBooks ID from qbreference by account number or name
+
+    Falls back to default when the reference table has not been synced or has no match. Lookups are cached until a
+    sync or refresh_qb_reference_cache() sees qbreference change; the default is not cached, callers may pass
+    different ones.
+    """
+    if acct_num is not None:
+        condition, value = 'acct_num = :value', str(acct_num)
+    else:
+        condition, value = 'name = :value', name
+    key = (entity_type, acct_num, name)
+    with _reference_lock:
+        generation = _reference_generation
+        if key in _reference_cache:
+            qb_id = _reference_cache[key]
+            return qb_id if qb_id is not None else default
+
+    try:
+        # savepoint: a failed lookup must not roll back the caller's pending work
+        with db.session.begin_nested():
+            qb_id = db.session.execute(
+                text(f"SELECT qb_id FROM qbreference WHERE entity_type = :entity_type AND {condition} ORDER BY qb_id LIMIT 1"),
+                {'entity_type': entity_type, 'value': value}
+            ).scalar()
+    except Exception as e:
+        print(f"QB reference lookup failed, using default ID: {e}")
+        return default
+
+    qb_id = int(qb_id) if qb_id is not None else None
+    with _reference_lock:
+        if generation == _reference_generation:  # not invalidated by a sync meanwhile
+            _reference_cache[key] = qb_id
+    return qb_id if qb_id is not None else default
@@ -4,9 +4,7 @@ current_directory = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_directory, os.pardir, os.pardir, os.pardir, os.pardir))
 sys.path.append(project_root)
 
-import requests
-from dotenv import dotenv_values
-from backend.processing.api.refresh_tokens import check_token_validity
+from backend.processing.api.quickbooks_client import get_quickbooks_client
 import json
 
 import pandas as pd
@@ -16,37 +14,22 @@ QB_AccountID_Lookup_Table = pd.read_csv(os.path.join(project_root, 'backend', 'p
 COGS_statement_category = 'COGS'
 COGS_statement_pnl_item = 'COGS - PC and Hardware'
 
-# Fetch tokens and expiration from .env
-env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
-config = dotenv_values(env_path)
-access_token = config.get('ACCESS_TOKEN')
-realm_id = config.get('REALM_ID')
+# Lookup logic for Statement Category and PnL Items - indexed once, first mapping row wins for duplicated keys
+QB_AccountID_Lookup = {
+    (statement_category, pnl_item): (p_and_l_account_id, bs_account_id)
+    for statement_category, pnl_item, p_and_l_account_id, bs_account_id in QB_AccountID_Lookup_Table[
+        ['Statement Category', 'Statement PnL Items', 'P&L Account ID', 'BS Account ID']
+    ].drop_duplicates(subset=['Statement Category', 'Statement PnL Items']).itertuples(index=False)
+}
 
-# Lookup logic for Statement Category and PnL Items
 def get_account_ids(statement_category, pnl_item):
-    account_row = QB_AccountID_Lookup_Table[
-        (QB_AccountID_Lookup_Table['Statement Category'] == statement_category) & 
-        (QB_AccountID_Lookup_Table['Statement PnL Items'] == pnl_item)
-    ]
-    
-    if not account_row.empty:
-        p_and_l_account_id = account_row['P&L Account ID'].values[0]
-        bs_account_id = account_row['BS Account ID'].values[0]
-        return p_and_l_account_id, bs_account_id
-    else:
-        return None, None
+    return QB_AccountID_Lookup.get((statement_category, pnl_item), (None, None))
 
 def create_COGS_journal_entry(access_token, realm_id, COGS_amount, booking_date_start, booking_date_end):
-    # Check if access token is valid
-    access_token = check_token_validity()
-
-    base_url = 'https://sandbox-quickbooks.api.intuit.com'
-    endpoint = f"{base_url}/v3/company/{realm_id}/journalentry"
+    # Shared client handles the access token, connection reuse and retries
+    client = get_quickbooks_client()
 
     headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
         # Add this to prevent gzip encoding in the response
         'Accept-Encoding': 'identity'
     }
@@ -102,17 +85,7 @@ def create_COGS_journal_entry(access_token, realm_id, COGS_amount, booking_date_
 
     # Make the POST request to create the journal entry with error handling
     try:
-        # First attempt with standard settings
-        response = requests.post(endpoint, headers=headers, json=data)
-        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-    except requests.exceptions.ContentDecodingError:
-        # If we get a content decoding error, try with a session that disables content encoding
-        print("Content decoding error encountered, retrying with different settings...")
-        session = requests.Session()
-        session.headers.update(headers)
-        # Disable automatic content decompression
-        session.mount('https://', requests.adapters.HTTPAdapter())
-        response = session.post(endpoint, json=data)
+        response = client.create_journal_entry(data, headers=headers)
     except Exception as e:
         print(f"Error making request to QuickBooks API: {str(e)}")
         raise
@@ -127,5 +100,5 @@ def create_COGS_journal_entry(access_token, realm_id, COGS_amount, booking_date_
         raise Exception(f"Failed to create journal entry: {response.text}")
 
 # Call the function to create a journal entry
-# create_COGS_journal_entry(access_token, realm_id, 20, '2024-01-01', '2024-01-31')
+# create_COGS_journal_entry(None, None, 20, '2024-01-01', '2024-01-31')
 
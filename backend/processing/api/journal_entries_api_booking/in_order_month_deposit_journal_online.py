@@ -9,13 +9,14 @@ current_directory = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_directory, os.pardir, os.pardir, os.pardir, os.pardir))
 sys.path.append(project_root)
 
-import requests
-from dotenv import dotenv_values
-from backend.processing.api.refresh_tokens import check_token_validity
+from backend.processing.api.quickbooks_client import get_quickbooks_client
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from backend import db
+from backend.processing.api.api_requests.qb_reference_fetcher import get_qb_reference_id, refresh_qb_reference_cache
+from backend.processing.api.qb_account_mapping import map_qb_account_ids, report_unmapped_items, build_journal_lines, number_journal_lines
 
 def create_in_order_month_journal_entry(memory_processor):
     """
@@ -39,56 +40,31 @@ def create_in_order_month_journal_entry(memory_processor):
     pnl_data['Statement PnL Items'] = pnl_data['Statement PnL Items'].apply(lambda x: 'CouponRedemptionFee' if str(x)[:19] == 'CouponRedemptionFee' else x)
     pnl_data['Statement PnL Items'] = pnl_data['Statement PnL Items'].apply(lambda x: 'FBA Inventory Reimbursement' if str(x)[:27] == 'FBA Inventory Reimbursement' else x)
 
-    # Load QB Account ID mapping from database
-    qb_mapping_query = """
-        SELECT statement_category, statement_pnl_items, pnl_account_id, bs_account_id 
-        FROM qbaccountidmapping
-    """
-    QB_AccountID_Lookup_Table = pd.read_sql_query(qb_mapping_query, db.engine)
+    # Attach QB Account IDs from the cached QBAccountIDMapping table
+    pnl_data = map_qb_account_ids(pnl_data)
     
-    # Account IDs
-    accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee = 193
-    accountID_14500_Return_Inventory = 1150040062
+    # Account IDs - read from the synced qbreference table by account number, defaults used until it is synced
+    refresh_qb_reference_cache()
+    accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee = get_qb_reference_id('Account', default=193, acct_num='13300')
+    accountID_14500_Return_Inventory = get_qb_reference_id('Account', default=1150040062, acct_num='14500')
     accountID_Bank_Deposit = 1150040063
 
     journal_date_str_month_end = PnL_month_str
 
-    # Fetch tokens and expiration from .env
-    env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
-    config = dotenv_values(env_path)
-    access_token = config.get('ACCESS_TOKEN')
-    realm_id = config.get('REALM_ID')
-
-    # Lookup logic for Statement Category and PnL Items
-    def get_account_ids(statement_category, pnl_item):
-        account_row = QB_AccountID_Lookup_Table[
-            (QB_AccountID_Lookup_Table['statement_category'] == statement_category) & 
-            (QB_AccountID_Lookup_Table['statement_pnl_items'] == pnl_item)
-        ]
-        
-        if not account_row.empty:
-            p_and_l_account_id = account_row['pnl_account_id'].values[0]
-            bs_account_id = account_row['bs_account_id'].values[0]
-            return p_and_l_account_id, bs_account_id
-        else:
-            return None, None
-
-    def create_journal_entry(access_token, realm_id):
-        # Check if access token is valid
-        access_token = check_token_validity()
-
-        base_url = 'https://sandbox-quickbooks.api.intuit.com'
-        endpoint = f"{base_url}/v3/company/{realm_id}/journalentry"
-
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+    def create_journal_entry():
+        # Shared client handles the access token, connection reuse and retries
+        client = get_quickbooks_client()
 
         # Initialize journal lines
         journal_lines = []
-        id = 1
+
+        amount_columns = [
+            'Project PnL Paid', 'Project PnL Unpaid', 'Adjustment Items - Accrued Adjusted PnL to Adjust',
+            'Missing Items - Accrued PnL to Add', 'Return Items - Accrued Adjusted PnL to Adjust'
+        ]
+        amounts = pnl_data[amount_columns].astype(float)
+        has_pnl_account = pnl_data['pnl_account_id'].notna()
+        has_both_accounts = has_pnl_account & pnl_data['bs_account_id'].notna()
 
         # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         # Paid Order                                                                                                                                                                                |
@@ -96,185 +72,110 @@ def create_in_order_month_journal_entry(memory_processor):
         total_paid = 0
 
         # project P&L with adjustment
-        for idx, row in pnl_data.iterrows():
-            if (row['Project PnL Paid'] if pd.notna(row['Project PnL Paid']) else 0) + (row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0) != 0:
-                p_and_l_account_id, _ = get_account_ids(row['Statement Category'], row['Statement PnL Items'])
-                if p_and_l_account_id is not None:
-                    project_pnl =  row['Project PnL Paid'] if pd.notna(row['Project PnL Paid']) else 0
-                    adjusted_pnl = row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount = abs(round(project_pnl+adjusted_pnl,2))
-                    posting_type = "Credit" if row['Project PnL Paid'] > 0 else "Debit"
-                    journal_lines.append({
-                        "Id": str(id),
-                        "Description": row['Statement PnL Items'] + " - paid and adjusted based on Statements",
-                        "Amount": amount,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    total_paid += round(project_pnl+adjusted_pnl,2)
-                    id += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+        project_pnl = amounts['Project PnL Paid'].fillna(0)
+        adjusted_pnl = amounts['Adjustment Items - Accrued Adjusted PnL to Adjust'].fillna(0)
+        to_book = (project_pnl + adjusted_pnl) != 0
+        booked = pnl_data[to_book & has_pnl_account]
+        report_unmapped_items(pnl_data.loc[to_book & ~has_pnl_account, 'Statement PnL Items'])
+        paid_adjusted_amount = (project_pnl + adjusted_pnl)[booked.index].round(2)
+        journal_lines += build_journal_lines(
+            booked['Statement PnL Items'] + " - paid and adjusted based on Statements",
+            paid_adjusted_amount.abs(),
+            np.where(amounts.loc[booked.index, 'Project PnL Paid'] > 0, "Credit", "Debit"),
+            booked['pnl_account_id']
+        )
+        total_paid += paid_adjusted_amount.sum()
         
         # add missing items
-        for idx, row in pnl_data.iterrows():
-            if row['Missing Items - Accrued PnL to Add'] != 0 and pd.notna(row['Missing Items - Accrued PnL to Add']):
-                p_and_l_account_id, _ = get_account_ids(row['Statement Category'], row['Statement PnL Items'])
-                if p_and_l_account_id is not None:
-                    amount = abs(round(row['Missing Items - Accrued PnL to Add'],2))
-                    posting_type = "Credit" if row['Missing Items - Accrued PnL to Add'] > 0 else "Debit"
-                    journal_lines.append({
-                        "Id": str(id),
-                        "Description": row['Statement PnL Items'] + " - paid and adjusted based on Statements",
-                        "Amount": amount,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    total_paid += round(row['Missing Items - Accrued PnL to Add'],2)
-                    id += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+        missing_pnl = amounts['Missing Items - Accrued PnL to Add']
+        to_book = (missing_pnl != 0) & missing_pnl.notna()
+        booked = pnl_data[to_book & has_pnl_account]
+        report_unmapped_items(pnl_data.loc[to_book & ~has_pnl_account, 'Statement PnL Items'])
+        missing_amount = missing_pnl[booked.index].round(2)
+        journal_lines += build_journal_lines(
+            booked['Statement PnL Items'] + " - paid and adjusted based on Statements",
+            missing_amount.abs(),
+            np.where(missing_amount > 0, "Credit", "Debit"),
+            booked['pnl_account_id']
+        )
+        total_paid += missing_amount.sum()
         
         # FBA Inbound Transportation Fee difference from Statmenet to Prepaid Expenses (Assets) account
         FBA_Inbound_to_Asset_amount = pnl_data.loc[pnl_data['Statement PnL Items'] == 'FBA Inbound Transportation Fee', 'FBA Inbound Transportation Fee Diff to Balance Sheet Asset'].values[0]
         if pd.notna(FBA_Inbound_to_Asset_amount) and FBA_Inbound_to_Asset_amount !=0:
             posting_type_BS = "Debit" if FBA_Inbound_to_Asset_amount > 0 else "Credit"
             amount = abs(round(FBA_Inbound_to_Asset_amount,2))
-            journal_lines.append({
-                "Id": str(id),
-                "Description": " FBA Inbound Transportation Fee - difference from Statements to 13300 - Prepaid FBA Inbound Transportation Fee",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type_BS,
-                    "AccountRef": {
-                        "value": str(accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee)
-                    }
-                }
-            })
+            journal_lines += build_journal_lines(
+                [" FBA Inbound Transportation Fee - difference from Statements to 13300 - Prepaid FBA Inbound Transportation Fee"],
+                [amount],
+                [posting_type_BS],
+                [accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee]
+            )
             total_paid += -round(FBA_Inbound_to_Asset_amount,2)
-            id += 1
 
         # Returns - non principal price
-        for idx, row in pnl_data.iterrows():
-            if row['Return Items - Accrued Adjusted PnL to Adjust'] != 0 and pd.notna(row['Return Items - Accrued Adjusted PnL to Adjust']):
-                p_and_l_account_id, _ = get_account_ids(row['Statement Category'], row['Statement PnL Items'])
-                if p_and_l_account_id is not None:
-                    amount = abs(round(row['Return Items - Accrued Adjusted PnL to Adjust'],2))
-                    posting_type = "Credit" if row['Return Items - Accrued Adjusted PnL to Adjust'] > 0 else "Debit"
-                    journal_lines.append({
-                        "Id": str(id),
-                        "Description": row['Statement PnL Items'] + " - Return Related",
-                        "Amount": amount,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    total_paid += round(row['Return Items - Accrued Adjusted PnL to Adjust'],2)
-                    id += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+        return_pnl = amounts['Return Items - Accrued Adjusted PnL to Adjust']
+        to_book = (return_pnl != 0) & return_pnl.notna()
+        booked = pnl_data[to_book & has_pnl_account]
+        report_unmapped_items(pnl_data.loc[to_book & ~has_pnl_account, 'Statement PnL Items'])
+        return_amount = return_pnl[booked.index].round(2)
+        journal_lines += build_journal_lines(
+            booked['Statement PnL Items'] + " - Return Related",
+            return_amount.abs(),
+            np.where(return_pnl[booked.index] > 0, "Credit", "Debit"),
+            booked['pnl_account_id']
+        )
+        total_paid += return_amount.sum()
         
         # Returns - principal price to Return Inventory Account
         if pd.notna(return_principal_to_inventory):
             posting_type_BS = "Debit"
             amount = -round(return_principal_to_inventory,2)
-            journal_lines.append({
-                "Id": str(id),
-                "Description": "Return Principal to 14500 - Return Inventory",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type,
-                    "AccountRef": {
-                        "value": str(accountID_14500_Return_Inventory)
-                    }
-                }
-            })
+            journal_lines += build_journal_lines(
+                ["Return Principal to 14500 - Return Inventory"],
+                [amount],
+                [posting_type_BS],
+                [accountID_14500_Return_Inventory]
+            )
             total_paid += round(return_principal_to_inventory,2)
-            id += 1
 
         # Book the In-Order Month Statement Deposit line
-        journal_lines.append({
-            "Id": str(id),
-            "Description": "In-Order Month Statement Bank Deposit",
-            "Amount": abs(total_paid),
-            "DetailType": "JournalEntryLineDetail",
-            "JournalEntryLineDetail": {
-                "PostingType": "Debit" if total_paid > 0 else "Credit",
-                "AccountRef": {
-                    "value": str(accountID_Bank_Deposit)
-                }
-            }
-        })
-        id += 1
+        total_paid = round(total_paid, 2)
+        journal_lines += build_journal_lines(
+            ["In-Order Month Statement Bank Deposit"],
+            [abs(total_paid)],
+            ["Debit" if total_paid > 0 else "Credit"],
+            [accountID_Bank_Deposit]
+        )
 
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Unpaid Order                                                                                                                                                                              |
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # Process Project PnL Unpaid
-        for idx, row in pnl_data.iterrows():
-            if row['Project PnL Unpaid'] != 0 and pd.notna(row['Project PnL Unpaid']):
-                p_and_l_account_id, bs_account_id = get_account_ids(row['Statement Category'], row['Statement PnL Items'])
-                if p_and_l_account_id is not None and bs_account_id is not None:
-                    amount = abs(row['Project PnL Unpaid'])
-
-                    # P&L Account booking
-                    posting_type = "Credit" if row['Project PnL Unpaid'] > 0 else "Debit"
-                    journal_lines.append({
-                        "Id": str(id),
-                        "Description": row['Statement PnL Items'] + " - unpaid estimate",
-                        "Amount": amount,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    id += 1
-
-                    # BS Account booking
-                    posting_type_BS = "Debit" if row['Project PnL Unpaid'] > 0 else "Credit"
-                    entity_type_BS = "Customer" if row['Project PnL Unpaid'] > 0 else "Vendor"
-                    entity_value_BS = "58" if row['Project PnL Unpaid'] > 0 else "59"
-                    AR_AP_type = " - AR" if row['Project PnL Unpaid'] > 0 else " - AP"
-                    journal_lines.append({
-                        "Id": str(id),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    id += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+        # Process Project PnL Unpaid: one P&L line followed by its AR/AP line per item
+        unpaid_pnl = amounts['Project PnL Unpaid']
+        to_book = (unpaid_pnl != 0) & unpaid_pnl.notna()
+        booked = pnl_data[to_book & has_both_accounts]
+        report_unmapped_items(pnl_data.loc[to_book & ~has_both_accounts, 'Statement PnL Items'])
+        unpaid_amount = unpaid_pnl[booked.index]
+        is_receivable = unpaid_amount > 0
+        pnl_lines = build_journal_lines(
+            booked['Statement PnL Items'] + " - unpaid estimate",
+            unpaid_amount.abs(),
+            np.where(is_receivable, "Credit", "Debit"),
+            booked['pnl_account_id']
+        )
+        AR_AP_lines = build_journal_lines(
+            booked['Statement PnL Items'] + np.where(is_receivable, " - AR", " - AP"),
+            unpaid_amount.abs(),
+            np.where(is_receivable, "Debit", "Credit"),
+            booked['bs_account_id'],
+            entity_types=np.where(is_receivable, "Customer", "Vendor"),
+            entity_values=np.where(is_receivable, "58", "59")
+        )
+        for pnl_line, AR_AP_line in zip(pnl_lines, AR_AP_lines):
+            journal_lines += [pnl_line, AR_AP_line]
+
+        journal_lines = number_journal_lines(journal_lines)
 
         # Create the journal entry
         data = {
@@ -284,7 +185,7 @@ def create_in_order_month_journal_entry(memory_processor):
         }
 
         # Make the POST request to create the journal entry
-        response = requests.post(endpoint, headers=headers, json=data)
+        response = client.create_journal_entry(data)
 
         if response.status_code == 200:
             return {"success": True, "message": "Journal entry created successfully.", "data": response.json()}
@@ -292,4 +193,4 @@ def create_in_order_month_journal_entry(memory_processor):
             return {"success": False, "error": f"Error: {response.status_code}", "details": response.text}
 
     # Call the function to create a journal entry
-    return create_journal_entry(access_token, realm_id)
+    return create_journal_entry()
@@ -9,13 +9,14 @@ current_directory = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_directory, os.pardir, os.pardir, os.pardir, os.pardir))
 sys.path.append(project_root)
 
-import requests
-from dotenv import dotenv_values
-from backend.processing.api.refresh_tokens import check_token_validity
+from backend.processing.api.quickbooks_client import get_quickbooks_client
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from backend import db
+from backend.processing.api.api_requests.qb_reference_fetcher import get_qb_reference_id, refresh_qb_reference_cache
+from backend.processing.api.qb_account_mapping import map_qb_account_ids, report_unmapped_items, build_journal_lines, number_journal_lines
 
 def create_out_of_order_month_journal_entry(memory_processor):
     """
@@ -39,455 +40,174 @@ def create_out_of_order_month_journal_entry(memory_processor):
     pnl_data['Statement PnL Items'] = pnl_data['Statement PnL Items'].apply(lambda x: 'CouponRedemptionFee' if str(x)[:19] == 'CouponRedemptionFee' else x)
     pnl_data['Statement PnL Items'] = pnl_data['Statement PnL Items'].apply(lambda x: 'FBA Inventory Reimbursement' if str(x)[:27] == 'FBA Inventory Reimbursement' else x)
 
-    # Load QB Account ID mapping from database
-    qb_mapping_query = """
-        SELECT statement_category, statement_pnl_items, pnl_account_name, pnl_account_id, bs_account_name, bs_account_id 
-        FROM qbaccountidmapping
-    """
-    QB_AccountID_Lookup_Table = pd.read_sql_query(qb_mapping_query, db.engine)
+    # Attach QB Account IDs and names from the cached QBAccountIDMapping table
+    pnl_data = map_qb_account_ids(pnl_data)
     
-    # Account IDs
-    accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee = 193
-    accountID_14500_Return_Inventory = 1150040062
-    accountID_21351_AP_Return_Sales_Principal_Reversal = 1150040036
+    # Account IDs - read from the synced qbreference table by account number, defaults used until it is synced
+    refresh_qb_reference_cache()
+    accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee = get_qb_reference_id('Account', default=193, acct_num='13300')
+    accountID_14500_Return_Inventory = get_qb_reference_id('Account', default=1150040062, acct_num='14500')
+    accountID_21351_AP_Return_Sales_Principal_Reversal = get_qb_reference_id('Account', default=1150040036, acct_num='21351')
     accountID_Bank_Deposit = 1150040063
 
     journal_date_str_month_end = PnL_month_str
     journal_date_str_close = process_statement_deposit_date
 
-    # Fetch tokens and expiration from .env
-    env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
-    config = dotenv_values(env_path)
-    access_token = config.get('ACCESS_TOKEN')
-    realm_id = config.get('REALM_ID')
-
-    # Lookup logic for Statement Category and PnL Items
-    def get_account_ids(statement_category, pnl_item):
-        account_row = QB_AccountID_Lookup_Table[
-            (QB_AccountID_Lookup_Table['statement_category'] == statement_category) & 
-            (QB_AccountID_Lookup_Table['statement_pnl_items'] == pnl_item)
-        ]
-        
-        if not account_row.empty:
-            p_and_l_account_id = account_row['pnl_account_id'].values[0]
-            bs_account_id = account_row['bs_account_id'].values[0]
-            return p_and_l_account_id, bs_account_id
-        else:
-            return None, None
-        
-    def get_account_name(statement_category, pnl_item):
-        account_row = QB_AccountID_Lookup_Table[
-            (QB_AccountID_Lookup_Table['statement_category'] == statement_category) & 
-            (QB_AccountID_Lookup_Table['statement_pnl_items'] == pnl_item)
-        ]
-        
-        if not account_row.empty:
-            bs_account_name = account_row['bs_account_name'].values[0]
-            return bs_account_name
-        else:
-            return None
-
-    def create_journal_entry(access_token, realm_id):
-        # Check if access token is valid
-        access_token = check_token_validity()
-
-        base_url = 'https://sandbox-quickbooks.api.intuit.com'
-        endpoint = f"{base_url}/v3/company/{realm_id}/journalentry"
+    def create_journal_entry():
+        # Shared client handles the access token, connection reuse and retries
+        client = get_quickbooks_client()
 
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-
-        # Initialize journal lines
+        # Initialize journal lines - collected as (P&L row position, step within row, line) and ordered by row at the end
         journal_lines_close = []
-        id_close = 1
-
         journal_lines_new_adj = []
-        id_new_adj = 1
+
+        has_pnl_account = pnl_data['pnl_account_id'].notna()
+        has_bs_account = pnl_data['bs_account_id'].notna()
+        is_AR_account = pnl_data['bs_account_name'].fillna('').astype(str).str.contains(' AR ', regex=False)
+
+        def item_lines(value_column, has_account, account_column, description_suffix, credit_when_positive, entity=None):
+            """Journal lines for every P&L row with a non-zero value_column, plus the rounded amounts booked"""
+            values = pnl_data[value_column].astype(float).fillna(0)
+            to_book = values != 0
+            report_unmapped_items(pnl_data.loc[to_book & ~has_account, 'Statement PnL Items'])
+
+            booked = to_book & has_account
+            positions = np.flatnonzero(booked.to_numpy())
+            booked_values = values[booked]
+            is_positive = (booked_values > 0).to_numpy()
+
+            if isinstance(description_suffix, tuple):
+                description_suffix = np.where(is_positive, description_suffix[0], description_suffix[1])
+            posting_types = np.where(is_positive == credit_when_positive, "Credit", "Debit")
+
+            entity_types, entity_values = None, None
+            if entity == 'sign':
+                entity_types = np.where(is_positive, "Customer", "Vendor")
+                entity_values = np.where(is_positive, "58", "59")
+            elif entity == 'account_name':
+                entity_types = np.where(is_AR_account[booked], "Customer", "Vendor")
+                entity_values = np.where(is_AR_account[booked], "58", "59")
+
+            lines = build_journal_lines(
+                pnl_data.loc[booked, 'Statement PnL Items'] + description_suffix,
+                booked_values.round(2).abs(),
+                posting_types,
+                pnl_data.loc[booked, account_column],
+                entity_types=entity_types,
+                entity_values=entity_values
+            )
+            return positions, lines, booked_values.round(2)
+
+        def add_lines(journal_lines, step, positions, lines):
+            journal_lines.extend((position, step, line) for position, line in zip(positions, lines))
 
         # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         # Paid Order after Order Month                                                                                                                                                                                |
         # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         total_paid = 0
 
-        for idx, row in pnl_data.iterrows():
-            p_and_l_account_id, bs_account_id = get_account_ids(row['Statement Category'], row['Statement PnL Items'])
-            bs_account_name = get_account_name(row['Statement Category'], row['Statement PnL Items'])
-            # close past AR AP
-            if (row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] if pd.notna(row['Project PnL Paid after Order Month End: Past Unpaid Estimate']) else 0)  != 0:
-                if bs_account_id is not None:
-                    project_pnl =  row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] if pd.notna(row['Project PnL Paid after Order Month End: Past Unpaid Estimate']) else 0
-                    amount_to_close_AR_AP = abs(round(project_pnl,2))
-                    posting_type_BS = "Credit" if row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] > 0 else "Debit"
-                    entity_type_BS = "Customer" if row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] > 0 else "Vendor"
-                    entity_value_BS = "58" if row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] > 0 else "59"
-                    AR_AP_type = " - close past AR" if row['Project PnL Paid after Order Month End: Past Unpaid Estimate'] > 0 else " - close past AP"
-                    journal_lines_close.append({
-                        "Id": str(id_close),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_close_AR_AP,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    total_paid += round(project_pnl,2)
-                    id_close += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-            
-            # add adj AR/AP and P&L at month-end date, then close the adj AR/AP at statement deposit date
-            if (row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0) != 0:
-                # add adj AR/AP
-                if bs_account_id is not None:
-                    adjusted_pnl = row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_adjust_pnl = abs(round(adjusted_pnl,2))
-                    posting_type_BS = "Debit" if row['Adjustment Items - Accrued Adjusted PnL to Adjust'] > 0 else "Credit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - adjust AR/AP based on out-of-month statement"
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_adjust_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # add adj P&L
-                if p_and_l_account_id is not None:
-                    adjusted_pnl = row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_adjust_pnl = abs(round(adjusted_pnl,2))
-                    posting_type = "Credit" if row['Adjustment Items - Accrued Adjusted PnL to Adjust'] > 0 else "Debit"
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + " - adjustment based on out-of-month statement",
-                        "Amount": amount_to_adjust_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # close the adj AR/AP at statement deposit date
-                if bs_account_id is not None:
-                    adjusted_pnl = row['Adjustment Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Adjustment Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_adjust_pnl = abs(round(adjusted_pnl,2))
-                    posting_type_BS = "Credit" if row['Adjustment Items - Accrued Adjusted PnL to Adjust'] > 0 else "Debit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - close AR/AP adjustment"
-                    journal_lines_close.append({
-                        "Id": str(id_close),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_adjust_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    total_paid += round(adjusted_pnl,2)
-                    id_close += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-
-            # add missing items
-            if (row['Missing Items - Accrued PnL to Add'] if pd.notna(row['Missing Items - Accrued PnL to Add']) else 0) != 0:
-                # add missing items AR/AP
-                if bs_account_id is not None:
-                    missing_pnl = row['Missing Items - Accrued PnL to Add'] if pd.notna(row['Missing Items - Accrued PnL to Add']) else 0
-                    amount_to_add_for_missing_pnl = abs(round(missing_pnl,2))
-                    posting_type_BS = "Debit" if row['Missing Items - Accrued PnL to Add'] > 0 else "Credit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - add missing items based on out-of-month statement"
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_add_for_missing_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # add missing items P&L
-                if p_and_l_account_id is not None:
-                    missing_pnl = row['Missing Items - Accrued PnL to Add'] if pd.notna(row['Missing Items - Accrued PnL to Add']) else 0
-                    amount_to_add_for_missing_pnl = abs(round(missing_pnl,2))
-                    posting_type = "Credit" if row['Missing Items - Accrued PnL to Add'] > 0 else "Debit"
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + " - add missing items based on out-of-month statement",
-                        "Amount": amount_to_add_for_missing_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # close the missing items AR/AP at statement deposit date
-                if bs_account_id is not None:
-                    missing_pnl = row['Missing Items - Accrued PnL to Add'] if pd.notna(row['Missing Items - Accrued PnL to Add']) else 0
-                    amount_to_add_for_missing_pnl = abs(round(missing_pnl,2))
-                    posting_type_BS = "Credit" if row['Missing Items - Accrued PnL to Add'] > 0 else "Debit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - close missing items AR/AP" 
-                    journal_lines_close.append({
-                        "Id": str(id_close),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_add_for_missing_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    total_paid += round(missing_pnl,2)
-                    id_close += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-            
-            # Returns - non principal price
-            if (row['Return Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Return Items - Accrued Adjusted PnL to Adjust']) else 0) != 0:
-                # add non principal price return AR/AP
-                if bs_account_id is not None:
-                    return_non_principal_price = row['Return Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Return Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_add_for_non_principal_return_pnl = abs(round(return_non_principal_price,2))
-                    posting_type_BS = "Debit" if row['Return Items - Accrued Adjusted PnL to Adjust'] > 0 else "Credit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - add AR/AP for non principal price return" 
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_add_for_non_principal_return_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # add non principal price return P&L
-                if p_and_l_account_id is not None:
-                    return_non_principal_price = row['Return Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Return Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_add_for_non_principal_return_pnl = abs(round(return_non_principal_price,2))
-                    posting_type = "Credit" if row['Return Items - Accrued Adjusted PnL to Adjust'] > 0 else "Debit"
-                    journal_lines_new_adj.append({
-                        "Id": str(id_new_adj),
-                        "Description": row['Statement PnL Items'] + " - add non principal price return",
-                        "Amount": amount_to_add_for_non_principal_return_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type,
-                            "AccountRef": {
-                                "value": str(int(p_and_l_account_id))
-                            }
-                        }
-                    })
-                    id_new_adj += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
-                # close the non principal price return AR/AP at statement deposit date
-                if bs_account_id is not None:
-                    return_non_principal_price = row['Return Items - Accrued Adjusted PnL to Adjust'] if pd.notna(row['Return Items - Accrued Adjusted PnL to Adjust']) else 0
-                    amount_to_add_for_non_principal_return_pnl = abs(round(return_non_principal_price,2))
-                    posting_type_BS = "Credit" if row['Return Items - Accrued Adjusted PnL to Adjust'] > 0 else "Debit"
-                    entity_type_BS = "Customer" if " AR " in bs_account_name else "Vendor"
-                    entity_value_BS = "58" if " AR " in bs_account_name else "59"
-                    AR_AP_type =  " - close AR/AP for non principal price return" 
-                    journal_lines_close.append({
-                        "Id": str(id_close),
-                        "Description": row['Statement PnL Items'] + AR_AP_type,
-                        "Amount": amount_to_add_for_non_principal_return_pnl,
-                        "DetailType": "JournalEntryLineDetail",
-                        "JournalEntryLineDetail": {
-                            "PostingType": posting_type_BS,
-                            "AccountRef": {
-                                "value": str(int(bs_account_id))
-                            },
-                            "Entity": {
-                                "Type": entity_type_BS, 
-                                "EntityRef": {
-                                    "value": entity_value_BS
-                                }
-                            }
-                        }
-                    })
-                    total_paid += round(return_non_principal_price,2)
-                    id_close += 1
-                else:
-                    print(f"{row['Statement PnL Items']} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+        # close past AR AP
+        positions, lines, booked_values = item_lines(
+            'Project PnL Paid after Order Month End: Past Unpaid Estimate', has_bs_account, 'bs_account_id',
+            (" - close past AR", " - close past AP"), credit_when_positive=True, entity='sign'
+        )
+        add_lines(journal_lines_close, 1, positions, lines)
+        total_paid += booked_values.sum()
+
+        # add adj AR/AP and P&L at month-end date, then close the adj AR/AP at statement deposit date
+        # add missing items AR/AP and P&L, then close the missing items AR/AP at statement deposit date
+        # Returns - non principal price AR/AP and P&L, then close the non principal price return AR/AP at statement deposit date
+        item_steps = [
+            (
+                'Adjustment Items - Accrued Adjusted PnL to Adjust',
+                " - adjust AR/AP based on out-of-month statement",
+                " - adjustment based on out-of-month statement",
+                " - close AR/AP adjustment"
+            ),
+            (
+                'Missing Items - Accrued PnL to Add',
+                " - add missing items based on out-of-month statement",
+                " - add missing items based on out-of-month statement",
+                " - close missing items AR/AP"
+            ),
+            (
+                'Return Items - Accrued Adjusted PnL to Adjust',
+                " - add AR/AP for non principal price return",
+                " - add non principal price return",
+                " - close AR/AP for non principal price return"
+            ),
+        ]
+        for step, (value_column, AR_AP_suffix, pnl_suffix, close_suffix) in enumerate(item_steps):
+            positions, lines, _ = item_lines(
+                value_column, has_bs_account, 'bs_account_id', AR_AP_suffix, credit_when_positive=False, entity='account_name'
+            )
+            add_lines(journal_lines_new_adj, 2 * step, positions, lines)
+            positions, lines, _ = item_lines(
+                value_column, has_pnl_account, 'pnl_account_id', pnl_suffix, credit_when_positive=True
+            )
+            add_lines(journal_lines_new_adj, 2 * step + 1, positions, lines)
+            positions, lines, booked_values = item_lines(
+                value_column, has_bs_account, 'bs_account_id', close_suffix, credit_when_positive=True, entity='account_name'
+            )
+            add_lines(journal_lines_close, step + 2, positions, lines)
+            total_paid += booked_values.sum()
+
+        journal_lines_close = [line for _, _, line in sorted(journal_lines_close, key=lambda x: (x[0], x[1]))]
+        journal_lines_new_adj = [line for _, _, line in sorted(journal_lines_new_adj, key=lambda x: (x[0], x[1]))]
         
         # FBA Inbound Transportation Fee difference from Statmenet to Prepaid Expenses (Assets) account
         FBA_Inbound_to_Asset_amount = pnl_data.loc[pnl_data['Statement PnL Items'] == 'FBA Inbound Transportation Fee', 'FBA Inbound Transportation Fee Diff to Balance Sheet Asset'].values[0]
         if pd.notna(FBA_Inbound_to_Asset_amount) and FBA_Inbound_to_Asset_amount !=0:
             posting_type_BS = "Debit" if FBA_Inbound_to_Asset_amount > 0 else "Credit"
             amount = abs(round(FBA_Inbound_to_Asset_amount,2))
-            journal_lines_close.append({
-                "Id": str(id_close),
-                "Description": " FBA Inbound Transportation Fee - difference from Statements to 13300 - Prepaid FBA Inbound Transportation Fee",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type_BS,
-                    "AccountRef": {
-                        "value": str(accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee)
-                    }
-                }
-            })
+            journal_lines_close += build_journal_lines(
+                [" FBA Inbound Transportation Fee - difference from Statements to 13300 - Prepaid FBA Inbound Transportation Fee"],
+                [amount],
+                [posting_type_BS],
+                [accountID_13300_Prepaid_FBA_Inbound_Transportation_Fee]
+            )
             total_paid += -round(FBA_Inbound_to_Asset_amount,2)
-            id_close += 1     
         
         # Returns - principal price to Return Inventory Account
         if pd.notna(return_principal_to_inventory) and return_principal_to_inventory !=0:
-            # add inventory adj
-            posting_type_BS = "Debit"
             amount = -round(return_principal_to_inventory,2)
-            journal_lines_new_adj.append({
-                "Id": str(id_new_adj),
-                "Description": "Return Principal to 14500 - Return Inventory",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type_BS,
-                    "AccountRef": {
-                        "value": str(accountID_14500_Return_Inventory)
-                    }
-                }
-            })
-            id_new_adj += 1
-            # add inventory adj AP
-            posting_type_BS = "Credit"
-            journal_lines_new_adj.append({
-                "Id": str(id_new_adj),
-                "Description": "Return Principal AP",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type_BS,
-                    "AccountRef": {
-                        "value": str(accountID_21351_AP_Return_Sales_Principal_Reversal)
-                    },
-                    "Entity": {
-                        "Type": "Vendor", 
-                        "EntityRef": {
-                            "value": "59"
-                        }
-                    }
-                }
-            })
-            id_new_adj += 1
+            # add inventory adj, then the inventory adj AP
+            journal_lines_new_adj += build_journal_lines(
+                ["Return Principal to 14500 - Return Inventory"],
+                [amount],
+                ["Debit"],
+                [accountID_14500_Return_Inventory]
+            )
+            journal_lines_new_adj += build_journal_lines(
+                ["Return Principal AP"],
+                [amount],
+                ["Credit"],
+                [accountID_21351_AP_Return_Sales_Principal_Reversal],
+                entity_types="Vendor",
+                entity_values="59"
+            )
             # close inventory adj AP at statement deposit date
-            posting_type_BS = "Debit"
-            journal_lines_close.append({
-                "Id": str(id_close),
-                "Description": "Close Return Principal AP",
-                "Amount": amount,
-                "DetailType": "JournalEntryLineDetail",
-                "JournalEntryLineDetail": {
-                    "PostingType": posting_type_BS,
-                    "AccountRef": {
-                        "value": str(accountID_21351_AP_Return_Sales_Principal_Reversal)
-                    },
-                    "Entity": {
-                        "Type": "Vendor", 
-                        "EntityRef": {
-                            "value": "59"
-                        }
-                    }
-                }
-            })
+            journal_lines_close += build_journal_lines(
+                ["Close Return Principal AP"],
+                [amount],
+                ["Debit"],
+                [accountID_21351_AP_Return_Sales_Principal_Reversal],
+                entity_types="Vendor",
+                entity_values="59"
+            )
             total_paid += round(return_principal_to_inventory,2)
-            id_close += 1   
 
         # Book the Out-of-Order Month Statement Deposit line
-        journal_lines_close.append({
-            "Id": str(id_close),
-            "Description": "Out-of-Order Month Statement Bank Deposit",
-            "Amount": abs(total_paid),
-            "DetailType": "JournalEntryLineDetail",
-            "JournalEntryLineDetail": {
-                "PostingType": "Debit" if total_paid > 0 else "Credit",
-                "AccountRef": {
-                    "value": str(accountID_Bank_Deposit)
-                }
-            }
-        })
+        total_paid = round(total_paid, 2)
+        journal_lines_close += build_journal_lines(
+            ["Out-of-Order Month Statement Bank Deposit"],
+            [abs(total_paid)],
+            ["Debit" if total_paid > 0 else "Credit"],
+            [accountID_Bank_Deposit]
+        )
+
+        journal_lines_close = number_journal_lines(journal_lines_close)
+        journal_lines_new_adj = number_journal_lines(journal_lines_new_adj)
 
         # Create the journal entry
         data_month_end_adj = {
@@ -502,8 +222,8 @@ def create_out_of_order_month_journal_entry(memory_processor):
         }
 
         # Make the POST request to create the journal entry
-        response1 = requests.post(endpoint, headers=headers, json=data_month_end_adj)
-        response2 = requests.post(endpoint, headers=headers, json=data_after_month_end_close)
+        response1 = client.create_journal_entry(data_month_end_adj)
+        response2 = client.create_journal_entry(data_after_month_end_close)
 
         results = []
         if response1.status_code == 200:
@@ -526,4 +246,4 @@ def create_out_of_order_month_journal_entry(memory_processor):
         }
 
     # Call the function to create journal entries
-    return create_journal_entry(access_token, realm_id)
+    return create_journal_entry()
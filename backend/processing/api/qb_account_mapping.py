@@ -0,0 +1,141 @@
+"""
+QuickBooks account ID mapping shared by the journal entry builders
+Loads qbaccountidmapping once per process into a dict keyed by (statement_category, statement_pnl_items); the
+/qb-account-mapping/* routes invalidate it, and other processes reload it when qbaccountmappingversion changes
+"""
+
+import threading
+import pandas as pd
+from sqlalchemy import text
+from backend import db
+
+_mapping_lock = threading.Lock()
+_mapping_cache = None
+_mapping_version = None
+
+_mapping_columns = ['pnl_account_name', 'pnl_account_id', 'bs_account_name', 'bs_account_id']
+
+
+def _load_mapping_version():
+    # Bumped by a trigger on every write (database/QBaccountMapping.sql), so writes handled by another worker or made
+    # by hand are seen too. Without the table or its row only the explicit invalidation applies
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(text("SELECT version FROM qbaccountmappingversion WHERE id = 1")).scalar()
+    except Exception:
+        return None
+
+
+def get_qb_account_mapping():
+    """
+    Return the cached QB account mapping, reloading it after an invalidation or a qbaccountmappingversion change
+
+    Returns:
+        dict: (statement_category, statement_pnl_items) -> {pnl_account_name, pnl_account_id, bs_account_name, bs_account_id}
+    """
+    global _mapping_cache, _mapping_version
+
+    version = _load_mapping_version()
+    with _mapping_lock:
+        if _mapping_cache is None or version != _mapping_version:
+            rows = db.session.execute(text("""
+                SELECT statement_category, statement_pnl_items, pnl_account_name, pnl_account_id, bs_account_name, bs_account_id
+                FROM qbaccountidmapping
+                ORDER BY id
+            """)).mappings().all()
+
+            mapping = {}
+            for row in rows:
+                # first record wins for duplicated keys, same as the previous DataFrame lookup
+                mapping.setdefault(
+                    (row['statement_category'], row['statement_pnl_items']),
+                    {column: row[column] for column in _mapping_columns}
+                )
+            _mapping_cache = mapping
+            _mapping_version = version
+        return _mapping_cache
+
+
+def invalidate_qb_account_mapping():
+    """Drop the cached mapping, called after every /qb-account-mapping/* write"""
+    global _mapping_cache, _mapping_version
+    with _mapping_lock:
+        _mapping_cache = None
+        _mapping_version = None
+
+
+def map_qb_account_ids(pnl_data):
+    """
+    Attach QB account IDs and names to every P&L row with a single indexed lookup
+
+    Args:
+        pnl_data: DataFrame with 'Statement Category' and 'Statement PnL Items' columns
+
+    Returns:
+        DataFrame: pnl_data with pnl_account_name, pnl_account_id, bs_account_name and bs_account_id columns
+    """
+    mapping = get_qb_account_mapping()
+    mapping_table = pd.DataFrame.from_dict(mapping, orient='index', columns=_mapping_columns)
+    if mapping_table.empty:
+        mapping_table.index = pd.MultiIndex.from_tuples([], names=['statement_category', 'statement_pnl_items'])
+
+    keys = pd.MultiIndex.from_arrays([pnl_data['Statement Category'], pnl_data['Statement PnL Items']])
+    accounts = mapping_table.reindex(keys)
+    accounts.index = pnl_data.index
+
+    pnl_data = pnl_data.drop(columns=_mapping_columns, errors='ignore')
+    return pd.concat([pnl_data, accounts], axis=1)
+
+
+def report_unmapped_items(pnl_items):
+    """Print the P&L items that cannot be booked because no QB account is mapped"""
+    for pnl_item in pnl_items:
+        print(f"{pnl_item} cannot be categorized to QB account. Check QBAccountIDMapping table in database")
+
+
+def build_journal_lines(descriptions, amounts, posting_types, account_ids, entity_types=None, entity_values=None):
+    """
+    Build QuickBooks journal lines column-wise, without Ids (see number_journal_lines)
+
+    Args:
+        descriptions, amounts, posting_types, account_ids: equally long Series/lists, one entry per line
+        entity_types, entity_values: optional Customer/Vendor entity per line for AR/AP accounts
+
+    Returns:
+        list: journal line dicts
+    """
+    descriptions = list(descriptions)
+    amounts = [float(amount) for amount in amounts]
+    posting_types = list(posting_types)
+    account_values = [str(int(account_id)) for account_id in account_ids]
+    if entity_types is not None:
+        entity_types = [entity_types] * len(descriptions) if isinstance(entity_types, str) else list(entity_types)
+        entity_values = [entity_values] * len(descriptions) if isinstance(entity_values, str) else list(entity_values)
+
+    lines = []
+    for i in range(len(descriptions)):
+        line_detail = {
+            "PostingType": posting_types[i],
+            "AccountRef": {
+                "value": account_values[i]
+            }
+        }
+        if entity_types is not None:
+            line_detail["Entity"] = {
+                "Type": entity_types[i],
+                "EntityRef": {
+                    "value": entity_values[i]
+                }
+            }
+        lines.append({
+            "Description": descriptions[i],
+            "Amount": amounts[i],
+            "DetailType": "JournalEntryLineDetail",
+            "JournalEntryLineDetail": line_detail
+        })
+    return lines
+
+
+def number_journal_lines(lines, start=1):
+    """Assign sequential QuickBooks line Ids in booking order"""
+    return [{"Id": str(line_id), **line} for line_id, line in enumerate(lines, start)]
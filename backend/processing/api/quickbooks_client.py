@@ -0,0 +1,195 @@
+"""
+Shared QuickBooks Online API client
+One keep-alive Session per process with pooled connections, cached access token, bounded retries and request timing metrics
+"""
+
+import os
+import time
+import uuid
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+QUICKBOOKS_BASE_URL = os.getenv('QUICKBOOKS_BASE_URL', 'https://sandbox-quickbooks.api.intuit.com')
+QUICKBOOKS_MINOR_VERSION = os.getenv('QUICKBOOKS_MINOR_VERSION')
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry at which the access token is refreshed proactively
+
+
+class QuickBooksAPIError(Exception):
+    """Raised when a QuickBooks request cannot be completed after all retries"""
+    def __init__(self, message, status_code=None, response_text=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+
+
+def refresh_tokens_source(force_refresh=False):
+    """Default token source backed by the shared refresh_tokens.token_manager"""
+    from backend.processing.api.refresh_tokens import token_manager
+
+    return token_manager.get_token(force_refresh=force_refresh, margin=TOKEN_REFRESH_MARGIN)
+
+
+class QuickBooksClient:
+    """
+    Thread-safe QuickBooks client shared by the journal entry builders and the api_request_* fetchers
+
+    Args:
+        base_url: QuickBooks API host, overridable (QUICKBOOKS_BASE_URL) to point at a local stub server
+        token_source: callable(force_refresh) -> (access_token, token_expiration, realm_id)
+        max_retries: retries on 429/5xx responses and connection errors
+        backoff_factor: base seconds for exponential backoff (backoff_factor * 2 ** attempt)
+        timeout: per-request timeout in seconds
+        pool_maxsize: keep-alive connections kept per host, sized for gunicorn gthread workers
+    """
+
+    def __init__(self, base_url=None, token_source=None, max_retries=3, backoff_factor=0.5, timeout=30, pool_maxsize=8):
+        self.base_url = (base_url or QUICKBOOKS_BASE_URL).rstrip('/')
+        self.token_source = token_source or refresh_tokens_source
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        })
+
+        self._token_lock = threading.Lock()
+        self._access_token = None
+        self._token_expiration = 0
+        self._realm_id = None
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {}
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Token handling
+    # ---------------------------------------------------------------------------------------------------------------
+    def _get_access_token(self, force_refresh=False):
+        with self._token_lock:
+            if force_refresh or self._access_token is None or time.time() > self._token_expiration - TOKEN_REFRESH_MARGIN:
+                self._access_token, self._token_expiration, self._realm_id = self.token_source(force_refresh)
+            return self._access_token
+
+    @property
+    def realm_id(self):
+        if self._realm_id is None:
+            self._get_access_token()
+        return self._realm_id
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Metrics
+    # ---------------------------------------------------------------------------------------------------------------
+    def _record(self, key, seconds, retries, failed):
+        with self._metrics_lock:
+            entry = self._metrics.setdefault(key, {'count': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            entry['count'] += 1
+            entry['retries'] += retries
+            entry['errors'] += int(failed)
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def metrics(self):
+        """Per-endpoint request counts, retries, errors and timings since process start"""
+        with self._metrics_lock:
+            return {
+                key: {**entry, 'avg_seconds': entry['total_seconds'] / entry['count'] if entry['count'] else 0.0}
+                for key, entry in self._metrics.items()
+            }
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Requests
+    # ---------------------------------------------------------------------------------------------------------------
+    def request(self, method, path, params=None, headers=None, **kwargs):
+        """
+        Send a request to /v3/company/{realm_id}/{path}, retrying 429/5xx with exponential backoff
+
+        POST requests carry a QuickBooks requestid so a retried create is not booked twice.
+
+        Returns:
+            requests.Response: the last response received (callers check status_code as before)
+        """
+        method = method.upper()
+        params = dict(params or {})
+        if method == 'POST':
+            params.setdefault('requestid', uuid.uuid4().hex)
+        if QUICKBOOKS_MINOR_VERSION:
+            params.setdefault('minorversion', QUICKBOOKS_MINOR_VERSION)
+
+        metrics_key = f"{method} {path.split('/')[0]}"
+        started = time.perf_counter()
+        retries = 0
+        refreshed = False
+        response = None
+
+        while True:
+            request_headers = {'Authorization': f'Bearer {self._get_access_token()}'}
+            request_headers.update(headers or {})
+            url = f"{self.base_url}/v3/company/{self.realm_id}/{path}"
+
+            try:
+                response = self.session.request(method, url, params=params, headers=request_headers, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if retries >= self.max_retries:
+                    self._record(metrics_key, time.perf_counter() - started, retries, failed=True)
+                    raise QuickBooksAPIError(f"QuickBooks request failed after {retries} retries: {e}") from e
+                self._sleep_before_retry(retries)
+                retries += 1
+                continue
+
+            # access token revoked or expired early: refresh once and resend
+            if response.status_code == 401 and not refreshed:
+                self._get_access_token(force_refresh=True)
+                refreshed = True
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and retries < self.max_retries:
+                self._sleep_before_retry(retries, response.headers.get('Retry-After'))
+                retries += 1
+                continue
+
+            break
+
+        self._record(metrics_key, time.perf_counter() - started, retries, failed=response.status_code >= 400)
+        return response
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        try:
+            delay = float(retry_after) if retry_after is not None else self.backoff_factor * (2 ** attempt)
+        except ValueError:
+            delay = self.backoff_factor * (2 ** attempt)
+        time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def query(self, statement):
+        """Run a QuickBooks query statement, e.g. SELECT * FROM Account STARTPOSITION 1 MAXRESULTS 100"""
+        return self.get('query', params={'query': statement})
+
+    def create_journal_entry(self, data, headers=None):
+        return self.post('journalentry', json=data, headers=headers)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_quickbooks_client():
+    """Process-wide QuickBooksClient, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = QuickBooksClient()
+    return _client
@@ -4,111 +4,176 @@ current_directory = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_directory, os.pardir, os.pardir, os.pardir))
 sys.path.append(project_root)
 
+import json
 import time
+import tempfile
+import threading
 import requests
-from dotenv import load_dotenv, set_key, dotenv_values
+from dotenv import dotenv_values
 
+try:
+    import fcntl  # cross-process refresh lock for gunicorn workers; not available on Windows dev machines
+except ImportError:
+    fcntl = None
 
-env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
-config = dotenv_values(env_path)
-
-# Fetch tokens and expiration from .env
-access_token = config.get('ACCESS_TOKEN')
-refresh_token = config.get('REFRESH_TOKEN')
-realm_id = config.get('REALM_ID')
-token_expiration = float(config.get('TOKEN_EXPIRATION'))
 
-client_id = config.get('CLIENT_ID')  
-client_secret = config.get('CLIENT_SECRET')
+env_path = os.path.join(project_root, 'backend', 'processing', 'api', '.env')
+state_path = os.getenv('QB_TOKEN_STATE_PATH', os.path.join(project_root, 'backend', 'processing', 'api', '.qb_token_state.json'))
 
 # URL for refreshing the token
 token_url = 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer'
 
-# Function to manually update the .env file without adding quotes
-def update_env_file(env_path, key, value):
-    """Update the .env file with the given key-value pair without adding single quotes."""
-    # Read the existing content of the .env file
-    with open(env_path, 'r') as file:
-        lines = file.readlines()
-
-    # Update the key with the new value (strip any single quotes around the value)
-    updated_lines = []
-    for line in lines:
-        if line.startswith(f'{key}='):
-            updated_lines.append(f'{key}={value}\n')
-        else:
-            updated_lines.append(line)
-
-    # Write the updated content back to the .env file
-    with open(env_path, 'w') as file:
-        file.writelines(updated_lines)
+
+class TokenManager:
+    """
+    In-process holder of the QuickBooks OAuth tokens shared by all QuickBooks modules
+
+    Tokens live in memory behind a lock. The .env file is only read once to bootstrap client credentials and the
+    first tokens; every refresh is persisted atomically, once, to a small JSON state store (state_path) so other
+    gunicorn workers and the COGS booking subprocess pick up the rotated refresh token.
+    """
+
+    def __init__(self, env_path, state_path):
+        self.env_path = env_path
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._state_mtime = None
+
+        self.access_token = None
+        self.refresh_token = None
+        self.realm_id = None
+        self.token_expiration = 0.0
+        self.client_id = None
+        self.client_secret = None
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # State store
+    # ---------------------------------------------------------------------------------------------------------------
+    def _load(self):
+        config = dotenv_values(self.env_path) if os.path.exists(self.env_path) else {}
+        self.client_id = os.getenv('CLIENT_ID') or config.get('CLIENT_ID')
+        self.client_secret = os.getenv('CLIENT_SECRET') or config.get('CLIENT_SECRET')
+
+        if not self._load_state_store():
+            self.access_token = config.get('ACCESS_TOKEN')
+            self.refresh_token = config.get('REFRESH_TOKEN')
+            self.realm_id = config.get('REALM_ID')
+            self.token_expiration = float(config.get('TOKEN_EXPIRATION') or 0)
+        self._loaded = True
+
+    def _load_state_store(self):
+        """Load tokens from the state store if another process wrote a newer one; returns True when loaded"""
+        try:
+            mtime = os.path.getmtime(self.state_path)
+        except OSError:
+            return False
+        if self._state_mtime is not None and mtime <= self._state_mtime:
+            return False
+
+        with open(self.state_path, 'r') as file:
+            state = json.load(file)
+        self.access_token = state.get('access_token')
+        self.refresh_token = state.get('refresh_token')
+        self.realm_id = state.get('realm_id', self.realm_id)
+        self.token_expiration = float(state.get('token_expiration') or 0)
+        self._state_mtime = mtime
+        return True
+
+    def _persist(self):
+        """Write the token state to a temp file and atomically rename it over the state store"""
+        state = {
+            'access_token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'realm_id': self.realm_id,
+            'token_expiration': self.token_expiration
+        }
+        state_dir = os.path.dirname(self.state_path) or '.'
+        fd, temp_path = tempfile.mkstemp(dir=state_dir, prefix='.qb_token_state_')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.state_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._state_mtime = os.path.getmtime(self.state_path)
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Tokens
+    # ---------------------------------------------------------------------------------------------------------------
+    def get_token(self, force_refresh=False, margin=0):
+        """
+        Return (access_token, token_expiration, realm_id), refreshing when the token expires within margin seconds
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if force_refresh or time.time() > self.token_expiration - margin:
+                self._refresh_locked(force_refresh)
+            return self.access_token, self.token_expiration, self.realm_id
+
+    def refresh(self):
+        """Refresh the access token using the refresh token"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._refresh_locked(force_refresh=True)
+
+    def _refresh_locked(self, force_refresh):
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(self.state_path + '.lock', 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # another worker may have refreshed while we waited for the lock
+            if self._load_state_store() and not force_refresh and time.time() < self.token_expiration:
+                return
+
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            }
+            payload = {
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+            }
+
+            try:
+                response = requests.post(token_url, headers=headers, data=payload, timeout=10)
+                response.raise_for_status()
+
+                tokens = response.json()
+                self.access_token = tokens['access_token']
+                self.refresh_token = tokens['refresh_token']
+                self.realm_id = tokens.get('realmId', self.realm_id)
+                self.token_expiration = time.time() + tokens['expires_in']
+
+                self._persist()
+                print("Token and Realm ID refreshed successfully!")
+
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to refresh token: {e}")
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+
+token_manager = TokenManager(env_path, state_path)
+
 
 def refresh_access_token():
     """Refresh the access token using the refresh token."""
-    global access_token, refresh_token, realm_id, token_expiration
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    payload = {
-        'grant_type': 'refresh_token',
-        'refresh_token': refresh_token,
-        'client_id': client_id,
-        'client_secret': client_secret,
-    }
-
-    try:
-        response = requests.post(token_url, headers=headers, data=payload, timeout=10)
-        response.raise_for_status()
-
-        tokens = response.json()
-        access_token = tokens['access_token']
-        refresh_token = tokens['refresh_token']
-        realm_id = tokens.get('realmId', realm_id)  
-        token_expiration = time.time() + tokens['expires_in']
-
-        # Manually update the tokens in the .env file without single quotes
-        update_env_file(env_path, 'ACCESS_TOKEN', access_token)
-        update_env_file(env_path, 'REFRESH_TOKEN', refresh_token)
-        update_env_file(env_path, 'REALM_ID', realm_id)
-        update_env_file(env_path, 'TOKEN_EXPIRATION', str(token_expiration))
-        print("Token and Realm ID refreshed successfully!")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to refresh token: {e}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+    token_manager.refresh()
 
 
 def check_token_validity():
     """Check if the access token is still valid. Refresh if expired."""
-    if time.time() > token_expiration:
-        print("Access token expired. Refreshing...")
-        refresh_access_token()
-    else:
-        print("Access token is still valid.")
-    
+    access_token, _, _ = token_manager.get_token()
     return access_token
-
-# def make_api_call():
-#     """Make a request to the API using the access token."""
-#     check_token_validity()  # Ensure we have a valid token before making a request
-
-#     base_url = 'https://sandbox-quickbooks.api.intuit.com'
-#     url = f'{base_url}/v3/company/{realm_id}/companyinfo/{realm_id}'
-#     headers = {
-#         'Authorization': f'Bearer {access_token}',
-#         'Accept': 'application/json'
-#     }
-
-#     response = requests.get(url, headers=headers)
-
-#     print(f"Status Code: {response.status_code}")
-#     print(f"Response Text: {response.text}")
-#     if response.status_code == 200:
-#         return response.json()
-#     else:
-#         return None
-
-# # Example usage:
-# data = make_api_call()
-# print(data)
@@ -27,35 +27,6 @@ def sum_statement_items_nonReturn(df, PnL_month, first_day_PnL_month):
         (df['posted-date-PST-PDT'] >= first_day_PnL_month)
         )
 
-    # Items that will appear all the time
-    result = pd.DataFrame({
-        'Sales Principal': [df.loc[order_condition, 'ItemPrice: Principal'].sum()],
-        'Shipping': [df.loc[order_condition, 'ItemPrice: Shipping'].sum()],
-        'Gift Wrap': [df.loc[order_condition, 'ItemPrice: GiftWrap'].sum()],
-        
-        'Sales Tax': [df.loc[order_condition, 'ItemPrice: Tax'].sum()],
-        'Shipping Tax': [df.loc[order_condition, 'ItemPrice: ShippingTax'].sum()],
-        'Gift Wrap Tax': [df.loc[order_condition, 'ItemPrice: GiftWrapTax'].sum()],
-        
-        'Commission': [df.loc[order_condition, 'ItemFees: Commission'].sum()],
-        'FBA Fulfillment Fee': [df.loc[order_condition, 'ItemFees: FBAPerUnitFulfillmentFee'].sum()],
-        'Sales Tax Service Fee': [df.loc[order_condition, 'ItemFees: SalesTaxServiceFee'].sum()],
-
-        'Marketplace Facilitator Tax Principal': [df.loc[order_condition, 'ItemWithheldTax: MarketplaceFacilitatorTax-Principal'].sum()],
-        'Marketplace Facilitator Tax Shipping': [df.loc[order_condition, 'ItemWithheldTax: MarketplaceFacilitatorTax-Shipping'].sum()],
-
-        'FBM Shipping Commission': [df.loc[order_condition, 'ItemFees: ShippingHB'].sum()],
-        'Digital Services Fee': [df.loc[order_condition, 'ItemFees: DigitalServicesFee'].sum()],
-        
-        'Sponsored Products Charge': [df.loc[nonorder_condition, 'Cost of Advertising: TransactionTotalAmount'].sum()],
-        'Product Sales Promotion': [df.loc[order_condition, 'Promotion: Principal'].sum()],
-        'Shipping Promotion': [df.loc[order_condition, 'Promotion: Shipping'].sum()],
-        
-        'FBA Inbound Transportation Fee': [df.loc[nonorder_condition, 'other-transaction: FBAInboundTransportationFee'].sum()],
-        'Subscription Fee': [df.loc[nonorder_condition, 'other-transaction: Subscription Fee'].sum()],
-        'Storage Fee': [df.loc[nonorder_condition, 'other-transaction: Storage Fee'].sum()],
-        })
-
     always_sum_columns = {
         'Sales Principal': 'ItemPrice: Principal',
         'Shipping': 'ItemPrice: Shipping',
@@ -77,21 +48,41 @@ def sum_statement_items_nonReturn(df, PnL_month, first_day_PnL_month):
         'Subscription Fee': 'other-transaction: Subscription Fee',
         'Storage Fee': 'other-transaction: Storage Fee'
         }
+    # items summed over non-order rows (posted in PnL month), everything else is summed over order rows
+    nonorder_sum_columns = [
+        'Cost of Advertising: TransactionTotalAmount',
+        'other-transaction: FBAInboundTransportationFee',
+        'other-transaction: Subscription Fee',
+        'other-transaction: Storage Fee'
+        ]
     always_sum_columns_names = list(always_sum_columns.values())
+    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
+
+    # Sum every line item in one pass: group by the (order, non-order) condition category once,
+    # then add up the groups each line item belongs to. The two conditions can overlap, so both are kept as keys.
+    sum_columns = always_sum_columns_names + list(remaining_columns)
+    condition_sums = df[sum_columns].groupby(
+        [order_condition.rename('order'), nonorder_condition.rename('nonorder')]
+        ).sum()
+    order_sums = condition_sums[condition_sums.index.get_level_values('order')].sum()
+    nonorder_sums = condition_sums[condition_sums.index.get_level_values('nonorder')].sum()
+
+    # Items that will appear all the time
+    result = pd.DataFrame({
+        item: [nonorder_sums[col] if col in nonorder_sum_columns else order_sums[col]]
+        for item, col in always_sum_columns.items()
+        })
 
     # Handle items that will not appear all the time
-    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
     for col in remaining_columns:
         if col in [
             'ItemFees: ShippingChargeback'
             ]:
-            col_sum = df.loc[order_condition, col].sum()
-            if col_sum != 0:
-                result[col] = col_sum
+            col_sum = order_sums[col]
         else:
-            col_sum = df.loc[nonorder_condition, col].sum()
-            if col_sum != 0:
-                result[col] = col_sum
+            col_sum = nonorder_sums[col]
+        if col_sum != 0:
+            result[col] = col_sum
 
     result = result.T
     result.columns = ['Statement Values']
@@ -37,17 +37,21 @@ def sum_statement_items_Return(df, PnL_month):
         'Return Product Revenue Reversal - Gift Wrap Tax': 'ItemPrice: GiftWrapTax'
         }
     
+    always_sum_columns_names = list(always_sum_columns.values())
+    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
+
+    # Sum every line item in one pass over the order condition instead of re-masking the frame per column
+    sum_columns = [col for col in always_sum_columns_names if col in df.columns] + list(remaining_columns)
+    order_sums = df.loc[order_condition, sum_columns].sum()
+
     result = pd.DataFrame({
-        col_name: [df.loc[order_condition, col].sum()] if col in df.columns else [0]
+        col_name: [order_sums[col]] if col in df.columns else [0]
         for col_name, col in always_sum_columns.items()
     })
 
-    always_sum_columns_names = list(always_sum_columns.values())
-
     # Handle items that will not appear all the time
-    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
     for col in remaining_columns:
-        col_sum = df.loc[order_condition, col].sum()
+        col_sum = order_sums[col]
         if col_sum != 0:
             result[col] = col_sum
     if 'ItemPrice: Principal' in result.columns:
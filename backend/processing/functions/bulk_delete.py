@@ -0,0 +1,79 @@
+"""
+Batched deletes of selected rows by natural key (or id)
+The selected keys are loaded once into a temporary staging table; the dependent rows referencing them (e.g.
+ManufactureResult rows fulfilled by a purchase order) are read with one join per dependent table, and the delete is one
+DELETE ... WHERE EXISTS (staged key) AND NOT EXISTS (dependent row) ... RETURNING, so deleting many rows costs a few
+round trips instead of several per row
+"""
+
+import pandas as pd
+from sqlalchemy import select, exists, and_
+from backend import db
+from backend.processing.functions.bulk_insert import load_stage
+from backend.processing.functions.change_log import change_tracker, TRACKED_TABLES, tracked_columns
+
+
+def _matches(columns, other_columns):
+    return and_(*[column == other for column, other in zip(columns, other_columns)])
+
+
+def delete_by_key(table, key_columns, keys, references=(), partial=True):
+    """
+    Delete the rows of table whose key is in keys, except those still referenced by a dependent table
+
+    The caller validates the keys and commits.
+
+    Args:
+        table: SQLAlchemy Table
+        key_columns: natural key, e.g. ['purchase_order_id', 'product'], or ['id']
+        keys: key tuples of the selected rows
+        references: (dependent Table, its columns referencing key_columns in the same order) pairs,
+                    e.g. (ManufactureResult.__table__, ['fulfilled_by_po', 'product'])
+        partial: delete the unreferenced rows when some are referenced; when False nothing is deleted then
+
+    Returns:
+        dict: deleted, the deleted key tuples; missing, the keys with no stored row; referenced, key tuple ->
+              {dependent table name: [dependent row dicts]} for the stored rows that were kept
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {'deleted': [], 'missing': [], 'referenced': {}}
+    connection = db.session.connection()
+    stage = load_stage(table, pd.DataFrame(keys, columns=key_columns), {
+        column: table.c[column].type for column in key_columns
+    })
+    key = [table.c[column] for column in key_columns]
+    stored = exists().where(_matches(key, stage.c))
+
+    referenced = {}
+    for dependent, columns in references:
+        # semi-join: dependents of staged keys that are stored, the rows a per-key check would have reported
+        dependent_columns = [dependent.c[column] for column in columns]
+        rows = connection.execute(
+            select(dependent).join(stage, _matches(dependent_columns, stage.c)).where(stored)
+        ).mappings()
+        for row in rows:
+            dependents = referenced.setdefault(tuple(row[column] for column in columns), {})
+            dependents.setdefault(dependent.name, []).append(dict(row))
+
+    deleted = []
+    if partial or not referenced:
+        returned = list(dict.fromkeys(
+            key_columns + (tracked_columns(table.name) if table.name in TRACKED_TABLES else [])
+        ))
+        statement = table.delete().where(
+            stored,
+            # anti-join: rows still referenced stay, also when a dependent row was added after the check above
+            *[
+                ~exists().where(_matches([dependent.c[column] for column in columns], key))
+                for dependent, columns in references
+            ]
+        ).returning(*[table.c[column] for column in returned])
+        rows = [dict(row) for row in connection.execute(statement).mappings()]
+        change_tracker.record(table.name, 'delete', rows)
+        deleted = [tuple(row[column] for column in key_columns) for row in rows]
+    stage.drop(connection)
+
+    kept = set(deleted) | set(referenced)
+    missing = [selected for selected in keys if selected not in kept] if partial or not referenced else []
+    return {'deleted': deleted, 'missing': missing, 'referenced': referenced}
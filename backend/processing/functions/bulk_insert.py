@@ -0,0 +1,288 @@
+"""
+Bulk insert and upsert of a validated DataFrame into a model table
+PostgreSQL streams the frame through COPY on the session's connection (same transaction as the caller), other
+databases use a Core executemany insert. Upserts go through a temporary staging table and one
+INSERT ... SELECT ... ON CONFLICT (natural key) DO UPDATE, so re-uploading overlapping report files only writes the
+rows that changed. Every write is recorded in the change log (see change_log.py), COPY and connection-level executes
+are not seen by its session events
+"""
+
+import io
+import pandas as pd
+from sqlalchemy import Table, MetaData, Column, Integer, Numeric, Date, DateTime, Boolean, select, func, and_, or_, true, literal_column
+from backend import db
+from backend.processing.functions.change_log import change_tracker, TRACKED_TABLES, tracked_columns
+
+COPY_NULL = '\\N'  # NULL marker in the COPY stream; a literal '\N' string value would be read as NULL
+
+
+def dialect_insert():
+    """insert() of the configured database (PostgreSQL or SQLite), the one with on_conflict_do_update / _do_nothing"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def frame_records(frame):
+    """DataFrame -> list of dicts with NaN / NaT as None, built column-wise (to_dict('records') is slow on object frames)"""
+    values = {column: frame[column].astype(object).where(frame[column].notna(), None).tolist() for column in frame.columns}
+    return [dict(zip(values, row)) for row in zip(*values.values())]
+
+
+def copy_frame(table, frame):
+    """COPY the frame's columns into table on the session's current connection"""
+    # integer columns holding NULLs arrive as float; COPY rejects '2.0' for an integer column
+    integer_columns = [column for column in frame.columns if isinstance(table.c[column].type, Integer)]
+    if integer_columns:
+        frame = frame.astype({column: 'Int64' for column in integer_columns})
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+    columns = ', '.join(frame.columns)
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_frame(table, frame):
+    """
+    Insert every row of frame into table; the caller commits
+
+    Args:
+        table: SQLAlchemy Table, e.g. AmazonAllOrders.__table__
+        frame: DataFrame whose columns are table columns
+
+    Returns:
+        int: rows inserted
+    """
+    if frame.empty:
+        return 0
+    if db.session.get_bind().dialect.name == 'postgresql':
+        copy_frame(table, frame)
+    else:
+        db.session.connection().execute(table.insert(), frame_records(frame))
+    change_tracker.record(table.name, 'insert', frame)
+    return len(frame)
+
+
+def load_stage(table, frame, column_types):
+    """
+    Load frame into a temporary table stage_<table> on the session's current connection; the caller drops it
+
+    Args:
+        column_types: stage column name -> SQLAlchemy type, in frame column order
+    """
+    connection = db.session.connection()
+    stage = Table(
+        f'stage_{table.name}', MetaData(), *[Column(column, column_type) for column, column_type in column_types.items()],
+        prefixes=['TEMPORARY']
+    )
+    stage.drop(connection, checkfirst=True)  # left over on this connection by a failed request
+    stage.create(connection)
+    if connection.dialect.name == 'postgresql':
+        copy_frame(stage, frame)
+    else:
+        connection.execute(stage.insert(), frame_records(frame))
+    return stage
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Upserts
+# ---------------------------------------------------------------------------------------------------------------
+def _result(key_columns, inserted=0, updated=0, unchanged=0, duplicates=0, changes=None, rejected=None):
+    return {
+        'inserted': inserted, 'updated': updated, 'unchanged': unchanged, 'duplicates': duplicates,
+        'changes': changes if changes is not None else pd.DataFrame(columns=key_columns + ['action']),
+        'rejected': rejected if rejected is not None else pd.Series(dtype=object)
+    }
+
+
+def conflict_target(table, key_columns):
+    """ON CONFLICT columns of a natural key; nullable columns are indexed as coalesce(column, '') (see models)"""
+    return [
+        func.coalesce(table.c[column], literal_column("''")) if table.c[column].nullable else table.c[column]
+        for column in key_columns
+    ]
+
+
+def combine_repeated_keys(table, frame, key_columns, sum_columns=()):
+    """
+    One row per natural key; a key repeated in frame is never resolved by keeping one of its rows
+
+    Rows of a key that agree on every column but sum_columns are combined into the first one with sum_columns added
+    up (e.g. two lines of one SKU in an order); every other row of a repeated key is rejected.
+
+    Returns:
+        tuple: (frame with one row per key, Series of the rejected rows' frame index -> error message,
+                rows combined into another one)
+    """
+    rejected = pd.Series(dtype=object)
+    keys = frame[key_columns].astype(object).where(frame[key_columns].notna(), '')  # same equality as conflict_target
+    repeated = keys.duplicated(keep=False)
+    if not repeated.any():
+        return frame, rejected, 0
+
+    rows = frame[repeated]
+    groups = keys[repeated].groupby(key_columns, sort=False).ngroup()
+    other_columns = [column for column in frame.columns if column not in key_columns and column not in sum_columns]
+    differing = (
+        rows[other_columns].groupby(groups).nunique(dropna=False).gt(1) if other_columns
+        else pd.DataFrame(index=pd.Index(groups.unique()))
+    )
+    combinable = groups.map(~differing.any(axis=1)).astype(bool) if sum_columns else pd.Series(False, index=rows.index)
+
+    combined_groups = groups[combinable]
+    first = rows[combinable][~combined_groups.duplicated()].copy()
+    sums = rows.loc[combinable, list(sum_columns)].apply(pd.to_numeric).groupby(combined_groups).sum(min_count=1)
+    for column in sum_columns:
+        column_sums = sums[column].reindex(combined_groups[first.index]).values
+        if isinstance(table.c[column].type, Numeric):
+            column_sums = column_sums.round(table.c[column].type.scale or 2)  # as stored, so a re-upload compares equal
+        first[column] = column_sums
+
+    key = ', '.join(key_columns)
+    if sum_columns:
+        messages = {
+            group: f"{key} repeats in this upload with different {', '.join(columns[columns.astype(bool)].index)}."
+            for group, columns in differing.iterrows()
+        }
+    else:
+        messages = {group: f'{key} repeats in this upload; send one row per key.' for group in groups.unique()}
+    rejected = groups[~combinable].map(messages).astype(object)
+    distinct = pd.concat([frame[~repeated], first]).sort_index()
+    return distinct, rejected, len(combined_groups) - len(first)
+
+
+def upsert_frame(table, frame, key_columns, sum_columns=()):
+    """
+    Insert new rows and update changed ones by natural key; rows equal to the stored ones are not written
+
+    key_columns must match a unique index of table. Rows repeating a key are combined or rejected as described in
+    combine_repeated_keys. The caller commits.
+
+    Args:
+        table: SQLAlchemy Table with an integer id primary key
+        frame: DataFrame whose columns are table columns (without id)
+        key_columns: natural key, e.g. ['amazon_order_id', 'sku']
+        sum_columns: columns added up when rows repeating a key agree on every other column, e.g. ['quantity']
+
+    Returns:
+        dict: inserted / updated / unchanged / duplicates (rows combined into another) row counts, changes, a
+              DataFrame of the key columns of the written rows with action 'inserted' or 'updated', and rejected, a
+              Series of frame index -> error message of the rows not written
+    """
+    if frame.empty:
+        return _result(key_columns)
+    distinct, rejected, duplicates = combine_repeated_keys(table, frame, key_columns, sum_columns)
+    if distinct.empty:
+        return _result(key_columns, duplicates=duplicates, rejected=rejected)
+
+    connection = db.session.connection()
+    columns = list(frame.columns)
+    stage = load_stage(table, distinct, {column: table.c[column].type for column in columns})
+
+    postgresql = connection.dialect.name == 'postgresql'
+    if not postgresql:
+        # SQLite has no xmax: the staged keys already stored before the INSERT are the ones it can only update
+        stored_keys = pd.DataFrame(connection.execute(
+            select(*[table.c[column] for column in key_columns])
+            .join(stage, and_(*[
+                stored == (func.coalesce(stage.c[column], literal_column("''")) if table.c[column].nullable else stage.c[column])
+                for column, stored in zip(key_columns, conflict_target(table, key_columns))
+            ]))
+        ).all(), columns=key_columns).drop_duplicates()
+    insert = dialect_insert()(table).from_select(columns, select(*stage.c).where(true()))  # WHERE: SQLite needs it before ON CONFLICT
+    value_columns = [column for column in columns if column not in key_columns]
+    insert = insert.on_conflict_do_update(
+        index_elements=conflict_target(table, key_columns),
+        set_={column: insert.excluded[column] for column in value_columns},
+        where=or_(*[table.c[column].is_distinct_from(insert.excluded[column]) for column in value_columns])
+    )
+    changed_columns = [
+        column for column in (tracked_columns(table.name) if table.name in TRACKED_TABLES else [])
+        if column not in key_columns
+    ]
+    returned = [table.c[column] for column in key_columns + changed_columns]
+    if postgresql:
+        # xmax is 0 only on a row version created by the INSERT, an updated row carries the updating transaction id
+        returned.append(literal_column('xmax = 0', Boolean).label('inserted'))
+    written = pd.DataFrame(connection.execute(insert.returning(*returned)).all(), columns=[column.name for column in returned])
+    stage.drop(connection)
+
+    if postgresql:
+        is_new = written.pop('inserted').astype(bool)
+    else:
+        is_new = written[key_columns].merge(stored_keys, how='left', indicator=True)['_merge'].eq('left_only').to_numpy()
+    written['action'] = pd.Series(is_new, index=written.index).map({True: 'inserted', False: 'updated'})
+    change_tracker.record(table.name, 'insert', written[written['action'] == 'inserted'])
+    change_tracker.record(table.name, 'update', written[written['action'] == 'updated'])
+    inserted = int((written['action'] == 'inserted').sum())
+    return _result(
+        key_columns, inserted=inserted, updated=len(written) - inserted, unchanged=len(distinct) - len(written),
+        duplicates=duplicates, changes=written[key_columns + ['action']], rejected=rejected
+    )
+
+
+def _normalized(table, frame):
+    # one representation per column type, so payload values and values read back from the database compare equal
+    normalized = pd.DataFrame(index=frame.index)
+    for column in frame.columns:
+        column_type = table.c[column].type
+        if isinstance(column_type, (Date, DateTime)):
+            normalized[column] = pd.to_datetime(frame[column], errors='coerce')
+        elif isinstance(column_type, Integer):
+            normalized[column] = pd.to_numeric(frame[column], errors='coerce').astype('Float64')
+        elif isinstance(column_type, Numeric):
+            normalized[column] = pd.to_numeric(frame[column], errors='coerce').astype('Float64').round(column_type.scale or 2)
+        else:
+            normalized[column] = frame[column].astype(object).where(frame[column].notna(), None).astype(str)
+    return normalized
+
+
+def replace_partitions(table, frame, partition_column):
+    """
+    Replace the stored rows of every partition (e.g. a settlement) in frame whose rows differ from the upload
+
+    For tables without a row-level natural key: a partition stored with exactly the uploaded rows is left alone, a
+    changed one is deleted and inserted again. The caller commits.
+
+    Returns:
+        dict: as upsert_frame; inserted counts rows of new partitions, updated rows of replaced ones, and changes
+              lists the partitions written
+    """
+    key_columns = [partition_column]
+    if frame.empty:
+        return _result(key_columns)
+    partitions = frame[partition_column].unique().tolist()
+
+    connection = db.session.connection()
+    columns = list(frame.columns)
+    stored = pd.read_sql_query(
+        select(*[table.c[column] for column in columns]).where(table.c[partition_column].in_(partitions)), connection
+    )
+
+    def row_hashes(rows):
+        hashes = pd.util.hash_pandas_object(_normalized(table, rows), index=False)
+        return {partition: sorted(group) for partition, group in hashes.groupby(rows[partition_column].values)}
+
+    uploaded_hashes, stored_hashes = row_hashes(frame), row_hashes(stored)
+    actions = {
+        partition: 'inserted' if partition not in stored_hashes else 'updated'
+        for partition in partitions if uploaded_hashes.get(partition) != stored_hashes.get(partition)
+    }
+    replaced = [partition for partition, action in actions.items() if action == 'updated']
+    if replaced:
+        connection.execute(table.delete().where(table.c[partition_column].in_(replaced)))
+        change_tracker.record(table.name, 'delete', stored[stored[partition_column].isin(replaced)])
+    insert_frame(table, frame[frame[partition_column].isin(list(actions))])
+
+    rows = frame[partition_column].map(actions)
+    return _result(
+        key_columns, inserted=int((rows == 'inserted').sum()), updated=int((rows == 'updated').sum()),
+        unchanged=int(rows.isna().sum()),
+        changes=pd.DataFrame({partition_column: list(actions), 'action': list(actions.values())})
+    )
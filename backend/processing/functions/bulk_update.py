@@ -0,0 +1,94 @@
+"""
+Batched updates of grid edits by natural key
+The selected rows, the referenced customers / suppliers and the key collisions are each read with one set-based
+query, and all edits are applied by one UPDATE ... FROM a staging table ... RETURNING, so editing many rows costs one
+round trip per phase instead of several per row
+"""
+
+import pandas as pd
+from sqlalchemy import select, func, tuple_
+from backend import db
+from backend.processing.functions.bulk_insert import load_stage
+from backend.processing.functions.change_log import change_tracker, TRACKED_TABLES, tracked_columns
+
+
+def settable_columns(table):
+    """Columns an edit can write: everything but the surrogate id and database-computed columns (e.g. total_cost)"""
+    return [column.name for column in table.c if column.name != 'id' and column.computed is None]
+
+
+def rows_by_key(table, key_columns, keys):
+    """
+    Stored rows of table whose natural key is in keys, in one query
+
+    Returns:
+        dict: key tuple -> row dict with every column of table
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    result = db.session.execute(
+        select(table).where(tuple_(*[table.c[column] for column in key_columns]).in_(keys))
+    )
+    return {tuple(row[column] for column in key_columns): dict(row) for row in result.mappings()}
+
+
+def ids_by_name(name_column, id_column, names):
+    """
+    Case-insensitive name -> id lookup of many names in one query (customers / suppliers)
+
+    Returns:
+        dict: lower-cased name -> (id, stored name)
+    """
+    lowered = list({name.lower() for name in names if name})
+    if not lowered:
+        return {}
+    rows = db.session.execute(select(name_column, id_column).where(func.lower(name_column).in_(lowered))).all()
+    return {name.lower(): (row_id, name) for name, row_id in rows}
+
+
+def update_by_key(table, key_columns, updates):
+    """
+    Apply edits to rows identified by their current natural key, moving them to a new key where it changes
+
+    The caller validates the edits (rows exist, new keys are free) and commits.
+
+    Args:
+        table: SQLAlchemy Table
+        key_columns: natural key, e.g. ['sales_record_id', 'sku']
+        updates: list of (current key tuple, {column: new value}), every dict with the same columns
+
+    Returns:
+        list: row dicts of the updated rows as stored after the update (RETURNING)
+    """
+    if not updates:
+        return []
+    value_columns = list(updates[0][1])
+    old_columns = [f'old_{column}' for column in key_columns]
+    frame = pd.DataFrame(
+        [tuple(key) + tuple(values[column] for column in value_columns) for key, values in updates],
+        columns=old_columns + value_columns
+    )
+    connection = db.session.connection()
+    stage = load_stage(table, frame, {
+        **{old: table.c[column].type for old, column in zip(old_columns, key_columns)},
+        **{column: table.c[column].type for column in value_columns}
+    })
+    key_match = [table.c[column] == stage.c[old] for column, old in zip(key_columns, old_columns)]
+
+    changed = table.name in TRACKED_TABLES
+    if changed:
+        # partitions the rows move out of; RETURNING below only sees the new values
+        previous = connection.execute(
+            select(*[table.c[column] for column in tracked_columns(table.name)]).where(*key_match)
+        ).mappings().all()
+    statement = (
+        table.update().where(*key_match)
+        .values({column: stage.c[column] for column in value_columns})
+        .returning(*table.c)
+    )
+    rows = [dict(row) for row in connection.execute(statement).mappings()]
+    stage.drop(connection)
+    if changed:
+        change_tracker.record(table.name, 'update', [dict(row) for row in previous] + rows)
+    return rows
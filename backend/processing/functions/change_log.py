@@ -0,0 +1,488 @@
+"""
+Change log of the input and generated tables, feeding incremental recomputation
+Writes made through the session (ORM flushes, Core and textual INSERT / UPDATE / DELETE statements) and by the bulk
+upload helpers are reduced to the partitions they touch (table x SKU x month) and appended to the changelog table in
+the writing transaction; generate pipelines and dashboard caches ask which partitions changed since their last
+successful run instead of assuming everything did
+"""
+
+import os
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache, wraps
+import pandas as pd
+from flask import has_request_context, request
+from sqlalchemy import event, select, func, or_, case, inspect
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.sql.dml import Insert, Update, Delete
+from sqlalchemy.sql.elements import TextClause
+from backend import db
+from backend.models import ChangeLog, ChangeLogCheckpoint
+
+CHANGE_LOG_ENABLED = os.getenv('CHANGE_LOG_ENABLED', '1') == '1'
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '90'))  # pruned when a consumer checkpoints
+CHANGE_LOG_SETTLE_SECONDS = int(os.getenv('CHANGE_LOG_SETTLE_SECONDS', '60'))  # longest expected commit of a change, incl. clock skew
+
+# table -> (partition key columns, date column); None = the table changes as a whole
+# Derived tables rebuilt from these (skudimension, productdimension, profitabilityweeksku, qbreference) are not tracked
+TRACKED_TABLES = {
+    'customers': ((), None),
+    'suppliers': ((), None),
+    'purchaseorders': (('product',), 'order_date'),
+    'manufactureorders': (('sku',), 'manufacture_date'),
+    'salesrecords': (('sku',), 'sales_date'),
+    'returns': (('sku',), 'return_date'),
+    'stockinitiationaddition': (('sku',), 'manufacture_completion_date'),
+    'stockexchange': (('sku_original', 'sku_new'), 'exchange_date'),
+    'failedstockexchange': (('sku_original', 'sku_new'), 'exchange_date'),
+    'manufactureresult': (('sku',), 'manufacture_completion_date'),
+    'failedmanufactureresult': (('sku',), 'manufacture_date'),
+    'inventory': (('sku',), 'as_of_date'),
+    'inventoryrawmaterial': (('product',), 'as_of_date'),
+    'cogs': (('sku',), 'sales_date'),
+    'failedcogs': (('sku',), 'sales_date'),
+    'amazonallorders': (('sku',), 'purchase_date_pst_pdt'),
+    'skueconomics': (('msku',), 'start_date_pst_pdt'),
+    'adsspendbyday': (('sku',), 'date_by_day'),
+    'amazonstatements': (('sku',), 'posted_date_time_pst_pdt'),
+    'adscreditcardpayment': ((), 'issued_on'),
+    'amazoninboundshipping': (('msku',), 'created_pst_pdt'),
+    'fbmshippingcost': ((), 'payment_date'),
+    'allorderspnl': (('sku',), 'data_month_last_day'),
+    'qbaccountidmapping': ((), None),
+}
+
+_BUFFER = 'change_log_buffer'  # session.info keys
+_SOURCE = 'change_log_source'
+
+_TEXT_WRITE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.I)
+_VALUES = re.compile(r'\bVALUES\b', re.I)
+_WHERE = re.compile(r'\bWHERE\b(.*)$', re.I | re.S)
+_BIND = re.compile(r'(?<!:):(\w+)')
+
+
+def tracked_columns(table_name):
+    """Key and date columns of a tracked table, the ones its change rows are built from"""
+    key_columns, date_column = TRACKED_TABLES[table_name]
+    return list(key_columns) + ([date_column] if date_column else [])
+
+
+def _as_date(value):
+    if value is None or value != value:  # None / NaN / NaT
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _parenthesized(statement, start):
+    # text between the first '(' at or after start and its matching ')'
+    opened = statement.find('(', start)
+    if opened < 0:
+        return None
+    depth = 0
+    for position in range(opened, len(statement)):
+        depth += {'(': 1, ')': -1}.get(statement[position], 0)
+        if depth == 0:
+            return statement[opened + 1:position]
+    return None
+
+
+def _split_top_level(values):
+    parts, depth, current = [], 0, ''
+    for character in values:
+        depth += {'(': 1, ')': -1}.get(character, 0)
+        if character == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += character
+    return parts + [current]
+
+
+@lru_cache(maxsize=1024)
+def parse_text_write(statement):
+    """
+    Table, operation and tracked column -> bind parameter name of a textual write to a tracked table
+
+    INSERT ... (columns) VALUES (:binds) maps every tracked column bound in VALUES; UPDATE / DELETE map the tracked
+    columns compared to a bind parameter in WHERE (e.g. WHERE sku = :SKU). Unmapped columns leave the change
+    table-wide (no key) or month-less (no date).
+
+    Returns:
+        tuple: (table, operation, ((column, bind), ...)), or None for other statements
+    """
+    match = _TEXT_WRITE.match(statement)
+    if match is None or match.group(2).lower() not in TRACKED_TABLES:
+        return None
+    verb, table_name = match.group(1).split()[0].lower(), match.group(2).lower()
+    operation = {'insert': 'insert', 'update': 'update', 'delete': 'delete'}[verb]
+    columns = tracked_columns(table_name)
+    binds = {}
+    if operation == 'insert':
+        names = _parenthesized(statement, match.end())
+        values_match = _VALUES.search(statement, match.end())
+        values = _parenthesized(statement, values_match.end()) if values_match else None
+        if names is not None and values is not None:
+            for name, value in zip(_split_top_level(names), _split_top_level(values)):
+                bound = _BIND.findall(value)
+                if name.strip().strip('"').lower() in columns and len(bound) == 1:
+                    binds[name.strip().strip('"').lower()] = bound[0]
+    else:
+        where = _WHERE.search(statement)
+        if where is not None:
+            for column in columns:
+                bound = re.search(rf'\b{column}\s*=\s*:(\w+)', where.group(1), re.I)
+                if bound:
+                    binds[column] = bound.group(1)
+    return table_name, operation, tuple(binds.items())
+
+
+def _keep_value(target, value, oldvalue, initiator):
+    return value
+
+
+def _current_source(session):
+    source = session.info.get(_SOURCE)
+    if source is None and has_request_context():
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        source = f"{request.method} {rule}"
+    return source
+
+
+class ChangeTracker:
+    """
+    Buffers the partitions written in a session transaction and appends them to changelog before it commits
+
+    A change row is (table, operation, partition_key, month) with the date range and row count it covers;
+    partition_key is the SKU (product for purchase orders / raw materials), NULL when not known, and month is NULL
+    when the dates are not known; both NULL is a table-wide change
+    """
+
+    def __init__(self):
+        self._installed = False
+        self._log_tables = None  # whether changelog / changelogcheckpoint exist, checked on first use
+        self.consumers = {}  # consumer name -> tables it reads, registered by consumer()
+
+    @property
+    def installed(self):
+        """Listening and the change log tables exist (database/change_log.sql has been run)"""
+        return self._installed and self._log_tables_exist()
+
+    def _log_tables_exist(self, bind=None):
+        # checked once per process and lazily, so a schema bootstrapped after install() still counts
+        if self._log_tables is None:
+            inspector = inspect(bind if bind is not None else db.engine)
+            self._log_tables = all(inspector.has_table(table) for table in ('changelog', 'changelogcheckpoint'))
+            if not self._log_tables:
+                print("⚠️ Change log disabled: changelog / changelogcheckpoint do not exist. "
+                      "Run database/change_log.sql and restart to enable it.", flush=True)
+        return self._log_tables
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Session events
+    # ---------------------------------------------------------------------------------------------------------------
+    def install(self):
+        """Listen on every Session; called once from backend/__init__.py"""
+        if self._installed:
+            return
+        event.listen(Session, 'before_flush', self._before_flush)
+        event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+        event.listen(Session, 'before_commit', self._before_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        # load the old value of an expired key / date attribute when it is set, so its partition is recorded too
+        for mapper in db.Model.registry.mappers:
+            if mapper.local_table.name in TRACKED_TABLES:
+                for column in tracked_columns(mapper.local_table.name):
+                    event.listen(getattr(mapper.class_, column), 'set', _keep_value, active_history=True)
+        self._installed = True
+
+    def _before_flush(self, session, flush_context, instances):
+        for operation, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+            for obj in objects:
+                table_name = getattr(obj, '__tablename__', None)
+                if table_name not in TRACKED_TABLES:
+                    continue
+                if operation == 'update' and not session.is_modified(obj, include_collections=False):
+                    continue
+                columns = tracked_columns(table_name)
+                row = {column: getattr(obj, column) for column in columns}
+                self._add_rows(session, table_name, operation, [row])
+                if operation == 'update':
+                    # a changed SKU / date also dirties the partition the row moved out of
+                    old = {}
+                    for column in columns:
+                        history = attributes.get_history(obj, column)
+                        if history.deleted:
+                            old[column] = history.deleted[0]
+                    if old:
+                        self._add_rows(session, table_name, operation, [{**row, **old}])
+
+    def _do_orm_execute(self, orm_execute_state):
+        statement = orm_execute_state.statement
+        session = orm_execute_state.session
+        parameters = orm_execute_state.parameters
+        rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+        if isinstance(statement, TextClause):
+            parsed = parse_text_write(statement.text)
+            if parsed is None:
+                return
+            table_name, operation, binds = parsed
+            if not binds:
+                self.record(table_name, operation, session=session)
+            else:
+                self._add_rows(
+                    session, table_name, operation,
+                    [{column: row.get(bind) for column, bind in binds} for row in rows] or [{}]
+                )
+        elif isinstance(statement, (Insert, Update, Delete)):
+            table = statement.table
+            table_name = getattr(table, 'name', None) or getattr(getattr(table, '__table__', None), 'name', None)
+            if table_name not in TRACKED_TABLES:
+                return
+            operation = 'insert' if isinstance(statement, Insert) else 'update' if isinstance(statement, Update) else 'delete'
+            if operation == 'insert' and rows:
+                self._add_rows(session, table_name, operation, rows)
+            else:
+                # criteria-based UPDATE / DELETE (e.g. query.delete()): the rows are not known up front
+                self.record(table_name, operation, session=session)
+
+    def _before_commit(self, session):
+        if not session.info.get(_BUFFER) and not (session.new or session.dirty or session.deleted):
+            return
+        session.flush()  # before_commit runs ahead of the commit's own flush; ORM changes are collected there
+        buffer = session.info.pop(_BUFFER, None)
+        if not buffer or not self._log_tables_exist(session.connection()):
+            return
+        changed_at = datetime.utcnow()
+        session.execute(ChangeLog.__table__.insert(), [
+            {
+                'table_name': table_name, 'operation': operation, 'partition_key': partition_key, 'month': month,
+                'date_from': date_from, 'date_to': date_to, 'row_count': row_count, 'source': source,
+                'changed_at': changed_at
+            }
+            for (table_name, operation, partition_key, month, source), (date_from, date_to, row_count) in buffer.items()
+        ])
+
+    def _after_rollback(self, session):
+        session.info.pop(_BUFFER, None)
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Recording
+    # ---------------------------------------------------------------------------------------------------------------
+    def _add(self, buffer, key, date_from, date_to, count):
+        entry = buffer.get(key)
+        if entry is None:
+            buffer[key] = [date_from, date_to, count]
+            return
+        if date_from is not None:
+            entry[0] = date_from if entry[0] is None else min(entry[0], date_from)
+            entry[1] = date_to if entry[1] is None else max(entry[1], date_to)
+        entry[2] += count
+
+    def _add_rows(self, session, table_name, operation, rows):
+        key_columns, date_column = TRACKED_TABLES[table_name]
+        buffer = session.info.setdefault(_BUFFER, {})
+        source = _current_source(session)
+        if not key_columns and date_column is None:
+            self._add(buffer, (table_name, operation, None, None, source), None, None, len(rows))
+            return
+        for row in rows:
+            day = _as_date(row.get(date_column)) if date_column else None
+            month = day.replace(day=1) if day else None
+            for key_column in key_columns or (None,):
+                partition_key = row.get(key_column) if key_column else None
+                partition_key = None if partition_key is None else str(partition_key)
+                self._add(buffer, (table_name, operation, partition_key, month, source), day, day, 1)
+
+    def record(self, table_name, operation, rows=None, session=None):
+        """
+        Record a write made outside the session events (COPY, connection-level executes)
+
+        Args:
+            table_name: tracked table, e.g. 'amazonallorders'; other tables are ignored
+            operation: 'insert', 'update' or 'delete'
+            rows: DataFrame or list of dicts holding the table's tracked columns; None records a table-wide change
+            session: defaults to db.session
+        """
+        if not self._installed or table_name not in TRACKED_TABLES:
+            return
+        session = session if session is not None else db.session()
+        if not self._log_tables_exist(session.connection()):
+            return
+        if rows is None:
+            buffer = session.info.setdefault(_BUFFER, {})
+            self._add(buffer, (table_name, operation, None, None, _current_source(session)), None, None, 0)
+            return
+        if not isinstance(rows, pd.DataFrame):
+            self._add_rows(session, table_name, operation, rows)
+            return
+        if rows.empty:
+            return
+        key_columns, date_column = TRACKED_TABLES[table_name]
+        buffer = session.info.setdefault(_BUFFER, {})
+        source = _current_source(session)
+        if not key_columns and date_column is None:
+            self._add(buffer, (table_name, operation, None, None, source), None, None, len(rows))
+            return
+        # aggregate column-wise first; bulk uploads carry many rows per (SKU, month)
+        days = pd.to_datetime(rows[date_column], errors='coerce') if date_column else pd.Series(pd.NaT, index=rows.index)
+        for key_column in key_columns or (None,):
+            grouped = pd.DataFrame({
+                'partition_key': rows[key_column].astype(object) if key_column else None,
+                'month': days.dt.to_period('M').dt.to_timestamp(),
+                'day': days
+            }).groupby(['partition_key', 'month'], dropna=False)['day'].agg(['min', 'max', 'size'])
+            for (partition_key, month), (first, last, size) in grouped.iterrows():
+                key = (
+                    table_name, operation, None if partition_key is None or partition_key != partition_key else str(partition_key),
+                    _as_date(month), source
+                )
+                self._add(buffer, key, _as_date(first), _as_date(last), int(size))
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Consumers
+    # ---------------------------------------------------------------------------------------------------------------
+    def latest_change_id(self, tables=None):
+        """Highest changelog id, optionally of the given tables only; read on its own connection"""
+        query = select(func.max(ChangeLog.id))
+        if tables:
+            query = query.where(ChangeLog.table_name.in_(list(tables)))
+        with db.engine.connect() as connection:
+            return connection.execute(query).scalar() or 0
+
+    def settled_change_id(self):
+        """
+        Highest changelog id below which every row is committed and visible
+
+        Ids are handed out when a transaction appends its rows, right before it commits, so a lower id can still be in
+        flight when a higher one is read; rows written more than CHANGE_LOG_SETTLE_SECONDS ago, and all lower ids,
+        are not. Checkpointing this instead of the highest id keeps late commits dirty instead of skipping them.
+        """
+        settled_at = datetime.utcnow() - timedelta(seconds=CHANGE_LOG_SETTLE_SECONDS)
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(func.max(ChangeLog.id)).where(ChangeLog.changed_at <= settled_at)
+            ).scalar() or 0
+
+    def checkpoint(self, consumer):
+        """changelog id covered by the consumer's last successful run, 0 when it never ran"""
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(ChangeLogCheckpoint.last_change_id).where(ChangeLogCheckpoint.consumer == consumer)
+            ).scalar() or 0
+
+    def changes_since(self, change_id, tables=None, limit=1000):
+        """changelog rows after change_id, oldest first"""
+        query = db.session.query(ChangeLog).filter(ChangeLog.id > change_id)
+        if tables:
+            query = query.filter(ChangeLog.table_name.in_(list(tables)))
+        return query.order_by(ChangeLog.id).limit(limit).all()
+
+    def dirty_partitions(self, consumer, tables=None):
+        """
+        Partitions of tables (default: the ones the consumer registered) changed since the consumer's last
+        successful run, its own writes excluded
+
+        Returns:
+            dict: since_change_id / upto_change_id (pass upto to mark_consumed once recomputed), full_tables (tables
+                  with a table-wide change: recompute everything that reads them) and partitions, one per
+                  (table, partition_key, month) with the changed date range and row count; a NULL partition_key
+                  is every SKU of that month, a NULL month every month of that SKU
+        """
+        tables = tables or self.consumers.get(consumer, ())
+        since = self.checkpoint(consumer)
+        upto = self.settled_change_id()
+        window = [
+            ChangeLog.id > since, ChangeLog.id <= upto, ChangeLog.table_name.in_(list(tables)),
+            or_(ChangeLog.source.is_(None), ChangeLog.source != consumer)
+        ]
+        with db.engine.connect() as connection:
+            full_tables = connection.execute(
+                select(ChangeLog.table_name)
+                .where(*window, ChangeLog.partition_key.is_(None), ChangeLog.month.is_(None)).distinct()
+            ).scalars().all()
+            partitions = connection.execute(
+                select(
+                    ChangeLog.table_name, ChangeLog.partition_key, ChangeLog.month, func.min(ChangeLog.date_from),
+                    func.max(ChangeLog.date_to), func.sum(ChangeLog.row_count)
+                ).where(*window, or_(ChangeLog.partition_key.is_not(None), ChangeLog.month.is_not(None)))
+                .group_by(ChangeLog.table_name, ChangeLog.partition_key, ChangeLog.month)
+                .order_by(ChangeLog.table_name, ChangeLog.partition_key, ChangeLog.month)
+            ).all()
+        return {
+            'consumer': consumer,
+            'since_change_id': since,
+            'upto_change_id': upto,
+            'full_tables': sorted(full_tables),
+            'partitions': [
+                {
+                    'table_name': table_name, 'partition_key': partition_key,
+                    'month': _as_date(month).isoformat() if month else None,
+                    'date_from': _as_date(date_from).isoformat() if date_from else None,
+                    'date_to': _as_date(date_to).isoformat() if date_to else None,
+                    'row_count': int(row_count or 0)
+                }
+                for table_name, partition_key, month, date_from, date_to, row_count in partitions
+            ]
+        }
+
+    def mark_consumed(self, consumer, change_id):
+        """
+        Move the consumer's checkpoint to change_id (never backwards) and prune expired changelog rows
+
+        Runs in its own transaction, so a failed or rolled back session does not lose the checkpoint.
+        """
+        now = datetime.utcnow()
+        checkpoints = ChangeLogCheckpoint.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                checkpoints.update().where(checkpoints.c.consumer == consumer).values(
+                    last_change_id=case(
+                        (checkpoints.c.last_change_id < change_id, change_id), else_=checkpoints.c.last_change_id
+                    ),
+                    updated_at=now
+                )
+            ).rowcount
+            if not updated:
+                connection.execute(checkpoints.insert().values(consumer=consumer, last_change_id=change_id, updated_at=now))
+            connection.execute(
+                ChangeLog.__table__.delete().where(ChangeLog.changed_at < now - timedelta(days=CHANGE_LOG_RETENTION_DAYS))
+            )
+
+    def consumer(self, name, tables):
+        """
+        Decorator for a generate route reading tables: its writes are tagged with name and a 2xx / 3xx response
+        checkpoints the changes it has seen, so dirty_partitions(name, tables) lists only later ones
+
+        Changes committed while the route runs, or in the CHANGE_LOG_SETTLE_SECONDS before it, stay dirty for the next
+        run (see settled_change_id).
+        """
+        self.consumers[name] = tuple(tables)
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.installed:
+                    return func(*args, **kwargs)
+                upto = self.settled_change_id()
+                db.session.info[_SOURCE] = name
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    db.session.info.pop(_SOURCE, None)
+                status = result[1] if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int) \
+                    else getattr(result, 'status_code', 200)
+                if status < 400:
+                    self.mark_consumed(name, upto)
+                return result
+            return wrapper
+        return decorator
+
+
+change_tracker = ChangeTracker()
@@ -0,0 +1,174 @@
+"""
+Memoized computation graph for the dashboard helpers
+Each helper is a named node over the tables it reads; results are shared by all threads of a gunicorn worker and
+keyed by (node, args, data version) so the parallel chart requests of one page load compute each base frame once
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+import pandas as pd
+from flask import Response, g, has_request_context
+from sqlalchemy import text, select, func
+from backend import db
+from backend.models import ChangeLog
+from backend.processing.functions.change_log import change_tracker
+
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '300'))  # seconds; bounds staleness of writes the fingerprint cannot see
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv('DASHBOARD_CACHE_MAX_ENTRIES', '64'))
+
+
+def _share(result):
+    # callers add columns / filter in place, so every caller gets its own copy of the cached frames
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy()
+    if isinstance(result, tuple):
+        return tuple(_share(item) for item in result)
+    if isinstance(result, list):
+        return [_share(item) for item in result]
+    return result
+
+
+def _is_cacheable(result):
+    # error paths return (jsonify(...), status) tuples; never cache those
+    if isinstance(result, Response):
+        return False
+    if isinstance(result, (tuple, list)):
+        return all(_is_cacheable(item) for item in result)
+    return True
+
+
+class ComputationGraph:
+    """
+    Registry of named dashboard helper nodes with a process-wide, bounded result cache
+
+    Args:
+        ttl: seconds a cached result stays valid even when the data version is unchanged
+        max_entries: least recently used results are evicted beyond this size
+    """
+
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL, max_entries=DASHBOARD_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # key -> (computed_at, result)
+        self._inflight = {}  # key -> threading.Event, set once the computing thread is done
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0}
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Data version
+    # ---------------------------------------------------------------------------------------------------------------
+    def _table_fingerprint(self, table):
+        # Cheap change detector, same as the QB account mapping cache: row count and highest id
+        # (tables with a composite key such as inventory use the last key column, e.g. as_of_date)
+        table_meta = db.metadata.tables.get(table)
+        if table_meta is None or 'id' in table_meta.columns:
+            version_column = 'id'
+        else:
+            version_column = list(table_meta.primary_key.columns)[-1].name
+        count, max_version = db.session.execute(text(f"SELECT COUNT(*), MAX({version_column}) FROM {table}")).one()
+        if not change_tracker.installed:
+            return count, max_version
+        # in-place UPDATEs keep count and id; the change log sees them (writes from outside the app still need the TTL)
+        last_change = db.session.execute(
+            select(func.max(ChangeLog.id)).where(ChangeLog.table_name == table)
+        ).scalar()
+        return count, max_version, last_change
+
+    def data_version(self, tables):
+        """
+        Fingerprint of the given tables, read at most once per request so every node in a request sees one version
+        """
+        fingerprints = g.setdefault('dashboard_table_fingerprints', {}) if has_request_context() else {}
+        version = []
+        for table in sorted(tables):
+            if table not in fingerprints:
+                fingerprints[table] = self._table_fingerprint(table)
+            version.append((table, fingerprints[table]))
+        return tuple(version)
+
+    def node_tables(self, name):
+        """Tables read by a node and, transitively, by the nodes it depends on"""
+        node = self._nodes[name]
+        tables = set(node['tables'])
+        for dependency in node['depends_on']:
+            tables |= self.node_tables(dependency)
+        return tables
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Nodes
+    # ---------------------------------------------------------------------------------------------------------------
+    def node(self, tables=(), depends_on=(), name=None):
+        """
+        Register a helper as a graph node and memoize it
+
+        Args:
+            tables: tables the helper queries directly
+            depends_on: names of the nodes the helper calls
+            name: node name, defaults to the function name
+        """
+        def decorator(func):
+            node_name = name or func.__name__
+            self._nodes[node_name] = {'tables': tuple(tables), 'depends_on': tuple(depends_on)}
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (node_name, args, tuple(sorted(kwargs.items())), self.data_version(self.node_tables(node_name)))
+                return _share(self._get_or_compute(key, lambda: func(*args, **kwargs)))
+
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def _get_or_compute(self, key, compute):
+        while True:
+            with self._lock:
+                cached = self._results.get(key)
+                if cached is not None and time.time() - cached[0] < self.ttl:
+                    self._results.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return cached[1]
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    self._stats['misses'] += 1
+                    break
+                self._stats['waits'] += 1
+            # another thread is computing the same node: wait for it, then read its result
+            event.wait()
+            with self._lock:
+                cached = self._results.get(key)
+                if cached is not None:
+                    self._results.move_to_end(key)
+                    return cached[1]
+            # the computing thread failed or the result was not cacheable; compute on our own
+
+        try:
+            result = compute()
+            if _is_cacheable(result):
+                with self._lock:
+                    self._results[key] = (time.time(), result)
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def invalidate(self, name=None):
+        """Drop cached results of one node, or of all nodes when name is None"""
+        with self._lock:
+            for key in [key for key in self._results if name is None or key[0] == name]:
+                del self._results[key]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'entries': len(self._results), 'nodes': sorted(self._nodes)}
+
+
+dashboard_graph = ComputationGraph()
@@ -0,0 +1,85 @@
+"""
+Database connection pool settings and usage metrics
+Pool sizing comes from the environment so it can follow the gunicorn layout (apprunner.yaml runs 4 workers x 8
+threads, each worker with its own pool); checkouts are timed so /metrics shows how long requests wait for a connection
+"""
+
+import os
+import time
+import threading
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # one per gthread
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '4'))  # short bursts, e.g. a generate job next to dashboard loads
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # seconds; below RDS / proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection and how many timed out"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'checkouts': 0, 'timeouts': 0, 'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self._record(time.perf_counter() - started, timed_out=True)
+            raise
+        self._record(time.perf_counter() - started)
+        return connection
+
+    def _record(self, seconds, timed_out=False):
+        with self._metrics_lock:
+            self._metrics['checkouts'] += int(not timed_out)
+            self._metrics['timeouts'] += int(timed_out)
+            self._metrics['total_wait_seconds'] += seconds
+            self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], seconds)
+
+    def metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['avg_wait_seconds'] = metrics['total_wait_seconds'] / metrics['checkouts'] if metrics['checkouts'] else 0.0
+        return metrics
+
+
+def engine_options(database_url):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database
+
+    SQLite (local fallback only) keeps SQLAlchemy's default pool.
+    """
+    if database_url.startswith('sqlite'):
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+def pool_metrics(engine):
+    """Current pool usage plus checkout wait statistics of this worker process"""
+    pool = engine.pool
+    metrics = {'pool_class': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        metrics.update(pool.metrics())
+    return metrics
@@ -0,0 +1,412 @@
+"""
+FIFO costing of sales against inventory lots, partitioned by SKU
+A sale only draws from lots of its own SKU, so sales and lots are grouped by SKU and every group is allocated on its
+own: small runs in this process, larger ones across a pool of worker processes. The sale and lot columns are placed
+once in shared memory, workers map them instead of receiving pickled copies and write the remaining lot quantities of
+their SKUs back in place; cogs and failedcogs rows are merged back in sales order, so the result does not depend on the
+number of workers. The pool is off unless COGS_WORKERS is raised above 1
+"""
+
+import os
+import math
+import threading
+import multiprocessing
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+
+# Worker processes per app process. Every app process owns its own pool, so the default keeps costing
+# in-process; raise it (e.g. COGS_WORKERS=4) on hosts running few app processes with spare cores
+COGS_WORKERS = int(os.getenv('COGS_WORKERS', '1'))  # 1 costs every run in-process
+COGS_PARALLEL_MIN_SALES = int(os.getenv('COGS_PARALLEL_MIN_SALES', '20000'))  # smaller runs are not worth the pool round trip
+TASKS_PER_WORKER = 4  # SKU chunks per worker, so one large SKU does not leave the other workers idle
+
+RETURN, RESULT, INITIATION = 0, 1, 2  # lot kinds, in the order lots completed on the same day are drawn
+NO_INVENTORY, INSUFFICIENT = 'No available inventory', 'Insufficient stock to fulfill order'
+LOT_COLUMNS = {
+    RETURN: ('return', 'return_date'),
+    RESULT: ('result', 'manufacture_completion_date'),
+    INITIATION: ('initiation', 'manufacture_completion_date'),
+}
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Allocation of one chunk of SKUs (runs in the pool workers, or in-process)
+# ---------------------------------------------------------------------------------------------------------------
+def _allocate_sku(arrays, bounds, components, batch_lots, monotonic, cogs, failed):
+    """
+    Cost the sales of one SKU; appends to cogs / failed and writes the remaining lot quantities into arrays
+
+    Returns:
+        tuple: (successful, failed) sale counts
+    """
+    (sale_start, sale_end), lot_bounds = bounds[0], dict(zip((RETURN, RESULT, INITIATION), bounds[1:]))
+    left, unit_costs, rows, groups, members_of, lots = {}, {}, {}, {}, {}, []
+    for kind, (start, end) in lot_bounds.items():
+        prefix = LOT_COLUMNS[kind][0]
+        left[kind] = arrays[f'{prefix}_left'][start:end].tolist()
+        rows[kind] = arrays[f'{prefix}_row'][start:end].tolist()
+        groups[kind] = arrays[f'{prefix}_group'][start:end].tolist()
+        members_of[kind] = {}
+        for index, group in enumerate(groups[kind]):
+            members_of[kind].setdefault(group, []).append(index)
+        days = arrays[f'{prefix}_day'][start:end].tolist()
+        if kind == RESULT:
+            lot_codes = arrays['result_lot'][start:end].tolist()
+            usable = arrays['result_usable'][start:end].tolist()
+            if batch_lots:
+                batches = {}
+                for index, lot_code in enumerate(lot_codes):
+                    batches.setdefault(lot_code, []).append(index)
+                lots.extend((days[indexes[0]], kind, indexes[0], indexes) for indexes in batches.values())
+                continue
+        else:
+            unit_costs[kind] = arrays[f'{prefix}_unit_cost'][start:end].tolist()
+        lots.extend((day, kind, index, (index,)) for index, day in enumerate(days))
+    lots.sort(key=lambda lot: (lot[0], lot[1]))  # stable: frame order among lots of one kind and day
+    lot_days = [lot[0] for lot in lots]
+
+    successful_count = failed_count = 0
+    first = 0
+    for position, sales_day, quantity_sold in zip(
+            arrays['sale_position'][sale_start:sale_end].tolist(),
+            arrays['sale_day'][sale_start:sale_end].tolist(),
+            arrays['sale_quantity'][sale_start:sale_end].tolist()):
+        if monotonic:
+            # quantities only go down, so a used-up lot at the front stays used up for every later sale
+            while first < len(lots) and all(left[lots[first][1]][index] <= 0 for index in lots[first][3]):
+                first += 1
+        available = []
+        for lot in lots[first:bisect_right(lot_days, sales_day, first)]:
+            quantities = [left[lot[1]][index] for index in lot[3] if left[lot[1]][index] > 0]
+            if quantities:
+                available.append((lot, min(quantities)))
+        if not available:
+            failed.append((position, NO_INVENTORY, quantity_sold))
+            failed_count += 1
+            continue
+
+        remaining_qty = quantity_sold
+        sale_cogs, decrements = [], []
+        for (_, kind, index, _), available_qty in available:
+            if remaining_qty == 0:
+                break
+            if kind == RESULT and not usable[index]:
+                continue
+            allocated_qty = min(remaining_qty, available_qty)
+            remaining_qty -= allocated_qty
+            if kind == RESULT:
+                for component, (update_group, ratio, unit_cost, product, _) in enumerate(components[lot_codes[index]]):
+                    if ratio is None:
+                        raise KeyError(product)
+                    consumed_qty = allocated_qty * ratio
+                    sale_cogs.append((position, kind, rows[kind][index], component, consumed_qty, consumed_qty * float(unit_cost)))
+                    decrements.append((kind, update_group, consumed_qty))
+            else:
+                sale_cogs.append((position, kind, rows[kind][index], -1, allocated_qty, allocated_qty * unit_costs[kind][index]))
+                decrements.append((kind, groups[kind][index], allocated_qty))
+
+        # a sale sees the quantities left before it; its own draws apply from the next sale on
+        for kind, group, consumed_qty in decrements:
+            for index in members_of[kind].get(group, ()):
+                left[kind][index] -= consumed_qty
+
+        if sale_cogs:
+            cogs.extend(sale_cogs)
+            successful_count += 1
+        if remaining_qty > 0:
+            failed.append((position, INSUFFICIENT, remaining_qty))
+            if remaining_qty == quantity_sold:
+                failed_count += 1
+
+    for kind, (start, end) in lot_bounds.items():
+        arrays[f'{LOT_COLUMNS[kind][0]}_left'][start:end] = left[kind]
+    return successful_count, failed_count
+
+
+def _allocate_chunk(arrays, chunk, components, batch_lots, monotonic):
+    cogs, failed = [], []
+    successful_count = failed_count = 0
+    for bounds in chunk:
+        successful, unsuccessful = _allocate_sku(arrays, bounds, components, batch_lots, monotonic, cogs, failed)
+        successful_count += successful
+        failed_count += unsuccessful
+    return cogs, failed, successful_count, failed_count
+
+
+def _views(buffer, layout):
+    return {
+        name: np.ndarray((length,), dtype=dtype, buffer=buffer, offset=offset)
+        for name, (offset, dtype, length) in layout.items()
+    }
+
+
+def _allocate_shared(shared_name, layout, chunk, components, batch_lots, monotonic):
+    """Pool task: cost a chunk of SKUs from the arrays in shared memory block shared_name"""
+    shared = SharedMemory(name=shared_name)
+    arrays = None
+    try:
+        arrays = _views(shared.buf, layout)
+        return _allocate_chunk(arrays, chunk, components, batch_lots, monotonic)
+    finally:
+        del arrays  # views must go before the block is closed
+        shared.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Worker pool
+# ---------------------------------------------------------------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """The process pool, created on first use and kept for later runs"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: workers are not forked from this (multi-threaded) app process, and the server imports this
+            # module once for all of them
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=COGS_WORKERS, mp_context=context)
+        return _pool
+
+
+def _discard_executor(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _chunks(partitions, sales_counts, count):
+    """Split the SKU partitions, in order, into about count chunks of similar sales counts"""
+    target = math.ceil(sum(sales_counts) / count)
+    chunks, chunk, chunk_sales = [], [], 0
+    for bounds, sales in zip(partitions, sales_counts):
+        chunk.append(bounds)
+        chunk_sales += sales
+        if chunk_sales >= target:
+            chunks.append(chunk)
+            chunk, chunk_sales = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _allocate_parallel(arrays, partitions, sales_counts, components, batch_lots, monotonic):
+    pool = _executor()
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (offset, array.dtype.str, len(array))
+        offset += array.nbytes  # every column is 8 bytes wide, so offsets stay aligned
+    shared = SharedMemory(create=True, size=max(offset, 1))
+    views = None
+    try:
+        views = _views(shared.buf, layout)
+        for name, array in arrays.items():
+            views[name][:] = array
+        chunks = _chunks(partitions, sales_counts, COGS_WORKERS * TASKS_PER_WORKER)
+        futures = [
+            pool.submit(
+                _allocate_shared, shared.name, layout, chunk,
+                {code: components[code] for code in _lot_codes(arrays, chunk)}, batch_lots, monotonic
+            )
+            for chunk in chunks
+        ]
+        try:
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            _discard_executor(pool)
+            raise
+        for name in arrays:
+            if name.endswith('_left'):
+                arrays[name][:] = views[name]
+        return results
+    finally:
+        del views
+        shared.close()
+        shared.unlink()
+
+
+def _lot_codes(arrays, chunk):
+    codes = set()
+    for bounds in chunk:
+        start, end = bounds[2]
+        codes.update(arrays['result_lot'][start:end].tolist())
+    return codes
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------------------------------------------
+def _days(dates):
+    return pd.to_datetime(pd.Series(dates, dtype=object)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+def _codes(values):
+    return pd.factorize(pd.Series(values, dtype=object))[0].astype(np.int64)
+
+
+def allocate_sales(sales_df, returns_df, initiation_df, results_df, ratio_table, batch_lots=False):
+    """
+    FIFO-cost every sale against the returns, stock initiation / addition and manufacture result lots of its SKU
+
+    Sales are costed in frame order (by sales_date) and draw from lots completed on or before their date, oldest
+    first. The quantity_left columns of the three lot frames are updated in place.
+
+    Args:
+        sales_df: sales_record_id, sku, quantity_sold, sales_date rows
+        returns_df, initiation_df, results_df: returns, stockinitiationaddition and manufactureresult rows, dates as
+                                               dates and quantity_left as of the first sale
+        ratio_table: ProductRatioTable of the run
+        batch_lots: draw a manufacture result batch as one lot holding the smallest quantity_left of its rows (as the
+                    as-of-date inventory does) instead of one lot per row
+
+    Returns:
+        dict: cogs and failedcogs, the rows to insert in sales order; successful and failed, sale counts
+    """
+    frames = {RETURN: returns_df, RESULT: results_df, INITIATION: initiation_df}
+    sale_skus = sales_df['sku'].astype(str).tolist()
+    skus = {sku: code for code, sku in enumerate(dict.fromkeys(sale_skus))}  # only SKUs with sales are costed
+
+    # sales and lots of each table ordered by SKU (stably, keeping frame order within a SKU)
+    sale_codes = np.array([skus[sku] for sku in sale_skus], dtype=np.int64)
+    sale_order = np.argsort(sale_codes, kind='stable')
+    arrays = {
+        'sale_position': sale_order.astype(np.int64),
+        'sale_day': _days(sales_df['sales_date'])[sale_order],
+        'sale_quantity': sales_df['quantity_sold'].to_numpy(dtype=np.int64)[sale_order],
+    }
+    code_bounds = {'sale': (np.sort(sale_codes), None)}
+    for kind, frame in frames.items():
+        prefix, date_column = LOT_COLUMNS[kind]
+        codes = np.array([skus.get(sku, -1) for sku in frame['sku'].astype(str).tolist()], dtype=np.int64)
+        order = np.argsort(codes, kind='stable')
+        arrays[f'{prefix}_row'] = order.astype(np.int64)
+        arrays[f'{prefix}_day'] = _days(frame[date_column])[order]
+        arrays[f'{prefix}_left'] = frame['quantity_left'].to_numpy(dtype=np.int64)[order]
+        code_bounds[prefix] = codes[order]
+
+    # unit costs of returns and stock initiations; the groups a draw is taken off (rows sharing the key of the lot)
+    arrays['return_unit_cost'] = (
+        returns_df['return_unit_price'].astype(float) * returns_df['fx_rate'].astype(float)
+    ).to_numpy(dtype=np.float64)[arrays['return_row']]
+    arrays['return_group'] = _codes(returns_df['return_order_id'].astype(str))[arrays['return_row']]
+    arrays['initiation_unit_cost'] = initiation_df['unit_cost'].astype(float).to_numpy(dtype=np.float64)[arrays['initiation_row']]
+    arrays['initiation_group'] = _codes(initiation_df['result_id'])[arrays['initiation_row']]
+
+    # manufacture result lots: every (order, batch, completion date, SKU) is costed through its batch products
+    result_keys = list(zip(*(results_df[column].tolist() for column in (
+        'manufacture_order_id', 'manufacture_batch', 'sku', 'product', 'fulfilled_by_po', 'manufacture_completion_date'
+    ))))
+    update_groups = {}  # (order, batch, SKU, product, PO) -> group
+    lot_codes = {}      # (order, batch, completion date, SKU) -> code
+    result_groups, result_lots = [], []
+    for order_id, batch, sku, product, po_id, completion_date in result_keys:
+        result_groups.append(update_groups.setdefault((order_id, batch, str(sku), str(product), str(po_id)), len(update_groups)))
+        result_lots.append(lot_codes.setdefault((order_id, batch, completion_date, str(sku)), len(lot_codes)))
+    arrays['result_group'] = np.array(result_groups, dtype=np.int64)[arrays['result_row']]
+    arrays['result_lot'] = np.array(result_lots, dtype=np.int64)[arrays['result_row']]
+    usable = results_df['unit_cost'].notna().to_numpy() if not batch_lots else np.ones(len(results_df), dtype=bool)
+    for row in np.flatnonzero(~usable):
+        print(f"Warning: Skipping manufacture record {result_keys[row][:3]} with no unit cost")
+    arrays['result_usable'] = usable.astype(np.int64)[arrays['result_row']]
+
+    costed = set(arrays['result_lot'][code_bounds['result'] >= 0].tolist())
+    components = {}  # lot code -> [(update group, ratio, unit cost, product, PO)] of the batch products
+    for (order_id, batch, completion_date, sku), code in lot_codes.items():
+        if code not in costed:
+            continue
+        product_ratios, _ = ratio_table.lot_ratios(int(order_id), int(batch), completion_date)
+        components[code] = [
+            (
+                update_groups.get((order_id, batch, sku, str(product), str(po_id)), -1),
+                product_ratios.get(str(product)), product_unit_cost, str(product), str(po_id)
+            )
+            for product, po_id, product_unit_cost in ratio_table.batch_products(int(order_id), int(batch))
+        ]
+
+    # one partition per SKU: its (start, end) in the sales and in each lot table
+    partitions, sales_counts = [], []
+    for code in range(len(skus)):
+        bounds = [tuple(np.searchsorted(code_bounds['sale'][0], [code, code + 1]).tolist())]
+        for kind in frames:
+            bounds.append(tuple(np.searchsorted(code_bounds[LOT_COLUMNS[kind][0]], [code, code + 1]).tolist()))
+        partitions.append(tuple(bounds))
+        sales_counts.append(bounds[0][1] - bounds[0][0])
+
+    monotonic = bool((arrays['sale_quantity'] >= 0).all()) and all(
+        ratio is None or ratio >= 0 for lot in components.values() for _, ratio, _, _, _ in lot
+    )
+    results = None
+    if COGS_WORKERS > 1 and len(sales_df) >= COGS_PARALLEL_MIN_SALES and len(partitions) > 1:
+        try:
+            results = _allocate_parallel(arrays, partitions, sales_counts, components, batch_lots, monotonic)
+        except BrokenProcessPool as e:
+            print(f"COGS worker pool failed ({e}), costing in-process")
+    if results is None:
+        results = [_allocate_chunk(arrays, partitions, components, batch_lots, monotonic)]
+
+    for kind, frame in frames.items():
+        if not frame.empty:
+            prefix = LOT_COLUMNS[kind][0]
+            quantity_left = frame['quantity_left'].to_numpy(dtype=np.int64, copy=True)
+            quantity_left[arrays[f'{prefix}_row']] = arrays[f'{prefix}_left']
+            frame['quantity_left'] = quantity_left
+
+    # merge: rows of every chunk are in sales order already, so a stable sort by sale keeps each sale's draw order
+    sales_columns = [sales_df[column].tolist() for column in ('sales_record_id', 'sales_date', 'quantity_sold')]
+    lot_columns = {
+        RETURN: returns_df['return_order_id'].tolist(),
+        RESULT: list(zip(results_df['manufacture_order_id'].tolist(), results_df['manufacture_batch'].tolist(), result_lots)),
+        INITIATION: initiation_df['result_id'].tolist(),
+    }
+    cogs = []
+    for position, kind, row, component, consumed_qty, cost in sorted(
+            (row for chunk_cogs, _, _, _ in results for row in chunk_cogs), key=lambda row: row[0]):
+        sku = sale_skus[position]
+        if kind == RESULT:
+            order_id, batch, code = lot_columns[RESULT][row]
+            result_id, batch, (_, _, _, product, po_id) = int(order_id), int(batch), components[code][component]
+        elif kind == RETURN:
+            result_id, batch, product, po_id = 0, 0, sku, str(lot_columns[RETURN][row])
+        else:
+            result_id, batch, product, po_id = -1, -1, sku, 'INITIATION & ADDITION ' + str(lot_columns[INITIATION][row])
+        cogs.append({
+            'sales_record_id': str(sales_columns[0][position]),
+            'sales_date': sales_columns[1][position],
+            'sku': sku,
+            'quantity_sold': consumed_qty,
+            'result_id': result_id,
+            'manufacture_batch': batch,
+            'product': product,
+            'fulfilled_by_po': po_id,
+            'cogs': cost
+        })
+    failedcogs = [
+        {
+            'sales_record_id': str(sales_columns[0][position]),
+            'sales_date': sales_columns[1][position],
+            'sku': sale_skus[position],
+            'quantity_sold': int(sales_columns[2][position]),
+            'failed_quantity': failed_qty,
+            'failure_reason': reason
+        }
+        for position, reason, failed_qty in sorted(
+            (row for _, chunk_failed, _, _ in results for row in chunk_failed), key=lambda row: row[0])
+    ]
+    return {
+        'cogs': cogs,
+        'failedcogs': failedcogs,
+        'successful': sum(result[2] for result in results),
+        'failed': sum(result[3] for result in results),
+    }
@@ -0,0 +1,119 @@
+"""
+Lot records and product ratios shared by manufacture result generation, stock exchange and COGS costing
+Ratios are computed once per key from the frames a generation run has already fetched, instead of filtering those
+frames (or querying the database) for every batch built or lot consumed; keys missing from the frames are read from
+the database once and cached
+"""
+
+from sqlalchemy import text
+from backend import db
+
+
+class POLot:
+    """A purchase order in one product's FIFO queue; quantity_left is what batching may still take from it"""
+    __slots__ = ('staged', 'quantity_left')
+
+    def __init__(self, staged):
+        self.staged = staged  # the staged PO dict, copied into each batch drawing from it
+        self.quantity_left = staged['allocated_qty']
+
+
+def ratios_of(products_info):
+    """(product, quantity) pairs -> ({product: quantity // smallest quantity}, smallest quantity)"""
+    if not products_info:
+        return {}, 0
+    min_quantity = min(qty for _, qty in products_info)
+    return {product: qty // min_quantity for product, qty in products_info}, min_quantity
+
+
+class ProductRatioTable:
+    """
+    Product ratios of manufacture orders and manufacture result batches, built once per generation run
+
+    Args:
+        manufacture_orders_df: manufacture_order_id, product, manufacture_quantity rows, ordered by order and product
+        manufacture_results_df: manufactureresult rows with manufacture_completion_date as dates
+        database: read keys missing from the frames from the database; when False they have no products
+    Either frame may be None; lookups then go to the database, once per key.
+    """
+
+    def __init__(self, manufacture_orders_df=None, manufacture_results_df=None, database=True):
+        self._database = database
+        self._order_products = {}  # order_id -> [(product, manufacture_quantity)]
+        self._lot_products = {}    # (order_id, batch, completion_date) -> [(product, fulfilled_quantity)]
+        self._batch_products = {}  # (order_id, batch) -> distinct [(product, fulfilled_by_po, unit_cost)]
+        self._order_ratios = {}
+        self._lot_ratios = {}
+
+        if manufacture_orders_df is not None and not manufacture_orders_df.empty:
+            columns = manufacture_orders_df[['manufacture_order_id', 'product', 'manufacture_quantity']]
+            for order_id, product, quantity in zip(*(columns[column].tolist() for column in columns)):
+                self._order_products.setdefault(order_id, []).append((product, quantity))
+
+        if manufacture_results_df is not None and not manufacture_results_df.empty:
+            columns = manufacture_results_df[[
+                'manufacture_order_id', 'manufacture_batch', 'manufacture_completion_date', 'product',
+                'fulfilled_quantity', 'fulfilled_by_po', 'unit_cost'
+            ]]
+            for order_id, batch, completion_date, product, quantity, po_id, unit_cost in zip(
+                    *(columns[column].tolist() for column in columns)):
+                self._lot_products.setdefault((order_id, batch, completion_date), []).append((product, quantity))
+                self._batch_products.setdefault((order_id, batch), {})[(product, po_id, unit_cost)] = None
+            self._batch_products = {key: list(products) for key, products in self._batch_products.items()}
+
+    def order_ratios(self, order_id):
+        """Ratios of a manufacture order's products, from its manufacture quantities"""
+        if order_id not in self._order_ratios:
+            products_info = self._order_products.get(order_id)
+            if products_info is None and not self._database:
+                products_info = []
+            elif products_info is None:
+                products_info = db.session.execute(text("""
+                    SELECT product, manufacture_quantity
+                    FROM manufactureorders
+                    WHERE manufacture_order_id = :order_id
+                    ORDER BY product;
+                """), {'order_id': order_id}).fetchall()
+                if not products_info:
+                    print(f"calculate_product_ratios for MO {order_id}: No products found!")
+            self._order_ratios[order_id] = ratios_of(products_info)
+        return self._order_ratios[order_id]
+
+    def lot_ratios(self, order_id, batch, completion_date):
+        """
+        Ratios of the products making up one SKU of a manufacture result lot
+
+        Lots of manufacture orders (order_id > 0) use the order's ratios; lots created by stock exchanges use the
+        fulfilled quantities of their batch.
+        """
+        if order_id > 0:
+            return self.order_ratios(order_id)
+        key = (order_id, batch, completion_date)
+        if key not in self._lot_ratios:
+            products_info = self._lot_products.get(key)
+            if products_info is None and not self._database:
+                products_info = []
+            elif products_info is None:
+                products_info = db.session.execute(text("""
+                    SELECT product, fulfilled_quantity
+                    FROM manufactureresult
+                    WHERE manufacture_order_id = :order_id and manufacture_batch = :batch and manufacture_completion_date = :completion_date
+                    ORDER BY product;
+                """), {'order_id': order_id, 'batch': batch, 'completion_date': completion_date}).fetchall()
+            self._lot_ratios[key] = ratios_of(products_info)
+        return self._lot_ratios[key]
+
+    def batch_products(self, order_id, batch):
+        """Distinct (product, fulfilled_by_po, unit_cost) of a manufacture result batch"""
+        key = (order_id, batch)
+        if key not in self._batch_products and not self._database:
+            return []
+        if key not in self._batch_products:
+            rows = db.session.execute(text("""
+                SELECT product, fulfilled_by_PO, unit_cost
+                FROM manufactureresult
+                WHERE manufacture_order_id = :order_id
+                AND manufacture_batch = :batch;
+            """), {'order_id': order_id, 'batch': batch}).fetchall()
+            self._batch_products[key] = list(dict.fromkeys(tuple(row) for row in rows))
+        return self._batch_products[key]
@@ -0,0 +1,398 @@
+"""
+FIFO manufacture result generation and stock exchanges over in-memory frames
+The generate routes fetch the input tables, run these and write the returned rows; the what-if simulation runs them on
+copies of the same frames with its overlays applied, so both see one engine. Purchase orders are queued per product
+once, instead of filtering the purchase order frame for every product of every manufacture order
+"""
+
+from collections import deque
+from datetime import datetime, timedelta
+import pandas as pd
+from backend.processing.functions.fifo_lots import POLot, ProductRatioTable
+
+PO_LEAD_DAYS = 5  # purchase orders dated up to this many days after the manufacture date can still supply it
+
+
+def process_manufacture_batches(order_id, staged_updates, required_skus, product_ratios=None):
+    if product_ratios is None:
+        product_ratios, _ = ProductRatioTable().order_ratios(order_id)
+    batch_number = 1
+    final_updates = []
+
+    # Group POs per product and sort them FIFO; exhausted POs are popped from the front of the queue
+    product_po_queues = {}
+    for update in sorted(staged_updates, key=lambda x: x['order_date']):
+        product_po_queues.setdefault(update['product'], deque()).append(POLot(update))
+
+    fulfilled_skus = 0
+
+    while fulfilled_skus < required_skus:
+        max_skus = float('inf')
+        current_pos = {}
+
+        for product, ratio in product_ratios.items():
+            queue = product_po_queues.get(product)
+
+            # Skip POs that don't have enough for even 1 ratio unit
+            while queue and queue[0].quantity_left < ratio:
+                queue.popleft()
+
+            if not queue:
+                return []  # No more usable POs for this product
+
+            po = queue[0]
+            possible_skus = po.quantity_left // ratio
+
+            if possible_skus == 0:
+                return []  # Defensive: shouldn't hit this if while-loop above is correct
+
+            current_pos[product] = po
+            max_skus = min(max_skus, possible_skus)
+
+        # Limit to how many SKUs still needed
+        batch_skus = min(max_skus, required_skus - fulfilled_skus)
+
+        # Consume from each product's current PO
+        for product, ratio in product_ratios.items():
+            po = current_pos[product]
+            consume_qty = batch_skus * ratio
+
+            final_updates.append({
+                **po.staged,
+                'allocated_qty': consume_qty,
+                'manufacture_batch': batch_number,
+                'cost': consume_qty * po.staged['unit_price']
+            })
+
+            po.quantity_left -= consume_qty
+            if po.quantity_left == 0:
+                product_po_queues[product].popleft()
+
+        fulfilled_skus += batch_skus
+        batch_number += 1
+
+    return final_updates
+
+
+def _failed_rows(order_id, order_rows, failure_reason):
+    failed = []
+    for sku, product, _, manufacture_date in order_rows:
+        if isinstance(manufacture_date, datetime):
+            manufacture_date = manufacture_date.strftime('%Y-%m-%d')
+        failed.append({
+            'manufacture_order_id': order_id,
+            'sku': str(sku),
+            'product': str(product),
+            'manufacture_date': manufacture_date,
+            'failure_reason': failure_reason
+        })
+    return failed
+
+
+def build_manufacture_results(manufacture_orders_df, purchase_orders_df, cutoff_date=None, ratio_table=None):
+    """
+    Build the manufacture result batches of every manufacture order, drawing purchase orders FIFO
+
+    Purchase orders start from their purchase quantity; quantity_left of purchase_orders_df is updated in place with
+    what is left after all orders. With cutoff_date only the orders manufactured on or before it are built.
+
+    Args:
+        manufacture_orders_df: manufacture_order_id, sku, product, manufacture_quantity, manufacture_date rows,
+                               ordered by order and product
+        purchase_orders_df: purchaseorders rows; same-day purchase orders of a product are drawn in frame order
+        ratio_table: ProductRatioTable of the run, built from manufacture_orders_df when None
+
+    Returns:
+        dict: manufactureresult and failedmanufactureresult, the rows to insert; total_processed, successful, failed
+              and success_rate of the manufacture orders
+    """
+    manufacture_orders_df = manufacture_orders_df.copy()
+    if not manufacture_orders_df.empty:
+        manufacture_orders_df['manufacture_date'] = pd.to_datetime(manufacture_orders_df['manufacture_date']).dt.date
+    if not purchase_orders_df.empty:
+        purchase_orders_df['quantity_left'] = purchase_orders_df['purchase_quantity']
+        purchase_orders_df['order_date'] = pd.to_datetime(purchase_orders_df['order_date']).dt.date
+
+    if cutoff_date is not None and not manufacture_orders_df.empty:
+        # only orders manufactured on or before the cutoff; their purchase orders are limited by each order's own date
+        cutoff_date = pd.Timestamp(cutoff_date).date()
+        built = manufacture_orders_df.loc[manufacture_orders_df['manufacture_date'] <= cutoff_date, 'manufacture_order_id']
+        manufacture_orders_df = manufacture_orders_df[manufacture_orders_df['manufacture_order_id'].isin(built)]
+    if ratio_table is None:
+        ratio_table = ProductRatioTable(manufacture_orders_df)
+
+    # Rows of every order, in frame order
+    order_rows = {}
+    columns = ['manufacture_order_id', 'sku', 'product', 'manufacture_quantity', 'manufacture_date']
+    for order_id, sku, product, quantity, manufacture_date in zip(*(manufacture_orders_df[column].tolist() for column in columns)):
+        order_rows.setdefault(int(order_id), []).append((sku, product, quantity, manufacture_date))
+
+    # FIFO queue of every product (stable by order_date) and the remaining quantity of every purchase order row
+    quantity_left = purchase_orders_df['quantity_left'].astype(int).tolist()
+    po_rows = {}  # (purchase_order_id, product) -> row positions
+    product_pos = {}
+    columns = ['purchase_order_id', 'product', 'order_date', 'purchase_unit_price', 'fx_rate']
+    for position, (po_id, product, order_date, unit_price, fx_rate) in enumerate(
+            zip(*(purchase_orders_df[column].tolist() for column in columns))):
+        po_rows.setdefault((str(po_id), product), []).append(position)
+        product_pos.setdefault(product, []).append((order_date, position, str(po_id), float(unit_price), float(fx_rate)))
+    for queue in product_pos.values():
+        queue.sort(key=lambda po: po[0])
+
+    all_manufacture_results = []
+    all_failed_results = []
+
+    import time
+    start_time = time.time()
+    print(f"🚀 Starting processing of {len(order_rows)} manufacture orders at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    processed_count = 0
+    successful_count = 0
+    failed_count = 0
+
+    for order_id, mo_order_data in order_rows.items():
+        processed_count += 1
+        staged_updates = []
+
+        # Progress logging every 100 orders or for specific intervals
+        if processed_count % 100 == 0 or processed_count <= 10:
+            progress_pct = (processed_count / len(order_rows)) * 100
+            print(f"[{processed_count}/{len(order_rows)}] ({progress_pct:.1f}%) Processing MO {order_id}... (Success: {successful_count}, Failed: {failed_count})")
+
+        # Major milestone logging every 1000 orders
+        if processed_count % 1000 == 0:
+            print(f"\n🎯 MILESTONE: {processed_count} orders processed ({(processed_count/len(order_rows)*100):.1f}% complete)")
+            print(f"   📊 Current Stats: ✅ {successful_count} successful, ❌ {failed_count} failed")
+            print("   ⏱️  Process continuing...\n")
+
+        # Step 1: Compute product ratios and required SKU count
+        try:
+            product_ratios, _ = ratio_table.order_ratios(order_id)
+            product_qtys = [(product, quantity) for _, product, quantity, _ in mo_order_data]
+
+            # Check if all products exist in product_ratios
+            missing_products = [product for product, _ in product_qtys if product not in product_ratios]
+            if missing_products:
+                print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: FAILED - Missing products in ratios: {missing_products}")
+                failed_count += 1
+                all_failed_results.extend(_failed_rows(
+                    order_id, mo_order_data, f'Missing product in ratios calculation: {missing_products}'
+                ))
+                continue  # Skip to next order
+
+            required_skus = min(qty // product_ratios[product] for product, qty in product_qtys)
+
+        except ZeroDivisionError as e:
+            print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: FAILED - ZeroDivisionError in ratio calculation: {e}")
+            failed_count += 1
+            required_skus = 0
+        except Exception as e:
+            print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: FAILED - Error in ratio calculation: {e}")
+            failed_count += 1
+            all_failed_results.extend(_failed_rows(order_id, mo_order_data, f'Error in ratio calculation: {str(e)}'))
+            continue  # Skip to next order
+
+        # Step 2: Prepare raw PO pool (no allocation yet) from the product's FIFO queue
+        for sku, product, _, manufacture_date in mo_order_data:
+            sku = str(sku)
+            product = str(product)
+
+            if isinstance(manufacture_date, str):
+                manufacture_date = datetime.strptime(manufacture_date, '%Y-%m-%d').date()
+
+            try:
+                po_cutoff_date = manufacture_date + timedelta(days=PO_LEAD_DAYS)
+                for order_date, position, po_id, unit_price, fx_rate in product_pos.get(product, ()):
+                    if order_date > po_cutoff_date:
+                        break
+                    left = quantity_left[position]
+                    if left <= 0:
+                        continue
+                    staged_updates.append({
+                        'order_id': order_id,
+                        'sku': sku,
+                        'product': product,
+                        'po_id': po_id,
+                        'allocated_qty': left,
+                        'unit_price': unit_price * fx_rate,
+                        'fx_rate': fx_rate,
+                        'cost': left * unit_price * fx_rate,
+                        'completion_date': manufacture_date,
+                        'order_date': order_date
+                    })
+            except Exception as e:
+                print(f"MO {order_id}: Error processing POs for product '{product}': {e}")
+                # Continue with other products rather than failing the entire MO
+
+        # Step 3: Attempt batching
+        try:
+            processed_updates = process_manufacture_batches(order_id, staged_updates, required_skus, product_ratios)
+        except Exception as e:
+            print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: ERROR in batching process: {e}")
+            processed_updates = []
+
+        if processed_updates:
+            for update in processed_updates:
+                all_manufacture_results.append({
+                    'manufacture_order_id': update['order_id'],
+                    'manufacture_batch': update['manufacture_batch'],
+                    'sku': update['sku'],
+                    'product': update['product'],
+                    'fulfilled_by_po': update['po_id'],
+                    'fulfilled_quantity': update['allocated_qty'],
+                    'cost': update['cost'],
+                    'unit_cost': update['unit_price'],
+                    'manufacture_completion_date': update['completion_date'],
+                    'status': 'COMPLETED',
+                    'quantity_left': update['allocated_qty']
+                })
+                # Consumed quantities are no longer available to the next orders
+                for position in po_rows.get((update['po_id'], update['product']), ()):
+                    quantity_left[position] -= update['allocated_qty']
+
+            successful_count += 1
+            if processed_count % 100 == 0 or processed_count <= 10:
+                print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: SUCCESS - Collected {len(processed_updates)} manufacture results for batch processing")
+        else:
+            print(f"[{processed_count}/{len(order_rows)}] MO {order_id}: FAILED - Insufficient stock or batching failed")
+            failed_count += 1
+            all_failed_results.extend(_failed_rows(order_id, mo_order_data, 'Insufficient stock to fulfill order'))
+
+    purchase_orders_df['quantity_left'] = quantity_left
+
+    # Final processing summary
+    duration = time.time() - start_time
+    print(f"\n🎉 === PROCESSING COMPLETE ===")
+    print(f"⏱️  Total Duration: {duration:.2f} seconds ({duration/60:.1f} minutes)")
+    print(f"📦 Total Orders Processed: {processed_count}")
+    print(f"✅ Successful: {successful_count}")
+    print(f"❌ Failed: {failed_count}")
+    print(f"📊 Success Rate: {(successful_count/processed_count*100):.1f}%" if processed_count > 0 else "N/A")
+    print(f"⚡ Processing Speed: {(processed_count/duration):.1f} orders/second" if duration > 0 else "N/A")
+
+    return {
+        'manufactureresult': all_manufacture_results,
+        'failedmanufactureresult': all_failed_results,
+        'total_processed': processed_count,
+        'successful': successful_count,
+        'failed': failed_count,
+        'success_rate': round((successful_count/processed_count*100), 1) if processed_count > 0 else 0
+    }
+
+
+def exchange_stock(manufacture_results_df, stock_exchanges_df, ratio_table):
+    """
+    Move manufactured stock from sku_original to sku_new for every stock exchange, in frame order
+
+    An exchange draws whole manufacture batches of the original SKU completed on or before its date, newest first,
+    and creates one batch of the new SKU per batch drawn (manufacture_order_id -2, -3, ...). Exchanges that cannot be
+    fully fulfilled change nothing and are returned as failed.
+
+    Args:
+        manufacture_results_df: manufactureresult rows with result_id, ordered by result_id, dates as dates
+        stock_exchanges_df: sku_original, sku_new, quantity, exchange_date rows, ordered by exchange_date
+        ratio_table: ProductRatioTable giving the product ratios of the manufacture orders
+
+    Returns:
+        dict: manufactureresult, the rows after the exchanges (new rows get the next result_ids); updated and
+              inserted, the result_ids of the stored rows drawn from and of the new rows; failedstockexchange, the
+              rows to insert
+    """
+    rows = {column: manufacture_results_df[column].tolist() for column in manufacture_results_df.columns}
+    rows_by_sku = {}
+    for position, sku in enumerate(rows['sku']):
+        rows_by_sku.setdefault(sku, []).append(position)
+    next_result_id = int(max(rows['result_id'], default=0)) + 1
+    stored_rows = len(rows['result_id'])
+    updated, failed = set(), []
+
+    mo_number = -2
+    columns = ['sku_original', 'sku_new', 'quantity', 'exchange_date']
+    for sku_original, sku_new, exchange_quantity, exchange_date in zip(*(stock_exchanges_df[column].tolist() for column in columns)):
+        remaining_qty = exchange_quantity
+        staged_updates = []
+
+        # Stock of the original SKU available on the exchange date, newest batch first
+        available = [
+            position for position in rows_by_sku.get(sku_original, ())
+            if rows['quantity_left'][position] > 0 and rows['manufacture_completion_date'][position] <= exchange_date
+        ]
+        available.sort(key=lambda position: (
+            rows['manufacture_completion_date'][position], rows['manufacture_batch'][position],
+            rows['manufacture_order_id'][position]
+        ), reverse=True)
+        if not available:
+            failed.append({'sku_original': sku_original, 'sku_new': sku_new, 'quantity': exchange_quantity, 'exchange_date': exchange_date})
+            print(f"Failed to process exchange of {sku_original}. No available stock found")
+            continue
+
+        # Group results by MO ID and batch
+        grouped_results = {}
+        for position in available:
+            grouped_results.setdefault((rows['manufacture_order_id'][position], rows['manufacture_batch'][position]), []).append(position)
+
+        batch_number = 1
+        for (mo_id, batch), group in grouped_results.items():
+            if remaining_qty <= 0:
+                break
+
+            # Find how much we can consume from this group
+            product_ratios, _ = ratio_table.order_ratios(mo_id)
+            min_available = float('inf')
+            for position in group:
+                product = rows['product'][position]
+                if product in product_ratios:
+                    min_available = min(min_available, int(rows['fulfilled_quantity'][position]) // product_ratios[product])
+
+            to_consume = min(remaining_qty, min_available)
+            if to_consume <= 0:
+                continue
+
+            for position in group:
+                product = rows['product'][position]
+                if product in product_ratios:
+                    consume_qty = to_consume * product_ratios[product]
+                    unit_cost = rows['unit_cost'][position]
+                    staged_updates.append(('update', position, consume_qty, rows['cost'][position] - consume_qty * unit_cost))
+                    staged_updates.append(('insert', {
+                        'manufacture_order_id': mo_number,
+                        'manufacture_batch': batch_number,
+                        'sku': sku_new,
+                        'product': product,
+                        'fulfilled_by_po': rows['fulfilled_by_po'][position],
+                        'fulfilled_quantity': consume_qty,
+                        'cost': consume_qty * unit_cost,
+                        'unit_cost': unit_cost,
+                        'manufacture_completion_date': exchange_date,
+                        'status': 'COMPLETED',
+                        'quantity_left': consume_qty
+                    }))
+
+            remaining_qty -= to_consume
+            batch_number = batch_number + 1
+        mo_number = mo_number - 1
+
+        # Only apply the updates if the exchange can be fully fulfilled
+        if remaining_qty > 0:
+            failed.append({'sku_original': sku_original, 'sku_new': sku_new, 'quantity': exchange_quantity, 'exchange_date': exchange_date})
+            continue
+        for update in staged_updates:
+            if update[0] == 'update':
+                _, position, consume_qty, new_cost = update
+                rows['fulfilled_quantity'][position] -= consume_qty
+                rows['quantity_left'][position] -= consume_qty
+                rows['cost'][position] = new_cost
+                if position < stored_rows:
+                    updated.add(rows['result_id'][position])
+            else:
+                new_row = {**update[1], 'result_id': next_result_id}
+                next_result_id += 1
+                for column, values in rows.items():
+                    values.append(new_row.get(column))
+                rows_by_sku.setdefault(sku_new, []).append(len(rows['result_id']) - 1)
+
+    return {
+        'manufactureresult': pd.DataFrame(rows, columns=manufacture_results_df.columns),
+        'updated': sorted(updated),
+        'inserted': rows['result_id'][stored_rows:],
+        'failedstockexchange': failed
+    }
@@ -0,0 +1,292 @@
+"""
+What-if simulation of manufacture results, stock exchanges and COGS, entirely in memory
+The engine inputs are read once per data version and memoized in the dashboard computation graph together with the
+baseline run; a simulation applies its overlays (added, changed or removed purchase orders, sales and stock exchanges)
+to copies of those frames, runs the same engines as the generate routes and compares COGS and inventory per SKU with
+the baseline. Nothing is written to the database
+"""
+
+import pandas as pd
+from sqlalchemy import text
+from backend import db
+from backend.processing.functions.dashboard_graph import dashboard_graph
+from backend.processing.functions.pipeline_timing import pipeline_timer
+from backend.processing.functions.fifo_lots import ProductRatioTable
+from backend.processing.functions.fifo_manufacture import build_manufacture_results, exchange_stock
+from backend.processing.functions.fifo_cogs import allocate_sales
+
+
+def _date(value):
+    day = pd.Timestamp(value)
+    if pd.isna(day):  # None, '' and NaN parse to NaT
+        raise ValueError(f"{value!r} is not a date")
+    return day.date()
+
+
+# table -> (query in the order the generate routes read it, date column)
+INPUTS = {
+    'purchaseorders': ("SELECT * FROM purchaseorders ORDER BY product, order_date, purchase_order_id", 'order_date'),
+    'manufactureorders': ("""
+        SELECT manufacture_order_id, sku, product, manufacture_quantity, manufacture_date
+        FROM manufactureorders ORDER BY manufacture_order_id, product
+    """, 'manufacture_date'),
+    'stockexchange': ("SELECT id, sku_original, sku_new, quantity, exchange_date FROM stockexchange ORDER BY exchange_date, id", 'exchange_date'),
+    'salesrecords': ("SELECT sales_record_id, sku, quantity_sold, sales_date FROM salesrecords ORDER BY sales_date", 'sales_date'),
+    'returns': ("SELECT * FROM returns ORDER BY sku, return_date", 'return_date'),
+    'stockinitiationaddition': ("SELECT * FROM stockinitiationaddition ORDER BY sku, manufacture_completion_date", 'manufacture_completion_date'),
+}
+
+# Overlayable tables: natural key, the columns an overlay row may set (all of them for a new row) and the frame order
+OVERLAYS = {
+    'purchaseorders': (
+        ['purchase_order_id', 'product'],
+        {'purchase_order_id': str, 'product': str, 'order_date': _date, 'purchase_quantity': int, 'purchase_unit_price': float, 'fx_rate': float},
+        ['product', 'order_date', 'purchase_order_id']
+    ),
+    'salesrecords': (
+        ['sales_record_id', 'sku'],
+        {'sales_record_id': str, 'sku': str, 'sales_date': _date, 'quantity_sold': int},
+        ['sales_date']
+    ),
+    'stockexchange': (
+        ['sku_original', 'sku_new', 'exchange_date'],
+        {'sku_original': str, 'sku_new': str, 'exchange_date': _date, 'quantity': int},
+        ['exchange_date']
+    ),
+}
+
+RESULT_COLUMNS = [
+    'manufacture_order_id', 'manufacture_batch', 'sku', 'product', 'fulfilled_by_po', 'fulfilled_quantity', 'cost',
+    'unit_cost', 'manufacture_completion_date', 'status', 'quantity_left'
+]
+SUMMARY_COLUMNS = ['cogs', 'failed_sales', 'unfulfilled_quantity', 'in_stock_quantity', 'inventory_value']
+AMOUNT_COLUMNS = ('cogs', 'inventory_value')
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Inputs and overlays
+# ---------------------------------------------------------------------------------------------------------------
+@dashboard_graph.node(tables=list(INPUTS))
+def simulation_inputs():
+    """Input frames of the engines, one per INPUTS table in that order, with dates as dates"""
+    frames = []
+    for table, (query, date_column) in INPUTS.items():
+        frame = pd.read_sql_query(text(query), db.session.connection())
+        frame[date_column] = pd.to_datetime(frame[date_column]).dt.date
+        frames.append(frame)
+    return tuple(frames)
+
+
+def apply_overlay(frame, table, overlay):
+    """
+    Copy of an input frame with one table's overlay applied
+
+    Args:
+        overlay: {'upsert': [rows], 'delete': [rows]}; an upserted row sets the given columns of the row with its key
+                 or, when there is none, is added and must give every column of OVERLAYS; a deleted row gives the key
+
+    Returns:
+        tuple: (frame in engine order, {'updated', 'added', 'deleted'} row counts)
+
+    Raises:
+        ValueError: unknown columns, missing or invalid values, or a deleted key without a row
+    """
+    key_columns, converters, order = OVERLAYS[table]
+    if not isinstance(overlay, dict) or set(overlay) - {'upsert', 'delete'}:
+        raise ValueError(f"The {table} overlay takes 'upsert' and 'delete' lists of rows")
+
+    def parse(row, required):
+        if not isinstance(row, dict):
+            raise ValueError(f"{table} overlay rows must be objects, got {row!r}")
+        unknown = sorted(set(row) - set(converters))
+        if unknown:
+            raise ValueError(f"{table} overlays cannot set {unknown}; allowed columns are {list(converters)}")
+        missing = [column for column in required if row.get(column) is None]
+        if missing:
+            raise ValueError(f"{table} overlay row {row} is missing {missing}")
+        nulls = [column for column, value in row.items() if value is None]
+        if nulls:
+            raise ValueError(f"{table} overlay row {row} sets {nulls} to null")
+        try:
+            return {column: converters[column](value) for column, value in row.items()}
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid {table} overlay row {row}: {e}")
+
+    rows = {column: frame[column].tolist() for column in frame.columns}
+    positions = {key: position for position, key in enumerate(zip(*(rows[column] for column in key_columns)))}
+    counts = {'updated': 0, 'added': 0, 'deleted': 0}
+
+    for row in overlay.get('upsert', []):
+        row = parse(row, key_columns)
+        key = tuple(row[column] for column in key_columns)
+        position = positions.get(key)
+        if position is None:
+            row = parse(row, list(converters))
+            positions[key] = len(rows[key_columns[0]])
+            for column, values in rows.items():
+                values.append(row.get(column))
+            counts['added'] += 1
+        else:
+            for column, value in row.items():
+                rows[column][position] = value
+            counts['updated'] += 1
+
+    deleted = set()
+    for row in overlay.get('delete', []):
+        row = parse(row, key_columns)
+        key = tuple(row[column] for column in key_columns)
+        if key not in positions:
+            raise ValueError(f"No {table} row with {dict(zip(key_columns, key))} to delete")
+        deleted.add(positions.pop(key))
+    counts['deleted'] = len(deleted)
+
+    frame = pd.DataFrame(rows, columns=frame.columns)
+    frame = frame[~frame.index.isin(deleted)]
+    return frame.sort_values(order, kind='stable').reset_index(drop=True), counts
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Engine run and comparison
+# ---------------------------------------------------------------------------------------------------------------
+def run_fifo(inputs, cutoff_date=None):
+    """
+    Run manufacture result generation, stock exchanges and COGS on the input frames without writing anything
+
+    Like the generate routes when cutoff_date is None, like the /inventory/generate snapshot of cutoff_date otherwise.
+    The frames are modified in place.
+
+    Returns:
+        dict: cogs and failedcogs rows; manufactureresult, returns and stockinitiationaddition frames with the
+              quantities left after the sales
+    """
+    purchase_orders_df, manufacture_orders_df, stock_exchanges_df, sales_records_df, returns_df, stock_initiation_df = inputs
+    ratio_table = ProductRatioTable(manufacture_orders_df, database=False)
+
+    manufacture = build_manufacture_results(manufacture_orders_df, purchase_orders_df, cutoff_date, ratio_table)
+    results_df = pd.DataFrame(manufacture['manufactureresult'], columns=RESULT_COLUMNS)
+    results_df.insert(0, 'result_id', range(1, len(results_df) + 1))
+    results_df[['cost', 'unit_cost']] = results_df[['cost', 'unit_cost']].astype(float).round(4)  # as stored, numeric(15, 4)
+
+    if cutoff_date is not None:
+        stock_exchanges_df = stock_exchanges_df[stock_exchanges_df['exchange_date'] <= _date(cutoff_date)]
+        sales_records_df = sales_records_df[sales_records_df['sales_date'] <= _date(cutoff_date)].reset_index(drop=True)
+    results_df = exchange_stock(results_df, stock_exchanges_df, ratio_table)['manufactureresult']
+    results_df[['cost', 'unit_cost']] = results_df[['cost', 'unit_cost']].astype(float).round(4)
+    results_df = results_df.sort_values(['sku', 'manufacture_completion_date', 'result_id'], kind='stable').reset_index(drop=True)
+
+    returns_df['quantity_left'] = returns_df['return_quantity']
+    stock_initiation_df['quantity_left'] = stock_initiation_df['fulfilled_quantity']
+    allocation = allocate_sales(
+        sales_records_df, returns_df, stock_initiation_df, results_df,
+        ProductRatioTable(manufacture_orders_df, results_df, database=False), batch_lots=cutoff_date is not None
+    )
+    return {
+        'cogs': allocation['cogs'],
+        'failedcogs': allocation['failedcogs'],
+        'manufactureresult': results_df,
+        'returns': returns_df,
+        'stockinitiationaddition': stock_initiation_df
+    }
+
+
+def _lots(skus, stock, value):
+    return pd.DataFrame({
+        'sku': pd.Series(skus, dtype=object).to_numpy(), 'stock': pd.Series(stock, dtype='int64').to_numpy(),
+        'value': pd.Series(value, dtype=float).to_numpy()
+    })
+
+
+def sku_summary(run, cutoff_date=None):
+    """
+    COGS, failed sales and inventory per SKU of a run; inventory is valued as /inventory/generate does
+
+    Returns:
+        DataFrame: SUMMARY_COLUMNS indexed by sku
+    """
+    cogs = pd.DataFrame(run['cogs'], columns=['sku', 'cogs'])
+    cogs['cogs'] = cogs['cogs'].astype(float).round(2)  # as stored, numeric(15, 2)
+    failed = pd.DataFrame(run['failedcogs'], columns=['sku', 'failed_quantity'])
+    results_df, returns_df, initiation_df = run['manufactureresult'], run['returns'], run['stockinitiationaddition']
+    if cutoff_date is not None:
+        cutoff_date = _date(cutoff_date)
+        results_df = results_df[results_df['manufacture_completion_date'] <= cutoff_date]
+        returns_df = returns_df[returns_df['return_date'] <= cutoff_date]
+        initiation_df = initiation_df[initiation_df['manufacture_completion_date'] <= cutoff_date]
+
+    # a manufacture batch holds as many SKUs as its scarcest product row
+    batches = results_df.assign(
+        value=results_df['unit_cost'].astype(float) * results_df['quantity_left']
+    ).groupby(['sku', 'manufacture_order_id', 'manufacture_batch']).agg(stock=('quantity_left', 'min'), value=('value', 'sum')).reset_index()
+    lots = pd.concat([
+        _lots(batches['sku'], batches['stock'], batches['value']),
+        _lots(initiation_df['sku'], initiation_df['quantity_left'], initiation_df['unit_cost'].astype(float) * initiation_df['quantity_left']),
+        _lots(returns_df['sku'], returns_df['quantity_left'], returns_df['return_unit_price'].astype(float) * returns_df['quantity_left']),
+    ])
+    inventory = lots.groupby('sku')[['stock', 'value']].sum()
+
+    summary = pd.concat([
+        cogs.groupby('sku')['cogs'].sum(),
+        failed.groupby('sku')['failed_quantity'].agg(['count', 'sum']).set_axis(['failed_sales', 'unfulfilled_quantity'], axis=1),
+        inventory.set_axis(['in_stock_quantity', 'inventory_value'], axis=1),
+    ], axis=1)
+    return summary.reindex(columns=SUMMARY_COLUMNS).astype(float).fillna(0)
+
+
+@dashboard_graph.node(depends_on=['simulation_inputs'])
+def simulation_baseline(cutoff_date=None):
+    """sku_summary of the stored inputs"""
+    return sku_summary(run_fifo(list(simulation_inputs()), cutoff_date), cutoff_date)
+
+
+def _values(row):
+    return {column: round(float(row[column]), 2) if column in AMOUNT_COLUMNS else int(row[column]) for column in SUMMARY_COLUMNS}
+
+
+def simulate(overlays, cutoff_date=None):
+    """
+    Simulate COGS and inventory with overlays applied to the stored purchase orders, sales and stock exchanges
+
+    Args:
+        overlays: table -> overlay (see apply_overlay) for the OVERLAYS tables
+        cutoff_date: simulate the inventory snapshot of that date instead of the full generation
+
+    Returns:
+        dict: totals and skus (the SKUs whose figures change) with baseline, scenario and delta figures; overlays,
+              the rows changed per table
+
+    Raises:
+        ValueError: an invalid overlay
+    """
+    if not isinstance(overlays, dict) or set(overlays) - set(OVERLAYS):
+        raise ValueError(f"Overlays are given per table, one of {list(OVERLAYS)}")
+    cutoff_date = _date(cutoff_date).isoformat() if cutoff_date else None  # one baseline cache entry per date
+
+    with pipeline_timer.span('load') as load:
+        inputs = list(simulation_inputs())
+        load.rows = sum(len(frame) for frame in inputs)
+    with pipeline_timer.span('baseline'):
+        baseline = simulation_baseline(cutoff_date)
+
+    with pipeline_timer.span('overlay'):
+        changed = {}
+        for table, overlay in overlays.items():
+            position = list(INPUTS).index(table)
+            inputs[position], changed[table] = apply_overlay(inputs[position], table, overlay)
+    with pipeline_timer.span('scenario', rows=len(inputs[list(INPUTS).index('salesrecords')])):
+        scenario = sku_summary(run_fifo(inputs, cutoff_date), cutoff_date) if changed else baseline
+
+    skus = baseline.index.union(scenario.index)
+    baseline, scenario = baseline.reindex(skus, fill_value=0), scenario.reindex(skus, fill_value=0)
+    delta = scenario - baseline
+    moved = delta.index[(delta.abs() >= 0.005).any(axis=1)]
+    return {
+        'as_of_date': cutoff_date,
+        'overlays': changed,
+        'totals': {
+            'baseline': _values(baseline.sum()), 'scenario': _values(scenario.sum()), 'delta': _values(delta.sum())
+        },
+        'skus': [
+            {'sku': sku, 'baseline': _values(baseline.loc[sku]), 'scenario': _values(scenario.loc[sku]), 'delta': _values(delta.loc[sku])}
+            for sku in moved
+        ]
+    }
@@ -0,0 +1,187 @@
+"""
+Per-phase timing for the generate pipelines
+A run is a tree of named spans (fetch / allocate / write ...) with durations and row counts; finished runs are printed
+as one JSON line, aggregated per phase for the /metrics route and, when asked for, profiled with cProfile
+"""
+
+import os
+import io
+import json
+import time
+import cProfile
+import pstats
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from flask import has_request_context, request
+
+PIPELINE_RUNS_KEPT = int(os.getenv('PIPELINE_RUNS_KEPT', '50'))
+PIPELINE_PROFILE_DIR = os.getenv('PIPELINE_PROFILE_DIR')  # profiled runs are also dumped here as .prof files when set
+PROFILE_TOP_FUNCTIONS = 30
+
+
+class Span:
+    """One timed phase; rows is the number of rows it read or wrote, if known"""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.children = []
+        self.error = None
+        self.seconds = None
+        self._started = time.perf_counter()
+
+    def add_rows(self, rows):
+        self.rows = (self.rows or 0) + int(rows)
+
+    def to_dict(self):
+        span = {'name': self.name, 'seconds': round(self.seconds, 4) if self.seconds is not None else None}
+        if self.rows is not None:
+            span['rows'] = int(self.rows)
+        if self.error:
+            span['error'] = self.error
+        if self.children:
+            span['phases'] = [child.to_dict() for child in self.children]
+        return span
+
+
+def _response_error(result):
+    # routes return (jsonify(...), status); a 4xx / 5xx marks the run as failed
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int) and result[1] >= 400:
+        payload = result[0].get_json(silent=True) if hasattr(result[0], 'get_json') else None
+        return str(payload.get('error', result[1]))[:300] if isinstance(payload, dict) else str(result[1])
+    return None
+
+
+class PipelineTimer:
+    """
+    Collects span trees per thread and keeps the last runs plus per-phase aggregates for the process
+
+    Args:
+        runs_kept: number of finished runs kept for /metrics/pipeline_runs
+    """
+
+    def __init__(self, runs_kept=PIPELINE_RUNS_KEPT):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._runs = deque(maxlen=runs_kept)
+        self._phases = {}  # 'run/phase/...' -> aggregate
+        self._profile_lock = threading.Lock()  # only one cProfile can be active per process
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Spans
+    # ---------------------------------------------------------------------------------------------------------------
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, rows=None, profile=None):
+        """
+        Time a phase; spans opened inside it become its nested phases, the outermost span is the run
+
+        Args:
+            name: phase name, e.g. 'fetch'
+            rows: rows handled by the phase, can also be set later via span.rows / span.add_rows()
+            profile: run cProfile for the whole run; None profiles when the request has ?profile=1
+        """
+        stack = self._stack()
+        span = Span(name, rows)
+        if stack:
+            stack[-1].children.append(span)
+        stack.append(span)
+        profiler = self._start_profiler(profile) if len(stack) == 1 else None
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)[:300]
+            raise
+        finally:
+            span.seconds = time.perf_counter() - span._started
+            stack.pop()
+            if not stack:
+                self._finish(span, profiler)
+
+    def timed(self, name):
+        """Decorator running the function inside span(name); a route's 4xx / 5xx response marks the span as failed"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name) as span:
+                    result = func(*args, **kwargs)
+                    span.error = span.error or _response_error(result)
+                    return result
+            return wrapper
+        return decorator
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Profiling
+    # ---------------------------------------------------------------------------------------------------------------
+    def _start_profiler(self, profile):
+        if profile is None:
+            profile = has_request_context() and request.args.get('profile', '').lower() in ('1', 'true')
+        if not profile or not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler (e.g. a debugger) is already attached
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _stop_profiler(self, profiler, run_name):
+        try:
+            profiler.disable()
+        finally:
+            self._profile_lock.release()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        if PIPELINE_PROFILE_DIR:
+            os.makedirs(PIPELINE_PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PIPELINE_PROFILE_DIR, f"{run_name}_{datetime.now():%Y%m%d_%H%M%S}.prof"))
+        return output.getvalue()
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Results
+    # ---------------------------------------------------------------------------------------------------------------
+    def _finish(self, root, profiler):
+        run = {'finished_at': datetime.now().isoformat(timespec='seconds'), **root.to_dict()}
+        print(json.dumps({'event': 'pipeline_run', **run}), flush=True)
+        if profiler is not None:
+            run['profile'] = self._stop_profiler(profiler, root.name)
+
+        with self._lock:
+            self._runs.append(run)
+            pending = [(root.name, root)]
+            while pending:
+                path, span = pending.pop()
+                entry = self._phases.setdefault(path, {'count': 0, 'errors': 0, 'rows': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                entry['count'] += 1
+                entry['errors'] += int(span.error is not None)
+                entry['rows'] += int(span.rows or 0)
+                entry['total_seconds'] += span.seconds
+                entry['max_seconds'] = max(entry['max_seconds'], span.seconds)
+                entry['last_seconds'] = span.seconds
+                pending.extend((f"{path}/{child.name}", child) for child in span.children)
+
+    def metrics(self):
+        """Per-phase counts, errors, rows and timings since process start, keyed by 'run/phase/...'"""
+        with self._lock:
+            return {
+                path: {**entry, 'avg_seconds': entry['total_seconds'] / entry['count'] if entry['count'] else 0.0}
+                for path, entry in sorted(self._phases.items())
+            }
+
+    def runs(self, name=None, limit=None):
+        """Most recent finished runs first, optionally only those named name"""
+        with self._lock:
+            runs = [run for run in reversed(self._runs) if name is None or run['name'] == name]
+        return runs[:limit] if limit else runs
+
+
+pipeline_timer = PipelineTimer()
@@ -0,0 +1,197 @@
+"""
+SQL statement timing at the SQLAlchemy engine level
+Every cursor execution is timed and aggregated by a normalized statement fingerprint (literals and bind parameters
+replaced by ?), together with the routes issuing it; statements slower than SLOW_QUERY_SECONDS are printed with their
+parameters, and EXPLAIN plans of the slowest fingerprints can be fetched on demand
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_TIMING_ENABLED = os.getenv('QUERY_TIMING_ENABLED', '1') == '1'
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '1.0'))
+QUERY_TIMING_MAX_FINGERPRINTS = int(os.getenv('QUERY_TIMING_MAX_FINGERPRINTS', '500'))
+MAX_ROUTES_PER_FINGERPRINT = 10
+OTHER_FINGERPRINT = 'other'  # statements beyond QUERY_TIMING_MAX_FINGERPRINTS are counted here
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PARAMETERS = re.compile(r'%\(\w+\)s|%s|(?<![:\w]):\w+|\?')
+_NUMBERS = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(statement):
+    """Statement text with comments, literals and bind parameters collapsed, so one query shape is one fingerprint"""
+    normalized = _COMMENTS.sub(' ', statement)
+    normalized = _STRINGS.sub('?', normalized)
+    normalized = _PARAMETERS.sub('?', normalized)
+    normalized = _NUMBERS.sub('?', normalized)
+    normalized = _LISTS.sub('(?)', normalized)  # IN (?, ?, ?) and VALUES (?, ?)
+    normalized = _VALUES.sub('(?)', normalized)  # multi-row VALUES
+    return _WHITESPACE.sub(' ', normalized).strip().rstrip(';')
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def _current_route():
+    if has_request_context():
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        return f"{request.method} {rule}"
+    return 'no request'
+
+
+def _short_repr(parameters, limit=1000):
+    text_value = repr(parameters)
+    return text_value if len(text_value) <= limit else text_value[:limit] + '...'
+
+
+class QueryTimer:
+    """
+    Per-process aggregates of statement timings keyed by fingerprint
+
+    Args:
+        slow_seconds: executions at least this long are printed as slow_query log lines
+        max_fingerprints: distinct fingerprints tracked before new ones are counted under 'other'
+    """
+
+    def __init__(self, slow_seconds=SLOW_QUERY_SECONDS, max_fingerprints=QUERY_TIMING_MAX_FINGERPRINTS):
+        self.slow_seconds = slow_seconds
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._statements = {}  # fingerprint -> aggregate
+        self._installed = False
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Engine events
+    # ---------------------------------------------------------------------------------------------------------------
+    def install(self):
+        """Listen on every Engine; called once from backend/__init__.py"""
+        if self._installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._installed = True
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_timing_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_timing_started', None)
+        if started is None or conn.get_execution_options().get('skip_query_timing'):
+            return
+        seconds = time.perf_counter() - started
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        self.record(statement, parameters, seconds, rows, executemany, _current_route())
+
+    def record(self, statement, parameters, seconds, rows=None, executemany=False, route='no request'):
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_fingerprints:
+                    key, normalized = OTHER_FINGERPRINT, OTHER_FINGERPRINT
+                    entry = self._statements.get(key)
+                if entry is None:
+                    entry = self._statements[key] = {
+                        'fingerprint': key, 'statement': normalized[:2000], 'count': 0, 'slow_count': 0, 'rows': 0,
+                        'total_seconds': 0.0, 'max_seconds': 0.0, 'routes': {}, 'slowest': None
+                    }
+            entry['count'] += 1
+            entry['rows'] += rows or 0
+            entry['total_seconds'] += seconds
+            if route in entry['routes'] or len(entry['routes']) < MAX_ROUTES_PER_FINGERPRINT:
+                entry['routes'][route] = entry['routes'].get(route, 0) + 1
+            if seconds >= entry['max_seconds']:
+                entry['max_seconds'] = seconds
+                # kept with the original parameters so the slowest execution can be EXPLAINed later
+                entry['slowest'] = {'statement': statement, 'parameters': None if executemany else parameters, 'route': route}
+            slow = seconds >= self.slow_seconds
+            if slow:
+                entry['slow_count'] += 1
+
+        if slow:
+            print(json.dumps({
+                'event': 'slow_query',
+                'seconds': round(seconds, 4),
+                'rows': rows,
+                'route': route,
+                'fingerprint': key,
+                'executemany': executemany,
+                'statement': statement[:4000],
+                'parameters': _short_repr(parameters[:1] if executemany else parameters)
+            }, default=str), flush=True)
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Results
+    # ---------------------------------------------------------------------------------------------------------------
+    def top(self, limit=20, sort='total_seconds'):
+        """Fingerprints ordered by sort (total_seconds, max_seconds, count or slow_count), slowest first"""
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda entry: entry.get(sort, 0), reverse=True)[:limit]
+            return [
+                {
+                    **{key: value for key, value in entry.items() if key != 'slowest'},
+                    'routes': dict(entry['routes']),
+                    'avg_seconds': entry['total_seconds'] / entry['count'] if entry['count'] else 0.0,
+                    'slowest_route': entry['slowest']['route'] if entry['slowest'] else None
+                }
+                for entry in entries
+            ]
+
+    def summary(self):
+        with self._lock:
+            return {
+                'fingerprints': len(self._statements),
+                'statements': sum(entry['count'] for entry in self._statements.values()),
+                'slow_statements': sum(entry['slow_count'] for entry in self._statements.values()),
+                'total_seconds': sum(entry['total_seconds'] for entry in self._statements.values()),
+                'slow_query_seconds': self.slow_seconds
+            }
+
+    def explain(self, key):
+        """
+        EXPLAIN plan of the slowest recorded execution of a fingerprint
+
+        Only SELECT / WITH statements are explained and the plan is not executed (no ANALYZE).
+
+        Returns:
+            dict: fingerprint and plan lines, or an error message
+        """
+        from backend import db
+
+        with self._lock:
+            entry = self._statements.get(key)
+            slowest = dict(entry['slowest']) if entry and entry['slowest'] else None
+        if slowest is None:
+            return {'fingerprint': key, 'error': 'No recorded execution'}
+        if not re.match(r'\s*(select|with)\b', slowest['statement'], re.I):
+            return {'fingerprint': key, 'error': 'Only SELECT statements are explained'}
+
+        prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        try:
+            with db.engine.connect().execution_options(skip_query_timing=True) as conn:
+                result = conn.exec_driver_sql(prefix + slowest['statement'], slowest['parameters'] or ())
+                plan = [' | '.join(str(value) for value in row) for row in result]
+                conn.rollback()
+            return {'fingerprint': key, 'plan': plan}
+        except Exception as e:
+            return {'fingerprint': key, 'error': str(e)}
+
+
+query_timer = QueryTimer()
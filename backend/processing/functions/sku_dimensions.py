@@ -0,0 +1,238 @@
+"""
+SKU and product dimension tables shared by the dashboard queries
+skudimension (sku -> brand, main_component) and productdimension (product -> ir, example SKU, brand, main_component)
+are filled incrementally when sales, PO and PnL rows are written, so the dashboards merge on them instead of parsing
+SKU strings and searching the SKU list for every PO product on each request
+"""
+
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text, bindparam
+from backend import db
+from backend.models import SKUDimension, ProductDimension
+from backend.processing.functions.dashboard_graph import dashboard_graph
+from backend.processing.functions.bulk_insert import dialect_insert
+
+IR_EXCEPTIONS = ['ALEG', 'V3520']  # products whose IR is the full product name
+
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Parsing rules
+# ---------------------------------------------------------------------------------------------------------------
+def parse_skus(skus):
+    """
+    Brand and main component of SKUs named <brand>_<main component>_...
+
+    Returns:
+        DataFrame: sku, brand, main_component (main_component is None for SKUs without '_')
+    """
+    skus = pd.Series(list(skus), dtype=object)
+    parsed = pd.DataFrame({'sku': skus})
+    parsed['brand'] = skus.str.split('_', n=1).str[0]
+    parsed['main_component'] = skus.where(skus.str.contains('_', na=False)).str.split('_').str[1]
+    return parsed
+
+
+def product_ir(product):
+    """IR of a purchased product: the product name without its last '-' suffix, except for IR_EXCEPTIONS"""
+    if isinstance(product, str) and any(product.startswith(prefix) for prefix in IR_EXCEPTIONS):
+        return product  # keep original
+    return product.rsplit('-', 1)[0] if isinstance(product, str) and '-' in product else product
+
+
+def resolve_products(products, sku_dimensions):
+    """
+    Match products to their first SKU containing the IR (case-insensitive), one search per distinct IR
+
+    Args:
+        products: iterable of product names
+        sku_dimensions: DataFrame with sku, brand, main_component
+
+    Returns:
+        DataFrame: product, ir, sku_one_example, brand, main_component
+    """
+    resolved = pd.DataFrame({'product': pd.Series(list(products), dtype=object)})
+    resolved['ir'] = resolved['product'].map(product_ir)
+
+    skus = sku_dimensions.sort_values('sku').reset_index(drop=True)
+    upper_skus = skus['sku'].str.upper()
+    ir_to_sku = {}
+    for ir in resolved['ir'].dropna().unique():
+        matched = skus['sku'][upper_skus.str.contains(ir.upper(), regex=False, na=False)]
+        ir_to_sku[ir] = matched.iloc[0] if not matched.empty else None
+    resolved['sku_one_example'] = resolved['ir'].map(ir_to_sku)
+
+    components = skus.set_index('sku')
+    resolved['brand'] = resolved['sku_one_example'].map(components['brand'])
+    resolved['main_component'] = resolved['sku_one_example'].map(components['main_component'])
+    return resolved
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Write-time maintenance
+# ---------------------------------------------------------------------------------------------------------------
+def _existing(column, table, values):
+    statement = text(f"SELECT {column} FROM {table} WHERE {column} IN :values").bindparams(bindparam('values', expanding=True))
+    return {row[0] for row in db.session.execute(statement, {'values': list(values)})}
+
+
+def register_skus(skus):
+    """
+    Add SKUs not yet in skudimension, then resolve products that were waiting for a matching SKU
+
+    Called after sales records or All Orders PnL rows are committed; failures are printed and do not affect the write.
+
+    Returns:
+        int: number of new SKUs
+    """
+    try:
+        skus = {sku for sku in skus if isinstance(sku, str) and sku}
+        new_skus = sorted(skus - _existing('sku', 'skudimension', skus)) if skus else []
+        if not new_skus:
+            return 0
+
+        rows = parse_skus(new_skus)
+        rows['updated_at'] = datetime.utcnow()
+        insert = dialect_insert()
+        db.session.execute(insert(SKUDimension.__table__).on_conflict_do_nothing(index_elements=['sku']), _records(rows))
+        _update_unresolved_products()
+        db.session.commit()
+        return len(new_skus)
+    except Exception as e:
+        print(f"SKU dimension update failed: {e}")
+        db.session.rollback()
+        return 0
+
+
+def register_products(products):
+    """
+    Add purchased products not yet in productdimension, resolved against the known SKUs
+
+    Called after purchase orders are committed; failures are printed and do not affect the write.
+
+    Returns:
+        int: number of new products
+    """
+    try:
+        products = {product for product in products if isinstance(product, str) and product}
+        new_products = sorted(products - _existing('product', 'productdimension', products)) if products else []
+        if not new_products:
+            return 0
+
+        rows = resolve_products(new_products, _load_sku_dimensions())
+        rows['updated_at'] = datetime.utcnow()
+        insert = dialect_insert()
+        db.session.execute(insert(ProductDimension.__table__).on_conflict_do_nothing(index_elements=['product']), _records(rows))
+        db.session.commit()
+        return len(new_products)
+    except Exception as e:
+        print(f"Product dimension update failed: {e}")
+        db.session.rollback()
+        return 0
+
+
+def _update_unresolved_products():
+    unresolved = [row[0] for row in db.session.execute(text("SELECT product FROM productdimension WHERE sku_one_example IS NULL"))]
+    if not unresolved:
+        return
+    rows = resolve_products(unresolved, _load_sku_dimensions())
+    rows = rows[rows['sku_one_example'].notna()]
+    if rows.empty:
+        return
+    rows['updated_at'] = datetime.utcnow()
+    db.session.execute(text("""
+        UPDATE productdimension
+        SET sku_one_example = :sku_one_example, brand = :brand, main_component = :main_component, updated_at = :updated_at
+        WHERE product = :product
+    """), _records(rows[['product', 'sku_one_example', 'brand', 'main_component', 'updated_at']]))
+
+
+def backfill_dimensions():
+    """Register every SKU and product already in allorderspnl, salesrecords and purchaseorders"""
+    register_skus(row[0] for row in db.session.execute(text("""
+        SELECT sku FROM allorderspnl WHERE sku IS NOT NULL
+        UNION
+        SELECT sku FROM salesrecords WHERE sku IS NOT NULL
+    """)))
+    register_products(row[0] for row in db.session.execute(text("SELECT DISTINCT product FROM purchaseorders")))
+
+
+def rebuild_dimensions():
+    """Drop and rebuild both dimension tables, e.g. after the parsing rules change"""
+    db.session.execute(text("DELETE FROM productdimension"))
+    db.session.execute(text("DELETE FROM skudimension"))
+    db.session.commit()
+    backfill_dimensions()
+    dashboard_graph.invalidate()
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Dashboard lookups
+# ---------------------------------------------------------------------------------------------------------------
+def _load_sku_dimensions():
+    return pd.DataFrame(
+        db.session.execute(text("SELECT sku, brand, main_component FROM skudimension")).mappings().all(),
+        columns=['sku', 'brand', 'main_component']
+    )
+
+
+def _backfill_if_empty(table):
+    # deployments that predate the dimension tables are backfilled on first read
+    if db.session.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None:
+        backfill_dimensions()
+
+
+@dashboard_graph.node(tables=['skudimension'])
+def get_sku_dimensions():
+    """sku, brand, main_component of every known SKU"""
+    _backfill_if_empty('skudimension')
+    return _load_sku_dimensions()
+
+
+@dashboard_graph.node(tables=['productdimension'], depends_on=['get_sku_dimensions'])
+def get_product_dimensions():
+    """product, ir, brand, main_component of every purchased product"""
+    _backfill_if_empty('productdimension')
+    return pd.DataFrame(
+        db.session.execute(text("SELECT product, ir, brand, main_component FROM productdimension")).mappings().all(),
+        columns=['product', 'ir', 'brand', 'main_component']
+    )
+
+
+def _assign(df, keys, lookup, columns):
+    for column in columns:
+        df[column] = keys.map(lookup[column]).astype(object).where(lambda values: values.notna(), None)
+    return df
+
+
+def attach_sku_dimensions(df, sku_column='sku', columns=('brand', 'main_component')):
+    """
+    Add brand / main_component columns to df from skudimension
+
+    SKUs missing from the dimension (e.g. statement-only SKUs) are parsed on the fly.
+    """
+    lookup = get_sku_dimensions().set_index('sku')
+    skus = df[sku_column]
+    missing = skus[skus.notna() & ~skus.isin(lookup.index)].unique()
+    if len(missing):
+        lookup = pd.concat([lookup, parse_skus(missing).set_index('sku')])
+    return _assign(df, skus, lookup, columns)
+
+
+def attach_product_dimensions(df, product_column='product', columns=('brand', 'main_component')):
+    """
+    Add brand / main_component columns to df from productdimension
+
+    Products missing from the dimension are resolved on the fly against the known SKUs.
+    """
+    lookup = get_product_dimensions().set_index('product')
+    products = df[product_column]
+    missing = products[products.notna() & ~products.isin(lookup.index)].unique()
+    if len(missing):
+        resolved = resolve_products(missing, get_sku_dimensions()).set_index('product')
+        lookup = pd.concat([lookup, resolved[lookup.columns]])
+    return _assign(df, products, lookup, columns)
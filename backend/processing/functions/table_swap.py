@@ -0,0 +1,218 @@
+"""
+Replacement of a generated table's rows, optionally through a shadow table swapped in at the end
+By default the table is cleared with one DELETE and loaded in place in the writing transaction; PostgreSQL readers keep
+seeing the previous rows until it commits (MVCC). With TABLE_SWAP_ENABLED=1, on PostgreSQL the new rows are loaded into
+<table>__shadow, created like the table (columns, defaults, generated columns, check constraints and indexes, then its
+foreign keys, owner, privileges, row-level security policies, replica identity and publications), and the shadow
+replaces the table by DROP and RENAME: the rebuild streams the rows in with COPY and leaves no dead rows to vacuum.
+Tables that views, triggers or foreign keys of other tables depend on are always loaded in place. The change log gets
+what the DELETE and INSERT statements used to record: a table-wide delete and the inserted rows
+"""
+
+import os
+import re
+from sqlalchemy import Table, MetaData, Column, text
+from backend import db
+from backend.processing.functions.bulk_insert import copy_frame, insert_frame
+from backend.processing.functions.change_log import change_tracker
+
+TABLE_SWAP_ENABLED = os.getenv('TABLE_SWAP_ENABLED', '0') == '1'  # 1 = rebuild PostgreSQL tables through shadow swaps
+SHADOW_SUFFIX = '__shadow'
+
+_INDEX_DEFINITION = re.compile(r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ')
+
+
+def _swappable(connection, name):
+    """No view, trigger or foreign key of another table refers to the table (they would follow the dropped one)"""
+    return connection.execute(text("""
+        SELECT 1 FROM pg_constraint WHERE contype = 'f' AND confrelid = CAST(:name AS regclass)
+        UNION ALL
+        SELECT 1 FROM pg_trigger WHERE tgrelid = CAST(:name AS regclass) AND NOT tgisinternal
+        UNION ALL
+        SELECT 1 FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE d.refobjid = CAST(:name AS regclass) AND r.ev_class <> d.refobjid
+        LIMIT 1
+    """), {'name': name}).first() is None
+
+
+def _indexes(connection, name):
+    """Index definition without its name and table -> index name"""
+    rows = connection.execute(text("""
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = CAST(:name AS regclass)
+    """), {'name': name})
+    return {_INDEX_DEFINITION.sub(r'\1', definition): index for index, definition in rows}
+
+
+def _load_shadow(connection, table, frame):
+    name, shadow_name = table.name, f'{table.name}{SHADOW_SUFFIX}'
+    connection.execute(text(f'DROP TABLE IF EXISTS {shadow_name}'))  # left over by a failed run
+    connection.execute(text(f'CREATE TABLE {shadow_name} (LIKE {name} INCLUDING ALL)'))
+    if not frame.empty:
+        copy_frame(Table(shadow_name, MetaData(), *[Column(column.name, column.type) for column in table.c]), frame)
+
+    # LIKE copies neither foreign keys (checked here once for all rows) nor sequence ownership (dropped with the table)
+    foreign_keys = connection.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' AND conrelid = CAST(:name AS regclass)
+    """), {'name': name}).all()
+    for constraint, definition in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {shadow_name} ADD CONSTRAINT "{constraint}" {definition}'))
+    sequences = connection.execute(text("""
+        SELECT attname, pg_get_serial_sequence(:name, attname)
+        FROM pg_attribute WHERE attrelid = CAST(:name AS regclass) AND attnum > 0 AND NOT attisdropped
+    """), {'name': name}).all()
+    for column, sequence in sequences:
+        if sequence is not None:
+            connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {shadow_name}."{column}"'))
+    _copy_access(connection, name, shadow_name)
+    connection.execute(text(f'ANALYZE {shadow_name}'))
+
+
+def _ddl(connection, statement):
+    # statements embed catalog text (policy expressions, quoted names): keep its colons from reading as bind params
+    connection.execute(text(statement.replace(':', '\\:')))
+
+
+_POLICY_COMMANDS = {'*': 'ALL', 'r': 'SELECT', 'a': 'INSERT', 'w': 'UPDATE', 'd': 'DELETE'}
+
+
+def _grants(connection, acl, name, column=None):
+    # (privilege, grantee, grantable) of an aclitem[] expression over the table's pg_class c / pg_attribute a row
+    return connection.execute(text(f"""
+        SELECT x.privilege_type, CASE WHEN x.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(x.grantee)) END,
+               x.is_grantable
+        FROM pg_class c LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = :column, aclexplode({acl}) x
+        WHERE c.oid = CAST(:name AS regclass)
+    """), {'name': name, 'column': column}).all()
+
+
+def _copy_access(connection, name, shadow_name):
+    """Owner, privileges, row-level security, replica identity and publications of the table onto its shadow"""
+    # LIKE copies none of them; without this the renamed shadow would lose its grants, policies and replication
+    owner, row_security, force_row_security, replica_identity = connection.execute(text("""
+        SELECT quote_ident(pg_get_userbyid(relowner)), relrowsecurity, relforcerowsecurity, relreplident
+        FROM pg_class WHERE oid = CAST(:name AS regclass)
+    """), {'name': name}).one()
+    _ddl(connection, f'ALTER TABLE {shadow_name} OWNER TO {owner}')
+
+    # table privileges (a NULL acl stands for the owner's default one), then column privileges
+    table_acl = "COALESCE(c.relacl, acldefault('r', c.relowner))"
+    for grantee in {grantee for _, grantee, _ in _grants(connection, table_acl, shadow_name)}:
+        _ddl(connection, f'REVOKE ALL ON {shadow_name} FROM {grantee}')
+    for privilege, grantee, grantable in _grants(connection, table_acl, name):
+        _ddl(connection, f'GRANT {privilege} ON {shadow_name} TO {grantee}' + (' WITH GRANT OPTION' if grantable else ''))
+    columns = connection.execute(text("""
+        SELECT attname FROM pg_attribute WHERE attrelid = CAST(:name AS regclass) AND attacl IS NOT NULL
+    """), {'name': name}).scalars().all()
+    for column in columns:
+        for privilege, grantee, grantable in _grants(connection, 'a.attacl', name, column):
+            _ddl(
+                connection,
+                f'GRANT {privilege} ("{column}") ON {shadow_name} TO {grantee}' + (' WITH GRANT OPTION' if grantable else '')
+            )
+
+    if row_security:
+        _ddl(connection, f'ALTER TABLE {shadow_name} ENABLE ROW LEVEL SECURITY')
+    if force_row_security:
+        _ddl(connection, f'ALTER TABLE {shadow_name} FORCE ROW LEVEL SECURITY')
+    policies = connection.execute(text("""
+        SELECT quote_ident(polname), polpermissive, polcmd,
+               ARRAY(SELECT CASE WHEN r = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(r)) END FROM unnest(polroles) r),
+               pg_get_expr(polqual, polrelid), pg_get_expr(polwithcheck, polrelid)
+        FROM pg_policy WHERE polrelid = CAST(:name AS regclass)
+    """), {'name': name}).all()
+    for policy, permissive, command, roles, using, with_check in policies:
+        _ddl(
+            connection,
+            f'CREATE POLICY {policy} ON {shadow_name} AS {"PERMISSIVE" if permissive else "RESTRICTIVE"} '
+            f'FOR {_POLICY_COMMANDS[command]} TO {", ".join(roles)}'
+            + (f' USING ({using})' if using is not None else '')
+            + (f' WITH CHECK ({with_check})' if with_check is not None else '')
+        )
+
+    if replica_identity == 'f':
+        _ddl(connection, f'ALTER TABLE {shadow_name} REPLICA IDENTITY FULL')
+    elif replica_identity == 'n':
+        _ddl(connection, f'ALTER TABLE {shadow_name} REPLICA IDENTITY NOTHING')
+    elif replica_identity == 'i':
+        shadow_indexes = _indexes(connection, shadow_name)
+        identity = connection.execute(text("""
+            SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = CAST(:name AS regclass) AND x.indisreplident
+        """), {'name': name}).scalar()
+        for definition, index in _indexes(connection, name).items():
+            if index == identity and definition in shadow_indexes:
+                _ddl(connection, f'ALTER TABLE {shadow_name} REPLICA IDENTITY USING INDEX "{shadow_indexes[definition]}"')
+
+    # publications listing the table, with their column lists and row filters (PostgreSQL 15+); FOR ALL TABLES
+    # publications cover the shadow by themselves
+    if int(connection.execute(text('SHOW server_version_num')).scalar()) >= 150000:
+        columns_and_filter = """
+            ARRAY(SELECT quote_ident(attname) FROM pg_attribute WHERE attrelid = r.prrelid AND attnum = ANY(r.prattrs) ORDER BY attnum),
+            pg_get_expr(r.prqual, r.prrelid)"""
+    else:
+        columns_and_filter = "ARRAY[]::text[], NULL"
+    publications = connection.execute(text(f"""
+        SELECT quote_ident(p.pubname), {columns_and_filter}
+        FROM pg_publication_rel r JOIN pg_publication p ON p.oid = r.prpubid
+        WHERE r.prrelid = CAST(:name AS regclass)
+    """), {'name': name}).all()
+    for publication, publication_columns, row_filter in publications:
+        _ddl(
+            connection,
+            f'ALTER PUBLICATION {publication} ADD TABLE {shadow_name}'
+            + (f' ({", ".join(publication_columns)})' if publication_columns else '')
+            + (f' WHERE ({row_filter})' if row_filter is not None else '')
+        )
+
+
+def _swap(connection, table):
+    name, shadow_name = table.name, f'{table.name}{SHADOW_SUFFIX}'
+    index_names = _indexes(connection, name)
+    shadow_index_names = _indexes(connection, shadow_name)
+    connection.execute(text(f'DROP TABLE {name}'))
+    connection.execute(text(f'ALTER TABLE {shadow_name} RENAME TO {name}'))
+    for definition, shadow_index in shadow_index_names.items():
+        if definition in index_names:  # renaming a primary key / unique index renames its constraint too
+            connection.execute(text(f'ALTER INDEX "{shadow_index}" RENAME TO "{index_names[definition]}"'))
+
+
+def replace_tables(frames):
+    """
+    Replace every row of each table with the rows of its frame; the caller commits
+
+    All shadows are loaded before the first swap, so reads of the tables only wait from the swaps to the commit.
+
+    Args:
+        frames: SQLAlchemy Table (e.g. COGS.__table__) -> DataFrame whose columns are table columns (without generated
+                ones); omitted columns take their defaults
+
+    Returns:
+        dict: table name -> rows written
+    """
+    connection = db.session.connection()
+    swapped = []
+    if TABLE_SWAP_ENABLED and connection.dialect.name == 'postgresql':
+        for table in frames:
+            # rebuilds and writes of the table wait for the swap, reads do not
+            connection.execute(text(f'LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE'))
+        swapped = [table for table in frames if _swappable(connection, table.name)]
+        for table in swapped:
+            _load_shadow(connection, table, frames[table])
+            change_tracker.record(table.name, 'delete')
+            change_tracker.record(table.name, 'insert', frames[table])
+        for table in swapped:
+            _swap(connection, table)
+
+    written = {table.name: len(frames[table]) for table in swapped}
+    for table, frame in frames.items():
+        if table.name not in written:
+            db.session.execute(text(f'DELETE FROM {table.name};'))  # recorded by the change log's session events
+            written[table.name] = insert_frame(table, frame)
+    return written
+
+
+def replace_table(table, frame):
+    """replace_tables of one table; returns the rows written"""
+    return replace_tables({table: frame})[table.name]
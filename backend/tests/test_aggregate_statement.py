@@ -0,0 +1,294 @@
+"""
+Cross-check of the single-pass statement sums against the per-column implementations they replaced
+The reference functions below are the previous sum_statement_items_nonReturn / sum_statement_items_Return, kept
+verbatim; both are run on a recorded pivoted statement frame of one PnL month
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from backend.processing.functions.config import must_have_columns_statement_details_pivoted
+from backend.processing.functions.aggregate_statement_no_return import sum_statement_items_nonReturn
+from backend.processing.functions.aggregate_statement_return import sum_statement_items_Return
+
+PNL_MONTH = pd.Timestamp('2024-03-31')
+FIRST_DAY_PNL_MONTH = PNL_MONTH.replace(day=1)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Previous implementations
+# ---------------------------------------------------------------------------------------------------------------
+
+def reference_sum_statement_items_nonReturn(df, PnL_month, first_day_PnL_month):
+
+    df = df[
+        (df['transaction-type'] != 'Refund') &
+        (df['transaction-type'] != 'Chargeback Refund') &
+        (df['transaction-type'] != 'A-to-z Guarantee Refund')
+        ]
+
+    exclude_columns = [
+        'marketplace-name', 
+        'settlement-id', 'settlement-start-date-PST-PDT', 'settlement-end-date-PST-PDT', 
+        'deposit-date-UTC','deposit-date-PST-PDT',
+        'posted-date-time', 'posted-date-UTC','posted-date-PST-PDT', 
+        'transaction-type',
+        'order-id', 'sku',
+        'all order PnL Date', 'sku', 'quantity-purchased'
+        ]
+
+    # Condition for summing different values (order-related and non-order-related)
+    PnL_month_str = PnL_month.strftime('%Y-%m-%d')
+    order_condition = (df['transaction-type'] == 'Order') & (df['all order PnL Date'] == PnL_month_str)
+    nonorder_condition = (
+        (df['posted-date-PST-PDT'] <= PnL_month) & 
+        (df['posted-date-PST-PDT'] >= first_day_PnL_month)
+        )
+
+    # Items that will appear all the time
+    result = pd.DataFrame({
+        'Sales Principal': [df.loc[order_condition, 'ItemPrice: Principal'].sum()],
+        'Shipping': [df.loc[order_condition, 'ItemPrice: Shipping'].sum()],
+        'Gift Wrap': [df.loc[order_condition, 'ItemPrice: GiftWrap'].sum()],
+        
+        'Sales Tax': [df.loc[order_condition, 'ItemPrice: Tax'].sum()],
+        'Shipping Tax': [df.loc[order_condition, 'ItemPrice: ShippingTax'].sum()],
+        'Gift Wrap Tax': [df.loc[order_condition, 'ItemPrice: GiftWrapTax'].sum()],
+        
+        'Commission': [df.loc[order_condition, 'ItemFees: Commission'].sum()],
+        'FBA Fulfillment Fee': [df.loc[order_condition, 'ItemFees: FBAPerUnitFulfillmentFee'].sum()],
+        'Sales Tax Service Fee': [df.loc[order_condition, 'ItemFees: SalesTaxServiceFee'].sum()],
+
+        'Marketplace Facilitator Tax Principal': [df.loc[order_condition, 'ItemWithheldTax: MarketplaceFacilitatorTax-Principal'].sum()],
+        'Marketplace Facilitator Tax Shipping': [df.loc[order_condition, 'ItemWithheldTax: MarketplaceFacilitatorTax-Shipping'].sum()],
+
+        'FBM Shipping Commission': [df.loc[order_condition, 'ItemFees: ShippingHB'].sum()],
+        'Digital Services Fee': [df.loc[order_condition, 'ItemFees: DigitalServicesFee'].sum()],
+        
+        'Sponsored Products Charge': [df.loc[nonorder_condition, 'Cost of Advertising: TransactionTotalAmount'].sum()],
+        'Product Sales Promotion': [df.loc[order_condition, 'Promotion: Principal'].sum()],
+        'Shipping Promotion': [df.loc[order_condition, 'Promotion: Shipping'].sum()],
+        
+        'FBA Inbound Transportation Fee': [df.loc[nonorder_condition, 'other-transaction: FBAInboundTransportationFee'].sum()],
+        'Subscription Fee': [df.loc[nonorder_condition, 'other-transaction: Subscription Fee'].sum()],
+        'Storage Fee': [df.loc[nonorder_condition, 'other-transaction: Storage Fee'].sum()],
+        })
+
+    always_sum_columns = {
+        'Sales Principal': 'ItemPrice: Principal',
+        'Shipping': 'ItemPrice: Shipping',
+        'Gift Wrap': 'ItemPrice: GiftWrap',
+        'Sales Tax': 'ItemPrice: Tax',
+        'Shipping Tax': 'ItemPrice: ShippingTax',
+        'Gift Wrap Tax': 'ItemPrice: GiftWrapTax',
+        'Commission': 'ItemFees: Commission',
+        'FBA Fulfillment Fee': 'ItemFees: FBAPerUnitFulfillmentFee',
+        'Sales Tax Service Fee': 'ItemFees: SalesTaxServiceFee',
+        'Marketplace Facilitator Tax Principal': 'ItemWithheldTax: MarketplaceFacilitatorTax-Principal',
+        'Marketplace Facilitator Tax Shipping': 'ItemWithheldTax: MarketplaceFacilitatorTax-Shipping',
+        'FBM Shipping Commission': 'ItemFees: ShippingHB',
+        'Digital Services Fee': 'ItemFees: DigitalServicesFee',
+        'Sponsored Products Charge': 'Cost of Advertising: TransactionTotalAmount',
+        'Product Sales Promotion': 'Promotion: Principal',
+        'Shipping Promotion': 'Promotion: Shipping',
+        'FBA Inbound Transportation Fee': 'other-transaction: FBAInboundTransportationFee',
+        'Subscription Fee': 'other-transaction: Subscription Fee',
+        'Storage Fee': 'other-transaction: Storage Fee'
+        }
+    always_sum_columns_names = list(always_sum_columns.values())
+
+    # Handle items that will not appear all the time
+    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
+    for col in remaining_columns:
+        if col in [
+            'ItemFees: ShippingChargeback'
+            ]:
+            col_sum = df.loc[order_condition, col].sum()
+            if col_sum != 0:
+                result[col] = col_sum
+        else:
+            col_sum = df.loc[nonorder_condition, col].sum()
+            if col_sum != 0:
+                result[col] = col_sum
+
+    result = result.T
+    result.columns = ['Statement Values']
+    result = result.reset_index()
+    result = result.rename(columns={'index': 'Statement PnL Items'})
+
+    return result
+
+
+def reference_sum_statement_items_Return(df, PnL_month):
+
+    df = df[
+        (df['transaction-type'] == 'Refund') |
+        (df['transaction-type'] == 'Chargeback Refund') |
+        (df['transaction-type'] == 'A-to-z Guarantee Refund')
+        ]
+
+    exclude_columns = [
+        'marketplace-name', 
+        'settlement-id', 'settlement-start-date-PST-PDT', 'settlement-end-date-PST-PDT', 
+        'deposit-date-UTC','deposit-date-PST-PDT',
+        'posted-date-time', 'posted-date-UTC','posted-date-PST-PDT', 
+        'transaction-type',
+        'order-id', 'sku',
+        'all order PnL Date', 'quantity-purchased'
+        ]
+
+    PnL_month_str = PnL_month.strftime('%Y-%m-%d')
+    order_condition = (df['all order PnL Date'] == PnL_month_str)
+
+    always_sum_columns = {
+        'Refunded Commission': 'ItemFees: Commission',
+        'Refunded FBM Shipping Commission': 'ItemFees: ShippingHB',
+        'Refunded Digital Services Fee': 'ItemFees: DigitalServicesFee',
+        'Refunded Product Promotion': 'Promotion: Principal',
+        'Refunded Shipping Promotion': 'Promotion: Shipping',
+        'Refunded Shipping Chargeback': 'ItemFees: ShippingChargeback',
+        'Refunded Marketplace Facilitator Tax - Principal': 'ItemWithheldTax: MarketplaceFacilitatorTax-Principal',
+        'Refunded Marketplace Facilitator Tax - Shipping': 'ItemWithheldTax: MarketplaceFacilitatorTax-Shipping',
+        'Return Product Revenue Reversal - Shipping': 'ItemPrice: Shipping',
+        'Return Product Revenue Reversal - Gift Wrap': 'ItemPrice: GiftWrap',
+        'Return Product Revenue Reversal - Tax': 'ItemPrice: Tax',
+        'Return Product Revenue Reversal - Shipping Tax':  'ItemPrice: ShippingTax',
+        'Return Product Revenue Reversal - Gift Wrap Tax': 'ItemPrice: GiftWrapTax'
+        }
+    
+    result = pd.DataFrame({
+        col_name: [df.loc[order_condition, col].sum()] if col in df.columns else [0]
+        for col_name, col in always_sum_columns.items()
+    })
+
+    always_sum_columns_names = list(always_sum_columns.values())
+
+    # Handle items that will not appear all the time
+    remaining_columns = df.columns.difference(exclude_columns + always_sum_columns_names, sort=False)
+    for col in remaining_columns:
+        col_sum = df.loc[order_condition, col].sum()
+        if col_sum != 0:
+            result[col] = col_sum
+    if 'ItemPrice: Principal' in result.columns:
+        result = result.drop(columns=['ItemPrice: Principal'])
+
+    result = result.T
+    result.columns = ['Statement Values']
+    result = result.reset_index()
+    result = result.rename(columns={'index': 'Statement PnL Items'})
+    
+    return result
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Recorded statement
+# ---------------------------------------------------------------------------------------------------------------
+# pivoted statement lines (statement_details_pivoted) of two settlements around March 2024: orders of the PnL month
+# and of February, refunds, non-order fees, an order missing from the all orders data and line items outside the
+# must-have columns; amounts not on a line are 0 (pivot fill_value), must-have columns absent from the pivot are NaN
+RECORDED_LINES = [
+    # transaction-type, order-id, sku, all order PnL Date, posted-date-PST-PDT, quantity-purchased, line items
+    ('Order', '111-0000001-0000001', 'SKU-A', '2024-03-31', '2024-03-04 10:15:00', 2, {
+        'ItemPrice: Principal': 39.98, 'ItemPrice: Tax': 3.2, 'ItemFees: Commission': -6.0,
+        'ItemFees: FBAPerUnitFulfillmentFee': -8.14, 'ItemWithheldTax: MarketplaceFacilitatorTax-Principal': -3.2,
+        'Promotion: Principal': -4.0}),
+    ('Order', '111-0000002-0000002', 'SKU-B', '2024-03-31', '2024-03-12 22:40:00', 1, {
+        'ItemPrice: Principal': 24.99, 'ItemPrice: Shipping': 5.99, 'ItemPrice: Tax': 2.5, 'ItemPrice: ShippingTax': 0.6,
+        'ItemFees: Commission': -3.75, 'ItemFees: ShippingHB': -0.9, 'ItemFees: ShippingChargeback': -5.99,
+        'ItemWithheldTax: MarketplaceFacilitatorTax-Principal': -2.5,
+        'ItemWithheldTax: MarketplaceFacilitatorTax-Shipping': -0.6, 'Promotion: Shipping': -5.99}),
+    ('Order', '111-0000003-0000003', 'SKU-A', '2024-02-29', '2024-03-01 03:05:00', 1, {
+        'ItemPrice: Principal': 19.99, 'ItemPrice: Tax': 1.6, 'ItemFees: Commission': -3.0,
+        'ItemFees: FBAPerUnitFulfillmentFee': -4.07, 'ItemFees: DigitalServicesFee': -0.12}),
+    ('Order', '111-0000004-0000004', 'SKU-C', 'Orders not in all order dataset', '2024-03-20 08:00:00', 3, {
+        'ItemPrice: Principal': 59.97, 'ItemFees: Commission': -9.0, 'ItemFees: SalesTaxServiceFee': -0.05}),
+    ('Order', '111-0000005-0000005', 'SKU-B', '2024-03-31', '2024-04-02 11:30:00', 1, {
+        'ItemPrice: Principal': 24.99, 'ItemFees: Commission': -3.75, 'ItemFees: FBAPerUnitFulfillmentFee': -5.4,
+        'other-transaction: Reversal Reimbursement': 12.5}),
+    ('Refund', '111-0000001-0000001', 'SKU-A', '2024-03-31', '2024-03-18 09:00:00', 0, {
+        'ItemPrice: Principal': -19.99, 'ItemPrice: Tax': -1.6, 'ItemFees: Commission': 2.4,
+        'ItemWithheldTax: MarketplaceFacilitatorTax-Principal': 1.6, 'Promotion: Principal': 2.0,
+        'ItemFees: RefundCommission': -0.6}),
+    ('Chargeback Refund', '111-0000002-0000002', 'SKU-B', '2024-03-31', '2024-03-25 14:00:00', 0, {
+        'ItemPrice: Principal': -24.99, 'ItemPrice: Shipping': -5.99, 'ItemFees: ShippingChargeback': 5.99,
+        'ItemFees: ShippingHB': 0.9}),
+    ('A-to-z Guarantee Refund', '111-0000003-0000003', 'SKU-A', '2024-02-29', '2024-03-27 16:45:00', 0, {
+        'ItemPrice: Principal': -19.99, 'ItemFees: Commission': 3.0}),
+    ('Cost of Advertising', None, None, '', '2024-03-15 00:00:00', 0, {
+        'Cost of Advertising: TransactionTotalAmount': -152.37}),
+    ('other-transaction', None, None, '', '2024-03-09 00:00:00', 0, {
+        'other-transaction: Storage Fee': -18.42, 'other-transaction: FBAInboundTransportationFee': -31.6}),
+    ('other-transaction', None, None, '', '2024-03-01 00:00:00', 0, {'other-transaction: Subscription Fee': -39.99}),
+    ('other-transaction', None, 'SKU-A', '', '2024-03-22 00:00:00', 0, {
+        'other-transaction: Reversal Reimbursement': 8.14, 'other-transaction: Disposal Fee': -0.5}),
+    ('other-transaction', None, None, '', '2024-02-28 00:00:00', 0, {'other-transaction: Storage Fee': -17.03}),
+    ('Order', '111-0000006-0000006', 'SKU-C', '2024-03-31', '2024-03-31 23:59:59', 1, {
+        'ItemPrice: Principal': 19.99, 'ItemFees: Commission': -3.0, 'other-transaction: Disposal Fee': -0.25}),
+]
+ABSENT_LINE_ITEMS = ['ItemPrice: GiftWrap', 'ItemPrice: GiftWrapTax']  # not in these settlements: NaN after the pivot
+
+
+def recorded_statement():
+    line_items = [
+        column for column in must_have_columns_statement_details_pivoted
+        if column.startswith(('ItemPrice', 'ItemFees', 'ItemWithheldTax', 'Promotion', 'Cost of', 'other-'))
+    ]
+    extra_line_items = sorted({item for *_, items in RECORDED_LINES for item in items if item not in line_items})
+    rows = []
+    for transaction_type, order_id, sku, pnl_date, posted, quantity, items in RECORDED_LINES:
+        row = {
+            'marketplace-name': 'Amazon.com', 'settlement-id': '11223344556',
+            'settlement-start-date-PST-PDT': pd.Timestamp('2024-02-27'), 'settlement-end-date-PST-PDT': pd.Timestamp('2024-04-05'),
+            'deposit-date-UTC': pd.Timestamp('2024-04-07'), 'deposit-date-PST-PDT': pd.Timestamp('2024-04-06'),
+            'posted-date-time': posted, 'posted-date-UTC': pd.Timestamp(posted) + pd.Timedelta(hours=7),
+            'posted-date-PST-PDT': pd.Timestamp(posted), 'transaction-type': transaction_type,
+            'order-id': order_id, 'all order PnL Date': pnl_date, 'sku': sku, 'quantity-purchased': quantity,
+        }
+        row.update({item: items.get(item, 0.0) for item in line_items + extra_line_items})
+        rows.append(row)
+    statement = pd.DataFrame(rows, columns=must_have_columns_statement_details_pivoted + extra_line_items)
+    statement[ABSENT_LINE_ITEMS] = np.nan
+    return statement
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def statement():
+    return recorded_statement()
+
+
+def test_non_return_sums_match_reference(statement):
+    expected = reference_sum_statement_items_nonReturn(statement, PNL_MONTH, FIRST_DAY_PNL_MONTH)
+    result = sum_statement_items_nonReturn(statement, PNL_MONTH, FIRST_DAY_PNL_MONTH)
+    pd.testing.assert_frame_equal(result, expected)
+    assert {'other-transaction: Reversal Reimbursement', 'other-transaction: Disposal Fee'} <= set(result['Statement PnL Items'])
+
+
+def test_return_sums_match_reference(statement):
+    expected = reference_sum_statement_items_Return(statement, PNL_MONTH)
+    result = sum_statement_items_Return(statement, PNL_MONTH)
+    pd.testing.assert_frame_equal(result, expected)
+    assert 'ItemFees: RefundCommission' in set(result['Statement PnL Items'])
+
+
+def test_return_sums_match_reference_without_optional_columns(statement):
+    # settlements without gift wrap or chargeback lines do not have those columns at all
+    statement = statement.drop(columns=ABSENT_LINE_ITEMS + ['ItemFees: ShippingChargeback'])
+    pd.testing.assert_frame_equal(
+        sum_statement_items_Return(statement, PNL_MONTH), reference_sum_statement_items_Return(statement, PNL_MONTH)
+    )
+
+
+@pytest.mark.parametrize('pnl_month', ['2024-02-29', '2024-04-30'])
+def test_sums_match_reference_for_other_months(statement, pnl_month):
+    pnl_month = pd.Timestamp(pnl_month)
+    first_day = pnl_month.replace(day=1)
+    pd.testing.assert_frame_equal(
+        sum_statement_items_nonReturn(statement, pnl_month, first_day),
+        reference_sum_statement_items_nonReturn(statement, pnl_month, first_day)
+    )
+    pd.testing.assert_frame_equal(
+        sum_statement_items_Return(statement, pnl_month), reference_sum_statement_items_Return(statement, pnl_month)
+    )
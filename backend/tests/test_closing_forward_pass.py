@@ -0,0 +1,153 @@
+"""
+Regression test of simulate_closing_forward_pass against the per-event loop it replaced
+reference_closing_loop is the previous loop of get_AR_AP_by_date_with_statement_shipping_closing_forecast with the FBM
+shipping step fixed to shift the rows after each payment date (it used the stale deposit loop variable forecast_date)
+"""
+
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from backend.evaluate_performance_dashboard_crud import simulate_closing_forward_pass
+
+AR_PAID_RATIO = 0.42
+AP_PAID_TO_AR_PAID_RATIO = 0.31
+FORECAST_START = date(2024, 3, 16)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Previous implementation
+# ---------------------------------------------------------------------------------------------------------------
+def reference_closing_loop(AR_AP_df, deposit_date_list_forecast, AR_paid_ratio_avg_actual, AP_paid_to_AR_paid_ratio_avg_actual, shipping_payment_date_list):
+    AR_AP_df = AR_AP_df.copy()
+    for forecast_date in deposit_date_list_forecast:
+        # Step 1: locate the row with matching deposit_date_pst_pdt
+        row_mask = AR_AP_df['date'] == forecast_date
+        if not row_mask.any():
+            continue  # skip if the row doesn't exist
+
+        row_index = AR_AP_df[row_mask].index[0]  # get the index of the matching row
+
+        # Get current AR/AP cumulative
+        current_AR_cum = AR_AP_df.at[row_index, 'AR_cumulative']
+        current_AP_cum = AR_AP_df.at[row_index, 'AP_cumulative']
+
+        # Step 2 & 3: Calculate closing values
+        AR_closing = current_AR_cum * AR_paid_ratio_avg_actual
+        AP_closing = AR_closing * AP_paid_to_AR_paid_ratio_avg_actual
+
+        # Step 4 & 5: Update current row
+        AR_AP_df.at[row_index, 'AR_closing'] = AR_closing
+        AR_AP_df.at[row_index, 'AP_closing'] = AP_closing
+        AR_AP_df.at[row_index, 'AR_cumulative'] = current_AR_cum - AR_closing
+        AR_AP_df.at[row_index, 'AP_cumulative'] = current_AP_cum - AP_closing
+
+        # Step 6: Update all rows after this row
+        later_rows_mask = AR_AP_df['date'] > forecast_date
+        AR_AP_df.loc[later_rows_mask, 'AR_cumulative'] -= AR_closing
+        AR_AP_df.loc[later_rows_mask, 'AP_cumulative'] -= AP_closing
+    for shipping_payment_date in shipping_payment_date_list:
+        # Step 1: locate the row with matching deposit_date_pst_pdt
+        row_mask = AR_AP_df['date'] == shipping_payment_date
+        if not row_mask.any():
+            continue  # skip if the row doesn't exist
+
+        row_index = AR_AP_df[row_mask].index[0]  # get the index of the matching row
+
+        # Get current AP cumulative
+        current_AP_cum = AR_AP_df.at[row_index, 'AP_cumulative']
+
+        # Step 2 & 3: Get FBM shipping cost forecast and calculate closing values
+        FBM_shipping_monthly_cost = AR_AP_df.at[row_index, 'FBM_shipping_cost_forecast_monthly']
+        current_AP_closing = AR_AP_df.at[row_index, 'AP_closing']
+        AR_AP_df.at[row_index, 'AP_closing'] = current_AP_closing + FBM_shipping_monthly_cost
+
+        # Step 4: Update current row
+        AR_AP_df.at[row_index, 'AP_cumulative'] = current_AP_cum - FBM_shipping_monthly_cost
+        # Step 6: Update all rows after this row
+        later_rows_mask = AR_AP_df['date'] > shipping_payment_date
+        AR_AP_df.loc[later_rows_mask, 'AP_cumulative'] -= FBM_shipping_monthly_cost
+    return AR_AP_df
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Fixture
+# ---------------------------------------------------------------------------------------------------------------
+def daily_AR_AP():
+    """Daily AR/AP of Jan - Jun 2024 with actual deposits every 14 days until mid-March and no row on 2024-05-05"""
+    dates = [date(2024, 1, 1) + timedelta(days=day) for day in range(182)]
+    dates.remove(date(2024, 5, 5))
+    AR_AP_df = pd.DataFrame({'date': dates})
+    day = np.arange(len(dates))
+    AR_AP_df['AR'] = 800.0 + 125.0 * (day % 7) + 3.5 * day
+    AR_AP_df['AP'] = 260.0 + 40.0 * (day % 5) + 1.25 * day
+    actual_deposits = {date(2024, 1, 12): (5400.0, 1650.0), date(2024, 1, 26): (9800.0, 3050.0),
+                       date(2024, 2, 9): (10450.0, 3210.0), date(2024, 2, 23): (11020.0, 3390.0),
+                       date(2024, 3, 8): (11630.0, 3580.0)}
+    AR_AP_df['AR_closing'] = AR_AP_df['date'].map(lambda d: actual_deposits.get(d, (0.0, 0.0))[0])
+    AR_AP_df['AP_closing'] = AR_AP_df['date'].map(lambda d: actual_deposits.get(d, (0.0, 0.0))[1])
+    AR_AP_df['AR_cumulative'] = (AR_AP_df['AR'] - AR_AP_df['AR_closing']).cumsum()
+    AR_AP_df['AP_cumulative'] = (AR_AP_df['AP'] - AR_AP_df['AP_closing']).cumsum()
+
+    # monthly FBM shipping forecast (2.5% of the month's forecast AR), paid at month end
+    AR_AP_df['FBM_shipping_cost_forecast'] = np.where(AR_AP_df['date'] >= FORECAST_START, AR_AP_df['AR'] * 0.025, np.nan)
+    month = AR_AP_df['date'].map(lambda d: (d.year, d.month))
+    AR_AP_df['FBM_shipping_cost_forecast_monthly'] = AR_AP_df.groupby(month)['FBM_shipping_cost_forecast'].transform('sum') * -1
+    return AR_AP_df
+
+
+# forecast deposits every 14 days after the last actual one; 2024-05-05 has no row and 2024-07-12 is past the data
+DEPOSIT_DATES = [date(2024, 3, 22) + timedelta(days=14 * n) for n in range(9)]
+# month ends from the first forecast day; 2024-07-31 is past the data
+SHIPPING_PAYMENT_DATES = [date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31), date(2024, 6, 30), date(2024, 7, 31)]
+
+
+@pytest.fixture
+def AR_AP_df():
+    return daily_AR_AP()
+
+
+def forward_pass(AR_AP_df, deposit_dates, shipping_payment_dates):
+    # as get_AR_AP_by_date_with_statement_shipping_closing_forecast: deposits first, then FBM shipping payments
+    series = simulate_closing_forward_pass(
+        AR_AP_df['date'],
+        AR_AP_df['AR_closing'].to_numpy(dtype=float),
+        AR_AP_df['AP_closing'].to_numpy(dtype=float),
+        AR_AP_df['AR_cumulative'].to_numpy(dtype=float),
+        AR_AP_df['AP_cumulative'].to_numpy(dtype=float),
+        deposit_dates=deposit_dates,
+        AR_paid_ratio=AR_PAID_RATIO,
+        AP_paid_to_AR_paid_ratio=AP_PAID_TO_AR_PAID_RATIO
+    )
+    series = simulate_closing_forward_pass(
+        AR_AP_df['date'], *series,
+        shipping_payment_dates=shipping_payment_dates,
+        shipping_payments=AR_AP_df['FBM_shipping_cost_forecast_monthly'].to_numpy(dtype=float)
+    )
+    return pd.DataFrame(dict(zip(['AR_closing', 'AP_closing', 'AR_cumulative', 'AP_cumulative'], series)))
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('deposit_dates, shipping_payment_dates', [
+    (DEPOSIT_DATES, SHIPPING_PAYMENT_DATES),
+    (DEPOSIT_DATES, []),
+    ([], SHIPPING_PAYMENT_DATES),
+    ([], []),
+])
+def test_forward_pass_matches_reference_loop(AR_AP_df, deposit_dates, shipping_payment_dates):
+    columns = ['AR_closing', 'AP_closing', 'AR_cumulative', 'AP_cumulative']
+    expected = reference_closing_loop(AR_AP_df, deposit_dates, AR_PAID_RATIO, AP_PAID_TO_AR_PAID_RATIO, shipping_payment_dates)
+    result = forward_pass(AR_AP_df, deposit_dates, shipping_payment_dates)
+    pd.testing.assert_frame_equal(result, expected[columns].reset_index(drop=True).astype(float), rtol=1e-9, atol=1e-6)
+
+
+def test_shipping_payment_is_carried_from_its_own_date(AR_AP_df):
+    # the previous loop shifted the rows after the last deposit date instead of after each payment date
+    result = forward_pass(AR_AP_df, [], [date(2024, 4, 30)])
+    payment = AR_AP_df.loc[AR_AP_df['date'] == date(2024, 4, 30), 'FBM_shipping_cost_forecast_monthly'].iloc[0]
+    shift = AR_AP_df['AP_cumulative'] - result['AP_cumulative']
+    assert payment < 0
+    assert (shift[AR_AP_df['date'] < date(2024, 4, 30)] == 0).all()
+    assert np.allclose(shift[AR_AP_df['date'] >= date(2024, 4, 30)], payment)
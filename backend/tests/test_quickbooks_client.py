@@ -0,0 +1,184 @@
+"""
+QuickBooksClient against a local HTTP stub
+The stub answers every request with the next scripted status and records what it received, so retries, backoff,
+token refreshes and requestid reuse are checked on the wire
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import pytest
+from backend.processing.api import quickbooks_client
+from backend.processing.api.quickbooks_client import QuickBooksClient
+
+REALM_ID = '4620816365'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        url = urlsplit(self.path)
+        self.server.received.append({
+            'method': self.command,
+            'path': url.path,
+            'params': {key: values[0] for key, values in parse_qs(url.query).items()},
+            'authorization': self.headers.get('Authorization'),
+            'body': self.rfile.read(length) if length else b'',
+        })
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        body = json.dumps({'status': status}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _answer
+    do_POST = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)  # port 0: the OS picks a free port
+    server.script, server.received = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff delays the client asked for, without actually sleeping"""
+    slept = []
+    monkeypatch.setattr(quickbooks_client.time, 'sleep', slept.append)
+    return slept
+
+
+def make_client(server, **kwargs):
+    refreshes = []
+
+    def token_source(force_refresh=False):
+        refreshes.append(force_refresh)
+        return f'token-{len(refreshes)}', 4102444800, REALM_ID
+
+    client = QuickBooksClient(base_url=f'http://127.0.0.1:{server.server_port}', token_source=token_source, **kwargs)
+    return client, refreshes
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Retries and backoff
+# ---------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retries_until_success_with_exponential_backoff(stub, delays, status):
+    stub.script = [(status, {}), (status, {}), (200, {})]
+    client, _ = make_client(stub, max_retries=3, backoff_factor=0.5)
+
+    response = client.get('companyinfo/1')
+
+    assert response.status_code == 200
+    assert len(stub.received) == 3
+    assert delays == [0.5, 1.0]
+    assert {request['path'] for request in stub.received} == {f'/v3/company/{REALM_ID}/companyinfo/1'}
+    metrics = client.metrics()['GET companyinfo']
+    assert (metrics['count'], metrics['retries'], metrics['errors']) == (1, 2, 0)
+
+
+def test_gives_up_after_max_retries(stub, delays):
+    stub.script = [(503, {})] * 10
+    client, _ = make_client(stub, max_retries=3, backoff_factor=0.25)
+
+    response = client.get('query', params={'query': 'SELECT * FROM Account'})
+
+    assert response.status_code == 503
+    assert len(stub.received) == 4  # the first attempt and three retries
+    assert delays == [0.25, 0.5, 1.0]
+    assert client.metrics()['GET query']['errors'] == 1
+
+
+def test_retry_after_header_overrides_backoff(stub, delays):
+    stub.script = [(429, {'Retry-After': '7'}), (200, {})]
+    client, _ = make_client(stub, backoff_factor=0.5)
+
+    assert client.get('companyinfo/1').status_code == 200
+    assert delays == [7.0]
+
+
+def test_client_errors_are_not_retried(stub, delays):
+    stub.script = [(400, {}), (200, {})]
+    client, _ = make_client(stub)
+
+    assert client.get('companyinfo/1').status_code == 400
+    assert len(stub.received) == 1
+    assert delays == []
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Token refresh
+# ---------------------------------------------------------------------------------------------------------------
+
+def test_unauthorized_refreshes_once_and_replays(stub, delays):
+    stub.script = [(401, {}), (200, {})]
+    client, refreshes = make_client(stub)
+
+    response = client.get('companyinfo/1')
+
+    assert response.status_code == 200
+    assert refreshes == [False, True]  # the first token, then exactly one forced refresh
+    assert [request['authorization'] for request in stub.received] == ['Bearer token-1', 'Bearer token-2']
+    assert stub.received[0]['path'] == stub.received[1]['path']
+    assert delays == []
+
+
+def test_second_unauthorized_is_returned_without_another_refresh(stub, delays):
+    stub.script = [(401, {}), (401, {}), (200, {})]
+    client, refreshes = make_client(stub)
+
+    assert client.get('companyinfo/1').status_code == 401
+    assert refreshes == [False, True]
+    assert len(stub.received) == 2
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Idempotent creates
+# ---------------------------------------------------------------------------------------------------------------
+
+def test_post_keeps_its_requestid_across_retries(stub, delays):
+    stub.script = [(500, {}), (401, {}), (503, {}), (200, {})]
+    client, _ = make_client(stub)
+    entry = {'Line': [], 'TxnDate': '2024-03-31'}
+
+    response = client.create_journal_entry(entry)
+
+    assert response.status_code == 200
+    assert [request['method'] for request in stub.received] == ['POST'] * 4
+    request_ids = {request['params'].get('requestid') for request in stub.received}
+    assert len(request_ids) == 1 and None not in request_ids
+    assert {request['body'] for request in stub.received} == {json.dumps(entry).encode()}
+
+
+def test_each_post_gets_its_own_requestid(stub, delays):
+    client, _ = make_client(stub)
+
+    client.post('journalentry', json={})
+    client.post('journalentry', json={})
+
+    assert stub.received[0]['params']['requestid'] != stub.received[1]['params']['requestid']
+
+
+def test_get_carries_no_requestid(stub, delays):
+    client, _ = make_client(stub)
+
+    client.get('companyinfo/1')
+
+    assert 'requestid' not in stub.received[0]['params']
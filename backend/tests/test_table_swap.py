@@ -0,0 +1,114 @@
+"""
+Shadow-table swaps of table_swap.replace_tables keep the table's owner, privileges, row-level security policies,
+replica identity and publication membership
+Needs DATABASE_URL of a PostgreSQL database the test may create a role, a table and a publication in (e.g. a local
+superuser); skipped otherwise
+"""
+
+import os
+import pandas as pd
+import pytest
+
+if not os.getenv('DATABASE_URL', '').startswith('postgresql'):
+    pytest.skip('needs DATABASE_URL of a PostgreSQL database', allow_module_level=True)
+
+from sqlalchemy import Table, MetaData, Column, Integer, String, Numeric, text
+from backend import app, db
+from backend.processing.functions import table_swap
+
+TABLE = 'swapprobe'
+READER = 'swapprobe_reader'
+PUBLICATION = 'swapprobe_publication'
+
+probe = Table(
+    TABLE, MetaData(),
+    Column('id', Integer, primary_key=True), Column('sku', String, nullable=False), Column('amount', Numeric(10, 2))
+)
+
+
+def catalog(connection):
+    """Access settings of the probe table as the catalog reports them"""
+    return {
+        'oid': connection.execute(text(f"SELECT CAST('{TABLE}' AS regclass)::oid")).scalar(),
+        'owner': connection.execute(text(f"SELECT pg_get_userbyid(relowner) FROM pg_class WHERE relname = '{TABLE}'")).scalar(),
+        'acl': sorted(connection.execute(text(f"""
+            SELECT pg_get_userbyid(x.grantee), x.privilege_type, x.is_grantable
+            FROM pg_class c, aclexplode(COALESCE(c.relacl, acldefault('r', c.relowner))) x WHERE c.relname = '{TABLE}'
+        """)).all()),
+        'column_acl': sorted(connection.execute(text(f"""
+            SELECT a.attname, pg_get_userbyid(x.grantee), x.privilege_type
+            FROM pg_attribute a, aclexplode(a.attacl) x WHERE a.attrelid = CAST('{TABLE}' AS regclass)
+        """)).all()),
+        'row_security': connection.execute(text(
+            f"SELECT relrowsecurity, relforcerowsecurity, relreplident FROM pg_class WHERE relname = '{TABLE}'"
+        )).one(),
+        'replica_identity_index': connection.execute(text(f"""
+            SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = CAST('{TABLE}' AS regclass) AND x.indisreplident
+        """)).scalar(),
+        'policies': sorted(connection.execute(text(
+            f"SELECT policyname, permissive, roles, cmd, qual, with_check FROM pg_policies WHERE tablename = '{TABLE}'"
+        )).all()),
+        'publications': connection.execute(text(
+            f"SELECT pubname, attnames, rowfilter FROM pg_publication_tables WHERE tablename = '{TABLE}'"
+        )).all(),
+    }
+
+
+@pytest.fixture
+def probe_table():
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text(f'DROP PUBLICATION IF EXISTS {PUBLICATION}'))
+            connection.execute(text(f'DROP TABLE IF EXISTS {TABLE}, {TABLE}{table_swap.SHADOW_SUFFIX}'))
+            connection.execute(text(f"""
+                DO $$ BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{READER}') THEN CREATE ROLE {READER}; END IF;
+                END $$
+            """))
+            probe.create(connection)
+            connection.execute(probe.insert(), [{'sku': 'SKU-A', 'amount': 1}, {'sku': 'SKU-B', 'amount': 2}])
+            connection.execute(text(f'GRANT SELECT, INSERT ON {TABLE} TO {READER} WITH GRANT OPTION'))
+            connection.execute(text(f'GRANT UPDATE (amount) ON {TABLE} TO {READER}'))
+            connection.execute(text(f'REVOKE TRUNCATE ON {TABLE} FROM CURRENT_USER'))
+            connection.execute(text(f'ALTER TABLE {TABLE} ENABLE ROW LEVEL SECURITY'))
+            connection.execute(text(f'CREATE UNIQUE INDEX {TABLE}_id_sku ON {TABLE} (id, sku)'))
+            connection.execute(text(f'ALTER TABLE {TABLE} REPLICA IDENTITY USING INDEX {TABLE}_id_sku'))
+            connection.execute(text(f"CREATE POLICY sku_a_only ON {TABLE} FOR SELECT TO {READER} USING (sku = 'SKU-A')"))
+            connection.execute(text(
+                f'CREATE POLICY positive_amounts ON {TABLE} AS RESTRICTIVE FOR INSERT TO PUBLIC WITH CHECK (amount > 0)'
+            ))
+            connection.execute(text(f"CREATE PUBLICATION {PUBLICATION} FOR TABLE {TABLE} (id, sku) WHERE (sku <> 'x')"))
+        yield
+        with db.engine.begin() as connection:
+            connection.execute(text(f'DROP PUBLICATION IF EXISTS {PUBLICATION}'))
+            connection.execute(text(f'DROP TABLE IF EXISTS {TABLE}'))
+            connection.execute(text(f'DROP ROLE IF EXISTS {READER}'))
+
+
+def rebuild(monkeypatch, swap):
+    monkeypatch.setattr(table_swap, 'TABLE_SWAP_ENABLED', swap)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            before = catalog(connection)
+        written = table_swap.replace_table(probe, pd.DataFrame({'sku': ['SKU-A', 'SKU-C'], 'amount': [3.5, 4.25]}))
+        db.session.commit()
+        with db.engine.connect() as connection:
+            after = catalog(connection)
+            rows = connection.execute(text(f'SELECT sku, amount FROM {TABLE} ORDER BY sku')).all()
+    assert written == 2
+    assert [(sku, float(amount)) for sku, amount in rows] == [('SKU-A', 3.5), ('SKU-C', 4.25)]
+    return before, after
+
+
+def test_swap_keeps_privileges_policies_and_publications(probe_table, monkeypatch):
+    before, after = rebuild(monkeypatch, swap=True)
+    assert after['oid'] != before['oid']  # the table was swapped, not loaded in place
+    for setting in ['owner', 'acl', 'column_acl', 'row_security', 'replica_identity_index', 'policies', 'publications']:
+        assert after[setting] == before[setting], setting
+    assert (READER, 'SELECT', True) in after['acl']
+
+
+def test_in_place_rebuild_keeps_the_table(probe_table, monkeypatch):
+    before, after = rebuild(monkeypatch, swap=False)
+    assert after == before
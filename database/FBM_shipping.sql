@@ -10,4 +10,4 @@ CREATE TABLE FBMShippingCost (
     payment_date TIMESTAMP
 );
 
-
+CREATE UNIQUE INDEX uq_fbmshippingcost_order_shipping ON FBMShippingCost (order_id, shipping_id);
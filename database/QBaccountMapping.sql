@@ -8,4 +8,34 @@ CREATE TABLE QBAccountIDMapping (
     pnl_account_id BIGINT,
     bs_account_name TEXT,
     bs_account_id BIGINT
-);
\ No newline at end of file
+);
+
+-- Table: QBAccountMappingVersion
+-- One row counting every write to QBAccountIDMapping, so each app process can tell its cached mapping is stale
+CREATE TABLE IF NOT EXISTS QBAccountMappingVersion (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL
+);
+
+INSERT INTO QBAccountMappingVersion (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Trigger function: bump the version after any insert, update, delete or truncate, from the app or by hand
+CREATE OR REPLACE FUNCTION bump_qbaccountmapping_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE QBAccountMappingVersion SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bump_qbaccountmapping_version_after_write ON QBAccountIDMapping;
+CREATE TRIGGER bump_qbaccountmapping_version_after_write
+AFTER INSERT OR UPDATE OR DELETE ON QBAccountIDMapping
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_qbaccountmapping_version();
+
+DROP TRIGGER IF EXISTS bump_qbaccountmapping_version_after_truncate ON QBAccountIDMapping;
+CREATE TRIGGER bump_qbaccountmapping_version_after_truncate
+AFTER TRUNCATE ON QBAccountIDMapping
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_qbaccountmapping_version();
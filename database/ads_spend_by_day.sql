@@ -7,3 +7,4 @@ CREATE TABLE AdsSpendByDay (
     spend NUMERIC(10, 2)
 );
 
+CREATE UNIQUE INDEX uq_adsspendbyday_date_sku ON AdsSpendByDay (date_by_day, sku);
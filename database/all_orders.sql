@@ -9,6 +9,7 @@ CREATE TABLE AmazonAllOrders (
     fulfillment_channel TEXT NOT NULL,
     sales_channel TEXT NOT NULL,
     sku TEXT NOT NULL,
+    line_number INTEGER NOT NULL DEFAULT 1,
     item_status TEXT NOT NULL,
     quantity INTEGER NOT NULL,
     currency TEXT,
@@ -21,3 +22,7 @@ CREATE TABLE AmazonAllOrders (
     item_promotion_discount NUMERIC(10, 2),
     ship_promotion_discount NUMERIC(10, 2)
 );
+
+-- Natural key of an order line; /amazon/all-orders/bulk-create upserts on it. An order can list one SKU on several lines
+-- (different item status, price or promotion): line_number is the line's position among them in the report
+CREATE UNIQUE INDEX uq_amazonallorders_order_sku_line ON AmazonAllOrders (amazon_order_id, sku, line_number);
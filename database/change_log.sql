@@ -0,0 +1,25 @@
+-- Table: ChangeLog
+-- Partitions (table x SKU x month) touched by writes, appended in the writing transaction; generate pipelines and
+-- dashboard caches read it to find what changed since their last successful run
+CREATE TABLE ChangeLog (
+    id SERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    partition_key TEXT,
+    month DATE,
+    date_from DATE,
+    date_to DATE,
+    row_count INTEGER NOT NULL,
+    source TEXT,
+    changed_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX changelog_table_name_id_idx ON ChangeLog (table_name, id);
+
+-- Table: ChangeLogCheckpoint
+-- Last ChangeLog id covered by each consumer's last successful run
+CREATE TABLE ChangeLogCheckpoint (
+    consumer TEXT PRIMARY KEY,
+    last_change_id INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
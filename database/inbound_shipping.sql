@@ -14,3 +14,6 @@ CREATE TABLE AmazonInboundShipping (
     currency TEXT,
     MSKU TEXT
 );
+
+-- MSKU is optional, rows without one share the key (shipment_id, '')
+CREATE UNIQUE INDEX uq_amazoninboundshipping_shipment_msku ON AmazonInboundShipping (shipment_id, COALESCE(MSKU, ''));
@@ -0,0 +1,14 @@
+-- Table: ProfitabilityWeekSKU
+-- Week x SKU net profit and revenue behind the profitability report, rebuilt by /amazon/all-orders-pnl/generate
+CREATE TABLE ProfitabilityWeekSKU (
+    week_label TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    week_start DATE NOT NULL,
+    week_end DATE NOT NULL,
+    net_profit NUMERIC(15, 2),
+    total_revenue NUMERIC(15, 2),
+    refreshed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (week_label, sku)
+);
+
+CREATE INDEX profitabilityweeksku_week_start_idx ON ProfitabilityWeekSKU (week_start);
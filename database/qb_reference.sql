@@ -0,0 +1,17 @@
+-- Table: QBReference
+-- Local copy of QuickBooks Account / Customer / Vendor IDs, refreshed by /quickbooks/references/sync
+CREATE TABLE QBReference (
+    entity_type TEXT NOT NULL,
+    qb_id TEXT NOT NULL,
+    name TEXT,
+    fully_qualified_name TEXT,
+    acct_num TEXT,
+    account_type TEXT,
+    active BOOLEAN,
+    last_updated_time TEXT,
+    synced_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (entity_type, qb_id)
+);
+
+CREATE INDEX qbreference_acct_num_idx ON QBReference (entity_type, acct_num);
+CREATE INDEX qbreference_name_idx ON QBReference (entity_type, name);
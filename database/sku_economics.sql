@@ -12,3 +12,5 @@ CREATE TABLE SKUEconomics (
     monthly_inventory_storage_fee_total NUMERIC(10, 2),
     inbound_transportation_charge_total NUMERIC(10, 2)
 );
+
+CREATE UNIQUE INDEX uq_skueconomics_store_msku_period ON SKUEconomics (amazon_store, MSKU, start_date_pst_pdt, end_date_pst_pdt);
@@ -0,0 +1,26 @@
+-- Table: SKUDimension
+-- SKU -> brand / main component, filled when sales and All Orders PnL rows are written
+CREATE TABLE SKUDimension (
+    sku TEXT PRIMARY KEY,
+    brand TEXT,
+    main_component TEXT,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX skudimension_brand_idx ON SKUDimension (brand);
+CREATE INDEX skudimension_main_component_idx ON SKUDimension (main_component);
+
+-- Table: ProductDimension
+-- Purchased product -> IR, example SKU, brand / main component, filled when purchase orders are written
+CREATE TABLE ProductDimension (
+    product TEXT PRIMARY KEY,
+    ir TEXT,
+    sku_one_example TEXT,
+    brand TEXT,
+    main_component TEXT,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX productdimension_ir_idx ON ProductDimension (ir);
+CREATE INDEX productdimension_brand_idx ON ProductDimension (brand);
+CREATE INDEX productdimension_main_component_idx ON ProductDimension (main_component);
@@ -22,3 +22,6 @@ CREATE TABLE AmazonStatements (
     sku TEXT,
     quantity_purchased INTEGER
 );
+
+-- Settlements are uploaded and replaced whole
+CREATE INDEX amazonstatements_settlement_id_idx ON AmazonStatements (settlement_id);
@@ -0,0 +1,54 @@
+-- Natural-key indexes for the upserting /amazon/*/bulk-create endpoints, for databases created before they existed
+-- Order lines repeating an order's SKU get their line numbers. Other rows repeating a key (left by overlapping
+-- re-uploads) are not removed here: the script lists them and rolls back without changing anything, so they can be
+-- reviewed and combined or deleted by hand, then the script run again
+
+BEGIN;
+
+-- An order can list one SKU on several lines (different item status, price or promotion), all of them valid: they are
+-- numbered in insertion order, as the upload numbers them in report order, and stay separate rows
+ALTER TABLE AmazonAllOrders ADD COLUMN IF NOT EXISTS line_number INTEGER NOT NULL DEFAULT 1;
+UPDATE AmazonAllOrders o SET line_number = numbered.line_number
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY amazon_order_id, sku ORDER BY id) AS line_number FROM AmazonAllOrders
+) numbered
+WHERE numbered.id = o.id AND o.line_number <> numbered.line_number;
+DROP INDEX IF EXISTS uq_amazonallorders_order_sku;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_amazonallorders_order_sku_line ON AmazonAllOrders (amazon_order_id, sku, line_number);
+
+CREATE TEMPORARY TABLE natural_key_duplicates ON COMMIT DROP AS
+SELECT 'SKUEconomics' AS table_name, amazon_store || ' / ' || MSKU || ' / ' || start_date_pst_pdt || ' / ' || end_date_pst_pdt AS natural_key, COUNT(*) AS rows, array_agg(id ORDER BY id) AS ids
+FROM SKUEconomics GROUP BY amazon_store, MSKU, start_date_pst_pdt, end_date_pst_pdt HAVING COUNT(*) > 1
+UNION ALL
+SELECT 'AdsSpendByDay', date_by_day || ' / ' || sku, COUNT(*), array_agg(id ORDER BY id)
+FROM AdsSpendByDay GROUP BY date_by_day, sku HAVING COUNT(*) > 1
+UNION ALL
+SELECT 'AmazonInboundShipping', shipment_id || ' / ' || COALESCE(MSKU, ''), COUNT(*), array_agg(id ORDER BY id)
+FROM AmazonInboundShipping GROUP BY shipment_id, COALESCE(MSKU, '') HAVING COUNT(*) > 1
+UNION ALL
+SELECT 'FBMShippingCost', order_id || ' / ' || shipping_id, COUNT(*), array_agg(id ORDER BY id)
+FROM FBMShippingCost GROUP BY order_id, shipping_id HAVING COUNT(*) > 1;
+
+SELECT * FROM natural_key_duplicates ORDER BY table_name, natural_key;
+
+DO $$
+DECLARE
+    duplicate_keys integer;
+    listing text;
+BEGIN
+    SELECT COUNT(*), string_agg(table_name || ' ' || natural_key || ' (ids ' || array_to_string(ids, ', ') || ')', E'\n')
+    INTO duplicate_keys, listing FROM natural_key_duplicates;
+    IF duplicate_keys > 0 THEN
+        RAISE EXCEPTION '% natural keys are repeated; no index was created', duplicate_keys USING DETAIL = listing;
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_skueconomics_store_msku_period ON SKUEconomics (amazon_store, MSKU, start_date_pst_pdt, end_date_pst_pdt);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_adsspendbyday_date_sku ON AdsSpendByDay (date_by_day, sku);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_amazoninboundshipping_shipment_msku ON AmazonInboundShipping (shipment_id, COALESCE(MSKU, ''));
+CREATE UNIQUE INDEX IF NOT EXISTS uq_fbmshippingcost_order_shipping ON FBMShippingCost (order_id, shipping_id);
+
+-- Statements keep duplicate lines (a settlement can repeat identical fee lines); re-uploaded settlements replace the stored ones
+CREATE INDEX IF NOT EXISTS amazonstatements_settlement_id_idx ON AmazonStatements (settlement_id);
+
+COMMIT;